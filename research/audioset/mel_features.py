@@ -216,3 +216,64 @@ def log_mel_spectrogram(data,
       num_spectrogram_bins=spectrogram.shape[1],
       audio_sample_rate=audio_sample_rate, **kwargs))
   return np.log(mel_spectrogram + log_offset)
+
+
+# Hann windows and mel matrices shared by all streams with the same settings.
+_cache = {}
+
+
+def _cached(function, *args):
+  """Returns function(*args), computing it only once per set of arguments."""
+  key = (function.__name__,) + args
+  if key not in _cache:
+    _cache[key] = function(*args)
+  return _cache[key]
+
+
+class LogMelSpectrogramStream(object):
+  """Incremental version of log_mel_spectrogram for audio arriving in chunks.
+
+  Waveform chunks are fed one after the other to process(), which returns the
+  log mel frames that became complete. Concatenating all returned frames gives
+  the same result as log_mel_spectrogram() on the concatenated waveform. Only
+  the samples of the last, incomplete frame are kept between calls.
+  """
+
+  def __init__(self,
+               audio_sample_rate=8000,
+               log_offset=0.0,
+               window_length_secs=0.025,
+               hop_length_secs=0.010,
+               **kwargs):
+    """Set up the stream, with the arguments of log_mel_spectrogram."""
+    self._log_offset = log_offset
+    self._window_length = int(round(audio_sample_rate * window_length_secs))
+    self._hop_length = int(round(audio_sample_rate * hop_length_secs))
+    self._fft_length = 2 ** int(
+        np.ceil(np.log(self._window_length) / np.log(2.0)))
+    self._window = _cached(periodic_hann, self._window_length)
+    self._mel_matrix = _cached(
+        spectrogram_to_mel_matrix, kwargs.get('num_mel_bins', 20),
+        self._fft_length // 2 + 1, audio_sample_rate,
+        kwargs.get('lower_edge_hertz', 125.0),
+        kwargs.get('upper_edge_hertz', 3800.0))
+    self._samples = np.zeros([0])
+
+  def process(self, data):
+    """Add a chunk of waveform and return the new log mel frames.
+
+    Args:
+      data: 1D np.array of waveform data following the previous chunk.
+
+    Returns:
+      2D np.array of (num_frames, num_mel_bins) with the log mel filterbank
+      magnitudes of the frames that were completed by this chunk.
+    """
+    samples = np.concatenate([self._samples, data])
+    if len(samples) < self._window_length:
+      self._samples = samples
+      return np.zeros([0, self._mel_matrix.shape[1]])
+    frames = frame(samples, self._window_length, self._hop_length)
+    self._samples = samples[len(frames) * self._hop_length:]
+    spectrogram = np.abs(np.fft.rfft(frames * self._window, self._fft_length))
+    return np.log(np.dot(spectrogram, self._mel_matrix) + self._log_offset)
@@ -15,6 +15,11 @@
 
 """Compute input examples for VGGish from audio waveform."""
 
+try:
+  from math import gcd
+except ImportError:  # Python 2.
+  from fractions import gcd
+
 import numpy as np
 import resampy
 from scipy.io import wavfile
@@ -84,3 +89,147 @@ def wavfile_to_examples(wav_file):
   assert wav_data.dtype == np.int16, 'Bad sample type: %r' % wav_data.dtype
   samples = wav_data / 32768.0  # Convert to [-1.0, +1.0]
   return waveform_to_examples(samples, sr)
+
+
+class _ResamplerStream(object):
+  """Incremental version of resampy.resample for audio arriving in chunks.
+
+  The input is cut into blocks of sr_orig / gcd(sr_orig, sr_new) samples,
+  which map to a whole number of output samples. A block is resampled once
+  enough input follows it to cover the resampling filter, together with that
+  much context on both sides, so its output matches resampling the whole
+  signal at once, up to floating point rounding.
+  """
+
+  def __init__(self, sr_orig, sr_new):
+    self._sr_orig = sr_orig
+    self._sr_new = sr_new
+    rate_gcd = gcd(sr_orig, sr_new)
+    self._in_block = sr_orig // rate_gcd
+    self._out_block = sr_new // rate_gcd
+    interp_win, precision, _ = resampy.filters.get_filter('kaiser_best')
+    support = len(interp_win) / float(precision) / min(1.0, sr_new / sr_orig)
+    num_pad_blocks = int(np.ceil((support + 1) / self._in_block))
+    self._pad = num_pad_blocks * self._in_block
+    self._samples = np.zeros([0])
+    self._offset = 0  # Index in the whole input of self._samples[0].
+    self._num_done_blocks = 0
+
+  def _resample(self, end):
+    """Resamples the input from the first pending block up to end."""
+    start = max(0, self._num_done_blocks * self._in_block - self._pad)
+    segment = self._samples[start - self._offset:end - self._offset]
+    skip = (self._num_done_blocks * self._in_block - start) // self._in_block
+    if int(len(segment) * self._sr_new / float(self._sr_orig)) < 1:
+      return np.zeros([0])
+    return resampy.resample(segment, self._sr_orig,
+                            self._sr_new)[skip * self._out_block:]
+
+  def process(self, data):
+    """Adds a chunk of input, and returns the output that became final."""
+    self._samples = np.concatenate([self._samples, data])
+    end = self._offset + len(self._samples)
+    num_ready_blocks = (end - self._pad) // self._in_block
+    if num_ready_blocks <= self._num_done_blocks:
+      return np.zeros([0])
+    num_new_blocks = num_ready_blocks - self._num_done_blocks
+    output = self._resample(num_ready_blocks * self._in_block + self._pad)
+    output = output[:num_new_blocks * self._out_block]
+    self._num_done_blocks = num_ready_blocks
+    # Keep the context needed by the next blocks.
+    keep_from = max(0, self._num_done_blocks * self._in_block - self._pad)
+    self._samples = self._samples[keep_from - self._offset:]
+    self._offset = keep_from
+    return output
+
+  def flush(self):
+    """Returns the remaining output, once all input has been added."""
+    output = self._resample(self._offset + len(self._samples))
+    self._samples = np.zeros([0])
+    self._offset = 0
+    self._num_done_blocks = 0
+    return output
+
+
+class WaveformToExamplesStream(object):
+  """Incremental version of waveform_to_examples for long recordings.
+
+  Audio is fed in chunks of any size to process(), which returns the examples
+  completed so far; flush() returns the remaining ones at the end of the
+  recording. Concatenating all returned examples gives the same result as
+  waveform_to_examples() on the whole waveform: exactly when the sample rate
+  is vggish_params.SAMPLE_RATE, and up to floating point rounding of the
+  resampling otherwise. Memory use is bounded by the chunk size.
+  """
+
+  def __init__(self, sample_rate):
+    """Set up the stream.
+
+    Args:
+      sample_rate: Sample rate of the waveform chunks.
+    """
+    self._resampler = None
+    if sample_rate != vggish_params.SAMPLE_RATE:
+      self._resampler = _ResamplerStream(sample_rate,
+                                         vggish_params.SAMPLE_RATE)
+    self._log_mel_stream = mel_features.LogMelSpectrogramStream(
+        audio_sample_rate=vggish_params.SAMPLE_RATE,
+        log_offset=vggish_params.LOG_OFFSET,
+        window_length_secs=vggish_params.STFT_WINDOW_LENGTH_SECONDS,
+        hop_length_secs=vggish_params.STFT_HOP_LENGTH_SECONDS,
+        num_mel_bins=vggish_params.NUM_MEL_BINS,
+        lower_edge_hertz=vggish_params.MEL_MIN_HZ,
+        upper_edge_hertz=vggish_params.MEL_MAX_HZ)
+    features_sample_rate = 1.0 / vggish_params.STFT_HOP_LENGTH_SECONDS
+    self._example_window_length = int(round(
+        vggish_params.EXAMPLE_WINDOW_SECONDS * features_sample_rate))
+    self._example_hop_length = int(round(
+        vggish_params.EXAMPLE_HOP_SECONDS * features_sample_rate))
+    self._log_mel = np.zeros([0, vggish_params.NUM_MEL_BINS])
+
+  def _examples(self, data):
+    """Turns resampled data into the examples that became complete."""
+    log_mel = np.concatenate(
+        [self._log_mel, self._log_mel_stream.process(data)])
+    if len(log_mel) < self._example_window_length:
+      self._log_mel = log_mel
+      return np.zeros([0, self._example_window_length,
+                       vggish_params.NUM_MEL_BINS])
+    # Copy the examples, which would otherwise be views of the buffer.
+    log_mel_examples = mel_features.frame(
+        log_mel,
+        window_length=self._example_window_length,
+        hop_length=self._example_hop_length).copy()
+    self._log_mel = log_mel[len(log_mel_examples) *
+                            self._example_hop_length:]
+    return log_mel_examples
+
+  def process(self, data):
+    """Adds a chunk of waveform and returns the examples it completed.
+
+    Args:
+      data: np.array of either one dimension (mono) or two dimensions
+        (multi-channel), as for waveform_to_examples, following the previous
+        chunk.
+
+    Returns:
+      3-D np.array of shape [num_examples, num_frames, num_bands], possibly
+      with no examples.
+    """
+    # Convert to mono.
+    if len(data.shape) > 1:
+      data = np.mean(data, axis=1)
+    if self._resampler:
+      data = self._resampler.process(data)
+    return self._examples(data)
+
+  def flush(self):
+    """Returns the examples still pending at the end of the waveform.
+
+    Returns:
+      3-D np.array of shape [num_examples, num_frames, num_bands], possibly
+      with no examples.
+    """
+    if not self._resampler:
+      return self._examples(np.zeros([0]))
+    return self._examples(self._resampler.flush())
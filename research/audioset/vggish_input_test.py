@@ -0,0 +1,108 @@
+# Copyright 2017 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for the streaming frontend of vggish_input."""
+
+import numpy as np
+import tensorflow as tf
+
+import mel_features
+import vggish_input
+import vggish_params
+
+
+def _stream(stream, data, chunk_sizes):
+  """Feeds data to stream in chunks of the given sizes, cycling through them.
+
+  Returns the concatenation of all outputs, including the flushed one.
+  """
+  outputs = []
+  start = 0
+  i = 0
+  while start < len(data):
+    end = start + chunk_sizes[i % len(chunk_sizes)]
+    outputs.append(stream.process(data[start:end]))
+    start = end
+    i += 1
+  if hasattr(stream, 'flush'):
+    outputs.append(stream.flush())
+  return np.concatenate(outputs)
+
+
+class VggishInputStreamTest(tf.test.TestCase):
+
+  def setUp(self):
+    np.random.seed(0)
+    # 3.3 seconds of a tone in noise, so that the last example is incomplete.
+    self._num_secs = 3.3
+
+  def _waveform(self, sample_rate):
+    t = np.arange(int(self._num_secs * sample_rate)) / float(sample_rate)
+    return (0.5 * np.sin(2 * np.pi * 440 * t) +
+            0.1 * np.random.uniform(-1, 1, len(t)))
+
+  def testLogMelSpectrogramStream(self):
+    sample_rate = vggish_params.SAMPLE_RATE
+    data = self._waveform(sample_rate)
+    kwargs = dict(
+        audio_sample_rate=sample_rate,
+        log_offset=vggish_params.LOG_OFFSET,
+        window_length_secs=vggish_params.STFT_WINDOW_LENGTH_SECONDS,
+        hop_length_secs=vggish_params.STFT_HOP_LENGTH_SECONDS,
+        num_mel_bins=vggish_params.NUM_MEL_BINS,
+        lower_edge_hertz=vggish_params.MEL_MIN_HZ,
+        upper_edge_hertz=vggish_params.MEL_MAX_HZ)
+    expected = mel_features.log_mel_spectrogram(data, **kwargs)
+    for chunk_sizes in [1000], [1, 399, 7], [len(data)]:
+      stream = mel_features.LogMelSpectrogramStream(**kwargs)
+      self.assertAllClose(expected, _stream(stream, data, chunk_sizes))
+
+  def testStreamAtModelSampleRate(self):
+    sample_rate = vggish_params.SAMPLE_RATE
+    data = self._waveform(sample_rate)
+    expected = vggish_input.waveform_to_examples(data, sample_rate)
+    for chunk_sizes in [16000], [3, 1777, 250], [len(data)]:
+      stream = vggish_input.WaveformToExamplesStream(sample_rate)
+      self.assertAllClose(expected, _stream(stream, data, chunk_sizes))
+
+  def testStreamWithResampling(self):
+    for sample_rate in 44100, 8000:
+      data = self._waveform(sample_rate)
+      expected = vggish_input.waveform_to_examples(data, sample_rate)
+      for chunk_sizes in [4410], [1, 5003, 97]:
+        stream = vggish_input.WaveformToExamplesStream(sample_rate)
+        self.assertAllClose(expected, _stream(stream, data, chunk_sizes),
+                            rtol=1e-4, atol=1e-4)
+
+  def testStreamMultiChannel(self):
+    sample_rate = vggish_params.SAMPLE_RATE
+    data = np.stack([self._waveform(sample_rate),
+                     self._waveform(sample_rate)], axis=1)
+    expected = vggish_input.waveform_to_examples(data, sample_rate)
+    stream = vggish_input.WaveformToExamplesStream(sample_rate)
+    self.assertAllClose(expected, _stream(stream, data, [5000]))
+
+  def testResamplerStream(self):
+    data = self._waveform(44100)
+    expected = vggish_input.resampy.resample(data, 44100,
+                                             vggish_params.SAMPLE_RATE)
+    for chunk_sizes in [1000], [13, 4000]:
+      stream = vggish_input._ResamplerStream(44100, vggish_params.SAMPLE_RATE)
+      self.assertAllClose(expected, _stream(stream, data, chunk_sizes),
+                          rtol=1e-5, atol=1e-5)
+
+
+if __name__ == '__main__':
+  tf.test.main()
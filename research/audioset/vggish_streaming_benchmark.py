@@ -0,0 +1,81 @@
+# Copyright 2017 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Throughput benchmark of the streaming VGGish input frontend.
+
+Feeds a synthetic waveform in fixed-size chunks through
+vggish_input.WaveformToExamplesStream, checks that the examples match those
+of vggish_input.waveform_to_examples on the whole waveform, and reports the
+throughput of both paths in seconds of audio per second of wall time.
+
+Usage:
+  $ python vggish_streaming_benchmark.py \
+      --num_secs 600 --sample_rate 44100 --chunk_secs 1.0
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+
+import vggish_input
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--num_secs', type=float, default=600.0,
+                      help='Duration of the synthetic waveform.')
+  parser.add_argument('--sample_rate', type=int, default=44100,
+                      help='Sample rate of the synthetic waveform.')
+  parser.add_argument('--chunk_secs', type=float, default=1.0,
+                      help='Duration of the chunks fed to the stream.')
+  args = parser.parse_args()
+
+  num_samples = int(args.num_secs * args.sample_rate)
+  chunk_length = int(args.chunk_secs * args.sample_rate)
+  # A 1 kHz sine wave with some noise.
+  t = np.arange(num_samples) / float(args.sample_rate)
+  waveform = (np.sin(2 * np.pi * 1000 * t) +
+              0.1 * np.random.RandomState(0).randn(num_samples))
+
+  start = time.time()
+  batch_examples = vggish_input.waveform_to_examples(waveform,
+                                                     args.sample_rate)
+  batch_secs = time.time() - start
+
+  start = time.time()
+  stream = vggish_input.WaveformToExamplesStream(args.sample_rate)
+  stream_examples = [
+      stream.process(waveform[i:i + chunk_length])
+      for i in range(0, num_samples, chunk_length)
+  ]
+  stream_examples.append(stream.flush())
+  stream_examples = np.concatenate(stream_examples)
+  stream_secs = time.time() - start
+
+  np.testing.assert_equal(stream_examples.shape, batch_examples.shape)
+  max_error = np.max(np.abs(stream_examples - batch_examples))
+  print('Examples: %d, max abs difference to batch path: %g' %
+        (len(stream_examples), max_error))
+  print('Batch:     %.1f audio-seconds per wall-second' %
+        (args.num_secs / batch_secs))
+  print('Streaming: %.1f audio-seconds per wall-second (%.2f s chunks)' %
+        (args.num_secs / stream_secs, args.chunk_secs))
+
+
+if __name__ == '__main__':
+  main()
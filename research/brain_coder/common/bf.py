@@ -36,36 +36,6 @@ CHARS = INT_TO_CHAR = ['>', '<', '+', '-', '[', ']', '.', ',']
 CHAR_TO_INT = dict([(c, i) for i, c in enumerate(INT_TO_CHAR)])
 
 
-class LookAheadIterator(object):
-  """Same API as Python iterator, with additional peek method."""
-
-  def __init__(self, iterable):
-    self._it = iter(iterable)
-    self._current_element = None
-    self._done = False
-    self._preload_next()
-
-  def _preload_next(self):
-    try:
-      self._current_element = self._it.next()
-    except StopIteration:
-      self._done = True
-
-  def next(self):
-    if self._done:
-      raise StopIteration
-    element = self._current_element
-    self._preload_next()
-    return element
-
-  def peek(self, default_value=None):
-    if self._done:
-      if default_value is None:
-        raise StopIteration
-      return default_value
-    return self._current_element
-
-
 def buildbracemap(code):
   """Build jump map.
 
@@ -101,14 +71,271 @@ def buildbracemap(code):
   return bracemap, correct_syntax
 
 
+# Opcodes of compiled programs. Runs of '>', '<', '+', '-' and of ignored
+# characters are merged into one operation, and clear loops '[-]' and '[+]' are
+# replaced by a single operation.
+(_NOP, _RIGHT, _LEFT, _ADD, _SUB, _OPEN, _CLOSE, _OUT, _IN, _CLEAR_SUB,
+ _CLEAR_ADD) = range(11)
+
+_RUN_OPCODES = {'>': _RIGHT, '<': _LEFT, '+': _ADD, '-': _SUB}
+_CLEAR_OPCODES = {'-': _CLEAR_SUB, '+': _CLEAR_ADD}
+
+# Number of operations executed between two checks of the timeout.
+_TIMEOUT_CHECK_INTERVAL = 1000
+
+
+class Program(object):
+  """BF code compiled into run-length merged operations.
+
+  A program can be passed to `evaluate` in place of the code, to compile the
+  code only once when it is run on several inputs.
+  """
+
+  def __init__(self, code):
+    """Compiles BF code.
+
+    Args:
+      code: String or list of BF characters. Any character not in CHARS will be
+          ignored.
+    """
+    self.code = list(code)
+    self.bracemap, self.correct_syntax = buildbracemap(self.code)
+    # Operation i has opcode ops[i] and argument args[i], and stands for the
+    # code characters in [starts[i], ends[i]). The argument is the repeat count
+    # of merged operations, and the index of the matching operation of braces.
+    self.ops, self.args, self.starts, self.ends = [], [], [], []
+    brace_ops = {}
+    position = 0
+    while position < len(self.code):
+      command = self.code[position]
+      end = position + 1
+      if command in _RUN_OPCODES:
+        while end < len(self.code) and self.code[end] == command:
+          end += 1
+        op, arg = _RUN_OPCODES[command], end - position
+      elif command in ('[', ']') and self.bracemap[position] == position:
+        op, arg = _NOP, 1  # Unmatched braces don't jump.
+      elif (command == '[' and self.bracemap[position] == position + 2 and
+            self.code[position + 1] in _CLEAR_OPCODES):
+        op, arg = _CLEAR_OPCODES[self.code[position + 1]], 1
+        end = position + 3
+      elif command in ('[', ']'):
+        op, arg = (_OPEN if command == '[' else _CLOSE), self.bracemap[position]
+        brace_ops[position] = len(self.ops)
+      elif command in ('.', ','):
+        op, arg = (_OUT if command == '.' else _IN), 1
+      else:
+        while end < len(self.code) and self.code[end] not in CHAR_TO_INT:
+          end += 1
+        op, arg = _NOP, end - position
+      self.ops.append(op)
+      self.args.append(arg)
+      self.starts.append(position)
+      self.ends.append(end)
+      position = end
+    for i, op in enumerate(self.ops):
+      if op in (_OPEN, _CLOSE):
+        self.args[i] = brace_ops[self.args[i]]
+
+
+class _Machine(object):
+  """Execution state of a BF program."""
+
+  def __init__(self, program, input_buffer, init_memory, base):
+    self.program = program
+    self.base = base
+    self.inputs = list(input_buffer) if input_buffer is not None else []
+    self.input_pos = 0
+    self.cells = list(init_memory) if init_memory else [0]
+    self.cellptr = 0
+    self.codeptr = 0
+    self.output_buffer = []
+    self.steps = 0
+
+  def snapshot(self):
+    """Returns the ExecutionSnapshot of the current state."""
+    code = self.program.code
+    return ExecutionSnapshot(
+        codeptr=self.codeptr,
+        codechar=code[self.codeptr] if self.codeptr < len(code) else '',
+        memptr=self.cellptr, memval=self.cells[self.cellptr],
+        memory=list(self.cells),
+        next_input=(self.inputs[self.input_pos]
+                    if self.input_pos < len(self.inputs) else 0),
+        output_buffer=list(self.output_buffer))
+
+  def run_chars(self, stop, max_steps, deadline, program_trace=None):
+    """Executes the code one character at a time, until codeptr reaches stop.
+
+    Args:
+      stop: Code position at which to stop.
+      max_steps: Execution step limit, or None.
+      deadline: Time at which execution times out, or None.
+      program_trace: If not None, a list to which an ExecutionSnapshot is added
+          before each step.
+
+    Returns:
+      The failure reason if execution was interrupted, otherwise None.
+    """
+    code, bracemap, base = self.program.code, self.program.bracemap, self.base
+    cells = self.cells
+    while self.codeptr < stop:
+      if program_trace is not None:
+        program_trace.append(self.snapshot())
+      command = code[self.codeptr]
+      cellptr = self.cellptr
+
+      if command == '>':
+        self.cellptr += 1
+        if self.cellptr == len(cells): cells.append(0)
+
+      if command == '<':
+        self.cellptr = 0 if cellptr <= 0 else cellptr - 1
+
+      if command == '+':
+        cells[cellptr] = cells[cellptr] + 1 if cells[cellptr] < (base - 1) else 0
+
+      if command == '-':
+        cells[cellptr] = cells[cellptr] - 1 if cells[cellptr] > 0 else (base - 1)
+
+      if command == '[' and cells[cellptr] == 0:
+        self.codeptr = bracemap[self.codeptr]
+      if command == ']' and cells[cellptr] != 0:
+        self.codeptr = bracemap[self.codeptr]
+
+      if command == '.': self.output_buffer.append(cells[cellptr])
+      if command == ',':
+        cells[cellptr] = (self.inputs[self.input_pos]
+                          if self.input_pos < len(self.inputs) else 0)
+        self.input_pos += 1
+
+      self.codeptr += 1
+      self.steps += 1
+
+      if (deadline is not None and
+          self.steps % _TIMEOUT_CHECK_INTERVAL == 0 and
+          time.time() > deadline):
+        return Status.TIMEOUT
+      if max_steps is not None and self.steps >= max_steps:
+        return Status.STEP_LIMIT
+    return None
+
+  def run(self, max_steps, deadline):
+    """Executes the compiled operations of the program.
+
+    Operations that would exceed the step limit, or that act on memory values
+    outside of [0, base), are executed one character at a time, so that the
+    result is the same as that of `run_chars`.
+
+    Args:
+      max_steps: Execution step limit, or None.
+      deadline: Time at which execution times out, or None.
+
+    Returns:
+      The failure reason if execution was interrupted, otherwise None.
+    """
+    program, base = self.program, self.base
+    ops, args, num_ops = program.ops, program.args, len(program.ops)
+    cells, inputs, output_buffer = self.cells, self.inputs, self.output_buffer
+    cellptr, input_pos, steps = self.cellptr, self.input_pos, self.steps
+    limit = max_steps if max_steps is not None else float('inf')
+    until_check = _TIMEOUT_CHECK_INTERVAL
+    pc = 0
+    reason = None
+    while pc < num_ops:
+      op = ops[pc]
+      arg = args[pc]
+      slow = False
+      if op == _OPEN:
+        if cells[cellptr] == 0:
+          pc = arg
+        steps += 1
+      elif op == _CLOSE:
+        if cells[cellptr] != 0:
+          pc = arg
+        steps += 1
+      elif op == _ADD or op == _SUB:
+        value = cells[cellptr]
+        if steps + arg > limit or not 0 <= value < base:
+          slow = True
+        else:
+          cells[cellptr] = (value + arg if op == _ADD else value - arg) % base
+          steps += arg
+      elif op == _RIGHT:
+        if steps + arg > limit:
+          slow = True
+        else:
+          cellptr += arg
+          if cellptr >= len(cells):
+            cells.extend([0] * (cellptr + 1 - len(cells)))
+          steps += arg
+      elif op == _LEFT:
+        if steps + arg > limit:
+          slow = True
+        else:
+          cellptr = cellptr - arg if cellptr > arg else 0
+          steps += arg
+      elif op == _OUT:
+        output_buffer.append(cells[cellptr])
+        steps += 1
+      elif op == _IN:
+        cells[cellptr] = inputs[input_pos] if input_pos < len(inputs) else 0
+        input_pos += 1
+        steps += 1
+      elif op == _NOP:
+        if steps + arg > limit:
+          slow = True
+        else:
+          steps += arg
+      else:
+        # Clear loop: the '[' test, then one '-' or '+' and one ']' test for
+        # each iteration.
+        value = cells[cellptr]
+        if value == 0:
+          cost = 1
+        else:
+          cost = 1 + 2 * (value if op == _CLEAR_SUB else base - value)
+        if steps + cost > limit or not 0 <= value < base:
+          slow = True
+        else:
+          cells[cellptr] = 0
+          steps += cost
+
+      if slow:
+        self.codeptr = program.starts[pc]
+        self.cellptr, self.input_pos, self.steps = cellptr, input_pos, steps
+        reason = self.run_chars(program.ends[pc], max_steps, deadline)
+        cellptr, input_pos, steps = self.cellptr, self.input_pos, self.steps
+        if reason is not None:
+          break
+      pc += 1
+
+      if steps >= limit:
+        reason = Status.STEP_LIMIT
+        break
+      until_check -= 1
+      if not until_check:
+        until_check = _TIMEOUT_CHECK_INTERVAL
+        if deadline is not None and time.time() > deadline:
+          reason = Status.TIMEOUT
+          break
+
+    self.cellptr, self.input_pos, self.steps = cellptr, input_pos, steps
+    if reason is None or pc >= num_ops:
+      self.codeptr = len(program.code)
+    elif not slow:
+      self.codeptr = program.starts[pc]
+    return reason
+
+
 def evaluate(code, input_buffer=None, init_memory=None, base=256, timeout=1.0,
              max_steps=None, require_correct_syntax=True, output_memory=False,
              debug=False):
   """Execute BF code.
 
   Args:
-    code: String or list of BF characters. Any character not in CHARS will be
-        ignored.
+    code: String or list of BF characters, or a `Program` compiled from them.
+        Any character not in CHARS will be ignored.
     input_buffer: A list of ints which will be used as the program's input
         stream. Each read op "," will read an int from this list. 0's will be
         read once the end of the list is reached, or if no input buffer is
@@ -120,7 +347,7 @@ def evaluate(code, input_buffer=None, init_memory=None, base=256, timeout=1.0,
         `base` it will overflow to 0. When a memory value is decremented to -1
         it will underflow to `base` - 1.
     timeout: Time limit for program execution in seconds. Set to None to
-        disable.
+        disable. The time is only checked every few thousand steps.
     max_steps: Execution step limit. An execution step is the execution of one
         operation (code character), even if that op has been executed before.
         Execution exits when this many steps are reached. Set to None to
@@ -145,90 +372,29 @@ def evaluate(code, input_buffer=None, init_memory=None, base=256, timeout=1.0,
       memory: If `output_memory` is True, a list of memory cells up to the last
           one written to. otherwise, None.
   """
-  input_iter = (
-      LookAheadIterator(input_buffer) if input_buffer is not None
-      else LookAheadIterator([]))
-
-  # Null memory value. This is the value of an empty memory. Also the value
-  # returned by the read operation when the input buffer is empty, or the
-  # end of the buffer is reached.
-  null_value = 0
-
-  code = list(code)
-  bracemap, correct_syntax = buildbracemap(code)  # will modify code list
-  if require_correct_syntax and not correct_syntax:
+  program = code if isinstance(code, Program) else Program(code)
+  if require_correct_syntax and not program.correct_syntax:
     return EvalResult([], False, Status.SYNTAX_ERROR, 0, 0.0,
                       [] if output_memory else None, [] if debug else None)
 
-  output_buffer = []
-
-  codeptr, cellptr = 0, 0
-
-  cells = list(init_memory) if init_memory else [0]
-
-  program_trace = [] if debug else None
-  success = True
-  reason = Status.SUCCESS
+  machine = _Machine(program, input_buffer, init_memory, base)
   start_time = time.time()
-  steps = 0
-  while codeptr < len(code):
-    command = code[codeptr]
-
-    if debug:
-      # Add step to program trace.
-      program_trace.append(ExecutionSnapshot(
-          codeptr=codeptr, codechar=command, memptr=cellptr,
-          memval=cells[cellptr], memory=list(cells),
-          next_input=input_iter.peek(null_value),
-          output_buffer=list(output_buffer)))
-
-    if command == '>':
-      cellptr += 1
-      if cellptr == len(cells): cells.append(null_value)
-
-    if command == '<':
-      cellptr = 0 if cellptr <= 0 else cellptr - 1
-
-    if command == '+':
-      cells[cellptr] = cells[cellptr] + 1 if cells[cellptr] < (base - 1) else 0
-
-    if command == '-':
-      cells[cellptr] = cells[cellptr] - 1 if cells[cellptr] > 0 else (base - 1)
-
-    if command == '[' and cells[cellptr] == 0: codeptr = bracemap[codeptr]
-    if command == ']' and cells[cellptr] != 0: codeptr = bracemap[codeptr]
-
-    if command == '.': output_buffer.append(cells[cellptr])
-    if command == ',': cells[cellptr] = next(input_iter, null_value)
-
-    codeptr += 1
-    steps += 1
-
-    if timeout is not None and time.time() - start_time > timeout:
-      success = False
-      reason = Status.TIMEOUT
-      break
-    if max_steps is not None and steps >= max_steps:
-      success = False
-      reason = Status.STEP_LIMIT
-      break
-
+  deadline = start_time + timeout if timeout is not None else None
   if debug:
-    # Add step to program trace.
-    command = code[codeptr] if codeptr < len(code) else ''
-    program_trace.append(ExecutionSnapshot(
-        codeptr=codeptr, codechar=command, memptr=cellptr,
-        memval=cells[cellptr], memory=list(cells),
-        next_input=input_iter.peek(null_value),
-        output_buffer=list(output_buffer)))
+    # Tracing needs the state before each step, so the code is not compiled.
+    program_trace = []
+    reason = machine.run_chars(len(program.code), max_steps, deadline,
+                               program_trace)
+    program_trace.append(machine.snapshot())
+  else:
+    program_trace = None
+    reason = machine.run(max_steps, deadline)
 
   return EvalResult(
-      output=output_buffer,
-      success=success,
-      failure_reason=reason,
-      steps=steps,
+      output=machine.output_buffer,
+      success=reason is None,
+      failure_reason=reason or Status.SUCCESS,
+      steps=machine.steps,
       time=time.time() - start_time,
-      memory=cells if output_memory else None,
+      memory=machine.cells if output_memory else None,
       program_trace=program_trace)
-
-
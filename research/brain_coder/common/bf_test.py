@@ -94,6 +94,30 @@ class BfTest(tf.test.TestCase):
         (er.output, er.success, er.failure_reason))
     self.assertTrue(er.steps < 100)
 
+  def testMaxStepsInMergedOps(self):
+    # The step limit falls inside runs of '+' and inside a clear loop.
+    for max_steps in xrange(1, 30):
+      er = bf.evaluate('+++++.>+++<[-]+.', base=256, input_buffer=[],
+                       timeout=None, max_steps=max_steps, output_memory=True)
+      self.assertEqual(min(max_steps, 24), er.steps)
+      trace = bf.evaluate('+++++.>+++<[-]+.', base=256, input_buffer=[],
+                          timeout=None, max_steps=max_steps, debug=True)
+      self.assertEqual(trace.program_trace[-1].memory, er.memory)
+      self.assertEqual(trace.program_trace[-1].output_buffer, er.output)
+
+  def testCompiledProgram(self):
+    program = bf.Program('>,[>,]<[.<]')
+    self.assertCorrectOutput(
+        [2, 3, 4], bf.evaluate(program, input_buffer=[4, 3, 2]))
+    self.assertCorrectOutput(
+        [7, 5], bf.evaluate(program, input_buffer=[5, 7]))
+
+  def testOutOfRangeMemory(self):
+    # Values at or above base are only decremented one at a time.
+    self.assertCorrectOutput(
+        [5, 0],
+        bf.evaluate('--.[-].', base=5, input_buffer=[], init_memory=[7]))
+
   def testOutputMemory(self):
     er = bf.evaluate('+>++>+++>++++.', base=256, input_buffer=[],
                      output_memory=True)
@@ -4,11 +4,13 @@ from __future__ import print_function
 
 """Configuration class."""
 
-import bisect
 from collections import deque
+from collections import OrderedDict
 import cPickle
 import heapq
+import io
 import random
+import struct
 
 from absl import logging
 import numpy as np
@@ -334,6 +336,51 @@ class MaxUniquePriorityQueue(object):
     return repr(self)
 
 
+class LRUCache(object):
+  """Mapping of bounded size which evicts the least recently used items."""
+
+  def __init__(self, max_size):
+    """Construct empty LRUCache.
+
+    Args:
+      max_size: Maximum number of items held by the cache.
+    """
+    assert max_size > 0
+    self.max_size = max_size
+    self._items = OrderedDict()
+
+  def __len__(self):
+    return len(self._items)
+
+  def __contains__(self, key):
+    return key in self._items
+
+  def get(self, key, default=None):
+    """Returns the value of `key` and marks it as recently used."""
+    if key not in self._items:
+      return default
+    value = self._items.pop(key)
+    self._items[key] = value
+    return value
+
+  def put(self, key, value):
+    """Adds or replaces the value of `key`, evicting the oldest item if full."""
+    self._items.pop(key, None)
+    self._items[key] = value
+    if len(self._items) > self.max_size:
+      self._items.popitem(last=False)
+
+
+# Magic bytes starting each block of a RouletteWheel save file. Files written
+# before the binary format existed hold one pickled (obj, weight, key) tuple
+# per entry instead, and are still loaded.
+_ROULETTE_BLOCK_MAGIC = b'RWB1'
+
+# Header of each save file block: magic, number of added entries, number of
+# weight updates, and byte length of the pickled objects and keys.
+_ROULETTE_BLOCK_HEADER = struct.Struct('<4sqqq')
+
+
 class RouletteWheel(object):
   """Randomly samples stored objects proportionally to their given weights.
 
@@ -350,6 +397,12 @@ class RouletteWheel(object):
   buffer multiple times, a "unique mode" is supported where duplicate
   experiences are ignored. In unique mode, weights can be quickly retrieved from
   keys.
+
+  Weights are kept in a numpy array, together with a Fenwick tree over them, so
+  that sampling one object and updating one weight both take O(log n) time.
+  `sample_many` draws all its samples at once with a binary search over the
+  cumulative sums of the weights, which are maintained incrementally as
+  objects are added.
   """
 
   def __init__(self, unique_mode=False, save_file=None):
@@ -363,60 +416,163 @@ class RouletteWheel(object):
       unique_mode: If True, puts this RouletteWheel into unique mode, where
           objects are added with hashable keys, so that duplicates are ignored.
       save_file: Optional file path to save to. Must be a string containing
-          an absolute path to a file, or None. File will be Python pickle
-          format.
+          an absolute path to a file, or None. File will be an append-only
+          binary log, see `incremental_save`.
     """
     self.unique_mode = unique_mode
     self.objects = []
-    self.weights = []
-    self.partial_sums = []
+    self._size = 0
+    self._weights = np.zeros(16, dtype=np.float64)
+    # Fenwick tree, 1-indexed: entry i holds the sum of the weights at indices
+    # [i - (i & -i), i).
+    self._tree = np.zeros(17, dtype=np.float64)
+    # Cumulative sums of the weights. Only entries before
+    # `_partial_sums_valid` are up to date, the rest are recomputed lazily
+    # after a weight update.
+    self._partial_sums = np.zeros(16, dtype=np.float64)
+    self._partial_sums_valid = 0
+    self._total_weight = 0.0
     if self.unique_mode:
-      self.keys_to_weights = {}
-    self.save_file = save_file
+      self.keys_to_indices = {}
+    # Items loaded from disk are not buffered, so `save_file` is only set
+    # after loading.
+    self.save_file = None
     self.save_to_disk_buffer = []
+    self.weight_updates_buffer = []
 
     if save_file is not None and tf.gfile.Exists(save_file):
       # Load from disk.
-      with tf.gfile.OpenFast(save_file, 'r') as f:
-        count = 0
-        while 1:
-          try:
-            obj, weight, key = cPickle.load(f)
-          except EOFError:
-            break
-          else:
-            self.add(obj, weight, key)
-            count += 1
-      logging.info('Loaded %d samples from disk.', count)
-      # Clear buffer since these items are already on disk.
-      self.save_to_disk_buffer = []
+      with tf.gfile.OpenFast(save_file, 'rb') as f:
+        data = f.read()
+      self._load(data, save_file)
+      logging.info('Loaded %d samples from disk.', len(self))
+    self.save_file = save_file
+
+  def _load(self, data, save_file):
+    """Restores entries and weight updates from the contents of a save file."""
+    # Files written before the binary format start with pickled entries.
+    f = io.BytesIO(data)
+    objs, weights, keys = [], [], []
+    while f.tell() < len(data) and not data.startswith(_ROULETTE_BLOCK_MAGIC,
+                                                      f.tell()):
+      obj, weight, key = cPickle.load(f)
+      objs.append(obj)
+      weights.append(weight)
+      keys.append(key)
+    self._extend(objs, weights, keys)
+
+    offset = f.tell()
+    while offset < len(data):
+      magic, num_added, num_updated, pickle_size = (
+          _ROULETTE_BLOCK_HEADER.unpack_from(data, offset))
+      if magic != _ROULETTE_BLOCK_MAGIC:
+        raise IOError('Corrupted RouletteWheel save file: %s' % save_file)
+      offset += _ROULETTE_BLOCK_HEADER.size
+      objs, keys = cPickle.loads(data[offset:offset + pickle_size])
+      offset += pickle_size
+      weights = np.frombuffer(data, np.float64, num_added, offset)
+      offset += weights.nbytes
+      update_indices = np.frombuffer(data, np.int64, num_updated, offset)
+      offset += update_indices.nbytes
+      update_weights = np.frombuffer(data, np.float64, num_updated, offset)
+      offset += update_weights.nbytes
+      self._extend(objs, weights, keys)
+      for index, weight in zip(update_indices.tolist(),
+                               update_weights.tolist()):
+        self.update_weight(index, weight)
 
   def __iter__(self):
-    return iter(zip(self.objects, self.weights))
+    return iter(zip(self.objects, self.weights.tolist()))
 
   def __len__(self):
-    return len(self.objects)
+    return self._size
+
+  @property
+  def weights(self):
+    """Array with the weight of each object, in insertion order."""
+    return self._weights[:self._size]
 
   def is_empty(self):
     """Returns whether there is anything in the roulette wheel."""
-    return not self.partial_sums
+    return not self._size
 
   @property
   def total_weight(self):
     """Total cumulative weight across all objects."""
-    if self.partial_sums:
-      return self.partial_sums[-1]
-    return 0.0
+    return self._total_weight
 
   def has_key(self, key):
     if self.unique_mode:
       RuntimeError('has_key method can only be called in unique mode.')
-    return key in self.keys_to_weights
+    return key in self.keys_to_indices
 
   def get_weight(self, key):
     if self.unique_mode:
       RuntimeError('get_weight method can only be called in unique mode.')
-    return self.keys_to_weights[key]
+    return float(self._weights[self.keys_to_indices[key]])
+
+  def get_index(self, key):
+    """Returns the index of the object with the given key, in unique mode."""
+    if not self.unique_mode:
+      raise RuntimeError('get_index method can only be called in unique mode.')
+    return self.keys_to_indices[key]
+
+  def _update_partial_sums(self):
+    """Recomputes the cumulative sums invalidated by weight updates."""
+    start = self._partial_sums_valid
+    if start < self._size:
+      offset = self._partial_sums[start - 1] if start else 0.0
+      np.cumsum(self._weights[start:self._size],
+                out=self._partial_sums[start:self._size])
+      self._partial_sums[start:self._size] += offset
+      self._partial_sums_valid = self._size
+
+  def _reserve(self, size):
+    """Grows the arrays so that they hold at least `size` weights."""
+    capacity = self._weights.size
+    if size <= capacity:
+      return
+    while capacity < size:
+      capacity *= 2
+    for name in ('_weights', '_partial_sums'):
+      array = np.zeros(capacity, dtype=np.float64)
+      array[:self._size] = getattr(self, name)[:self._size]
+      setattr(self, name, array)
+    # Tree entries only depend on the weights at or before their index, so
+    # existing entries stay valid.
+    tree = np.zeros(capacity + 1, dtype=np.float64)
+    tree[:self._size + 1] = self._tree[:self._size + 1]
+    self._tree = tree
+
+  def _extend(self, objs, weights, keys):
+    """Appends objects and their weights, without any validation."""
+    count = len(objs)
+    if not count:
+      return
+    start, end = self._size, self._size + count
+    self._reserve(end)
+    self._update_partial_sums()
+    self._weights[start:end] = weights
+    np.cumsum(self._weights[start:end], out=self._partial_sums[start:end])
+    if start:
+      self._partial_sums[start:end] += self._partial_sums[start - 1]
+    # The new tree entries are differences of cumulative sums.
+    indices = np.arange(start + 1, end + 1)
+    lower = indices - (indices & -indices)
+    self._tree[start + 1:end + 1] = (
+        self._partial_sums[indices - 1] -
+        np.where(lower > 0, self._partial_sums[lower - 1], 0.0))
+    self.objects.extend(objs)
+    if self.unique_mode:
+      self.keys_to_indices.update(zip(keys, range(start, end)))
+    self._size = end
+    self._partial_sums_valid = end
+    self._total_weight = float(self._partial_sums[end - 1])
+    if self.save_file is not None:
+      # Record new items in buffer.
+      self.save_to_disk_buffer.extend(
+          zip(objs, np.asarray(weights, dtype=np.float64).tolist(),
+              keys if keys is not None else [None] * count))
 
   def add(self, obj, weight, key=None):
     """Add one object and its weight to the roulette wheel.
@@ -445,19 +601,14 @@ class RouletteWheel(object):
       if key is None:
         raise ValueError(
             'Hashable key required for objects when unique mode is enabled.')
-      if key in self.keys_to_weights:
-        # Weight updates are not allowed. Ignore the given value of `weight`.
+      if key in self.keys_to_indices:
+        # Repeated adds keep the first weight, and ignore the given value of
+        # `weight`. Use `update_weight` to change it.
         return False
-      self.keys_to_weights[key] = weight
     elif key is not None:
       raise ValueError(
           'key argument should not be used when unique mode is disabled.')
-    self.objects.append(obj)
-    self.weights.append(weight)
-    self.partial_sums.append(self.total_weight + weight)
-    if self.save_file is not None:
-      # Record new item in buffer.
-      self.save_to_disk_buffer.append((obj, weight, key))
+    self._extend([obj], [weight], [key])
     return True
 
   def add_many(self, objs, weights, keys=None):
@@ -491,8 +642,65 @@ class RouletteWheel(object):
       raise ValueError('Number of objects does not equal number of keys.')
     if len(objs) != len(weights):
       raise ValueError('Number of objects does not equal number of weights.')
-    return sum([self.add(obj, weights[i], key=keys[i] if keys else None)
-                for i, obj in enumerate(objs)])
+    weights = np.asarray(weights, dtype=np.float64)
+    if np.any(weights < 0):
+      raise ValueError('Weight must be non-negative')
+    if self.unique_mode:
+      if None in keys:
+        raise ValueError(
+            'Hashable key required for objects when unique mode is enabled.')
+      # Keep the first occurrence of each key that is not stored yet.
+      selected = [i for i, key in enumerate(keys)
+                  if key not in self.keys_to_indices]
+      if len(set(keys[i] for i in selected)) != len(selected):
+        first = {}
+        for i in selected:
+          first.setdefault(keys[i], i)
+        selected = sorted(first.values())
+      if len(selected) != len(keys):
+        objs = [objs[i] for i in selected]
+        weights = weights[selected]
+        keys = [keys[i] for i in selected]
+    self._extend(list(objs), weights, keys)
+    return len(objs)
+
+  def update_weight(self, index, weight):
+    """Changes the weight of a stored object.
+
+    Args:
+      index: Index of the object, in insertion order. In unique mode, use
+          `get_index` to find the index of a key.
+      weight: New non-negative weight of the object.
+
+    Raises:
+      ValueError: If `weight` is negative.
+      IndexError: If there is no object at `index`.
+    """
+    if weight < 0:
+      raise ValueError('Weight must be non-negative')
+    if not 0 <= index < self._size:
+      raise IndexError('No object at index %d.' % index)
+    delta = weight - self._weights[index]
+    self._weights[index] = weight
+    i = index + 1
+    while i <= self._size:
+      self._tree[i] += delta
+      i += i & -i
+    self._partial_sums_valid = min(self._partial_sums_valid, index)
+    self._total_weight += delta
+    if self.save_file is not None:
+      self.weight_updates_buffer.append((index, float(weight)))
+
+  def _find(self, spin):
+    """Returns the index of the first object whose partial sum exceeds spin."""
+    index = 0
+    step = 1 << (self._size.bit_length() - 1)
+    while step:
+      if index + step <= self._size and self._tree[index + step] <= spin:
+        index += step
+        spin -= self._tree[index]
+      step >>= 1
+    return index
 
   def sample(self):
     """Spin the roulette wheel.
@@ -510,29 +718,40 @@ class RouletteWheel(object):
       raise RuntimeError('Trying to sample from empty roulette wheel.')
     spin = random.random() * self.total_weight
 
-    # Binary search.
-    i = bisect.bisect_right(self.partial_sums, spin)
-    if i == len(self.partial_sums):
+    i = self._find(spin)
+    if i == self._size:
       # This should not happen since random.random() will always be strictly
       # less than 1.0, and the last partial sum equals self.total_weight().
       # However it may happen due to rounding error. In that case it is easy to
       # handle this, just select the last object.
       i -= 1
 
-    return self.objects[i], self.weights[i]
+    return self.objects[i], float(self._weights[i])
 
   def sample_many(self, count):
     """Spin the roulette wheel `count` times and return the results."""
     if self.is_empty():
       raise RuntimeError('Trying to sample from empty roulette wheel.')
-    return [self.sample() for _ in xrange(count)]
+    self._update_partial_sums()
+    partial_sums = self._partial_sums[:self._size]
+    # Spins are drawn from `random`, as in `sample`, so that seeding it makes
+    # both reproducible.
+    spins = np.array([random.random() for _ in range(count)])
+    spins *= partial_sums[-1]
+    # As in `sample`, rounding error may select one past the last object.
+    indices = np.minimum(
+        np.searchsorted(partial_sums, spins, side='right'), self._size - 1)
+    return list(zip([self.objects[i] for i in indices.tolist()],
+                    self._weights[indices].tolist()))
 
   def incremental_save(self, log_info=False):
     """Write new entries to disk.
 
     This performs an append operation on the `save_file` given in the
-    constructor. Any entries added since the last call to `incremental_save`
-    will be appended to the file.
+    constructor. Any entries added and weights updated since the last call to
+    `incremental_save` are appended to the file as one block, holding the
+    pickled objects and keys followed by the raw weights, so that restoring
+    the file only takes a few bulk reads.
 
     If a new RouletteWheel is constructed with the same `save_file`, all the
     entries written there will be automatically loaded into the instance.
@@ -549,8 +768,22 @@ class RouletteWheel(object):
     if log_info:
       logging.info('Saving %d new samples to disk.',
                    len(self.save_to_disk_buffer))
-    with tf.gfile.OpenFast(self.save_file, 'a') as f:
-      for entry in self.save_to_disk_buffer:
-        cPickle.dump(entry, f)
-    # Clear the buffer.
+    if self.save_to_disk_buffer:
+      objs, weights, keys = zip(*self.save_to_disk_buffer)
+    else:
+      objs, weights, keys = (), (), ()
+    if self.weight_updates_buffer:
+      update_indices, update_weights = zip(*self.weight_updates_buffer)
+    else:
+      update_indices, update_weights = (), ()
+    pickled = cPickle.dumps((list(objs), list(keys)), cPickle.HIGHEST_PROTOCOL)
+    with tf.gfile.OpenFast(self.save_file, 'ab') as f:
+      f.write(_ROULETTE_BLOCK_HEADER.pack(
+          _ROULETTE_BLOCK_MAGIC, len(objs), len(update_indices), len(pickled)))
+      f.write(pickled)
+      f.write(np.array(weights, dtype=np.float64).tobytes())
+      f.write(np.array(update_indices, dtype=np.int64).tobytes())
+      f.write(np.array(update_weights, dtype=np.float64).tobytes())
+    # Clear the buffers.
     self.save_to_disk_buffer = []
+    self.weight_updates_buffer = []
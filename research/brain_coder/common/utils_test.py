@@ -6,6 +6,7 @@ from __future__ import print_function
 """
 
 from collections import Counter
+import cPickle
 import random
 import tempfile
 import numpy as np
@@ -378,5 +379,91 @@ class UtilsTest(tf.test.TestCase):
         count += 1
       self.assertEqual(i + 2, count)
 
+  def testRouletteWheel_UpdateWeight(self):
+    np.random.seed(12345)
+    r = utils.RouletteWheel(unique_mode=True)
+    r.add_many(['a', 'b', 'c'], [0.5, 0.25, 0.25], ['a', 'b', 'c'])
+    r.update_weight(r.get_index('b'), 0.0)
+    r.update_weight(r.get_index('c'), 0.5)
+    self.assertEqual(0.0, r.get_weight('b'))
+    self.assertTrue(np.isclose(1.0, r.total_weight))
+    with self.assertRaises(ValueError):
+      r.update_weight(0, -1.0)
+    with self.assertRaises(IndexError):
+      r.update_weight(3, 1.0)
+
+    # Check that both sampling methods follow the updated weights.
+    n = 100000
+    c = Counter(r.sample_many(n))
+    c.update(r.sample() for _ in range(n))
+    self.assertEqual(0, c[('b', 0.0)])
+    self.assertTrue(np.isclose(0.5, c[('a', 0.5)] / float(2 * n), atol=1e-2))
+    self.assertTrue(np.isclose(0.5, c[('c', 0.5)] / float(2 * n), atol=1e-2))
+
+  def testRouletteWheel_ManyObjects(self):
+    np.random.seed(12345)
+    r = utils.RouletteWheel()
+    weights = np.random.random_sample(1000)
+    for i in range(0, 1000, 100):
+      r.add_many(list(range(i, i + 100)), weights[i:i + 100].tolist())
+    r.update_weight(500, 0.0)
+    self.assertEqual(list(range(1000)), r.objects)
+    self.assertTrue(np.isclose(weights.sum() - weights[500], r.total_weight))
+    # Sampling with a given spin selects the first object whose partial sum
+    # exceeds it.
+    partial_sums = np.cumsum(r.weights)
+    for spin in np.random.random_sample(100) * r.total_weight:
+      self.assertEqual(np.searchsorted(partial_sums, spin, side='right'),
+                       r._find(spin))
+
+  def testRouletteWheel_IncrementalSaveWeightUpdates(self):
+    f = tempfile.NamedTemporaryFile()
+    r = utils.RouletteWheel(unique_mode=True, save_file=f.name)
+    r.add_many([[1, 2], [3], [4, 5, 6]], [0.1, 0.2, 0.3], ['a', 'b', 'c'])
+    r.incremental_save()
+    r.update_weight(r.get_index('a'), 0.4)
+    r.add([7], 0.5, 'd')
+    r.update_weight(r.get_index('d'), 0.6)
+    r.incremental_save()
+    r.incremental_save()  # Nothing new to save.
+
+    r2 = utils.RouletteWheel(unique_mode=True, save_file=f.name)
+    self.assertEqual(
+        [([1, 2], 0.4), ([3], 0.2), ([4, 5, 6], 0.3), ([7], 0.6)], list(r2))
+    self.assertEqual(0.6, r2.get_weight('d'))
+    self.assertTrue(np.isclose(1.5, r2.total_weight))
+
+  def testRouletteWheel_LoadPickledEntries(self):
+    # Save files written one pickled entry at a time can still be loaded.
+    f = tempfile.NamedTemporaryFile()
+    entries = [([1, 2, 3], 0.1, 'a'), ([4, 5], 0.2, 'b')]
+    with open(f.name, 'wb') as pickle_file:
+      for entry in entries:
+        cPickle.dump(entry, pickle_file)
+    r = utils.RouletteWheel(unique_mode=True, save_file=f.name)
+    self.assertEqual([([1, 2, 3], 0.1), ([4, 5], 0.2)], list(r))
+    r.add([6], 0.3, 'c')
+    r.incremental_save()
+
+    r2 = utils.RouletteWheel(unique_mode=True, save_file=f.name)
+    self.assertEqual([([1, 2, 3], 0.1), ([4, 5], 0.2), ([6], 0.3)], list(r2))
+
+  def testLRUCache(self):
+    cache = utils.LRUCache(max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    self.assertEqual(1, cache.get('a'))
+    cache.put('c', 3)  # Evicts 'b', which is the least recently used.
+    self.assertEqual(2, len(cache))
+    self.assertFalse('b' in cache)
+    self.assertEqual(None, cache.get('b'))
+    self.assertEqual(1, cache.get('a'))
+    cache.put('c', 4)
+    cache.put('d', 5)  # Evicts 'a'.
+    self.assertEqual(-1, cache.get('a', -1))
+    self.assertEqual(4, cache.get('c'))
+    self.assertEqual(5, cache.get('d'))
+
+
 if __name__ == '__main__':
   tf.test.main()
@@ -7,6 +7,7 @@ from __future__ import print_function
 import abc
 import copy
 import itertools
+import multiprocessing
 import random
 
 from absl import logging
@@ -14,12 +15,23 @@ import numpy as np
 
 from common import bf  # brain coder
 from common import reward as r  # brain coder
+from common import utils  # brain coder
 from single_task import misc  # brain coder
 from single_task import test_tasks  # brain coder
 
 
 MAX_EXECUTION_STEPS = 5000
 
+# Number of (code, test cases) scores remembered by MultiIOTaskManager.
+SCORE_CACHE_SIZE = 100000
+
+# Number of programs sent at once to a scoring process.
+SCORING_CHUNK_SIZE = 8
+
+# Seconds to wait for a scoring process to return a chunk of scores, after
+# which the scoring processes are assumed to be stuck and are restarted.
+SCORING_CHUNK_TIMEOUT = 60.0
+
 
 def make_task(task_name, override_kwargs=None, max_code_length=100,
               require_correct_syntax=False,
@@ -139,7 +151,8 @@ class MultiIOTaskManager(object):
   def __init__(self, task, max_code_length=32, min_code_length=0,
                max_execution_steps=MAX_EXECUTION_STEPS, correct_bonus=1.0,
                code_length_bonus=1.0, failure_reward=-2.0, reward_fn=None,
-               require_correct_syntax=False):
+               require_correct_syntax=False,
+               score_cache_size=SCORE_CACHE_SIZE):
     assert isinstance(task, BaseTask)
     self.task = task
     self.max_code_length = max_code_length
@@ -161,6 +174,13 @@ class MultiIOTaskManager(object):
     self.output_type = (
         task.output_type if hasattr(task, 'output_type')
         else misc.IOType.integer)
+    # Scores of recently run programs. Populations and batches often contain
+    # the same program several times, which only needs to be run once per set
+    # of test cases.
+    self._score_cache = (
+        utils.LRUCache(score_cache_size) if score_cache_size else None)
+    # Optional ScoringPool, see start_scoring_pool.
+    self._scoring_pool = None
     self._compute_best_reward()
 
   def _compute_best_reward(self):
@@ -174,8 +194,65 @@ class MultiIOTaskManager(object):
     self.good_reward = 0.75 * reward
     logging.info('Known best reward: %.4f', self.best_reward)
 
+  def start_scoring_pool(self, num_processes,
+                         chunk_size=SCORING_CHUNK_SIZE,
+                         chunk_timeout=SCORING_CHUNK_TIMEOUT):
+    """Scores batches of programs in `num_processes` worker processes.
+
+    Args:
+      num_processes: Number of worker processes.
+      chunk_size: Number of programs sent at once to a worker.
+      chunk_timeout: Seconds to wait for the scores of one chunk.
+    """
+    self.stop_scoring_pool()
+    self._scoring_pool = ScoringPool(self, num_processes, chunk_size,
+                                     chunk_timeout)
+
+  def stop_scoring_pool(self):
+    """Stops the worker processes, if any. Programs are then scored inline."""
+    if self._scoring_pool is not None:
+      self._scoring_pool.close()
+    self._scoring_pool = None
+
   def _score_batch(self, code_strings):
-    return [self._score_code(code) for code in code_strings]
+    if self._scoring_pool is None:
+      return [self._score_code(code) for code in code_strings]
+    # Test cases are drawn and scores cached in this process, as when scoring
+    # inline, and only the programs missing from the cache are run by the
+    # workers.
+    io_seq_sets = [self.task.make_io_set() for _ in code_strings]
+    reward_infos = [self._cached_score(code, io_seqs)
+                    for code, io_seqs in zip(code_strings, io_seq_sets)]
+    missing = [i for i, reward_info in enumerate(reward_infos)
+               if reward_info is None]
+    new_reward_infos = self._scoring_pool.score_batch(
+        [(code_strings[i], io_seq_sets[i]) for i in missing])
+    for i, reward_info in zip(missing, new_reward_infos):
+      self._cache_score(code_strings[i], io_seq_sets[i], reward_info)
+      reward_infos[i] = reward_info
+    return reward_infos
+
+  def _score_key(self, code, io_seqs):
+    return (code, tuple((tuple(i), tuple(o)) for i, o in io_seqs))
+
+  def _cached_score(self, code, io_seqs):
+    """Returns a copy of the cached RewardInfo of code, or None."""
+    if self._score_cache is None:
+      return None
+    reward_info = self._score_cache.get(self._score_key(code, io_seqs))
+    if reward_info is None:
+      return None
+    return reward_info._replace(
+        episode_rewards=list(reward_info.episode_rewards))
+
+  def _cache_score(self, code, io_seqs, reward_info):
+    # Timeouts depend on the machine load, so they are not remembered.
+    if (self._score_cache is not None and
+        reward_info.reason != bf.Status.TIMEOUT):
+      self._score_cache.put(
+          self._score_key(code, io_seqs),
+          reward_info._replace(
+              episode_rewards=list(reward_info.episode_rewards)))
 
   def _score_code(self, code):
     """Run test cases on code and compute reward.
@@ -191,12 +268,21 @@ class MultiIOTaskManager(object):
     # Get list of 2-tuples, each containing an input sequence and an output
     # sequence.
     io_seqs = self.task.make_io_set()
+    reward_info = self._cached_score(code, io_seqs)
+    if reward_info is None:
+      reward_info = self._run_code(code, io_seqs)
+      self._cache_score(code, io_seqs, reward_info)
+    return reward_info
+
+  def _run_code(self, code, io_seqs):
+    """Run test cases on code and compute reward, see `_score_code`."""
+    program = bf.Program(code)
     terminal_reward = 0.0
     results = []
     reason = 'correct'
     for input_seq, output_seq in io_seqs:
       eval_result = bf.evaluate(
-          code, input_buffer=input_seq, timeout=0.1,
+          program, input_buffer=input_seq, timeout=0.1,
           max_steps=self.max_execution_steps,
           base=self.task.base,
           require_correct_syntax=self.require_correct_syntax)
@@ -240,10 +326,97 @@ class MultiIOTaskManager(object):
         reason=reason)
 
   def rl_batch(self, batch_size):
-    """Produces list of reward functions. One for each program in the batch."""
+    """Produces list of reward functions. One for each program in the batch.
+
+    If a scoring pool is running, a single function that scores the whole
+    batch at once is returned instead.
+    """
+    if self._scoring_pool is not None:
+      return self._score_batch
     return [self._score_code] * batch_size
 
 
+# Task manager of a scoring process.
+_worker_task_manager = None
+
+
+def _init_scoring_worker(task_manager):
+  global _worker_task_manager
+  _worker_task_manager = task_manager
+  # Forked workers inherit the random state of the parent. Reseed them from
+  # the OS so that they do not all draw the same numbers.
+  random.seed()
+  np.random.seed()
+
+
+def _score_chunk(programs):
+  return [_worker_task_manager._run_code(code, io_seqs)
+          for code, io_seqs in programs]
+
+
+class ScoringPool(object):
+  """Scores the programs of a task manager in persistent worker processes.
+
+  The workers are forked with a copy of the task manager. They only run
+  programs on the test cases drawn by the calling process, which also keeps the
+  score cache, so only code strings, test cases and RewardInfo tuples are sent
+  between processes. Programs are sent in chunks, so that batches of a few
+  hundred programs are spread over all workers.
+
+  Program execution is bounded by the timeout of `bf.evaluate`. If a worker
+  still fails to return a chunk in time, e.g. because it was killed, the pool is
+  restarted and the rest of the batch is scored in the calling process.
+  """
+
+  def __init__(self, task_manager, num_processes,
+               chunk_size=SCORING_CHUNK_SIZE,
+               chunk_timeout=SCORING_CHUNK_TIMEOUT):
+    self.task_manager = task_manager
+    self.num_processes = num_processes
+    self.chunk_size = chunk_size
+    self.chunk_timeout = chunk_timeout
+    self._pool = None
+    self._start()
+
+  def _start(self):
+    self._pool = multiprocessing.Pool(
+        self.num_processes, initializer=_init_scoring_worker,
+        initargs=(self.task_manager,))
+
+  def score_batch(self, programs):
+    """Runs programs on their test cases.
+
+    Args:
+      programs: List of (code, io_seqs) tuples, where io_seqs is a list of
+          test cases as returned by the `make_io_set` method of the task.
+
+    Returns:
+      The RewardInfo of each program, in order.
+    """
+    chunks = [programs[i:i + self.chunk_size]
+              for i in xrange(0, len(programs), self.chunk_size)]
+    chunk_results = self._pool.imap(_score_chunk, chunks)
+    reward_infos = []
+    for i, chunk in enumerate(chunks):
+      try:
+        reward_infos.extend(chunk_results.next(self.chunk_timeout))
+      except multiprocessing.TimeoutError:
+        logging.warning(
+            'Scoring processes did not return scores within %.1f seconds. '
+            'Restarting them and scoring %d programs inline.',
+            self.chunk_timeout, len(programs) - len(reward_infos))
+        self._pool.terminate()
+        self._start()
+        for code, io_seqs in itertools.chain(*chunks[i:]):
+          reward_infos.append(self.task_manager._run_code(code, io_seqs))
+        break
+    return reward_infos
+
+  def close(self):
+    self._pool.terminate()
+    self._pool.join()
+
+
 def conditional_overwrite(current_value, new_value, allowed_overwrite_values):
   if current_value in allowed_overwrite_values:
     return new_value
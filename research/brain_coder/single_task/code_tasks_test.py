@@ -4,6 +4,8 @@ from __future__ import print_function
 
 """Tests for code_tasks."""
 
+import random
+
 import numpy as np
 import tensorflow as tf
 
@@ -104,5 +106,38 @@ class CodeTasksTest(tf.test.TestCase):
         1.0)
 
 
+  def testScoringPool(self):
+    task = code_tasks.make_task('reverse', max_code_length=20)
+    code_strings = [',[>,]<[.<]', '>,[>,]<[.<]', '+[]', ',.', '+++[-]'] * 4
+    expected = task._score_batch(code_strings)
+    task.start_scoring_pool(2, chunk_size=3)
+    try:
+      self.assertEqual(expected, task._score_batch(code_strings))
+      self.assertEqual(expected, task.rl_batch(len(code_strings))(code_strings))
+    finally:
+      task.stop_scoring_pool()
+    self.assertEqual([task._score_code] * 2, task.rl_batch(2))
+
+  def testScoringPoolRandomTestCases(self):
+    def make_task():
+      return code_tasks.make_task(
+          'reverse-tune', override_kwargs=dict(reward_type='rand-many'),
+          max_code_length=20)
+    code_strings = [',[>,]<[.<]', '>,[>,]<[.<]', '+[]', ',.', '+++[-]'] * 4
+    task = make_task()
+    np.random.seed(0)
+    random.seed(0)
+    expected = task._score_batch(code_strings)
+    # Test cases are drawn by the calling process, so the pool scores the
+    # programs on the same ones.
+    task = make_task()
+    task.start_scoring_pool(2, chunk_size=3)
+    try:
+      np.random.seed(0)
+      random.seed(0)
+      self.assertEqual(expected, task._score_batch(code_strings))
+    finally:
+      task.stop_scoring_pool()
+
 if __name__ == '__main__':
   tf.test.main()
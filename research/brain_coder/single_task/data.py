@@ -19,7 +19,7 @@ class DataManager(object):
   """Interface between environment and model."""
 
   def __init__(self, global_config, run_number=None,
-               do_code_simplification=False):
+               do_code_simplification=False, num_scoring_processes=0):
     """Constructs a DataManager.
 
     Args:
@@ -34,6 +34,8 @@ class DataManager(object):
           use this option to create code simplification (code golf) tasks, vs
           fixed length coding tasks. If True, a task with code simplification
           reward will be constructed.
+      num_scoring_processes: If greater than 1, programs are scored in this
+          many worker processes. Call `close` to stop them.
 
     Raises:
       ValueError: If global_config.env.task and global_config.env.task_cycle
@@ -68,6 +70,10 @@ class DataManager(object):
         do_code_simplification=do_code_simplification,
         correct_bonus=env_config.task_manager_config.correct_bonus,
         code_length_bonus=env_config.task_manager_config.code_length_bonus)
+    if (num_scoring_processes > 1 and
+        isinstance(self.rl_task, code_tasks.MultiIOTaskManager)):
+      logging.info('Scoring programs in %d processes.', num_scoring_processes)
+      self.rl_task.start_scoring_pool(num_scoring_processes)
 
   def sample_rl_batch(self):
     """Create reward functions from the current task.
@@ -87,3 +93,8 @@ class DataManager(object):
         reward_fns=reward_fns,
         batch_size=self.batch_size,
         good_reward=self.rl_task.good_reward)
+
+  def close(self):
+    """Stops the scoring processes, if any."""
+    if isinstance(self.rl_task, code_tasks.MultiIOTaskManager):
+      self.rl_task.stop_scoring_pool()
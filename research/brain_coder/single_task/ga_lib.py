@@ -82,6 +82,29 @@ def io_repr(result):
   return inputs, target_outputs, code_outputs
 
 
+def _to_ga_result(result, base):
+  """Converts a misc.RewardInfo from a task manager into a Result."""
+  def to_data_list(single_or_tuple):
+    if isinstance(single_or_tuple, misc.IOTuple):
+      return list(single_or_tuple)
+    return [single_or_tuple]
+
+  def to_ga_type(rl_type):
+    if rl_type == misc.IOType.string:
+      return IOType.string
+    return IOType.integer
+
+  return Result(
+      reward=sum(result.episode_rewards),
+      inputs=to_data_list(result.input_case),
+      code_outputs=to_data_list(result.code_output),
+      target_outputs=to_data_list(result.correct_output),
+      type_in=to_ga_type(result.input_type),
+      type_out=to_ga_type(result.output_type),
+      correct=result.reason == 'correct',
+      base=base)
+
+
 def make_task_eval_fn(task_manager):
   """Returns a wrapper that converts an RL task into a GA task.
 
@@ -93,34 +116,43 @@ def make_task_eval_fn(task_manager):
     a Result namedtuple instance containing the reward and information about
     code execution.
   """
-  def to_data_list(single_or_tuple):
-    if isinstance(single_or_tuple, misc.IOTuple):
-      return list(single_or_tuple)
-    return [single_or_tuple]
-
-  def to_ga_type(rl_type):
-    if rl_type == misc.IOType.string:
-      return IOType.string
-    return IOType.integer
-
   # Wrapper function.
   def evalbf(bf_chars):
     result = task_manager._score_code(''.join(bf_chars))
-    reward = sum(result.episode_rewards)
-    correct = result.reason == 'correct'
-    return Result(
-        reward=reward,
-        inputs=to_data_list(result.input_case),
-        code_outputs=to_data_list(result.code_output),
-        target_outputs=to_data_list(result.correct_output),
-        type_in=to_ga_type(result.input_type),
-        type_out=to_ga_type(result.output_type),
-        correct=correct,
-        base=task_manager.task.base)
+    return _to_ga_result(result, task_manager.task.base)
 
   return evalbf
 
 
+def make_task_batch_eval_fn(task_manager):
+  """Returns a wrapper that evaluates a list of individuals at once.
+
+  The programs are scored with the task manager's scoring pool, if it has
+  one running (see `MultiIOTaskManager.start_scoring_pool`).
+
+  Args:
+    task_manager: Is a task manager object from code_tasks.py
+
+  Returns:
+    A function that takes as input a list of lists of code chars, and outputs
+    a list of Result namedtuple instances, one for each list of code chars.
+  """
+  def evalbf_batch(bf_chars_list):
+    results = task_manager._score_batch(
+        [''.join(bf_chars) for bf_chars in bf_chars_list])
+    return [_to_ga_result(result, task_manager.task.base)
+            for result in results]
+
+  return evalbf_batch
+
+
+def _evaluate_individuals(individuals, task_eval_fn, task_batch_eval_fn):
+  """Returns the Result of each individual, evaluated in one batch if possible."""
+  if task_batch_eval_fn is not None:
+    return task_batch_eval_fn(individuals)
+  return [task_eval_fn(ind) for ind in individuals]
+
+
 def debug_str(individual, task_eval_fn):
   res = task_eval_fn(individual)
   input_str, target_output_str, code_output_str = io_repr(res)
@@ -257,7 +289,7 @@ def mutate_and_crossover(population, mutation_rate, crossover_rate):
 
 
 def ga_loop(population, cxpb, mutpb, ngen, task_eval_fn, halloffame=None,
-            checkpoint_writer=None):
+            checkpoint_writer=None, task_batch_eval_fn=None):
   """A bare bones genetic algorithm.
 
   Similar to chapter 7 of Back, Fogel and Michalewicz, "Evolutionary
@@ -276,6 +308,9 @@ def ga_loop(population, cxpb, mutpb, ngen, task_eval_fn, halloffame=None,
         Needs to have `write`, `load`, and `has_checkpoint` methods. Used to
         periodically save progress. In event of a restart, the population will
         be loaded from disk.
+    task_batch_eval_fn: (optional) a python function which maps a list of
+        Individuals to a list of Result namedtuples. If given, it is used
+        instead of `task_eval_fn` to evaluate each new generation at once.
 
   Returns:
     GaResult namedtuple instance. This contains information about the GA run,
@@ -296,16 +331,17 @@ def ga_loop(population, cxpb, mutpb, ngen, task_eval_fn, halloffame=None,
 
       # Evaluate the individuals with an invalid fitness
       invalid_ind = [ind for ind in population if not ind.fitness.valid]
-      for ind in invalid_ind:
-        ind.fitness.values = task_eval_fn(ind).reward,
-      for _, ind in halloffame.iter_in_order():
-        ind.fitness.values = task_eval_fn(ind).reward,
+      invalid_ind += [ind for _, ind in halloffame.iter_in_order()]
+      for ind, eval_result in zip(invalid_ind, _evaluate_individuals(
+          invalid_ind, task_eval_fn, task_batch_eval_fn)):
+        ind.fitness.values = eval_result.reward,
 
   if not has_checkpoint:
     # Evaluate the individuals with an invalid fitness
     invalid_ind = [ind for ind in population if not ind.fitness.valid]
-    for ind in invalid_ind:
-      ind.fitness.values = task_eval_fn(ind).reward,
+    for ind, eval_result in zip(invalid_ind, _evaluate_individuals(
+        invalid_ind, task_eval_fn, task_batch_eval_fn)):
+      ind.fitness.values = eval_result.reward,
 
     if halloffame is not None:
       for ind in population:
@@ -330,15 +366,18 @@ def ga_loop(population, cxpb, mutpb, ngen, task_eval_fn, halloffame=None,
 
     # Evaluate the individuals with an invalid fitness
     invalid_ind = [ind for ind in offspring if not ind.fitness.valid]
+    uncached_ind = []
     for ind in invalid_ind:
       str_repr = ''.join(ind)
       if program_reward_cache is not None and str_repr in program_reward_cache:
         ind.fitness.values = (program_reward_cache[str_repr],)
       else:
-        eval_result = task_eval_fn(ind)
-        ind.fitness.values = (eval_result.reward,)
-        if program_reward_cache is not None:
-          program_reward_cache[str_repr] = eval_result.reward
+        uncached_ind.append(ind)
+    for ind, eval_result in zip(uncached_ind, _evaluate_individuals(
+        uncached_ind, task_eval_fn, task_batch_eval_fn)):
+      ind.fitness.values = (eval_result.reward,)
+      if program_reward_cache is not None:
+        program_reward_cache[''.join(ind)] = eval_result.reward
 
     # Replace the current population by the offspring
     population = list(offspring)
@@ -187,8 +187,11 @@ def run_training(config=None, tuner=None, logdir=None, trial_name=None,  # pylin
     checkpoint_writer = CheckpointWriter(run_dir,
                                          population_size=config.batch_size)
 
-    data_manager = data.DataManager(config, run_number=global_rep)
+    data_manager = data.DataManager(
+        config, run_number=global_rep,
+        num_scoring_processes=FLAGS.num_scoring_processes)
     task_eval_fn = ga_lib.make_task_eval_fn(data_manager.rl_task)
+    task_batch_eval_fn = ga_lib.make_task_batch_eval_fn(data_manager.rl_task)
 
     if config.agent.algorithm == 'rand':
       logging.info('Running random search.')
@@ -207,8 +210,10 @@ def run_training(config=None, tuner=None, logdir=None, trial_name=None,  # pylin
           cxpb=config.agent.crossover_rate, mutpb=config.agent.mutation_rate,
           task_eval_fn=task_eval_fn,
           ngen=max_generations, halloffame=hof,
-          checkpoint_writer=checkpoint_writer)
+          checkpoint_writer=checkpoint_writer,
+          task_batch_eval_fn=task_batch_eval_fn)
 
+    data_manager.close()
     logging.info('Finished rep. Num gens: %d', result.generations)
 
     results_dict = {
@@ -144,7 +144,8 @@ class AsyncTrainer(object):
     self.config = config
     self.data_manager = data.DataManager(
         config, run_number=run_number,
-        do_code_simplification=not FLAGS.stop_on_success)
+        do_code_simplification=not FLAGS.stop_on_success,
+        num_scoring_processes=FLAGS.num_scoring_processes)
     self.task_id = task_id
     self.ps_tasks = ps_tasks
     self.is_chief = is_chief
@@ -666,6 +667,7 @@ def train(config, is_chief, tuner=None, run_dir=None, run_number=0,
     logging.info('Supervisor timed out. Quitting.')
   else:
     logging.info('Reached %s steps. Worker stopped.', global_step)
+  trainer.data_manager.close()
 
   # Dump profiling.
   """
@@ -59,6 +59,10 @@ flags.DEFINE_string(
     'logdir', None, 'Absolute path where to write results.')
 flags.DEFINE_integer('task_id', 0, 'ID for this worker.')
 flags.DEFINE_integer('num_workers', 1, 'How many workers there are.')
+flags.DEFINE_integer(
+    'num_scoring_processes', 0,
+    'Number of processes each worker uses to run the sampled programs on the '
+    'test cases. Set to 0 or 1 to run them in the worker process.')
 flags.DEFINE_integer(
     'max_npe', 0,
     'NPE = number of programs executed. Maximum number of programs to execute '
@@ -37,9 +37,6 @@ import os
 import re
 import matplotlib.pyplot as plt
 
-import graph_tool as gt
-import graph_tool.topology
-
 from tensorflow.python.platform import gfile
 import logging
 import src.file_utils as fu
@@ -54,7 +51,8 @@ import cv2
 label_nodes_with_class           = gu.label_nodes_with_class
 label_nodes_with_class_geodesic  = gu.label_nodes_with_class_geodesic
 get_distance_node_list           = gu.get_distance_node_list
-convert_to_graph_tool            = gu.convert_to_graph_tool
+get_optimal_action_table         = gu.get_optimal_action_table
+unpack_action_masks              = gu.unpack_action_masks
 generate_graph                   = gu.generate_graph
 get_hardness_distribution        = gu.get_hardness_distribution
 rng_next_goal_rejection_sampling = gu.rng_next_goal_rejection_sampling
@@ -74,6 +72,7 @@ get_map_to_predict               = mu.get_map_to_predict
 bin_points                       = du.bin_points
 make_geocentric                  = du.make_geocentric
 get_point_cloud_from_z           = du.get_point_cloud_from_z
+get_geocentric_point_cloud_from_z = du.get_geocentric_point_cloud_from_z
 get_camera_matrix                = du.get_camera_matrix
 
 def _get_semantic_maps(folder_name, building_name, map, flip):
@@ -301,31 +300,19 @@ class GridWorld():
 
   def get_feasible_actions(self, node_ids):
     """Returns the feasible set of actions from the current node."""
-    a = np.zeros((len(node_ids), self.task_params.num_actions), dtype=np.int32)
-    gtG = self.task.gtG
-    next_node = []
-    for i, c in enumerate(node_ids):
-      neigh = gtG.vertex(c).out_neighbours()
-      neigh_edge = gtG.vertex(c).out_edges()
-      nn = {}
-      for n, e in zip(neigh, neigh_edge):
-        _ = gtG.ep['action'][e]
-        a[i,_] = 1
-        nn[_] = int(n)
-      next_node.append(nn)
+    next_node_ids, feasible = self.task.graph.transition_table(
+        self.task_params.num_actions)
+    a = feasible[node_ids,:].astype(np.int32)
+    next_node = [dict(zip(np.where(f)[0].tolist(), n[f].tolist()))
+                 for f, n in zip(feasible[node_ids,:], next_node_ids[node_ids,:])]
     return a, next_node
 
   def take_action(self, current_node_ids, action):
     """Returns the new node after taking the action action. Stays at the current
     node if the action is invalid."""
-    actions, next_node_ids = self.get_feasible_actions(current_node_ids)
-    new_node_ids = []
-    for i, (c,a) in enumerate(zip(current_node_ids, action)):
-      if actions[i,a] == 1:
-        new_node_ids.append(next_node_ids[i][a])
-      else:
-        new_node_ids.append(c)
-    return new_node_ids
+    next_node_ids, _ = self.task.graph.transition_table(
+        self.task_params.num_actions)
+    return next_node_ids[current_node_ids, action].tolist()
 
   def set_r_obj(self, r_obj):
     """Sets the SwiftshaderRenderer object used for rendering."""
@@ -467,13 +454,11 @@ class MeshMapper(Building):
       G = generate_graph(self.valid_fn_vec,
                                   self.task_params.step_size, self.task.n_ori,
                                   (0, 0, 0))
-      gtG, nodes, nodes_to_id = convert_to_graph_tool(G)
-      self.task.gtG = gtG
-      self.task.nodes = nodes
+      self.task.graph = G
+      self.task.nodes = G.nodes
       self.task.delta_theta = 2.0*np.pi/(self.task.n_ori*1.)
-      self.task.nodes_to_id = nodes_to_id
       logging.info('Building %s, #V=%d, #E=%d', self.building_name,
-                   self.task.nodes.shape[0], self.task.gtG.num_edges())
+                   self.task.nodes.shape[0], self.task.graph.num_edges())
 
       if self.logdir is not None:
         write_traversible = cv2.applyColorMap(self.traversible.astype(np.uint8)*255, cv2.COLORMAP_JET)
@@ -488,7 +473,7 @@ class MeshMapper(Building):
         ax.set_axis_off(); ax.axis('equal');
         ax.set_title('{:s}, {:d}, {:d}'.format(self.building_name,
                                                self.task.nodes.shape[0],
-                                               self.task.gtG.num_edges()))
+                                               self.task.graph.num_edges()))
         if self.room_dims is not None:
           for i, r in enumerate(self.room_dims['dims']*1):
             min_ = r[:3]*1
@@ -507,7 +492,7 @@ class MeshMapper(Building):
     # instances is a list of list of node_ids.
     if self.task_params.move_type == 'circle':
       _, _, _, _, paths = rng_target_dist_field(self.task_params.batch_size,
-                                                self.task.gtG, rng, 0, 1,
+                                                self.task.graph, rng, 0, 1,
                                                 compute_path=True)
       instances_ = paths
 
@@ -520,7 +505,7 @@ class MeshMapper(Building):
 
     elif self.task_params.move_type == 'shortest_path':
       _, _, _, _, paths = rng_target_dist_field(self.task_params.batch_size,
-                                                self.task.gtG, rng,
+                                                self.task.graph, rng,
                                                 self.task_params.num_steps,
                                                 self.task_params.num_steps+1,
                                                 compute_path=True)
@@ -528,7 +513,7 @@ class MeshMapper(Building):
 
     elif self.task_params.move_type == 'circle+forward':
       _, _, _, _, paths = rng_target_dist_field(self.task_params.batch_size,
-                                                self.task.gtG, rng, 0, 1,
+                                                self.task.graph, rng, 0, 1,
                                                 compute_path=True)
       instances_ = paths
       instances = []
@@ -673,13 +658,13 @@ class MeshMapper(Building):
       inputs['theta_on_map'] = np.pi/2. - inputs['theta_on_map']
     return inputs
 
-def _nav_env_reset_helper(type, rng, nodes, batch_size, gtG, max_dist,
+def _nav_env_reset_helper(type, rng, nodes, batch_size, graph, max_dist,
                           num_steps, num_goals, data_augment, **kwargs):
   """Generates and returns a new episode."""
   max_compute = max_dist + 4*num_steps
   if type == 'general':
     start_node_ids, end_node_ids, dist, pred_map, paths = \
-        rng_target_dist_field(batch_size, gtG, rng, max_dist, max_compute,
+        rng_target_dist_field(batch_size, graph, rng, max_dist, max_compute,
                               nodes=nodes, compute_path=False)
     target_class = None
 
@@ -688,14 +673,14 @@ def _nav_env_reset_helper(type, rng, nodes, batch_size, gtG, max_dist,
     node_room_ids = kwargs['node_room_ids']
     # Sample the first one
     start_node_ids_, end_node_ids_, dist_, _, _ = rng_room_to_room(
-        batch_size, gtG, rng, max_dist, max_compute,
+        batch_size, graph, rng, max_dist, max_compute,
         node_room_ids=node_room_ids, nodes=nodes)
     start_node_ids = start_node_ids_
     goal_node_ids.append(end_node_ids_)
     dists.append(dist_)
     for n in range(num_goals-1):
       start_node_ids_, end_node_ids_, dist_, _, _ = rng_next_goal(
-          goal_node_ids[n], batch_size, gtG, rng, max_dist,
+          goal_node_ids[n], batch_size, graph, rng, max_dist,
           max_compute, node_room_ids=node_room_ids, nodes=nodes,
           dists_from_start_node=dists[n])
       goal_node_ids.append(end_node_ids_)
@@ -718,7 +703,7 @@ def _nav_env_reset_helper(type, rng, nodes, batch_size, gtG, max_dist,
       if n == 0: input_nodes = None
       else: input_nodes = goal_node_ids[n-1]
       start_node_ids_, end_node_ids_, dist_, _, _, _, _ = rng_next_goal_rejection_sampling(
-              input_nodes, batch_size, gtG, rng, max_dist, min_dist,
+              input_nodes, batch_size, graph, rng, max_dist, min_dist,
               max_compute, sampling_distribution, target_distribution, nodes,
               n_ori, step_size, distribution_bins, rejection_sampling_M)
       if n == 0: start_node_ids = start_node_ids_
@@ -733,7 +718,7 @@ def _nav_env_reset_helper(type, rng, nodes, batch_size, gtG, max_dist,
     node_room_ids = kwargs['node_room_ids']
     # Sample the first one.
     start_node_ids_, end_node_ids_, dist_, _, _ = rng_room_to_room(
-        batch_size, gtG, rng, max_dist, max_compute,
+        batch_size, graph, rng, max_dist, max_compute,
         node_room_ids=node_room_ids, nodes=nodes)
     start_node_ids = start_node_ids_
     goal_node_ids.append(end_node_ids_)
@@ -743,10 +728,7 @@ def _nav_env_reset_helper(type, rng, nodes, batch_size, gtG, max_dist,
     goal_node_ids.append(start_node_ids)
     dist = []
     for i in range(batch_size):
-      dist_ = gt.topology.shortest_distance(
-          gt.GraphView(gtG, reversed=True),
-          source=gtG.vertex(start_node_ids[i]), target=None)
-      dist_ = np.array(dist_.get_array())
+      dist_ = graph.shortest_distance(start_node_ids[i], reverse=True)
       dist.append(dist_)
     dists.append(dist)
     target_class = None
@@ -795,7 +777,7 @@ class NavigationEnv(GridWorld, Building):
     rng = np.random.RandomState(0)
     start_node_ids, end_node_ids, dists, pred_maps, paths, hardnesss, gt_dists = \
       rng_next_goal_rejection_sampling(
-          None, batch_size, self.task.gtG, rng, self.task_params.max_dist,
+          None, batch_size, self.task.graph, rng, self.task_params.max_dist,
           self.task_params.min_dist, self.task_params.max_dist,
           self.task.sampling_distribution, self.task.target_distribution,
           self.task.nodes, self.task_params.n_ori, self.task_params.step_size,
@@ -862,14 +844,12 @@ class NavigationEnv(GridWorld, Building):
                             n_ori=self.task_params.n_ori)
       G = generate_graph(self.valid_fn_vec, self.task_params.step_size,
                          self.task.n_ori, (0, 0, 0))
-      gtG, nodes, nodes_to_id = convert_to_graph_tool(G)
-      self.task.gtG = gtG
-      self.task.nodes = nodes
+      self.task.graph = G
+      self.task.nodes = G.nodes
       self.task.delta_theta = 2.0*np.pi/(self.task.n_ori*1.)
-      self.task.nodes_to_id = nodes_to_id
 
       logging.info('Building %s, #V=%d, #E=%d', self.building_name,
-                   self.task.nodes.shape[0], self.task.gtG.num_edges())
+                   self.task.nodes.shape[0], self.task.graph.num_edges())
       type = self.task_params.type
       if type == 'general':
         # Do nothing
@@ -892,7 +872,7 @@ class NavigationEnv(GridWorld, Building):
         target_d = np.zeros(n_bins); target_d[...] = 1./n_bins;
 
         sampling_d = get_hardness_distribution(
-            self.task.gtG, self.task_params.max_dist, self.task_params.min_dist,
+            self.task.graph, self.task_params.max_dist, self.task_params.min_dist,
             np.random.RandomState(0), 4000, bins, self.task.nodes,
             self.task_params.n_ori, self.task_params.step_size)
 
@@ -930,11 +910,8 @@ class NavigationEnv(GridWorld, Building):
             self.task_params.semantic_task.pix_distance+8, self.map.traversible,
             ff_cost=1., fo_cost=1., oo_cost=4., connectivity=8.)
 
-        dists = []
-        for i in range(len(self.class_map_names)):
-          class_nodes_ = np.where(self.task.node_class_label[:,i])[0]
-          dists.append(get_distance_node_list(gtG, source_nodes=class_nodes_, direction='to'))
-        self.task.dist_to_class = dists
+        self.task.dist_to_class, self.task.optimal_action_to_class = \
+            self._get_class_tables(seed)
         a_, b_ = np.where(self.task.node_class_label)
         self.task.class_nodes = np.concatenate((a_[:,np.newaxis], b_[:,np.newaxis]), axis=1)
         
@@ -948,6 +925,62 @@ class NavigationEnv(GridWorld, Building):
       if self.logdir is not None:
         self._debug_save_map_nodes(seed)
 
+  def _get_class_tables(self, seed):
+    """Returns the distance of every node to each class, and the bitmask of
+    optimal actions towards each class at every node. Tables are loaded from
+    task_params.cache_dir if it is set and they were cached there, and are
+    cached there otherwise. The file name holds the parameters the tables
+    depend on, and the cached nodes and class labels must match the current
+    ones for the tables to be reused."""
+    tp = self.task_params
+    file_name = None
+    if getattr(tp, 'cache_dir', None) is not None:
+      file_name = '{:s}_{:d}_{:d}_{:d}_{:d}_{:d}_{:s}_{:d}_{:s}.pkl'.format(
+          self.building_name, int(self.flipped), seed, tp.n_ori, tp.step_size,
+          tp.num_actions, tp.type, tp.semantic_task.pix_distance,
+          '-'.join(self.class_map_names))
+      file_name = os.path.join(tp.cache_dir, file_name)
+      if fu.exists(file_name):
+        a = utils.load_variables(file_name)
+        if (np.array_equal(a['nodes'], self.task.nodes) and
+            np.array_equal(a['node_class_label'], self.task.node_class_label)):
+          logging.info('Loaded class distances from %s.', file_name)
+          return a['dist_to_class'], a['optimal_action_to_class']
+        logging.info('Ignoring stale class distances in %s.', file_name)
+
+    next_node_ids, feasible = self.task.graph.transition_table(tp.num_actions)
+    dists = []; optimal_actions = [];
+    for i in range(len(self.class_map_names)):
+      class_nodes_ = np.where(self.task.node_class_label[:,i])[0]
+      dists.append(get_distance_node_list(self.task.graph,
+                                          source_nodes=class_nodes_,
+                                          direction='to'))
+      optimal_actions.append(get_optimal_action_table(next_node_ids, feasible,
+                                                      dists[-1]))
+
+    if file_name is not None:
+      # Write to a temporary file first, workers may read this file anytime.
+      utils.mkdir_if_missing(tp.cache_dir)
+      tmp_file_name = '{:s}.{:d}.tmp'.format(file_name, os.getpid())
+      utils.save_variables(tmp_file_name,
+                           [dists, optimal_actions, self.task.nodes,
+                            self.task.node_class_label],
+                           ['dist_to_class', 'optimal_action_to_class',
+                            'nodes', 'node_class_label'], overwrite=True)
+      fu.rename(tmp_file_name, file_name, True)
+    return dists, optimal_actions
+
+  def _get_optimal_actions(self, dists, target_class):
+    """Returns for each goal the batch_size x num_nodes bitmask of optimal
+    actions towards it."""
+    if target_class is not None:
+      tables = self.task.optimal_action_to_class
+      return [np.array([tables[t] for t in target_class])]
+    next_node_ids, feasible = self.task.graph.transition_table(
+        self.task_params.num_actions)
+    return [np.array([get_optimal_action_table(next_node_ids, feasible, d)
+                      for d in dists_]) for dists_ in dists]
+
   def reset(self, rngs):
     rng = rngs[0]; rng_perturb = rngs[1];
     nodes = self.task.nodes
@@ -955,7 +988,7 @@ class NavigationEnv(GridWorld, Building):
 
     start_node_ids, goal_node_ids, dists, target_class = \
         _nav_env_reset_helper(tp.type, rng, self.task.nodes, tp.batch_size,
-                              self.task.gtG, tp.max_dist, tp.num_steps,
+                              self.task.graph, tp.max_dist, tp.num_steps,
                               tp.num_goals, tp.data_augment,
                               **(self.task.reset_kwargs))
 
@@ -971,11 +1004,13 @@ class NavigationEnv(GridWorld, Building):
     perturbs = perturbs[:,:-(tp.num_goals),:]*1
 
     history = -np.ones((tp.batch_size, tp.num_steps*tp.num_goals), dtype=np.int32)
+    optimal_actions = self._get_optimal_actions(dists, target_class)
     self.episode = utils.Foo(
         start_nodes=start_nodes, start_node_ids=start_node_ids,
         goal_nodes=goal_nodes, goal_node_ids=goal_node_ids, dist_to_goal=dists,
-        perturbs=perturbs, goal_perturbs=end_perturbs, history=history,
-        target_class=target_class, history_frames=[])
+        optimal_actions=optimal_actions, perturbs=perturbs,
+        goal_perturbs=end_perturbs, history=history, target_class=target_class,
+        history_frames=[])
     return start_node_ids
 
   def take_action(self, current_node_ids, action, step_number):
@@ -983,32 +1018,19 @@ class NavigationEnv(GridWorld, Building):
     agent receives."""
     goal_number = step_number / self.task_params.num_steps
     new_node_ids = GridWorld.take_action(self, current_node_ids, action)
-    rewards = []
-    for i, n in enumerate(new_node_ids):
-      reward = 0
-      if n == self.episode.goal_node_ids[goal_number][i]:
-        reward = self.task_params.reward_at_goal
-      reward = reward - self.task_params.reward_time_penalty
-      rewards.append(reward)
-    return new_node_ids, rewards
+    at_goal = np.array(new_node_ids) == \
+        np.array(self.episode.goal_node_ids[goal_number])
+    rewards = at_goal*self.task_params.reward_at_goal - \
+        self.task_params.reward_time_penalty
+    return new_node_ids, rewards.tolist()
 
 
   def get_optimal_action(self, current_node_ids, step_number):
     """Returns the optimal action from the current node."""
     goal_number = step_number / self.task_params.num_steps
-    gtG = self.task.gtG
-    a = np.zeros((len(current_node_ids), self.task_params.num_actions), dtype=np.int32)
-    d_dict = self.episode.dist_to_goal[goal_number]
-    for i, c in enumerate(current_node_ids):
-      neigh = gtG.vertex(c).out_neighbours()
-      neigh_edge = gtG.vertex(c).out_edges()
-      ds = np.array([d_dict[i][int(x)] for x in neigh])
-      ds_min = np.min(ds)
-      for i_, e in enumerate(neigh_edge):
-        if ds[i_] == ds_min:
-          _ = gtG.ep['action'][e]
-          a[i, _] = 1
-    return a
+    masks = self.episode.optimal_actions[goal_number]
+    masks = masks[np.arange(len(current_node_ids)), current_node_ids]
+    return unpack_action_masks(masks, self.task_params.num_actions)
 
   def get_targets(self, current_node_ids, step_number):
     """Returns the target actions from the current node."""
@@ -1162,12 +1184,12 @@ class VisualNavigationEnv(NavigationEnv):
       cm = get_camera_matrix(self.task_params.img_width,
                              self.task_params.img_height,
                              self.task_params.img_fov)
-      XYZ = get_point_cloud_from_z(100./d[...,0], cm)
-      XYZ = make_geocentric(XYZ*100., self.robot.sensor_height,
-                                      self.robot.camera_elevation_degree)
+      XYZ = get_geocentric_point_cloud_from_z(
+          10000./d[...,0], cm, self.robot.sensor_height,
+          self.robot.camera_elevation_degree)
       for i in range(len(self.task_params.analytical_counts.map_sizes)):
         non_linearity = self.task_params.analytical_counts.non_linearity[i]
-        count, isvalid = bin_points(XYZ*1.,
+        count, isvalid = bin_points(XYZ,
                                     map_size=self.task_params.analytical_counts.map_sizes[i],
                                     xy_resolution=self.task_params.analytical_counts.xy_resolution[i],
                                     z_bins=self.task_params.analytical_counts.z_bins[i])
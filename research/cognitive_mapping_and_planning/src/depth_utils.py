@@ -14,9 +14,21 @@
 # ==============================================================================
 
 """Utilities for processing depth images.
+
+Batches of depth images are projected with array operations over the whole
+batch: pixel ray grids are cached per camera, and points of all images are
+binned with a single bincount. Pass float32 depth images and dtype=np.float32
+to keep the computation in single precision.
 """
 import numpy as np
 import src.rotation_utils as ru 
+import src.utils as utils
+
+# Pixel ray grids, keyed by image size, camera matrix, elevation and dtype.
+_ray_grids = {}
+
+# Number of points whose bin indices are computed at once by bin_points.
+_BIN_BLOCK_SIZE = 1 << 14
 
 def get_camera_matrix(width, height, fov):
   """Returns a camera matrix from image size and fov."""
@@ -26,26 +38,60 @@ def get_camera_matrix(width, height, fov):
   camera_matrix = utils.Foo(xc=xc, zc=zc, f=f)
   return camera_matrix
 
-def get_point_cloud_from_z(Y, camera_matrix):
+def _get_ray_grid(height, width, camera_matrix, camera_elevation_degree,
+                  dtype):
+  """Returns the HxWx3 grid of rays (x-xc)/f, 1, (z-zc)/f of the camera,
+  rotated by the camera elevation. Scaled by depth, these give the point cloud
+  of a depth image. Grids are cached."""
+  key = (height, width, camera_matrix.xc, camera_matrix.zc, camera_matrix.f,
+         camera_elevation_degree, np.dtype(dtype).str)
+  if key not in _ray_grids:
+    x, z = np.meshgrid(np.arange(width), np.arange(height-1, -1, -1))
+    rays = np.concatenate((((x-camera_matrix.xc) / camera_matrix.f)[...,np.newaxis],
+                           np.ones((height, width, 1)),
+                           ((z-camera_matrix.zc) / camera_matrix.f)[...,np.newaxis]),
+                          axis=2)
+    if camera_elevation_degree != 0:
+      R = ru.get_r_matrix([1.,0.,0.], angle=np.deg2rad(camera_elevation_degree))
+      rays = np.matmul(rays, R.T)
+    _ray_grids[key] = rays.astype(dtype)
+  return _ray_grids[key]
+
+def get_point_cloud_from_z(Y, camera_matrix, dtype=np.float64):
   """Projects the depth image Y into a 3D point cloud.
   Inputs:
     Y is ...xHxW
     camera_matrix
+    dtype of the output.
   Outputs:
     X is positive going right
     Y is positive into the image
     Z is positive up in the image
     XYZ is ...xHxWx3
   """
-  x, z = np.meshgrid(np.arange(Y.shape[-1]),
-                     np.arange(Y.shape[-2]-1, -1, -1))
-  for i in range(Y.ndim-2):
-    x = np.expand_dims(x, axis=0)
-    z = np.expand_dims(z, axis=0)
-  X = (x-camera_matrix.xc) * Y / camera_matrix.f
-  Z = (z-camera_matrix.zc) * Y / camera_matrix.f
-  XYZ = np.concatenate((X[...,np.newaxis], Y[...,np.newaxis],
-                        Z[...,np.newaxis]), axis=X.ndim)
+  rays = _get_ray_grid(Y.shape[-2], Y.shape[-1], camera_matrix, 0, dtype)
+  return np.asarray(Y, dtype=dtype)[...,np.newaxis] * rays
+
+def get_geocentric_point_cloud_from_z(Y, camera_matrix, sensor_height,
+                                      camera_elevation_degree,
+                                      dtype=np.float64):
+  """Projects the depth image Y into a 3D point cloud in the geocentric
+  coordinate frame, same as make_geocentric(get_point_cloud_from_z(Y,
+  camera_matrix), sensor_height, camera_elevation_degree), with the rotation
+  folded into the cached ray grid.
+  Inputs:
+    Y is ...xHxW
+    camera_matrix
+    sensor_height           : height of the sensor
+    camera_elevation_degree : camera elevation to rectify.
+    dtype of the output.
+  Outputs:
+    XYZ is ...xHxWx3
+  """
+  rays = _get_ray_grid(Y.shape[-2], Y.shape[-1], camera_matrix,
+                       camera_elevation_degree, dtype)
+  XYZ = np.asarray(Y, dtype=dtype)[...,np.newaxis] * rays
+  XYZ[...,2] += sensor_height
   return XYZ
 
 def make_geocentric(XYZ, sensor_height, camera_elevation_degree):
@@ -58,38 +104,68 @@ def make_geocentric(XYZ, sensor_height, camera_elevation_degree):
     XYZ : ...x3
   """
   R = ru.get_r_matrix([1.,0.,0.], angle=np.deg2rad(camera_elevation_degree))
+  R = R.astype(XYZ.dtype)
   XYZ = np.matmul(XYZ.reshape(-1,3), R.T).reshape(XYZ.shape)
   XYZ[...,2] = XYZ[...,2] + sensor_height
   return XYZ
 
+def accumulate_bins(ind, num_bins, wt=None, isvalid=None):
+  """Sums wt (or counts points) into bins, separately for each image.
+  Inputs:
+    ind: ... x N bin index of each point, leading dimensions index images.
+    num_bins: number of bins per image.
+    wt: ... x N weight of each point, or None to count points.
+    isvalid: ... x N, points where this is False are dropped, their ind need
+      not be valid.
+  Output:
+    ... x num_bins sums, float64 if wt is None, otherwise of the type of wt.
+  """
+  sh = ind.shape
+  num_images = int(np.prod(sh[:-1]))
+  # Offset bins of each image, so that one bincount covers the batch.
+  offsets = np.arange(num_images, dtype=np.int64)*num_bins
+  ind = (ind.reshape(num_images, sh[-1]) + offsets[:,np.newaxis]).ravel()
+  if wt is not None:
+    wt = wt.ravel()
+  if isvalid is not None:
+    isvalid = isvalid.ravel()
+    ind = ind[isvalid]
+    if wt is not None:
+      wt = wt[isvalid]
+  counts = np.bincount(ind, wt, minlength=num_images*num_bins)
+  counts = counts.astype(np.float64 if wt is None else wt.dtype, copy=False)
+  return counts.reshape(sh[:-1] + (num_bins,))
+
 def bin_points(XYZ_cms, map_size, z_bins, xy_resolution):
   """Bins points into xy-z bins
   XYZ_cms is ... x H x W x3
-  Outputs is ... x map_size x map_size x (len(z_bins)+1)
+  Outputs is ... x map_size x map_size x (len(z_bins)+1), of the type of
+  XYZ_cms
   """
   sh = XYZ_cms.shape
-  XYZ_cms = XYZ_cms.reshape([-1, sh[-3], sh[-2], sh[-1]])
   n_z_bins = len(z_bins)+1
   map_center = (map_size-1.)/2.
-  counts = []
-  isvalids = []
-  for XYZ_cm in XYZ_cms:
-    isnotnan = np.logical_not(np.isnan(XYZ_cm[:,:,0]))
-    X_bin = np.round(XYZ_cm[:,:,0] / xy_resolution + map_center).astype(np.int32)
-    Y_bin = np.round(XYZ_cm[:,:,1] / xy_resolution + map_center).astype(np.int32)
-    Z_bin = np.digitize(XYZ_cm[:,:,2], bins=z_bins).astype(np.int32)
+  XYZ = XYZ_cms.reshape(-1, 3)
+  isvalid = np.empty(XYZ.shape[0], dtype=np.bool_)
+  ind = np.empty(XYZ.shape[0], dtype=np.int64)
+  # Bin indices are computed in blocks that fit in cache.
+  for s in range(0, XYZ.shape[0], _BIN_BLOCK_SIZE):
+    XYZ_cm = XYZ[s:s+_BIN_BLOCK_SIZE]
+    X_bin = np.round(XYZ_cm[:,0] / xy_resolution + map_center).astype(np.int32)
+    Y_bin = np.round(XYZ_cm[:,1] / xy_resolution + map_center).astype(np.int32)
+    Z_bin = np.digitize(XYZ_cm[:,2], bins=z_bins).astype(np.int32)
 
-    isvalid = np.array([X_bin >= 0, X_bin < map_size, Y_bin >= 0, Y_bin < map_size,
-                        Z_bin >= 0, Z_bin < n_z_bins, isnotnan])
-    isvalid = np.all(isvalid, axis=0)
+    isvalid_ = isvalid[s:s+_BIN_BLOCK_SIZE]
+    np.logical_not(np.isnan(XYZ_cm[:,0]), out=isvalid_)
+    isvalid_ &= X_bin >= 0; isvalid_ &= X_bin < map_size;
+    isvalid_ &= Y_bin >= 0; isvalid_ &= Y_bin < map_size;
+    ind[s:s+_BIN_BLOCK_SIZE] = (Y_bin * map_size + X_bin) * n_z_bins + Z_bin
 
-    ind = (Y_bin * map_size + X_bin) * n_z_bins + Z_bin
-    ind[np.logical_not(isvalid)] = 0
-    count = np.bincount(ind.ravel(), isvalid.ravel().astype(np.int32),
-                         minlength=map_size*map_size*n_z_bins)
-    count = np.reshape(count, [map_size, map_size, n_z_bins])
-    counts.append(count)
-    isvalids.append(isvalid)
-  counts = np.array(counts).reshape(list(sh[:-3]) + [map_size, map_size, n_z_bins])
-  isvalids = np.array(isvalids).reshape(list(sh[:-3]) + [sh[-3], sh[-2], 1])
+  n = sh[-3]*sh[-2]
+  counts = accumulate_bins(ind.reshape(sh[:-3] + (n,)),
+                           map_size*map_size*n_z_bins,
+                           isvalid=isvalid.reshape(sh[:-3] + (n,)))
+  counts = counts.astype(XYZ_cms.dtype, copy=False)
+  counts = counts.reshape(sh[:-3] + (map_size, map_size, n_z_bins))
+  isvalids = isvalid.reshape(sh[:-3] + (sh[-3], sh[-2], 1))
   return counts, isvalids
@@ -14,102 +14,240 @@
 # ==============================================================================
 
 """Various function to manipulate graphs for computing distances.
+
+Graphs are NavGraph objects, which keep node coordinates in an array and edges
+in compressed sparse row (CSR) format. Graphs are generated and searched a
+whole frontier of nodes at a time, with array operations.
 """
 import skimage.morphology
 import numpy as np
-import networkx as nx
-import itertools
-import graph_tool as gt
-import graph_tool.topology
-import graph_tool.generation 
 import src.utils as utils
 
-# Compute shortest path from all nodes to or from all source nodes
-def get_distance_node_list(gtG, source_nodes, direction, weights=None):
-  gtG_ = gt.Graph(gtG)
-  v = gtG_.add_vertex()
-  
-  if weights is not None:
-    weights = gtG_.edge_properties[weights]
-  
-  for s in source_nodes:
-    e = gtG_.add_edge(s, int(v))
+# Distance of the nodes that an unweighted search does not reach.
+_INT_INF = np.iinfo(np.int32).max
+
+# Forward step in lattice units for each orientation, keyed by n_ori.
+_FORWARD_OFFSETS = {
+    4: np.array([[1, 0], [0, 1], [-1, 0], [0, -1]]),
+    6: np.array([[1, 0], [1, 1], [0, 1], [-1, 0], [-1, -1], [0, -1]])}
+
+# Steps in lattice units, and their actions, in undirected graphs.
+_UNDIRECTED_OFFSETS = np.array([[-1, 0], [1, 0], [0, -1], [0, 1]])
+_UNDIRECTED_ACTIONS = np.array([1, 2, 3, 4])
+
+def _gather_edges(indptr, node_ids):
+  """Returns the out-going edges of node_ids as (rows, edge ids), where rows
+  index into node_ids."""
+  starts = indptr[node_ids]
+  counts = indptr[node_ids+1] - starts
+  rows = np.repeat(np.arange(node_ids.size), counts)
+  edges = np.arange(rows.size) + np.repeat(starts - np.cumsum(counts) + counts,
+                                           counts)
+  return rows, edges
+
+def _bfs(indptr, indices, sources, max_dist):
+  """Breadth first search from all sources at once, one level at a time."""
+  dist = np.empty(indptr.size-1, dtype=np.int32)
+  dist[:] = _INT_INF
+  pred = np.arange(indptr.size-1)
+  dist[sources] = 0
+  frontier = sources
+  d = 0
+  while frontier.size > 0 and (max_dist is None or d < max_dist):
+    rows, edges = _gather_edges(indptr, frontier)
+    tgts = indices[edges]
+    unseen = dist[tgts] == _INT_INF
+    srcs = frontier[rows[unseen]]
+    frontier, first = np.unique(tgts[unseen], return_index=True)
+    d = d + 1
+    dist[frontier] = d
+    pred[frontier] = srcs[first]
+  return dist, pred
+
+def _label_correcting(indptr, indices, weights, sources, max_dist):
+  """Shortest paths with non-negative edge weights from all sources at once.
+  Relaxes the out-going edges of all nodes whose distance improved in the
+  previous round, until no distance improves."""
+  dist = np.empty(indptr.size-1, dtype=np.float64)
+  dist[:] = np.inf
+  pred = np.arange(indptr.size-1)
+  dist[sources] = 0.
+  frontier = sources
+  while frontier.size > 0:
+    rows, edges = _gather_edges(indptr, frontier)
+    srcs = frontier[rows]
+    tgts = indices[edges]
+    d = dist[srcs] + weights[edges]
+    better = d < dist[tgts]
+    if max_dist is not None:
+      better = np.logical_and(better, d <= max_dist)
+    srcs = srcs[better]; tgts = tgts[better]; d = d[better];
+    # Keep the best candidate for each target.
+    order = np.lexsort((d, tgts))
+    srcs = srcs[order]; tgts = tgts[order]; d = d[order];
+    first = np.ones(tgts.size, dtype=np.bool_)
+    first[1:] = tgts[1:] != tgts[:-1]
+    frontier = tgts[first]
+    dist[frontier] = d[first]
+    pred[frontier] = srcs[first]
+  return dist, pred
+
+class NavGraph(object):
+  """Directed graph with node coordinates in an array and out-going edges in
+  compressed sparse row format.
+
+  Attributes:
+    nodes: num_vertices x D array of node coordinates, (x, y, theta) for
+      navigation graphs.
+    indptr: edges indptr[i]:indptr[i+1] are the out-going edges of node i.
+    indices: target node of each edge.
+    actions: action that moves the agent along each edge, or None.
+    weights: length of each edge, or None for unit lengths.
+  """
+  def __init__(self, nodes, sources, targets, actions=None, weights=None):
+    self.nodes = nodes
+    sources = np.asarray(sources, dtype=np.int64)
+    order = np.argsort(sources, kind='mergesort')
+    counts = np.bincount(sources, minlength=nodes.shape[0])
+    self.indptr = np.concatenate(([0], np.cumsum(counts)))
+    self.indices = np.asarray(targets, dtype=np.int64)[order]
+    self.actions = None
+    if actions is not None:
+      self.actions = np.asarray(actions, dtype=np.int32)[order]
+    self.weights = None
     if weights is not None:
-      weights[e] = 0.
-
-  if direction == 'to':
-    dist = gt.topology.shortest_distance(
-        gt.GraphView(gtG_, reversed=True), source=gtG_.vertex(int(v)),
-        target=None, weights=weights)
-  elif direction == 'from':
-    dist = gt.topology.shortest_distance(
-        gt.GraphView(gtG_, reversed=False), source=gtG_.vertex(int(v)),
-        target=None, weights=weights)
-  dist = np.array(dist.get_array())
-  dist = dist[:-1]
-  if weights is None:
-    dist = dist-1
-  return dist
-
-# Functions for semantically labelling nodes in the traversal graph.
-def generate_lattice(sz_x, sz_y):
-  """Generates a lattice with sz_x vertices along x and sz_y vertices along y
-  direction Each of these vertices is step_size distance apart. Origin is at
-  (0,0).  """
-  g = gt.generation.lattice([sz_x, sz_y])
-  x, y = np.meshgrid(np.arange(sz_x), np.arange(sz_y))
-  x = np.reshape(x, [-1,1]); y = np.reshape(y, [-1,1]);
-  nodes = np.concatenate((x,y), axis=1)
-  return g, nodes
+      self.weights = np.asarray(weights, dtype=np.float64)[order]
+    self._reversed = None
+    self._transitions = None
+
+  def num_vertices(self):
+    return self.nodes.shape[0]
+
+  def num_edges(self):
+    return self.indices.size
+
+  def edge_sources(self):
+    """Returns the source node of each edge."""
+    return np.repeat(np.arange(self.num_vertices()), np.diff(self.indptr))
+
+  def reversed(self):
+    """Returns the graph with all edges reversed, built on first use."""
+    if self._reversed is None:
+      self._reversed = NavGraph(self.nodes, self.indices, self.edge_sources(),
+                                actions=self.actions, weights=self.weights)
+      self._reversed._reversed = self
+    return self._reversed
+
+  def transition_table(self, num_actions):
+    """Returns num_vertices x num_actions arrays (next_node_ids, feasible) with
+    the node that each action leads to, and whether the action is feasible.
+    Infeasible actions leave the agent where it is. Built on first use."""
+    if (self._transitions is None or
+        self._transitions[0].shape[1] != num_actions):
+      next_node_ids = np.repeat(np.arange(self.num_vertices())[:,np.newaxis],
+                                num_actions, axis=1)
+      feasible = np.zeros(next_node_ids.shape, dtype=np.bool_)
+      sources = self.edge_sources()
+      next_node_ids[sources, self.actions] = self.indices
+      feasible[sources, self.actions] = True
+      self._transitions = (next_node_ids, feasible)
+    return self._transitions
+
+  def out_edges(self, node_ids):
+    """Returns the out-going edges of node_ids as (rows, targets, actions),
+    where rows index into node_ids."""
+    node_ids = np.asarray(node_ids, dtype=np.int64)
+    rows, edges = _gather_edges(self.indptr, node_ids)
+    actions = None if self.actions is None else self.actions[edges]
+    return rows, self.indices[edges], actions
+
+  def shortest_distance(self, sources, reverse=False, weighted=False,
+                        max_dist=None, pred_map=False):
+    """Computes the distance of every node from the nearest of sources.
+
+    Args:
+      sources: node id or list of node ids.
+      reverse: if True, computes distances to sources instead, following edges
+        backwards.
+      weighted: if True, edges have lengths weights, otherwise unit lengths.
+      max_dist: nodes further than max_dist are left unreached.
+      pred_map: also return the predecessor of each node.
+
+    Returns:
+      dist: int32 distances for unit lengths, float64 otherwise; unreached
+        nodes have distance np.iinfo(np.int32).max or inf.
+      pred: (if pred_map) the previous node on a shortest path from the
+        sources, which is the next node towards them if reverse. Sources and
+        unreached nodes are their own predecessors.
+    """
+    graph = self.reversed() if reverse else self
+    sources = np.unique(np.asarray(sources, dtype=np.int64))
+    if weighted:
+      dist, pred = _label_correcting(graph.indptr, graph.indices,
+                                     graph.weights, sources, max_dist)
+    else:
+      dist, pred = _bfs(graph.indptr, graph.indices, sources, max_dist)
+    if pred_map:
+      return dist, pred
+    return dist
+
+def get_optimal_action_table(next_node_ids, feasible, dist):
+  """Returns the optimal actions at every node as a bitmask, given the
+  transition table of a graph and the distance of every node to the goal.
+  Bit a is set if action a is feasible and leads to a neighbour closest to the
+  goal; unpack with unpack_action_masks."""
+  num_actions = feasible.shape[1]
+  d = np.where(feasible, dist[next_node_ids], np.inf)
+  is_min = np.logical_and(feasible, d == np.min(d, axis=1, keepdims=True))
+  dtype = np.min_scalar_type(2**num_actions-1)
+  bits = (1 << np.arange(num_actions)).astype(dtype)
+  return np.sum(is_min*bits, axis=1, dtype=dtype)
+
+def unpack_action_masks(masks, num_actions):
+  """Unpacks bitmasks of actions into a len(masks) x num_actions 0/1 array."""
+  masks = np.asarray(masks)
+  return ((masks[:,np.newaxis] >> np.arange(num_actions)) & 1).astype(np.int32)
 
-def add_diagonal_edges(g, nodes, sz_x, sz_y, edge_len):
-  offset = [sz_x+1, sz_x-1]
-  for o in offset:
-    s = np.arange(nodes.shape[0]-o-1)
-    t = s + o
-    ind = np.all(np.abs(nodes[s,:] - nodes[t,:]) == np.array([[1,1]]), axis=1)
-    s = s[ind][:,np.newaxis]
-    t = t[ind][:,np.newaxis]
-    st = np.concatenate((s,t), axis=1)
-    for i in range(st.shape[0]):
-      e = g.add_edge(st[i,0], st[i,1], add_missing=False)
-      g.ep['wts'][e] = edge_len
+# Compute shortest path from all nodes to or from all source nodes
+def get_distance_node_list(graph, source_nodes, direction, weights=None):
+  assert(direction == 'to' or direction == 'from')
+  return graph.shortest_distance(source_nodes, reverse=(direction == 'to'),
+                                 weighted=bool(weights))
 
 def convert_traversible_to_graph(traversible, ff_cost=1., fo_cost=1.,
                                  oo_cost=1., connectivity=4):
+  """Converts the traversible map into an undirected grid graph with a node
+  per pixel. Edges between two free, two occupied, or a free and an occupied
+  pixel have their length scaled by ff_cost, oo_cost and fo_cost."""
   assert(connectivity == 4 or connectivity == 8)
 
   sz_x = traversible.shape[1]
   sz_y = traversible.shape[0]
-  g, nodes = generate_lattice(sz_x, sz_y)
-
-  # Assign costs.
-  edge_wts = g.new_edge_property('float')
-  g.edge_properties['wts'] = edge_wts
-  wts = np.ones(g.num_edges(), dtype=np.float32)
-  edge_wts.get_array()[:] = wts
+  x, y = np.meshgrid(np.arange(sz_x), np.arange(sz_y))
+  nodes = np.concatenate((np.reshape(x, [-1,1]), np.reshape(y, [-1,1])), axis=1)
+  ids = np.reshape(np.arange(sz_x*sz_y), (sz_y, sz_x))
 
+  # (dy, dx, length) of the edges to the neighbours of a pixel.
+  steps = [(0, 1, 1.), (1, 0, 1.)]
   if connectivity == 8:
-    add_diagonal_edges(g, nodes, sz_x, sz_y, np.sqrt(2.))
-
-  se = np.array([[int(e.source()), int(e.target())] for e in g.edges()])
-  s_xy = nodes[se[:,0]]
-  t_xy = nodes[se[:,1]]
-  s_t = np.ravel_multi_index((s_xy[:,1], s_xy[:,0]), traversible.shape)
-  t_t = np.ravel_multi_index((t_xy[:,1], t_xy[:,0]), traversible.shape)
-  s_t = traversible.ravel()[s_t]
-  t_t = traversible.ravel()[t_t]
-
-  wts = np.zeros(g.num_edges(), dtype=np.float32)
-  wts[np.logical_and(s_t == True, t_t == True)] = ff_cost
-  wts[np.logical_and(s_t == False, t_t == False)] = oo_cost
+    steps = steps + [(1, 1, np.sqrt(2.)), (1, -1, np.sqrt(2.))]
+  s = []; t = []; lens = [];
+  for dy, dx, l in steps:
+    s_ = ids[:sz_y-dy, max(0, -dx):sz_x-max(0, dx)].ravel()
+    t_ = ids[dy:, max(0, dx):sz_x-max(0, -dx)].ravel()
+    s.append(s_); t.append(t_); lens.append(np.ones(s_.size)*l)
+  s = np.concatenate(s); t = np.concatenate(t); lens = np.concatenate(lens)
+
+  s_t = traversible.ravel()[s] > 0
+  t_t = traversible.ravel()[t] > 0
+  wts = np.zeros(s.size, dtype=np.float64)
+  wts[np.logical_and(s_t, t_t)] = ff_cost
+  wts[np.logical_and(np.logical_not(s_t), np.logical_not(t_t))] = oo_cost
   wts[np.logical_xor(s_t, t_t)] = fo_cost
+  wts = wts*lens
 
-  edge_wts = g.edge_properties['wts']
-  for i, e in enumerate(g.edges()):
-    edge_wts[e] = edge_wts[e] * wts[i]
-  # d = edge_wts.get_array()*1.
-  # edge_wts.get_array()[:] = d*wts 
+  g = NavGraph(nodes, np.concatenate((s, t)), np.concatenate((t, s)),
+               weights=np.concatenate((wts, wts)))
   return g, nodes
 
 def label_nodes_with_class(nodes_xyt, class_maps, pix):
@@ -171,7 +309,7 @@ def label_nodes_with_class_geodesic(nodes_xyt, class_maps, pix, traversible,
   for i in range(n_classes):
     # class_node_ids = np.where(class_maps__.ravel() == i)[0]
     class_node_ids = np.where(class_maps[:,:,i].ravel() > 0)[0]
-    dist_i = get_distance_node_list(g, class_node_ids, 'to', weights='wts')
+    dist_i = get_distance_node_list(g, class_node_ids, 'to', weights=True)
     class_dist[:,:,i] = np.reshape(dist_i, class_dist[:,:,i].shape)
   class_map_geodesic = (class_dist <= pix)
   class_map_geodesic = np.reshape(class_map_geodesic, [-1, n_classes])
@@ -184,137 +322,139 @@ def label_nodes_with_class_geodesic(nodes_xyt, class_maps, pix, traversible,
   class_map_geodesic = class_dist <= pix
   return class_map_geodesic, node_class_label
 
-def _get_next_nodes_undirected(n, sc, n_ori):
-  nodes_to_add = []
-  nodes_to_validate = []
-  (p, q, r) = n
-  nodes_to_add.append((n, (p, q, r), 0))
-  if n_ori == 4:
-    for _ in [1, 2, 3, 4]:
-      if _ == 1:
-        v = (p - sc, q, r)
-      elif _ == 2:
-        v = (p + sc, q, r)
-      elif _ == 3:
-        v = (p, q - sc, r)
-      elif _ == 4:
-        v = (p, q + sc, r)
-      nodes_to_validate.append((n, v, _))
-  return nodes_to_add, nodes_to_validate
-
-def _get_next_nodes(n, sc, n_ori):
-  nodes_to_add = []
-  nodes_to_validate = []
-  (p, q, r) = n
-  for r_, a_ in zip([-1, 0, 1], [1, 0, 2]):
-    nodes_to_add.append((n, (p, q, np.mod(r+r_, n_ori)), a_))
 
-  if n_ori == 6:
-    if r == 0:
-      v = (p + sc, q, r)
-    elif r == 1:
-      v = (p + sc, q + sc, r)
-    elif r == 2:
-      v = (p, q + sc, r)
-    elif r == 3:
-      v = (p - sc, q, r)
-    elif r == 4:
-      v = (p - sc, q - sc, r)
-    elif r == 5:
-      v = (p, q - sc, r)
-  elif n_ori == 4:
-    if r == 0:
-      v = (p + sc, q, r)
-    elif r == 1:
-      v = (p, q + sc, r)
-    elif r == 2:
-      v = (p - sc, q, r)
-    elif r == 3:
-      v = (p, q - sc, r)
-  nodes_to_validate.append((n,v,3))
-
-  return nodes_to_add, nodes_to_validate
+def _grow_id_grid(id_grid, lo, ij):
+  """Grows id_grid, whose cell [0, 0] is lattice point lo, so that it covers
+  all lattice points ij. Grows by at least the current size on each side that
+  grows, so that copies are rare."""
+  hi = lo + np.array(id_grid.shape[:2])
+  ij_lo = np.min(ij, axis=0)
+  ij_hi = np.max(ij, axis=0) + 1
+  if np.all(ij_lo >= lo) and np.all(ij_hi <= hi):
+    return id_grid, lo
+  sz = hi - lo
+  new_lo = np.where(ij_lo < lo, ij_lo - sz, lo)
+  new_hi = np.where(ij_hi > hi, ij_hi + sz, hi)
+  new_id_grid = -np.ones(tuple(new_hi - new_lo) + id_grid.shape[2:],
+                         dtype=np.int64)
+  o = lo - new_lo
+  new_id_grid[o[0]:o[0]+sz[0], o[1]:o[1]+sz[1], :] = id_grid
+  return new_id_grid, new_lo
+
+def _get_next_nodes_undirected(ijr, n_ori):
+  """Returns the (targets, actions) of the edges out of nodes ijr, and which
+  targets need validation."""
+  n = ijr.shape[0]
+  tgts = [ijr]; actions = [np.zeros(n, dtype=np.int32)]
+  for o, a in zip(_UNDIRECTED_OFFSETS, _UNDIRECTED_ACTIONS):
+    tgt = ijr*1
+    tgt[:,:2] += o
+    tgts.append(tgt); actions.append(np.zeros(n, dtype=np.int32) + a)
+  to_validate = np.arange(len(tgts)*n) >= n
+  return np.concatenate(tgts), np.concatenate(actions), to_validate
+
+def _get_next_nodes(ijr, n_ori):
+  """Returns the (targets, actions) of the edges out of nodes ijr, and which
+  targets need validation."""
+  n = ijr.shape[0]
+  tgts = []; actions = [];
+  for r_, a_ in zip([-1, 0, 1], [1, 0, 2]):
+    tgt = ijr*1
+    tgt[:,2] = np.mod(tgt[:,2]+r_, n_ori)
+    tgts.append(tgt); actions.append(np.zeros(n, dtype=np.int32) + a_)
+  tgt = ijr*1
+  tgt[:,:2] += _FORWARD_OFFSETS[n_ori][ijr[:,2]]
+  tgts.append(tgt); actions.append(np.zeros(n, dtype=np.int32) + 3)
+  to_validate = np.arange(len(tgts)*n) >= 3*n
+  return np.concatenate(tgts), np.concatenate(actions), to_validate
 
 def generate_graph(valid_fn_vec=None, sc=1., n_ori=6,
                    starting_location=(0, 0, 0), vis=False, directed=True):
+  """Generates the graph of nodes reachable from starting_location.
+
+  Nodes are (x, y, theta), with x and y on a lattice of spacing sc around
+  starting_location, and are indexed through their integer lattice coordinates.
+  The graph is grown breadth first, validating the moves out of a whole
+  frontier of nodes with a single call to valid_fn_vec. Directed graphs have
+  actions 0 (stay), 1 and 2 (rotate) and 3 (forward), undirected graphs have
+  actions 0 (stay) and 1 to 4 (move along -x, +x, -y, +y).
+
+  Returns:
+    NavGraph with node coordinates in nodes and edge actions in actions.
+  """
   timer = utils.Timer()
   timer.tic()
-  if directed: G = nx.DiGraph(directed=True)
-  else: G = nx.Graph()
-  G.add_node(starting_location)
-  new_nodes = G.nodes()
-  while len(new_nodes) != 0:
-    nodes_to_add = []
-    nodes_to_validate = []
-    for n in new_nodes:
-      if directed:
-        na, nv = _get_next_nodes(n, sc, n_ori)
-      else:
-        na, nv = _get_next_nodes_undirected(n, sc, n_ori)
-      nodes_to_add = nodes_to_add + na
-      if valid_fn_vec is not None:
-        nodes_to_validate = nodes_to_validate + nv
-      else:
-        node_to_add = nodes_to_add + nv
+  origin = np.array(starting_location[:2])
+  next_nodes_fn = _get_next_nodes if directed else _get_next_nodes_undirected
+
+  # Map from lattice coordinates (i, j, r) to node id, -1 for unseen nodes.
+  id_grid = -np.ones((64, 64, n_ori), dtype=np.int64)
+  lo = np.array([-32, -32])
+  frontier = np.array([[0, 0, starting_location[2]]], dtype=np.int64)
+  frontier_ids = np.array([0], dtype=np.int64)
+  id_grid[32, 32, starting_location[2]] = 0
+  num_nodes = 1
+  all_ijr = [frontier]; srcs = []; tgts = []; actions = [];
+  while frontier.shape[0] != 0:
+    tgt, action, to_validate = next_nodes_fn(frontier, n_ori)
+    src = np.tile(frontier_ids, tgt.shape[0] // frontier.shape[0])
 
     # Validate nodes.
-    vs = [_[1] for _ in nodes_to_validate]
-    valids = valid_fn_vec(vs)
-
-    for nva, valid in zip(nodes_to_validate, valids):
-      if valid:
-        nodes_to_add.append(nva)
-
-    new_nodes = []
-    for n,v,a in nodes_to_add:
-      if not G.has_node(v):
-        new_nodes.append(v)
-      G.add_edge(n, v, action=a)
-
+    vs = tgt[to_validate]
+    xyt = np.concatenate((origin + vs[:,:2]*sc, vs[:,2:]), axis=1)
+    valid = np.ones(tgt.shape[0], dtype=np.bool_)
+    valid[to_validate] = np.array(valid_fn_vec(xyt), dtype=np.bool_)
+    src = src[valid]; tgt = tgt[valid]; action = action[valid];
+
+    # Look up targets, and give ids to the ones not seen before.
+    id_grid, lo = _grow_id_grid(id_grid, lo, tgt[:,:2])
+    ind = np.ravel_multi_index((tgt[:,0]-lo[0], tgt[:,1]-lo[1], tgt[:,2]),
+                               id_grid.shape)
+    tgt_ids = id_grid.ravel()[ind]
+    unseen = tgt_ids < 0
+    new_ind, first, inverse = np.unique(ind[unseen], return_index=True,
+                                        return_inverse=True)
+    frontier_ids = num_nodes + np.arange(new_ind.size)
+    id_grid.flat[new_ind] = frontier_ids
+    tgt_ids[unseen] = frontier_ids[inverse]
+    frontier = tgt[unseen][first]
+    num_nodes = num_nodes + new_ind.size
+
+    all_ijr.append(frontier); srcs.append(src); tgts.append(tgt_ids);
+    actions.append(action)
+
+  ijr = np.concatenate(all_ijr)
+  nodes = np.concatenate((origin + ijr[:,:2]*sc, ijr[:,2:]), axis=1)
+  G = NavGraph(nodes, np.concatenate(srcs), np.concatenate(tgts),
+               actions=np.concatenate(actions))
   timer.toc(average=True, log_at=1, log_str='src.graph_utils.generate_graph')
-  return (G)
+  return G
 
 def vis_G(G, ax, vertex_color='r', edge_color='b', r=None):
+  nodes = G.nodes
   if edge_color is not None:
-    for e in G.edges():
-      XYT = zip(*e)
-      x = XYT[-3]
-      y = XYT[-2]
-      t = XYT[-1]
-      if r is None or t[0] == r:
-        ax.plot(x, y, edge_color)
+    for s, t in zip(G.edge_sources(), G.indices):
+      if r is None or nodes[s,2] == r:
+        ax.plot(nodes[[s,t],0], nodes[[s,t],1], edge_color)
   if vertex_color is not None:
-    XYT = zip(*G.nodes())
-    x = XYT[-3]
-    y = XYT[-2]
-    t = XYT[-1]
-    ax.plot(x, y, vertex_color + '.')
+    ax.plot(nodes[:,0], nodes[:,1], vertex_color + '.')
 
 def convert_to_graph_tool(G):
+  """Converts a NavGraph into a graph-tool graph with an 'action' edge
+  property, for analysis with graph-tool."""
+  import graph_tool as gt
   timer = utils.Timer()
   timer.tic()
-  gtG = gt.Graph(directed=G.is_directed())
+  gtG = gt.Graph(directed=True)
+  gtG.add_vertex(G.num_vertices())
+  gtG.add_edge_list(np.concatenate((G.edge_sources()[:,np.newaxis],
+                                    G.indices[:,np.newaxis]), axis=1))
   gtG.ep['action'] = gtG.new_edge_property('int')
-
-  nodes_list = G.nodes()
-  nodes_array = np.array(nodes_list)
-
-  nodes_id = np.zeros((nodes_array.shape[0],), dtype=np.int64)
-
-  for i in range(nodes_array.shape[0]):
-    v = gtG.add_vertex()
-    nodes_id[i] = int(v)
-
-  # d = {key: value for (key, value) in zip(nodes_list, nodes_id)}
-  d = dict(itertools.izip(nodes_list, nodes_id))
-
-  for src, dst, data in G.edges_iter(data=True):
-    e = gtG.add_edge(d[src], d[dst])
-    gtG.ep['action'][e] = data['action']
-  nodes_to_id = d
+  gtG.ep['action'].get_array()[:] = G.actions
+  nodes_to_id = dict(zip([tuple(n) for n in G.nodes.tolist()],
+                         range(G.num_vertices())))
   timer.toc(average=True, log_at=1, log_str='src.graph_utils.convert_to_graph_tool')
-  return gtG, nodes_array, nodes_to_id
-
+  return gtG, G.nodes, nodes_to_id
 
 def _rejection_sampling(rng, sampling_d, target_d, bins, hardness, M):
   bin_ind = np.digitize(hardness, bins)-1
@@ -342,18 +482,16 @@ def heuristic_fn_vec(n1, n2, n_ori, step_size):
 
   return (d + dt).reshape((-1,1))
 
-def get_hardness_distribution(gtG, max_dist, min_dist, rng, trials, bins, nodes,
+def get_hardness_distribution(graph, max_dist, min_dist, rng, trials, bins, nodes,
                               n_ori, step_size):
   heuristic_fn = lambda node_ids, node_id: \
     heuristic_fn_vec(nodes[node_ids, :], nodes[[node_id], :], n_ori, step_size)
-  num_nodes = gtG.num_vertices()
+  num_nodes = graph.num_vertices()
   gt_dists = []; h_dists = [];
   for i in range(trials):
     end_node_id = rng.choice(num_nodes)
-    gt_dist = gt.topology.shortest_distance(gt.GraphView(gtG, reversed=True),
-                                            source=gtG.vertex(end_node_id),
-                                            target=None, max_dist=max_dist)
-    gt_dist = np.array(gt_dist.get_array())
+    gt_dist = graph.shortest_distance(end_node_id, reverse=True,
+                                      max_dist=max_dist)
     ind = np.where(np.logical_and(gt_dist <= max_dist, gt_dist >= min_dist))[0]
     gt_dist = gt_dist[ind]
     h_dist = heuristic_fn(ind, end_node_id)[:,0]
@@ -367,14 +505,14 @@ def get_hardness_distribution(gtG, max_dist, min_dist, rng, trials, bins, nodes,
   hist = hist / np.sum(hist)
   return hist
 
-def rng_next_goal_rejection_sampling(start_node_ids, batch_size, gtG, rng,
+def rng_next_goal_rejection_sampling(start_node_ids, batch_size, graph, rng,
                                      max_dist, min_dist, max_dist_to_compute,
                                      sampling_d, target_d,
                                      nodes, n_ori, step_size, bins, M):
   sample_start_nodes = start_node_ids is None
   dists = []; pred_maps = []; end_node_ids = []; start_node_ids_ = [];
   hardnesss = []; gt_dists = [];
-  num_nodes = gtG.num_vertices()
+  num_nodes = graph.num_vertices()
   for i in range(batch_size):
     done = False
     while not done:
@@ -383,10 +521,8 @@ def rng_next_goal_rejection_sampling(start_node_ids, batch_size, gtG, rng,
       else:
         start_node_id = start_node_ids[i]
 
-      gt_dist = gt.topology.shortest_distance(
-          gt.GraphView(gtG, reversed=False), source=start_node_id, target=None,
-          max_dist=max_dist)
-      gt_dist = np.array(gt_dist.get_array())
+      gt_dist = graph.shortest_distance(start_node_id, reverse=False,
+                                        max_dist=max_dist)
       ind = np.where(np.logical_and(gt_dist <= max_dist, gt_dist >= min_dist))[0]
       ind = rng.permutation(ind)
       gt_dist = gt_dist[ind]*1.
@@ -403,11 +539,8 @@ def rng_next_goal_rejection_sampling(start_node_ids, batch_size, gtG, rng,
         done = True
 
     # Compute distance from end node to all nodes, to return.
-    dist, pred_map = gt.topology.shortest_distance(
-        gt.GraphView(gtG, reversed=True), source=end_node_id, target=None,
-        max_dist=max_dist_to_compute, pred_map=True)
-    dist = np.array(dist.get_array())
-    pred_map = np.array(pred_map.get_array())
+    dist, pred_map = graph.shortest_distance(
+        end_node_id, reverse=True, max_dist=max_dist_to_compute, pred_map=True)
 
     hardnesss.append(hardness); dists.append(dist); pred_maps.append(pred_map);
     start_node_ids_.append(start_node_id); end_node_ids.append(end_node_id);
@@ -416,7 +549,7 @@ def rng_next_goal_rejection_sampling(start_node_ids, batch_size, gtG, rng,
   return start_node_ids_, end_node_ids, dists, pred_maps, paths, hardnesss, gt_dists
 
 
-def rng_next_goal(start_node_ids, batch_size, gtG, rng, max_dist,
+def rng_next_goal(start_node_ids, batch_size, graph, rng, max_dist,
                   max_dist_to_compute, node_room_ids, nodes=None,
                   compute_path=False, dists_from_start_node=None):
   # Compute the distance field from the starting location, and then pick a
@@ -427,10 +560,9 @@ def rng_next_goal(start_node_ids, batch_size, gtG, rng, max_dist,
     room_id = node_room_ids[start_node_ids[i]]
     # Compute distances.
     if dists_from_start_node == None:
-      dist, pred_map = gt.topology.shortest_distance(
-        gt.GraphView(gtG, reversed=False), source=gtG.vertex(start_node_ids[i]),
-        target=None, max_dist=max_dist_to_compute, pred_map=True)
-      dist = np.array(dist.get_array())
+      dist, pred_map = graph.shortest_distance(
+        start_node_ids[i], reverse=False, max_dist=max_dist_to_compute,
+        pred_map=True)
     else:
       dist = dists_from_start_node[i]
 
@@ -453,11 +585,8 @@ def rng_next_goal(start_node_ids, batch_size, gtG, rng, max_dist,
       logging.error('Did not find any good nodes.')
 
     # Compute distance to this new goal for doing distance queries.
-    dist, pred_map = gt.topology.shortest_distance(
-        gt.GraphView(gtG, reversed=True), source=gtG.vertex(end_node_id),
-        target=None, max_dist=max_dist_to_compute, pred_map=True)
-    dist = np.array(dist.get_array())
-    pred_map = np.array(pred_map.get_array())
+    dist, pred_map = graph.shortest_distance(
+        end_node_id, reverse=True, max_dist=max_dist_to_compute, pred_map=True)
 
     dists.append(dist)
     pred_maps.append(pred_map)
@@ -471,7 +600,7 @@ def rng_next_goal(start_node_ids, batch_size, gtG, rng, max_dist,
   return start_node_ids, end_node_ids, dists, pred_maps, paths
 
 
-def rng_room_to_room(batch_size, gtG, rng, max_dist, max_dist_to_compute,
+def rng_room_to_room(batch_size, graph, rng, max_dist, max_dist_to_compute,
                      node_room_ids, nodes=None, compute_path=False):
   # Sample one of the rooms, compute the distance field. Pick a destination in
   # another room if possible otherwise anywhere outside this room.
@@ -483,11 +612,8 @@ def rng_room_to_room(batch_size, gtG, rng, max_dist, max_dist_to_compute,
     end_node_ids.append(end_node_id)
 
     # Compute distances.
-    dist, pred_map = gt.topology.shortest_distance(
-        gt.GraphView(gtG, reversed=True), source=gtG.vertex(end_node_id),
-        target=None, max_dist=max_dist_to_compute, pred_map=True)
-    dist = np.array(dist.get_array())
-    pred_map = np.array(pred_map.get_array())
+    dist, pred_map = graph.shortest_distance(
+        end_node_id, reverse=True, max_dist=max_dist_to_compute, pred_map=True)
     dists.append(dist)
     pred_maps.append(pred_map)
 
@@ -520,20 +646,17 @@ def rng_room_to_room(batch_size, gtG, rng, max_dist, max_dist_to_compute,
   return start_node_ids, end_node_ids, dists, pred_maps, paths
 
 
-def rng_target_dist_field(batch_size, gtG, rng, max_dist, max_dist_to_compute,
+def rng_target_dist_field(batch_size, graph, rng, max_dist, max_dist_to_compute,
                           nodes=None, compute_path=False):
   # Sample a single node, compute distance to all nodes less than max_dist,
   # sample nodes which are a particular distance away.
   dists = []; pred_maps = []; paths = []; start_node_ids = []
-  end_node_ids = rng.choice(gtG.num_vertices(), size=(batch_size,),
+  end_node_ids = rng.choice(graph.num_vertices(), size=(batch_size,),
                             replace=False).tolist()
 
   for i in range(batch_size):
-    dist, pred_map = gt.topology.shortest_distance(
-        gt.GraphView(gtG, reversed=True), source=gtG.vertex(end_node_ids[i]),
-        target=None, max_dist=max_dist_to_compute, pred_map=True)
-    dist = np.array(dist.get_array())
-    pred_map = np.array(pred_map.get_array())
+    dist, pred_map = graph.shortest_distance(
+        end_node_ids[i], reverse=True, max_dist=max_dist_to_compute, pred_map=True)
     dists.append(dist)
     pred_maps.append(pred_map)
 
@@ -23,6 +23,7 @@ import matplotlib.pyplot as plt
 import PIL
 
 import src.utils as utils
+import src.depth_utils as du
 import cv2
 
 def _get_xy_bounding_box(vertex, padding):
@@ -34,23 +35,24 @@ def _get_xy_bounding_box(vertex, padding):
 def _project_to_map(map, vertex, wt=None, ignore_points_outside_map=False):
   """Projects points to map, returns how many points are present at each
   location."""
-  num_points = np.zeros((map.size[1], map.size[0]))
   vertex_ = vertex[:, :2] - map.origin
   vertex_ = np.round(vertex_ / map.resolution).astype(np.int)
+  good_ind = None
   if ignore_points_outside_map:
     good_ind = np.all(np.array([vertex_[:,1] >= 0, vertex_[:,1] < map.size[1],
                                 vertex_[:,0] >= 0, vertex_[:,0] < map.size[0]]),
                       axis=0)
-    vertex_ = vertex_[good_ind, :]
-    if wt is not None:
-      wt = wt[good_ind, :]
-  if wt is None:
-    np.add.at(num_points, (vertex_[:, 1], vertex_[:, 0]), 1)
-  else:
+  if wt is not None:
     assert(wt.shape[0] == vertex.shape[0]), \
       'number of weights should be same as vertices.'
-    np.add.at(num_points, (vertex_[:, 1], vertex_[:, 0]), wt)
-  return num_points
+    wt = np.asarray(wt, dtype=np.float64)
+  # Points outside the map are dropped through good_ind if ignored.
+  mode = 'clip' if ignore_points_outside_map else 'raise'
+  ind = np.ravel_multi_index((vertex_[:, 1], vertex_[:, 0]),
+                             (map.size[1], map.size[0]), mode=mode)
+  num_points = du.accumulate_bins(ind, map.size[1]*map.size[0], wt=wt,
+                                  isvalid=good_ind)
+  return np.reshape(num_points, (map.size[1], map.size[0]))
 
 def make_map(padding, resolution, vertex=None, sc=1.):
   """Returns a map structure."""
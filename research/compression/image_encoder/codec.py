@@ -0,0 +1,342 @@
+# Copyright 2017 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+r"""Neural Network Image Compression batch codec.
+
+Loads the compression model once and compresses many images of any size. Each
+image is padded and split into square tiles whose side is a multiple of 32, and
+the tiles of all images are run through the model in batches. The codes of all
+images are written to a single packed file with an index of their offsets.
+
+When an output directory is given, the images are also decoded at the encoded
+quality level, and the MS-SSIM of each reconstruction is reported along with
+its bits per pixel.
+
+Example usage:
+python codec.py --input_images=/your/images/*.png \
+--output_codes=codes.bin --iteration=15 --model=residual_gru.pb \
+--output_directory=/tmp/compression_output/
+
+python codec.py --input_codes=codes.bin --model=residual_gru.pb \
+--output_directory=/tmp/compression_output/
+"""
+import json
+import os
+import struct
+import time
+
+import numpy as np
+import tensorflow as tf
+
+tf.flags.DEFINE_string('input_images', None, 'Comma separated list of glob '
+                       'patterns of PNG or JPEG images to encode.')
+tf.flags.DEFINE_string('input_codes', None, 'Packed code file to decode.')
+tf.flags.DEFINE_integer('iteration', 15, 'Quality level for encoding images. '
+                        'Must be between 0 and 15 inclusive.')
+tf.flags.DEFINE_string('output_codes', None, 'File to save packed codes.')
+tf.flags.DEFINE_string('output_directory', None, 'Directory to save decoded '
+                       'images.')
+tf.flags.DEFINE_string('model', None, 'Location of compression model.')
+tf.flags.DEFINE_integer('tile_size', 128, 'Side of the square tiles images are '
+                        'split into. Must be a multiple of 32.')
+tf.flags.DEFINE_integer('batch_size', 16, 'Number of tiles per model call.')
+
+FLAGS = tf.flags.FLAGS
+
+# Identifies packed code files, and their format version.
+_MAGIC = b'RGCODES1'
+
+
+def get_code_tensor_names():
+  name_list = ['GruBinarizer/SignBinarizer/Sign:0']
+  for i in range(1, 16):
+    name_list.append('GruBinarizer/SignBinarizer/Sign_{}:0'.format(i))
+  return name_list
+
+
+def get_reconstruction_tensor_names():
+  return ['loop_{0:02d}/add:0'.format(i) for i in range(0, 16)]
+
+
+def split_into_tiles(image, tile_size):
+  """Pads an image by replicating its edges and splits it into tiles.
+
+  Args:
+    image: [height, width, 3] np.uint8 array.
+    tile_size: Int, side of the square tiles.
+
+  Returns:
+    [num_tiles, tile_size, tile_size, 3] array of tiles, in row major order.
+  """
+  height, width = image.shape[:2]
+  rows = -(-height // tile_size)
+  cols = -(-width // tile_size)
+  padded = np.pad(image, ((0, rows * tile_size - height),
+                          (0, cols * tile_size - width), (0, 0)),
+                  mode='edge')
+  tiles = padded.reshape(rows, tile_size, cols, tile_size, -1)
+  return tiles.transpose(0, 2, 1, 3, 4).reshape(
+      rows * cols, tile_size, tile_size, -1)
+
+
+def merge_tiles(tiles, height, width):
+  """Inverse of split_into_tiles, crops the padding of the merged image."""
+  tile_size = tiles.shape[1]
+  rows = -(-height // tile_size)
+  cols = -(-width // tile_size)
+  image = tiles.reshape(rows, cols, tile_size, tile_size, -1)
+  image = image.transpose(0, 2, 1, 3, 4).reshape(
+      rows * tile_size, cols * tile_size, -1)
+  return image[:height, :width]
+
+
+class ResidualGRUCodec(object):
+  """Encodes and decodes batches of images of any size with one model load."""
+
+  def __init__(self, model, tile_size=128, batch_size=16):
+    """Loads the compression model.
+
+    Args:
+      model: Location of the frozen compression model.
+      tile_size: Int, side of the square tiles images are split into. Must be
+        a multiple of 32.
+      batch_size: Int, number of tiles per model call.
+    """
+    if tile_size % 32 != 0:
+      raise ValueError('tile_size must be a multiple of 32, not %d.' %
+                       tile_size)
+    self.tile_size = tile_size
+    self.batch_size = batch_size
+    self._graph = tf.Graph()
+    with self._graph.as_default():
+      with tf.gfile.FastGFile(model, 'rb') as model_file:
+        graph_def = tf.GraphDef()
+        graph_def.ParseFromString(model_file.read())
+      _ = tf.import_graph_def(graph_def, name='')
+      self._input_tensor = self._graph.get_tensor_by_name('Placeholder:0')
+      self._code_tensors = [self._graph.get_tensor_by_name(name) for name in
+                            get_code_tensor_names()]
+      self._reconstruction_tensors = [
+          self._graph.get_tensor_by_name(name) for name in
+          get_reconstruction_tensor_names()]
+
+      # For decoding and encoding image files.
+      self._image_str = tf.placeholder(tf.string)
+      self._decoded_image = tf.image.decode_image(self._image_str, channels=3)
+      self._image = tf.placeholder(tf.uint8)
+      self._encoded_png = tf.image.encode_png(self._image)
+    self._sess = tf.Session(graph=self._graph)
+
+  def close(self):
+    self._sess.close()
+
+  def decode_image_file(self, image_str):
+    """Decodes a PNG or JPEG string into a [height, width, 3] uint8 array."""
+    return self._sess.run(self._decoded_image,
+                          feed_dict={self._image_str: image_str})
+
+  def encode_png(self, image):
+    """Encodes a [height, width, 3] uint8 array into a PNG string."""
+    return self._sess.run(self._encoded_png, feed_dict={self._image: image})
+
+  def _run_batches(self, fetches, feeds_fn, num_tiles):
+    """Runs fetches on batches of tiles, concatenating results over tiles.
+
+    feeds_fn(start, end) returns the feed dict of tiles start to end. Results
+    are [len(fetches), num_tiles, ...] arrays.
+    """
+    results = []
+    for start in range(0, num_tiles, self.batch_size):
+      end = min(start + self.batch_size, num_tiles)
+      results.append(self._sess.run(fetches, feed_dict=feeds_fn(start, end)))
+    return [np.concatenate([r[i] for r in results], axis=0)
+            for i in range(len(fetches))]
+
+  def encode(self, images, iteration):
+    """Encodes images at quality level iteration.
+
+    Args:
+      images: List of [height, width, 3] np.uint8 arrays, of any sizes.
+      iteration: Int, quality level between 0 and 15 inclusive.
+
+    Returns:
+      List of [iteration + 1, num_tiles, tile_size / 16, tile_size / 16, 32]
+      np.uint8 arrays of binary codes, one per image.
+    """
+    tiles = [split_into_tiles(image, self.tile_size) for image in images]
+    num_tiles = [t.shape[0] for t in tiles]
+    tiles = np.concatenate(tiles, axis=0)
+    codes = self._run_batches(
+        self._code_tensors[:iteration + 1],
+        lambda start, end: {self._input_tensor: tiles[start:end]},
+        tiles.shape[0])
+    # Convert sign codes in {-1, 1} to bits.
+    codes = ((np.stack(codes) + 1) // 2).astype(np.uint8)
+    return np.split(codes, np.cumsum(num_tiles)[:-1], axis=1)
+
+  def decode(self, codes, image_shapes):
+    """Decodes images from their codes, at the quality level of the codes.
+
+    Args:
+      codes: List of code arrays, as returned by encode.
+      image_shapes: List of the (height, width) of each image.
+
+    Returns:
+      List of [height, width, 3] np.uint8 arrays.
+    """
+    iteration = codes[0].shape[0] - 1
+    num_tiles = [c.shape[1] for c in codes]
+    codes = np.concatenate(codes, axis=1).astype(np.float32) * 2 - 1
+    code_tensors = self._code_tensors[:iteration + 1]
+    tiles, = self._run_batches(
+        [self._reconstruction_tensors[iteration]],
+        lambda start, end: dict(zip(code_tensors, codes[:, start:end])),
+        codes.shape[1])
+    tiles = np.uint8(np.clip(tiles + 0.5, 0, 255))
+    tiles = np.split(tiles, np.cumsum(num_tiles)[:-1], axis=0)
+    return [merge_tiles(t, height, width)
+            for t, (height, width) in zip(tiles, image_shapes)]
+
+
+def bits_per_pixel(codes, height, width):
+  """Returns the bits per pixel of the codes of a height x width image."""
+  return codes.size / float(height * width)
+
+
+def write_packed_codes(filename, names, codes, image_shapes):
+  """Writes the codes of many images to a single file.
+
+  The file holds the magic string, the bit-packed codes of each image one
+  after the other, a JSON index of their names, shapes, offsets and lengths,
+  and the 8 byte offset of the index.
+
+  Args:
+    filename: File to write.
+    names: List of strings, the name of each image.
+    codes: List of code arrays, as returned by ResidualGRUCodec.encode.
+    image_shapes: List of the (height, width) of each image.
+  """
+  index = []
+  with tf.gfile.GFile(filename, 'wb') as code_file:
+    offset = len(_MAGIC)
+    code_file.write(_MAGIC)
+    for name, image_codes, (height, width) in zip(names, codes, image_shapes):
+      packed = np.packbits(image_codes.reshape(-1)).tobytes()
+      code_file.write(packed)
+      index.append({'name': name, 'height': int(height), 'width': int(width),
+                    'shape': [int(d) for d in image_codes.shape],
+                    'offset': offset, 'length': len(packed)})
+      offset += len(packed)
+    code_file.write(json.dumps(index).encode('utf-8'))
+    code_file.write(struct.pack('<Q', offset))
+
+
+def read_packed_codes_index(filename):
+  """Returns the index of a packed code file, a list of dicts."""
+  with tf.gfile.GFile(filename, 'rb') as code_file:
+    if code_file.read(len(_MAGIC)) != _MAGIC:
+      raise ValueError('%s is not a packed code file.' % filename)
+    code_file.seek(code_file.size() - 8)
+    index_offset, = struct.unpack('<Q', code_file.read(8))
+    code_file.seek(index_offset)
+    return json.loads(
+        code_file.read(code_file.size() - 8 - index_offset).decode('utf-8'))
+
+
+def read_packed_codes(filename, entries):
+  """Reads the codes of the index entries from a packed code file."""
+  codes = []
+  with tf.gfile.GFile(filename, 'rb') as code_file:
+    for entry in entries:
+      code_file.seek(entry['offset'])
+      packed = np.frombuffer(code_file.read(entry['length']), dtype=np.uint8)
+      shape = entry['shape']
+      codes.append(np.unpackbits(packed)[:np.prod(shape)].reshape(shape))
+  return codes
+
+
+def main(_):
+  if ((FLAGS.input_images is None) == (FLAGS.input_codes is None) or
+      FLAGS.model is None or
+      (FLAGS.input_images is not None and FLAGS.output_codes is None) or
+      (FLAGS.input_codes is not None and FLAGS.output_directory is None)):
+    print('\nUsage: python codec.py --input_images=/your/images/*.png '
+          '--output_codes=codes.bin --iteration=15 --model=residual_gru.pb '
+          '[--output_directory=/tmp/compression_output/]\n'
+          'or: python codec.py --input_codes=codes.bin '
+          '--output_directory=/tmp/compression_output/ '
+          '--model=residual_gru.pb\n\n')
+    return
+
+  if FLAGS.iteration < 0 or FLAGS.iteration > 15:
+    print('\n--iteration must be between 0 and 15 inclusive.\n')
+    return
+
+  codec = ResidualGRUCodec(FLAGS.model, tile_size=FLAGS.tile_size,
+                           batch_size=FLAGS.batch_size)
+  if FLAGS.input_images is not None:
+    filenames = []
+    for pattern in FLAGS.input_images.split(','):
+      filenames.extend(sorted(tf.gfile.Glob(pattern)))
+    names = [os.path.splitext(os.path.basename(f))[0] for f in filenames]
+    images = []
+    for filename in filenames:
+      with tf.gfile.FastGFile(filename, 'rb') as input_image:
+        images.append(codec.decode_image_file(input_image.read()))
+    image_shapes = [image.shape[:2] for image in images]
+
+    start_time = time.time()
+    codes = codec.encode(images, FLAGS.iteration)
+    elapsed = time.time() - start_time
+    write_packed_codes(FLAGS.output_codes, names, codes, image_shapes)
+    print('Encoded %d images, %.2f images/sec.' %
+          (len(images), len(images) / elapsed))
+  else:
+    entries = read_packed_codes_index(FLAGS.input_codes)
+    names = [entry['name'] for entry in entries]
+    image_shapes = [(entry['height'], entry['width']) for entry in entries]
+    codes = read_packed_codes(FLAGS.input_codes, entries)
+    images = None
+
+  if FLAGS.output_directory is None:
+    codec.close()
+    return
+  if not tf.gfile.Exists(FLAGS.output_directory):
+    tf.gfile.MakeDirs(FLAGS.output_directory)
+
+  start_time = time.time()
+  reconstructions = codec.decode(codes, image_shapes)
+  elapsed = time.time() - start_time
+  print('Decoded %d images, %.2f images/sec.' %
+        (len(reconstructions), len(reconstructions) / elapsed))
+
+  if images is not None:
+    # Only needed to compare the reconstructions with the original images.
+    import msssim  # pylint: disable=g-import-not-at-top
+  for i, (name, reconstruction) in enumerate(zip(names, reconstructions)):
+    with tf.gfile.FastGFile(os.path.join(FLAGS.output_directory,
+                                         name + '.png'), 'w') as output_image:
+      output_image.write(codec.encode_png(reconstruction))
+    bpp = bits_per_pixel(codes[i], *image_shapes[i])
+    if images is None:
+      print('%s: %.4f bpp' % (name, bpp))
+    else:
+      score = msssim.MultiScaleSSIM(images[i][np.newaxis],
+                                    reconstruction[np.newaxis], max_val=255)
+      print('%s: %.4f bpp, MS-SSIM %.5f' % (name, bpp, score))
+  codec.close()
+
+
+if __name__ == '__main__':
+  tf.app.run()
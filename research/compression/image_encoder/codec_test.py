@@ -0,0 +1,102 @@
+# Copyright 2017 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for the tiling and the packed code files of the batch codec."""
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+import codec
+
+
+class TilesTest(tf.test.TestCase):
+
+  def testRoundTrip(self):
+    rng = np.random.RandomState(0)
+    for height, width, tile_size in [(1, 1, 32), (32, 32, 32), (33, 70, 32),
+                                     (100, 64, 64), (130, 257, 64)]:
+      image = rng.randint(0, 256, size=(height, width, 3)).astype(np.uint8)
+      tiles = codec.split_into_tiles(image, tile_size)
+      rows = -(-height // tile_size)
+      cols = -(-width // tile_size)
+      self.assertEqual((rows * cols, tile_size, tile_size, 3), tiles.shape)
+      self.assertEqual(np.uint8, tiles.dtype)
+      self.assertAllEqual(image, codec.merge_tiles(tiles, height, width))
+
+  def testTilesAreRowMajorAndEdgePadded(self):
+    image = np.arange(40 * 70 * 3).reshape(40, 70, 3) % 251
+    tiles = codec.split_into_tiles(image, 32)
+    self.assertEqual(6, tiles.shape[0])
+    padded = np.pad(image, ((0, 24), (0, 26), (0, 0)), mode='edge')
+    for i, tile in enumerate(tiles):
+      row, col = divmod(i, 3)
+      self.assertAllEqual(
+          padded[row * 32:(row + 1) * 32, col * 32:(col + 1) * 32], tile)
+
+
+class PackedCodesTest(tf.test.TestCase):
+
+  def _codes(self, rng, iteration, num_tiles, tile_size):
+    shape = (iteration + 1, num_tiles, tile_size // 16, tile_size // 16, 32)
+    return rng.randint(0, 2, size=shape).astype(np.uint8)
+
+  def testRoundTrip(self):
+    rng = np.random.RandomState(1)
+    filename = os.path.join(self.get_temp_dir(), 'codes.bin')
+    names = ['a.png', 'b.png', 'c.png']
+    image_shapes = [(33, 70), (1, 1), (130, 257)]
+    # A single bit, which does not fill a byte.
+    codes = [self._codes(rng, 0, 6, 32),
+             rng.randint(0, 2, size=(1,)).astype(np.uint8),
+             self._codes(rng, 3, 15, 64)]
+    codec.write_packed_codes(filename, names, codes, image_shapes)
+
+    index = codec.read_packed_codes_index(filename)
+    self.assertEqual(names, [entry['name'] for entry in index])
+    self.assertEqual(image_shapes,
+                     [(entry['height'], entry['width']) for entry in index])
+    self.assertEqual([list(c.shape) for c in codes],
+                     [entry['shape'] for entry in index])
+    for expected, entry in zip(codes, index):
+      self.assertEqual(-(-expected.size // 8), entry['length'])
+
+    for expected, actual in zip(codes,
+                                codec.read_packed_codes(filename, index)):
+      self.assertEqual(np.uint8, actual.dtype)
+      self.assertAllEqual(expected, actual)
+    # Entries can be read alone and in any order.
+    self.assertAllEqual(
+        codes[2], codec.read_packed_codes(filename, index[2:])[0])
+    actual = codec.read_packed_codes(filename, index[::-1])
+    for expected, actual_codes in zip(codes[::-1], actual):
+      self.assertAllEqual(expected, actual_codes)
+
+  def testEmpty(self):
+    filename = os.path.join(self.get_temp_dir(), 'empty.bin')
+    codec.write_packed_codes(filename, [], [], [])
+    self.assertEqual([], codec.read_packed_codes_index(filename))
+
+  def testNotPackedCodes(self):
+    filename = os.path.join(self.get_temp_dir(), 'other.bin')
+    with open(filename, 'wb') as f:
+      f.write(b'\x89PNG\r\n\x1a\n' + b'\0' * 16)
+    with self.assertRaises(ValueError):
+      codec.read_packed_codes_index(filename)
+
+
+if __name__ == '__main__':
+  tf.test.main()
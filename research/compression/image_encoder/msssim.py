@@ -17,13 +17,16 @@
 
 """Python implementation of MS-SSIM.
 
+Gaussian filtering is separable, so images are blurred with a cached 1-D kernel
+along height and width. All five local statistics are filtered together, and
+batches of images can be scored at once, in float64 or float32.
+
 Usage:
 
 python msssim.py --original_image=original.png --compared_image=distorted.png
 """
 import numpy as np
-from scipy import signal
-from scipy.ndimage.filters import convolve
+from scipy import ndimage
 import tensorflow as tf
 
 
@@ -31,6 +34,9 @@ tf.flags.DEFINE_string('original_image', None, 'Path to PNG image.')
 tf.flags.DEFINE_string('compared_image', None, 'Path to PNG image.')
 FLAGS = tf.flags.FLAGS
 
+# 1-D Gaussian kernels, keyed by (size, sigma, dtype).
+_gauss_kernels = {}
+
 
 def _FSpecialGauss(size, sigma):
   """Function to mimic the 'fspecial' gaussian MATLAB function."""
@@ -46,8 +52,54 @@ def _FSpecialGauss(size, sigma):
   return g / g.sum()
 
 
+def _GaussKernel1D(size, sigma, dtype):
+  """Returns the 1-D kernel whose outer product is _FSpecialGauss(size, sigma).
+
+  Kernels are cached.
+  """
+  key = (size, sigma, np.dtype(dtype).str)
+  if key not in _gauss_kernels:
+    radius = size // 2
+    offset = 0.5 if size % 2 == 0 else 0.0
+    x = np.arange(offset - radius, offset - radius + size)
+    g = np.exp(-(x**2)/(2.0 * sigma**2))
+    _gauss_kernels[key] = (g / g.sum()).astype(dtype)
+  return _gauss_kernels[key]
+
+
+def _FilterValid(images, kernel):
+  """Filters images along their height and width axes, the two axes before
+  the last one, keeping only outputs that don't need padding."""
+  size = kernel.size
+  height, width = images.shape[-3:-1]
+  for axis, length in ((images.ndim - 3, height), (images.ndim - 2, width)):
+    images = ndimage.correlate1d(images, kernel, axis=axis, mode='constant')
+    index = [slice(None)] * images.ndim
+    index[axis] = slice(size // 2, size // 2 + length - size + 1)
+    images = images[tuple(index)]
+  return images
+
+
+def _Downsample(images):
+  """Averages 2x2 blocks of [batch_size, height, width, depth] images.
+
+  Images with an odd height or width are extended by replicating their last
+  row or column, as filtering with a 2x2 box in 'reflect' mode then taking
+  every other pixel does.
+  """
+  _, height, width, _ = images.shape
+  if height % 2 or width % 2:
+    images = np.pad(images, ((0, 0), (0, height % 2), (0, width % 2), (0, 0)),
+                    mode='edge')
+  images = images[:, 0::2] + images[:, 1::2]
+  images = images[:, :, 0::2] + images[:, :, 1::2]
+  images *= 0.25
+  return images
+
+
 def _SSIMForMultiScale(img1, img2, max_val=255, filter_size=11,
-                       filter_sigma=1.5, k1=0.01, k2=0.03):
+                       filter_sigma=1.5, k1=0.01, k2=0.03, per_image=False,
+                       dtype=np.float64):
   """Return the Structural Similarity Map between `img1` and `img2`.
 
   This function attempts to match the functionality of ssim_index_new.m by
@@ -65,10 +117,12 @@ def _SSIMForMultiScale(img1, img2, max_val=255, filter_size=11,
       the original paper).
     k2: Constant used to maintain stability in the SSIM calculation (0.03 in
       the original paper).
+    per_image: If True, averages over each image instead of the whole batch.
+    dtype: Floating point type of the computation.
 
   Returns:
     Pair containing the mean SSIM and contrast sensitivity between `img1` and
-    `img2`.
+    `img2`, scalars or [batch_size] arrays if per_image.
 
   Raises:
     RuntimeError: If input images don't have the same shape or don't have four
@@ -81,8 +135,8 @@ def _SSIMForMultiScale(img1, img2, max_val=255, filter_size=11,
     raise RuntimeError('Input images must have four dimensions, not %d',
                        img1.ndim)
 
-  img1 = img1.astype(np.float64)
-  img2 = img2.astype(np.float64)
+  img1 = img1.astype(dtype, copy=False)
+  img2 = img2.astype(dtype, copy=False)
   _, height, width, _ = img1.shape
 
   # Filter size can't be larger than height or width of images.
@@ -91,19 +145,11 @@ def _SSIMForMultiScale(img1, img2, max_val=255, filter_size=11,
   # Scale down sigma if a smaller filter size is used.
   sigma = size * filter_sigma / filter_size if filter_size else 0
 
+  # Filter the five local statistics in one pass.
+  stats = np.stack([img1, img2, img1 * img1, img2 * img2, img1 * img2])
   if filter_size:
-    window = np.reshape(_FSpecialGauss(size, sigma), (1, size, size, 1))
-    mu1 = signal.fftconvolve(img1, window, mode='valid')
-    mu2 = signal.fftconvolve(img2, window, mode='valid')
-    sigma11 = signal.fftconvolve(img1 * img1, window, mode='valid')
-    sigma22 = signal.fftconvolve(img2 * img2, window, mode='valid')
-    sigma12 = signal.fftconvolve(img1 * img2, window, mode='valid')
-  else:
-    # Empty blur kernel so no need to convolve.
-    mu1, mu2 = img1, img2
-    sigma11 = img1 * img1
-    sigma22 = img2 * img2
-    sigma12 = img1 * img2
+    stats = _FilterValid(stats, _GaussKernel1D(size, sigma, dtype))
+  mu1, mu2, sigma11, sigma22, sigma12 = stats
 
   mu11 = mu1 * mu1
   mu22 = mu2 * mu2
@@ -117,13 +163,16 @@ def _SSIMForMultiScale(img1, img2, max_val=255, filter_size=11,
   c2 = (k2 * max_val) ** 2
   v1 = 2.0 * sigma12 + c2
   v2 = sigma11 + sigma22 + c2
-  ssim = np.mean((((2.0 * mu12 + c1) * v1) / ((mu11 + mu22 + c1) * v2)))
-  cs = np.mean(v1 / v2)
+  axis = (1, 2, 3) if per_image else None
+  cs_map = v1 / v2
+  ssim = np.mean(((2.0 * mu12 + c1) / (mu11 + mu22 + c1)) * cs_map, axis=axis)
+  cs = np.mean(cs_map, axis=axis)
   return ssim, cs
 
 
 def MultiScaleSSIM(img1, img2, max_val=255, filter_size=11, filter_sigma=1.5,
-                   k1=0.01, k2=0.03, weights=None):
+                   k1=0.01, k2=0.03, weights=None, per_image=False,
+                   dtype=np.float64):
   """Return the MS-SSIM score between `img1` and `img2`.
 
   This function implements Multi-Scale Structural Similarity (MS-SSIM) Image
@@ -148,9 +197,14 @@ def MultiScaleSSIM(img1, img2, max_val=255, filter_size=11, filter_sigma=1.5,
       the original paper).
     weights: List of weights for each level; if none, use five levels and the
       weights from the original paper.
+    per_image: If True, scores each image of the batch separately, otherwise
+      the statistics of each scale are averaged over the whole batch.
+    dtype: Floating point type of the computation, np.float32 is faster and
+      uses half the memory.
 
   Returns:
-    MS-SSIM score between `img1` and `img2`.
+    MS-SSIM score between `img1` and `img2`, or [batch_size] array of scores
+    if per_image.
 
   Raises:
     RuntimeError: If input images don't have the same shape or don't have four
@@ -167,20 +221,23 @@ def MultiScaleSSIM(img1, img2, max_val=255, filter_size=11, filter_sigma=1.5,
   weights = np.array(weights if weights else
                      [0.0448, 0.2856, 0.3001, 0.2363, 0.1333])
   levels = weights.size
-  downsample_filter = np.ones((1, 2, 2, 1)) / 4.0
-  im1, im2 = [x.astype(np.float64) for x in [img1, img2]]
-  mssim = np.array([])
-  mcs = np.array([])
-  for _ in range(levels):
+  im1, im2 = [x.astype(dtype) for x in [img1, img2]]
+  mssim = []
+  mcs = []
+  for level in range(levels):
     ssim, cs = _SSIMForMultiScale(
         im1, im2, max_val=max_val, filter_size=filter_size,
-        filter_sigma=filter_sigma, k1=k1, k2=k2)
-    mssim = np.append(mssim, ssim)
-    mcs = np.append(mcs, cs)
-    filtered = [convolve(im, downsample_filter, mode='reflect')
-                for im in [im1, im2]]
-    im1, im2 = [x[:, ::2, ::2, :] for x in filtered]
-  return (np.prod(mcs[0:levels-1] ** weights[0:levels-1]) *
+        filter_sigma=filter_sigma, k1=k1, k2=k2, per_image=per_image,
+        dtype=dtype)
+    mssim.append(ssim)
+    mcs.append(cs)
+    if level < levels - 1:
+      im1, im2 = [_Downsample(im) for im in [im1, im2]]
+  mssim = np.array(mssim, dtype=np.float64)
+  mcs = np.array(mcs, dtype=np.float64)
+  if per_image:
+    weights = weights[:, np.newaxis]
+  return (np.prod(mcs[0:levels-1] ** weights[0:levels-1], axis=0) *
           (mssim[levels-1] ** weights[levels-1]))
 
 
@@ -0,0 +1,133 @@
+# Copyright 2017 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests and benchmarks of MS-SSIM.
+
+Run the benchmarks with:
+python msssim_test.py --benchmarks=.
+"""
+
+import time
+
+import numpy as np
+from scipy import signal
+from scipy.ndimage.filters import convolve
+import tensorflow as tf
+
+import msssim
+
+
+def _ReferenceMultiScaleSSIM(img1, img2, max_val=255, filter_size=11,
+                             filter_sigma=1.5, k1=0.01, k2=0.03):
+  """MS-SSIM with 2-D FFT convolutions, in float64."""
+  weights = np.array([0.0448, 0.2856, 0.3001, 0.2363, 0.1333])
+  im1, im2 = [x.astype(np.float64) for x in [img1, img2]]
+  mssim, mcs = [], []
+  for _ in range(weights.size):
+    size = min(filter_size, im1.shape[1], im1.shape[2])
+    sigma = size * filter_sigma / filter_size
+    window = np.reshape(msssim._FSpecialGauss(size, sigma),  # pylint: disable=protected-access
+                        (1, size, size, 1))
+    mu1, mu2, sigma11, sigma22, sigma12 = [
+        signal.fftconvolve(x, window, mode='valid')
+        for x in [im1, im2, im1 * im1, im2 * im2, im1 * im2]]
+    sigma11 -= mu1 * mu1
+    sigma22 -= mu2 * mu2
+    sigma12 -= mu1 * mu2
+    c1 = (k1 * max_val) ** 2
+    c2 = (k2 * max_val) ** 2
+    v1 = 2.0 * sigma12 + c2
+    v2 = sigma11 + sigma22 + c2
+    mssim.append(np.mean(((2.0 * mu1 * mu2 + c1) * v1) /
+                         ((mu1 * mu1 + mu2 * mu2 + c1) * v2)))
+    mcs.append(np.mean(v1 / v2))
+    filtered = [convolve(im, np.ones((1, 2, 2, 1)) / 4.0, mode='reflect')
+                for im in [im1, im2]]
+    im1, im2 = [x[:, ::2, ::2, :] for x in filtered]
+  return (np.prod(np.array(mcs[:-1]) ** weights[:-1]) *
+          (mssim[-1] ** weights[-1]))
+
+
+def _RandomImagePair(shape, noise=20.0, seed=0):
+  rng = np.random.RandomState(seed)
+  img1 = rng.randint(0, 256, shape).astype(np.uint8)
+  img2 = np.clip(img1 + rng.randn(*shape) * noise, 0, 255).astype(np.uint8)
+  return img1, img2
+
+
+class MultiScaleSSIMTest(tf.test.TestCase):
+
+  def testMatchesReference(self):
+    # Odd sizes and small images exercise padding and reduced filter sizes.
+    for shape in [(2, 64, 48, 3), (1, 129, 97, 3), (3, 37, 41, 1),
+                  (1, 20, 20, 3)]:
+      img1, img2 = _RandomImagePair(shape)
+      for filter_size in [11, 8]:
+        expected = _ReferenceMultiScaleSSIM(img1, img2,
+                                            filter_size=filter_size)
+        self.assertAllClose(
+            expected, msssim.MultiScaleSSIM(img1, img2,
+                                            filter_size=filter_size),
+            rtol=0, atol=1e-9)
+        self.assertAllClose(
+            expected, msssim.MultiScaleSSIM(img1, img2,
+                                            filter_size=filter_size,
+                                            dtype=np.float32),
+            rtol=0, atol=1e-4)
+
+  def testPerImageMatchesSingleImages(self):
+    img1, img2 = _RandomImagePair((4, 64, 64, 3))
+    scores = msssim.MultiScaleSSIM(img1, img2, per_image=True)
+    self.assertEqual(scores.shape, (4,))
+    for i in range(4):
+      self.assertAllClose(
+          msssim.MultiScaleSSIM(img1[i:i + 1], img2[i:i + 1]), scores[i],
+          rtol=0, atol=1e-12)
+
+  def testIdenticalImages(self):
+    img1, _ = _RandomImagePair((2, 64, 64, 3))
+    self.assertAllClose(1.0, msssim.MultiScaleSSIM(img1, img1))
+
+
+class MultiScaleSSIMBenchmark(tf.test.Benchmark):
+
+  def _Benchmark(self, name, fn, iters=3):
+    img1, img2 = _RandomImagePair((8, 256, 256, 3), noise=10.0)
+    fn(img1, img2)
+    start_time = time.time()
+    for _ in range(iters):
+      fn(img1, img2)
+    self.report_benchmark(name=name, iters=iters,
+                          wall_time=(time.time() - start_time) / iters)
+
+  def benchmarkReference(self):
+    self._Benchmark('msssim_reference', _ReferenceMultiScaleSSIM)
+
+  def benchmarkFloat64(self):
+    self._Benchmark('msssim_float64', msssim.MultiScaleSSIM)
+
+  def benchmarkFloat32(self):
+    self._Benchmark(
+        'msssim_float32',
+        lambda img1, img2: msssim.MultiScaleSSIM(img1, img2, dtype=np.float32))
+
+  def benchmarkPerImage(self):
+    self._Benchmark(
+        'msssim_per_image',
+        lambda img1, img2: msssim.MultiScaleSSIM(img1, img2, per_image=True))
+
+
+if __name__ == '__main__':
+  tf.test.main()
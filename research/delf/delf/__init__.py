@@ -26,4 +26,6 @@ from delf.python import datum_io
 from delf.python import delf_v1
 from delf.python import feature_extractor
 from delf.python import feature_io
+# feature_index imports feature_io from the package, so it comes after it.
+from delf.python import feature_index
 # pylint: enable=unused-import
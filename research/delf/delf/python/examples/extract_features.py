@@ -17,6 +17,10 @@
 
 The images must be in JPG format. The program checks if descriptors already
 exist, and skips computation for those.
+
+Images are decoded by a pool of threads ahead of extraction, and descriptor
+post-processing (PCA/whitening) and file writing run on another pool, so both
+overlap with the DELF network running in the session.
 """
 
 from __future__ import absolute_import
@@ -25,17 +29,17 @@ from __future__ import print_function
 
 import argparse
 from google.protobuf import text_format
-import numpy as np
+from multiprocessing.pool import ThreadPool
 import os
 import sys
 import tensorflow as tf
 from tensorflow.python.platform import app
+import threading
 import time
 
 from delf import delf_config_pb2
 from delf import feature_extractor
 from delf import feature_io
-from delf import feature_pb2
 
 cmd_args = None
 
@@ -61,6 +65,32 @@ def _ReadImageList(list_path):
   return image_paths
 
 
+class _StageTimer(object):
+  """Accumulates the time spent in each stage of the pipeline, thread-safely."""
+
+  def __init__(self, stages):
+    self._lock = threading.Lock()
+    self._seconds = dict((stage, 0.0) for stage in stages)
+    self._stages = stages
+
+  def Add(self, stage, seconds):
+    with self._lock:
+      self._seconds[stage] += seconds
+
+  def Report(self, num_images):
+    with self._lock:
+      return ', '.join('%s %.3f s/image' % (stage, self._seconds[stage] /
+                                             max(num_images, 1))
+                       for stage in self._stages)
+
+
+def _OutputPath(image_path):
+  """Returns the path of the DELF feature file of an image."""
+  out_desc_filename = os.path.splitext(
+      os.path.basename(image_path))[0] + _DELF_EXT
+  return os.path.join(cmd_args.output_dir, out_desc_filename)
+
+
 def main(unused_argv):
   tf.logging.set_verbosity(tf.logging.INFO)
 
@@ -79,13 +109,25 @@ def main(unused_argv):
   if not os.path.exists(cmd_args.output_dir):
     os.makedirs(cmd_args.output_dir)
 
+  # If descriptor already exists, skip its computation, and do not even decode
+  # the image.
+  pending_paths = []
+  for image_path in image_paths:
+    if tf.gfile.Exists(_OutputPath(image_path)):
+      tf.logging.info('Skipping %s', image_path)
+    else:
+      pending_paths.append(image_path)
+  num_pending = len(pending_paths)
+
+  # PCA/whitening runs in numpy on the writer threads, not in the session.
+  pca_parameters = feature_extractor.LoadPcaParameters(config)
+  timer = _StageTimer(['decode', 'extract', 'postprocess_and_write'])
+
   # Tell TensorFlow that the model will be built into the default Graph.
   with tf.Graph().as_default():
-    # Reading list of images.
-    filename_queue = tf.train.string_input_producer(image_paths, shuffle=False)
-    reader = tf.WholeFileReader()
-    _, value = reader.read(filename_queue)
-    image_tf = tf.image.decode_jpeg(value, channels=3)
+    # JPEG decoding, run from the decoder threads.
+    jpeg_data = tf.placeholder(tf.string, shape=[])
+    image_tf = tf.image.decode_jpeg(jpeg_data, channels=3)
 
     with tf.Session() as sess:
       # Initialize variables.
@@ -108,57 +150,93 @@ def main(unused_argv):
       attention = tf.reshape(attention_with_extra_dim,
                              [tf.shape(attention_with_extra_dim)[0]])
 
-      locations, descriptors = feature_extractor.DelfFeaturePostProcessing(
-          boxes, raw_descriptors, config)
-
-      # Start input enqueue threads.
-      coord = tf.train.Coordinator()
-      threads = tf.train.start_queue_runners(sess=sess, coord=coord)
-      start = time.clock()
-      for i in range(num_images):
-        # Write to log-info once in a while.
-        if i == 0:
-          tf.logging.info('Starting to extract DELF features from images...')
-        elif i % _STATUS_CHECK_ITERATIONS == 0:
-          elapsed = (time.clock() - start)
-          tf.logging.info('Processing image %d out of %d, last %d '
-                          'images took %f seconds', i, num_images,
-                          _STATUS_CHECK_ITERATIONS, elapsed)
-          start = time.clock()
-
-        # # Get next image.
-        im = sess.run(image_tf)
-
-        # If descriptor already exists, skip its computation.
-        out_desc_filename = os.path.splitext(os.path.basename(
-            image_paths[i]))[0] + _DELF_EXT
-        out_desc_fullpath = os.path.join(cmd_args.output_dir, out_desc_filename)
-        if tf.gfile.Exists(out_desc_fullpath):
-          tf.logging.info('Skipping %s', image_paths[i])
-          continue
-
-        # Extract and save features.
-        (locations_out, descriptors_out, feature_scales_out,
-         attention_out) = sess.run(
-             [locations, descriptors, feature_scales, attention],
-             feed_dict={
-                 input_image:
-                     im,
-                 input_score_threshold:
-                     config.delf_local_config.score_threshold,
-                 input_image_scales:
-                     list(config.image_scales),
-                 input_max_feature_num:
-                     config.delf_local_config.max_feature_num
-             })
-
-        serialized_desc = feature_io.WriteToFile(
-            out_desc_fullpath, locations_out, feature_scales_out,
+      def _Decode(image_path):
+        start = time.time()
+        with tf.gfile.FastGFile(image_path, 'rb') as f:
+          im = sess.run(image_tf, feed_dict={jpeg_data: f.read()})
+        timer.Add('decode', time.time() - start)
+        return image_path, im
+
+      def _PostProcessAndWrite(image_path, boxes_out, raw_descriptors_out,
+                               feature_scales_out, attention_out):
+        start = time.time()
+        locations_out, descriptors_out = (
+            feature_extractor.DelfFeaturePostProcessingNumpy(
+                boxes_out, raw_descriptors_out, pca_parameters))
+        feature_io.WriteToFile(
+            _OutputPath(image_path), locations_out, feature_scales_out,
             descriptors_out, attention_out)
+        timer.Add('postprocess_and_write', time.time() - start)
 
-      # Finalize enqueue threads.
-      coord.request_stop()
-      coord.join(threads)
+      decode_pool = ThreadPool(cmd_args.num_decode_threads)
+      write_pool = ThreadPool(cmd_args.num_write_threads)
+      pending_writes = []
+      try:
+        tf.logging.info('Starting to extract DELF features from %d images...',
+                        num_pending)
+        start = time.time()
+        batches = [
+            pending_paths[i:i + cmd_args.batch_size]
+            for i in range(0, num_pending, cmd_args.batch_size)
+        ]
+        # Decode the next batch while the current one is being extracted.
+        next_batch = None
+        if batches:
+          next_batch = decode_pool.map_async(_Decode, batches[0])
+        num_done = 0
+        for batch_index in range(len(batches)):
+          decoded = next_batch.get()
+          if batch_index + 1 < len(batches):
+            next_batch = decode_pool.map_async(_Decode,
+                                               batches[batch_index + 1])
+          # Process images of the same size back to back.
+          decoded.sort(key=lambda path_and_image: path_and_image[1].shape)
+          for image_path, im in decoded:
+            extract_start = time.time()
+            (boxes_out, raw_descriptors_out, feature_scales_out,
+             attention_out) = sess.run(
+                 [boxes, raw_descriptors, feature_scales, attention],
+                 feed_dict={
+                     input_image:
+                         im,
+                     input_score_threshold:
+                         config.delf_local_config.score_threshold,
+                     input_image_scales:
+                         list(config.image_scales),
+                     input_max_feature_num:
+                         config.delf_local_config.max_feature_num
+                 })
+            timer.Add('extract', time.time() - extract_start)
+            pending_writes.append(
+                write_pool.apply_async(
+                    _PostProcessAndWrite,
+                    (image_path, boxes_out, raw_descriptors_out,
+                     feature_scales_out, attention_out)))
+
+            # Write to log-info once in a while.
+            num_done += 1
+            if num_done % _STATUS_CHECK_ITERATIONS == 0:
+              elapsed = time.time() - start
+              tf.logging.info('Processed %d out of %d images, %.2f images/s '
+                              '(%s)', num_done, num_pending,
+                              num_done / elapsed, timer.Report(num_done))
+          # Wait for the writes of the previous batch, which surfaces their
+          # errors and bounds the number of queued results.
+          for pending_write in pending_writes[:-len(decoded)]:
+            pending_write.get()
+          pending_writes = pending_writes[-len(decoded):]
+      finally:
+        decode_pool.close()
+        write_pool.close()
+        decode_pool.join()
+        write_pool.join()
+      for pending_write in pending_writes:
+        pending_write.get()
+      elapsed = time.time() - start
+      tf.logging.info('Extracted features from %d images in %.1f s, '
+                      '%.2f images/s (%s)', num_pending, elapsed,
+                      num_pending / max(elapsed, 1e-9),
+                      timer.Report(num_pending))
 
 
 if __name__ == '__main__':
@@ -187,5 +265,27 @@ if __name__ == '__main__':
       Directory where DELF features will be written to. Each image's features
       will be written to a file with same name, and extension replaced by .delf.
       """)
+  parser.add_argument(
+      '--batch_size',
+      type=int,
+      default=32,
+      help="""
+      Number of images decoded ahead of extraction. Images of a batch are
+      extracted grouped by size.
+      """)
+  parser.add_argument(
+      '--num_decode_threads',
+      type=int,
+      default=4,
+      help="""
+      Number of threads decoding JPEG images.
+      """)
+  parser.add_argument(
+      '--num_write_threads',
+      type=int,
+      default=2,
+      help="""
+      Number of threads applying PCA/whitening and writing feature files.
+      """)
   cmd_args, unparsed = parser.parse_known_args()
   app.run(main=main, argv=[sys.argv[0]] + unparsed)
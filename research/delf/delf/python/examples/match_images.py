@@ -26,11 +26,11 @@ from __future__ import division
 from __future__ import print_function
 
 import argparse
+from delf import feature_index
 from delf import feature_io
 import matplotlib.image as mpimg
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy.spatial import cKDTree
 from skimage.feature import plot_matches
 from skimage.measure import ransac
 from skimage.transform import AffineTransform
@@ -56,20 +56,11 @@ def main(unused_argv):
   num_features_2 = locations_2.shape[0]
   tf.logging.info("Loaded image 2's %d features" % num_features_2)
 
-  # Find nearest-neighbor matches using a KD tree.
-  d1_tree = cKDTree(descriptors_1)
-  distances, indices = d1_tree.query(
-      descriptors_2, distance_upper_bound=_DISTANCE_THRESHOLD)
-
-  # Select feature locations for putative matches.
-  locations_2_to_use = np.array([
-      locations_2[i,] for i in range(num_features_2)
-      if indices[i] != num_features_1
-  ])
-  locations_1_to_use = np.array([
-      locations_1[indices[i],] for i in range(num_features_2)
-      if indices[i] != num_features_1
-  ])
+  # Find nearest-neighbor matches using a KD tree, and select feature
+  # locations for putative matches.
+  locations_1_to_use, locations_2_to_use = feature_index.MatchFeatures(
+      locations_1, descriptors_1, locations_2, descriptors_2,
+      _DISTANCE_THRESHOLD)
 
   # Perform geometric verification using RANSAC.
   model_robust, inliers = ransac(
@@ -23,6 +23,7 @@ from delf import delf_v1
 from delf import delf_config_pb2
 from object_detection.core import box_list
 from object_detection.core import box_list_ops
+import numpy as np
 import tensorflow as tf
 
 
@@ -381,3 +382,103 @@ def DelfFeaturePostProcessing(boxes, descriptors, config):
           final_descriptors, dim=1, name='pca_l2_normalization')
 
   return locations, final_descriptors
+
+
+def ApplyPcaAndWhiteningNumpy(data,
+                              pca_matrix,
+                              pca_mean,
+                              output_dim,
+                              use_whitening=False,
+                              pca_variances=None):
+  """Applies PCA/whitening to data, as ApplyPcaAndWhitening but in numpy.
+
+  This allows running PCA/whitening outside of the TensorFlow session, eg in
+  a thread that post-processes features while the next image is extracted.
+
+  Args:
+    data: [N, dim] float array containing data which undergoes PCA/whitening.
+    pca_matrix: [dim, dim] float array PCA matrix, row-major.
+    pca_mean: [dim] float array, mean to subtract before projection.
+    output_dim: Number of dimensions to use in output data, of type int.
+    use_whitening: Whether whitening is to be used.
+    pca_variances: [dim] float array containing PCA variances. Only used if
+      use_whitening is True.
+
+  Returns:
+    output: [N, output_dim] float array with output of PCA/whitening operation.
+  """
+  output = np.dot(data - pca_mean, pca_matrix[:output_dim].T)
+
+  # Apply whitening if desired.
+  if use_whitening:
+    output /= np.sqrt(pca_variances[:output_dim])
+
+  return output
+
+
+def LoadPcaParameters(config):
+  """Loads the PCA parameters of a DelfConfig as float32 arrays.
+
+  Args:
+    config: DelfConfig proto with DELF extraction options.
+
+  Returns:
+    pca_parameters: Dict with keys 'pca_matrix', 'pca_mean', 'output_dim',
+      'use_whitening' and 'pca_variances', to be passed as keyword arguments
+      to ApplyPcaAndWhiteningNumpy; or None if PCA is not used.
+  """
+  if not config.delf_local_config.use_pca:
+    return None
+  pca_config = config.delf_local_config.pca_parameters
+  pca_variances = None
+  if pca_config.use_whitening:
+    pca_variances = datum_io.ReadFromFile(
+        pca_config.pca_variances_path).astype(np.float32)
+  return {
+      'pca_matrix':
+          datum_io.ReadFromFile(
+              pca_config.projection_matrix_path).astype(np.float32),
+      'pca_mean':
+          datum_io.ReadFromFile(pca_config.mean_path).astype(np.float32),
+      'output_dim':
+          pca_config.pca_dim,
+      'use_whitening':
+          pca_config.use_whitening,
+      'pca_variances':
+          pca_variances,
+  }
+
+
+def _L2NormalizeNumpy(data, epsilon=1e-12):
+  """Row-wise numpy equivalent of tf.nn.l2_normalize(data, dim=1)."""
+  square_sum = np.sum(np.square(data), axis=1, keepdims=True)
+  return data / np.sqrt(np.maximum(square_sum, epsilon))
+
+
+def DelfFeaturePostProcessingNumpy(boxes, descriptors, pca_parameters=None):
+  """Post-processes DELF features, as DelfFeaturePostProcessing but in numpy.
+
+  Args:
+    boxes: [N, 4] float array which denotes the selected receptive box. N is
+      the number of final feature points which pass through keypoint selection
+      and NMS steps.
+    descriptors: [N, input_dim] float array.
+    pca_parameters: PCA parameters returned by LoadPcaParameters, or None if
+      PCA is not used.
+
+  Returns:
+    locations: [N, 2] float array which denotes the selected keypoint
+      locations.
+    final_descriptors: [N, output_dim] float array with DELF descriptors after
+      normalization and (possibly) PCA/whitening.
+  """
+  boxes = np.asarray(boxes, dtype=np.float32)
+  locations = (boxes[:, 0:2] + boxes[:, 2:4]) / 2.0
+
+  final_descriptors = _L2NormalizeNumpy(
+      np.asarray(descriptors, dtype=np.float32))
+  if pca_parameters is not None:
+    final_descriptors = _L2NormalizeNumpy(
+        ApplyPcaAndWhiteningNumpy(final_descriptors, **pca_parameters))
+
+  return locations, final_descriptors
@@ -127,6 +127,41 @@ class FeatureExtractorTest(tf.test.TestCase):
 
     self.assertAllEqual(exp_output, output_out)
 
+  def testPcaWhiteningNumpy(self):
+    data = np.array([[1.0, 2.0, -2.0], [-5.0, 0.0, 3.0], [-1.0, 2.0, 0.0],
+                     [0.0, 4.0, -1.0]])
+    pca_matrix = np.array([[2.0, 0.0, -1.0], [0.0, 1.0, 1.0],
+                           [-1.0, 1.0, 3.0]])
+    pca_mean = np.array([1.0, 2.0, 3.0])
+    output_dim = 2
+    use_whitening = True
+    pca_variances = np.array([4.0, 1.0])
+
+    output = feature_extractor.ApplyPcaAndWhiteningNumpy(
+        data, pca_matrix, pca_mean, output_dim, use_whitening, pca_variances)
+
+    exp_output = [[2.5, -5.0], [-6.0, -2.0], [-0.5, -3.0], [1.0, -2.0]]
+
+    self.assertAllEqual(exp_output, output)
+
+  def testDelfFeaturePostProcessingNumpy(self):
+    boxes = [[-10.0, 0.0, 11.0, 21.0], [-2.5, 5.0, 18.5, 26.0]]
+    descriptors = [[3.0, 0.0, 4.0], [0.0, 0.0, 0.0]]
+    pca_parameters = {
+        'pca_matrix': np.eye(3),
+        'pca_mean': np.zeros([3]),
+        'output_dim': 2,
+        'use_whitening': False,
+        'pca_variances': None,
+    }
+
+    locations, final_descriptors = (
+        feature_extractor.DelfFeaturePostProcessingNumpy(
+            boxes, descriptors, pca_parameters))
+
+    self.assertAllEqual([[0.5, 10.5], [8.0, 15.5]], locations)
+    self.assertAllClose([[1.0, 0.0], [0.0, 0.0]], final_descriptors)
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -0,0 +1,326 @@
+# Copyright 2017 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Index of DELF features over an image collection.
+
+The index holds the descriptors of all database images in one KD tree, so a
+query image is matched against the whole database with a single
+nearest-neighbor search. Putative matches are then grouped per database image
+with array operations, and only the most promising images are verified
+geometrically using RANSAC.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+
+from delf import feature_io
+import numpy as np
+from scipy.spatial import cKDTree
+from skimage.measure import ransac
+from skimage.transform import AffineTransform
+import tensorflow as tf
+
+# Maximum descriptor distance for two features to be putatively matched.
+_DISTANCE_THRESHOLD = 0.8
+
+# Minimum number of correspondences needed to fit an affine transform.
+_MIN_RANSAC_SAMPLES = 3
+
+
+def MatchFeatures(locations_1,
+                  descriptors_1,
+                  locations_2,
+                  descriptors_2,
+                  distance_threshold=_DISTANCE_THRESHOLD,
+                  descriptors_1_tree=None):
+  """Finds putative matches between the features of two images.
+
+  Each feature of image 2 is matched to its nearest neighbor in image 1, if
+  their descriptors are closer than distance_threshold.
+
+  Args:
+    locations_1: [N1, 2] float array with the keypoint locations of image 1.
+    descriptors_1: [N1, depth] float array with the descriptors of image 1.
+    locations_2: [N2, 2] float array with the keypoint locations of image 2.
+    descriptors_2: [N2, depth] float array with the descriptors of image 2.
+    distance_threshold: Maximum distance between matched descriptors.
+    descriptors_1_tree: Optional cKDTree over descriptors_1, to avoid
+      rebuilding it when image 1 is matched against several images.
+
+  Returns:
+    locations_1_to_use: [M, 2] float array with the locations of the matched
+      features in image 1.
+    locations_2_to_use: [M, 2] float array with the locations of the matched
+      features in image 2.
+  """
+  if descriptors_1_tree is None:
+    descriptors_1_tree = cKDTree(descriptors_1)
+  _, indices = descriptors_1_tree.query(
+      descriptors_2, distance_upper_bound=distance_threshold)
+  # Features without a neighbor get index N1.
+  matched = indices != locations_1.shape[0]
+  return locations_1[indices[matched]], locations_2[matched]
+
+
+def CountInliers(locations_1, locations_2, residual_threshold=20,
+                 max_trials=1000):
+  """Counts the matches that are consistent with an affine transform.
+
+  Args:
+    locations_1: [M, 2] float array with matched locations in image 1.
+    locations_2: [M, 2] float array with matched locations in image 2.
+    residual_threshold: Maximum RANSAC residual for a match to be an inlier.
+    max_trials: Maximum number of RANSAC iterations.
+
+  Returns:
+    num_inliers: Number of inliers of the best transform found by RANSAC.
+  """
+  if locations_1.shape[0] < _MIN_RANSAC_SAMPLES:
+    return 0
+  _, inliers = ransac(
+      (locations_1, locations_2),
+      AffineTransform,
+      min_samples=_MIN_RANSAC_SAMPLES,
+      residual_threshold=residual_threshold,
+      max_trials=max_trials)
+  if inliers is None:
+    return 0
+  return int(np.sum(inliers))
+
+
+class FeatureIndex(object):
+  """Descriptor index over the DELF features of a collection of images."""
+
+  def __init__(self, image_names, locations, descriptors, image_ids):
+    """Creates an index from the features of all database images.
+
+    Args:
+      image_names: List of the names of the N database images.
+      locations: [M, 2] float array with the keypoint locations of all
+        database features.
+      descriptors: [M, depth] float array with all database descriptors.
+      image_ids: [M] int array with the index in image_names of the image
+        each feature belongs to.
+    """
+    self._image_names = list(image_names)
+    self._locations = np.asarray(locations, dtype=np.float32)
+    self._descriptors = np.asarray(descriptors, dtype=np.float32)
+    self._image_ids = np.asarray(image_ids, dtype=np.int32)
+    self._tree = cKDTree(self._descriptors)
+
+  @classmethod
+  def FromFeatures(cls, image_names, features):
+    """Creates an index from per-image features.
+
+    Args:
+      image_names: List of the names of the N database images.
+      features: List of N (locations, descriptors) pairs, as returned by
+        feature_io.ReadFromFile or feature_io.ReadFromPackedFile.
+
+    Returns:
+      index: FeatureIndex object.
+    """
+    locations = [np.reshape(l, [-1, 2]) for l, _ in features]
+    depth = max([np.shape(d)[-1] for _, d in features if np.size(d)] or [0])
+    descriptors = [np.reshape(d, [-1, depth]) for _, d in features]
+    image_ids = [
+        np.full([len(l)], i, dtype=np.int32) for i, l in enumerate(locations)
+    ]
+    if not image_ids:
+      return cls(image_names, np.zeros([0, 2]), np.zeros([0, depth]),
+                 np.zeros([0]))
+    return cls(image_names, np.concatenate(locations),
+               np.concatenate(descriptors), np.concatenate(image_ids))
+
+  @classmethod
+  def FromPackedFiles(cls, image_names, feature_paths):
+    """Creates an index from feature files written by WriteToPackedFile.
+
+    Args:
+      image_names: List of the names of the N database images.
+      feature_paths: List of N paths to packed feature files.
+
+    Returns:
+      index: FeatureIndex object.
+    """
+    features = []
+    for path in feature_paths:
+      locations, _, descriptors, _, _ = feature_io.ReadFromPackedFile(path)
+      features.append((locations, descriptors))
+    return cls.FromFeatures(image_names, features)
+
+  @classmethod
+  def Load(cls, file_path):
+    """Loads an index saved with Save.
+
+    The KD tree is not stored, it is rebuilt from the descriptors.
+
+    Args:
+      file_path: Path to the index file.
+
+    Returns:
+      index: FeatureIndex object.
+    """
+    with tf.gfile.FastGFile(file_path, 'rb') as f:
+      packed = np.load(io.BytesIO(f.read()))
+      return cls(packed['image_names'].tolist(), packed['locations'],
+                 packed['descriptors'], packed['image_ids'])
+
+  def Save(self, file_path):
+    """Saves the index to a file.
+
+    Args:
+      file_path: Path to file that will be written.
+    """
+    buf = io.BytesIO()
+    np.savez(
+        buf,
+        image_names=np.array(self._image_names, dtype='U'),
+        locations=self._locations,
+        descriptors=self._descriptors,
+        image_ids=self._image_ids)
+    with tf.gfile.FastGFile(file_path, 'wb') as f:
+      f.write(buf.getvalue())
+
+  @property
+  def image_names(self):
+    return self._image_names
+
+  @property
+  def num_features(self):
+    return self._descriptors.shape[0]
+
+  def _PutativeMatches(self, distances, indices):
+    """Groups the nearest neighbors of one query image by database image.
+
+    Args:
+      distances: [Q, K] float array with the distances of the K nearest
+        database features of each of the Q query features, in increasing
+        order; inf if there is no neighbor within the distance threshold.
+      indices: [Q, K] int array with the indices of those database features.
+
+    Returns:
+      query_ids: [P] int array with the query feature of each putative match.
+      feature_ids: [P] int array with the database feature of each match.
+      image_ids: [P] int array with the database image of each match, sorted.
+    """
+    num_neighbors = distances.shape[1]
+    found = np.isfinite(distances).ravel()
+    query_ids = np.repeat(np.arange(distances.shape[0]), num_neighbors)[found]
+    feature_ids = indices.ravel()[found]
+    image_ids = self._image_ids[feature_ids].astype(np.int64)
+    # As in MatchFeatures, a query feature is matched to at most one feature
+    # of each database image: its nearest one, which comes first.
+    pair_keys = query_ids * len(self._image_names) + image_ids
+    _, first = np.unique(pair_keys, return_index=True)
+    order = first[np.argsort(image_ids[first], kind='mergesort')]
+    return query_ids[order], feature_ids[order], image_ids[order]
+
+  def Query(self,
+            locations,
+            descriptors,
+            num_results=10,
+            num_candidates=100,
+            num_neighbors=10,
+            distance_threshold=_DISTANCE_THRESHOLD,
+            residual_threshold=20,
+            max_trials=1000):
+    """Retrieves the database images that best match one query image.
+
+    Args:
+      locations: [Q, 2] float array with the keypoint locations of the query.
+      descriptors: [Q, depth] float array with the descriptors of the query.
+      num_results: Number of database images to return.
+      num_candidates: Number of database images with most putative matches
+        that are verified with RANSAC.
+      num_neighbors: Number of nearest database features considered for each
+        query feature. A query feature only gets a putative match in images
+        that own one of its num_neighbors nearest neighbors.
+      distance_threshold: Maximum distance between matched descriptors.
+      residual_threshold: Maximum RANSAC residual for a match to be an inlier.
+      max_trials: Maximum number of RANSAC iterations.
+
+    Returns:
+      results: List of at most num_results (image_name, num_inliers) pairs,
+        sorted by decreasing number of inliers.
+    """
+    return self.BatchQuery([(locations, descriptors)], num_results,
+                           num_candidates, num_neighbors, distance_threshold,
+                           residual_threshold, max_trials)[0]
+
+  def BatchQuery(self,
+                 queries,
+                 num_results=10,
+                 num_candidates=100,
+                 num_neighbors=10,
+                 distance_threshold=_DISTANCE_THRESHOLD,
+                 residual_threshold=20,
+                 max_trials=1000):
+    """Retrieves the best matching database images for several queries.
+
+    The descriptors of all queries are searched in the index at once.
+
+    Args:
+      queries: List of (locations, descriptors) pairs, one per query image.
+      num_results: Number of database images to return per query.
+      num_candidates: Number of database images with most putative matches
+        that are verified with RANSAC, per query.
+      num_neighbors: Number of nearest database features considered for each
+        query feature.
+      distance_threshold: Maximum distance between matched descriptors.
+      residual_threshold: Maximum RANSAC residual for a match to be an inlier.
+      max_trials: Maximum number of RANSAC iterations.
+
+    Returns:
+      results: List with, for each query, a list of at most num_results
+        (image_name, num_inliers) pairs sorted by decreasing number of inliers.
+    """
+    num_query_features = [np.shape(l)[0] for l, _ in queries]
+    if not queries or not sum(num_query_features) or not self.num_features:
+      return [[] for _ in queries]
+    all_descriptors = np.concatenate([
+        np.reshape(d, [-1, self._descriptors.shape[1]]) for _, d in queries
+    ])
+    distances, indices = self._tree.query(
+        all_descriptors,
+        k=num_neighbors,
+        distance_upper_bound=distance_threshold)
+    distances = np.reshape(distances, [-1, num_neighbors])
+    indices = np.reshape(indices, [-1, num_neighbors])
+    splits = np.cumsum(num_query_features)[:-1]
+
+    results = []
+    for (locations, _), query_distances, query_indices in zip(
+        queries, np.split(distances, splits), np.split(indices, splits)):
+      query_ids, feature_ids, image_ids = self._PutativeMatches(
+          query_distances, query_indices)
+      num_matches = np.bincount(image_ids, minlength=len(self._image_names))
+      candidates = np.argsort(-num_matches, kind='mergesort')[:num_candidates]
+      candidates = candidates[num_matches[candidates] >= _MIN_RANSAC_SAMPLES]
+      # Matches are sorted by image, so each candidate owns a contiguous run.
+      starts = np.searchsorted(image_ids, candidates, side='left')
+      ends = np.searchsorted(image_ids, candidates, side='right')
+      scores = []
+      for image_id, start, end in zip(candidates, starts, ends):
+        num_inliers = CountInliers(
+            self._locations[feature_ids[start:end]],
+            np.asarray(locations)[query_ids[start:end]], residual_threshold,
+            max_trials)
+        scores.append((self._image_names[image_id], num_inliers))
+      scores.sort(key=lambda score: -score[1])
+      results.append(scores[:num_results])
+    return results
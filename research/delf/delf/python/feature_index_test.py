@@ -0,0 +1,98 @@
+# Copyright 2017 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for feature_index, the DELF descriptor index."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from delf import feature_index
+import numpy as np
+import os
+import subprocess
+import sys
+import tensorflow as tf
+
+
+def create_features(num_images=5, num_features=50, depth=40):
+  """Creates random unit-norm features for a collection of images.
+
+  Returns:
+    features: List of num_images (locations, descriptors) pairs.
+  """
+  rng = np.random.RandomState(0)
+  features = []
+  for _ in range(num_images):
+    locations = rng.rand(num_features, 2) * 500
+    descriptors = rng.rand(num_features, depth)
+    descriptors /= np.linalg.norm(descriptors, axis=1, keepdims=True)
+    features.append((locations, descriptors))
+  return features
+
+
+class FeatureIndexTest(tf.test.TestCase):
+
+  def testImportPackage(self):
+    # A fresh interpreter, so that the package initializes its modules in
+    # their own order rather than after this test's imports.
+    subprocess.check_call(
+        [sys.executable, '-c',
+         'import delf; delf.feature_index.FeatureIndex; delf.feature_io'])
+
+  def testMatchFeatures(self):
+    (locations_1, descriptors_1), (locations_2, _) = create_features(2)[:2]
+    # Image 2 holds a shifted copy of the first ten features of image 1.
+    descriptors_2 = np.concatenate(
+        [descriptors_1[:10], -np.ones([len(locations_2) - 10, 40])])
+
+    locations_1_to_use, locations_2_to_use = feature_index.MatchFeatures(
+        locations_1, descriptors_1, locations_2, descriptors_2)
+
+    self.assertAllEqual(locations_1[:10], locations_1_to_use)
+    self.assertAllEqual(locations_2[:10], locations_2_to_use)
+
+  def testBatchQuery(self):
+    features = create_features()
+    names = ['image_%d' % i for i in range(len(features))]
+    index = feature_index.FeatureIndex.FromFeatures(names, features)
+    queries = [(features[3][0][:30] + 5.0, features[3][1][:30]),
+               (features[1][0] * 1.5, features[1][1])]
+
+    results = index.BatchQuery(queries, num_results=2)
+
+    self.assertEqual(len(results), 2)
+    self.assertEqual(results[0][0], ('image_3', 30))
+    self.assertEqual(results[1][0], ('image_1', 50))
+    self.assertEqual(index.Query(*queries[0], num_results=1), [results[0][0]])
+
+  def testSaveAndLoad(self):
+    features = create_features()
+    names = ['image_%d' % i for i in range(len(features))]
+    index = feature_index.FeatureIndex.FromFeatures(names, features)
+
+    tmpdir = tf.test.get_temp_dir()
+    filename = os.path.join(tmpdir, 'test.index')
+    index.Save(filename)
+    loaded_index = feature_index.FeatureIndex.Load(filename)
+
+    self.assertEqual(names, loaded_index.image_names)
+    self.assertEqual(index.num_features, loaded_index.num_features)
+    self.assertEqual(
+        loaded_index.Query(*features[2], num_results=1), [('image_2', 50)])
+
+
+if __name__ == '__main__':
+  tf.test.main()
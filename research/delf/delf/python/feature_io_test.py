@@ -77,6 +77,21 @@ class DelfFeaturesIoTest(tf.test.TestCase):
     self.assertAllEqual(attention, parsed_data[3])
     self.assertAllEqual(np.zeros([4]), parsed_data[4])
 
+  def testConversionAndBackNoFeatures(self):
+    locations = np.array([])
+    scales = np.array([])
+    descriptors = np.array([])
+    attention = np.array([])
+
+    delf_features = feature_io.ArraysToDelfFeatures(locations, scales,
+                                                    descriptors, attention)
+    self.assertEqual(len(delf_features.feature), 0)
+
+    parsed_data = feature_io.ParseFromString(
+        delf_features.SerializeToString())
+    for array in parsed_data:
+      self.assertEqual(array.size, 0)
+
   def testWriteAndReadToFile(self):
     locations, scales, descriptors, attention, orientations = create_data()
 
@@ -92,6 +107,21 @@ class DelfFeaturesIoTest(tf.test.TestCase):
     self.assertAllEqual(attention, data_read[3])
     self.assertAllEqual(orientations, data_read[4])
 
+  def testWriteAndReadToPackedFile(self):
+    locations, scales, descriptors, attention, orientations = create_data()
+
+    tmpdir = tf.test.get_temp_dir()
+    filename = os.path.join(tmpdir, 'test.delf.npz')
+    feature_io.WriteToPackedFile(filename, locations, scales, descriptors,
+                                 attention, orientations)
+    data_read = feature_io.ReadFromPackedFile(filename)
+
+    self.assertAllEqual(locations, data_read[0])
+    self.assertAllEqual(scales, data_read[1])
+    self.assertAllEqual(descriptors, data_read[2])
+    self.assertAllEqual(attention, data_read[3])
+    self.assertAllEqual(orientations, data_read[4])
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -35,6 +35,12 @@ tf.flags.DEFINE_integer("batch_size", 600,
                         "The training batch size.")
 tf.flags.DEFINE_integer("batches_per_lot", 1,
                         "Number of batches per lot.")
+tf.flags.DEFINE_integer("microbatch_size", 0,
+                        "If positive, compute per-example gradients this many "
+                        "examples at a time with tf.gradients, and clip them "
+                        "by one global l2 norm, instead of using the "
+                        "per_example_gradients rewrite. Must divide "
+                        "batch_size. Per-layer gradient bounds are ignored.")
 # Together, batch_size and batches_per_lot determine lot_size.
 tf.flags.DEFINE_integer("num_training_steps", 50000,
                         "The number of training steps."
@@ -243,6 +249,7 @@ def Train(mnist_train_file, mnist_test_file, network_parameters, num_steps,
   params = {"accountant_type": FLAGS.accountant_type,
             "task_id": 0,
             "batch_size": FLAGS.batch_size,
+            "microbatch_size": FLAGS.microbatch_size,
             "projection_dimensions": FLAGS.projection_dimensions,
             "default_gradient_l2norm_bound":
             network_parameters.default_gradient_l2norm_bound,
@@ -269,8 +276,9 @@ def Train(mnist_train_file, mnist_test_file, network_parameters, num_steps,
     # Create the basic Mnist model.
     images, labels = MnistInput(mnist_train_file, batch_size, FLAGS.randomize)
 
+    variables = {}
     logits, projection, training_params = utils.BuildNetwork(
-        images, network_parameters)
+        images, network_parameters, variables=variables)
 
     cost = tf.nn.softmax_cross_entropy_with_logits(
         logits=logits, labels=tf.one_hot(labels, 10))
@@ -278,6 +286,14 @@ def Train(mnist_train_file, mnist_test_file, network_parameters, num_steps,
     # The actual cost is the average across the examples.
     cost = tf.reduce_sum(cost, [0]) / batch_size
 
+    def per_example_cost(example_images, example_labels):
+      """Rebuilds the network on some examples, sharing its variables."""
+      example_logits, _, _ = utils.BuildNetwork(
+          example_images, network_parameters, variables=variables)
+      return tf.nn.softmax_cross_entropy_with_logits(
+          logits=example_logits,
+          labels=tf.one_hot(example_labels, 10)) / batch_size
+
     if FLAGS.accountant_type == "Amortized":
       priv_accountant = accountant.AmortizedAccountant(NUM_TRAINING_IMAGES)
       sigma = None
@@ -332,8 +348,11 @@ def Train(mnist_train_file, mnist_test_file, network_parameters, num_steps,
           [eps, delta],
           gaussian_sanitizer,
           sigma=sigma,
-          batches_per_lot=FLAGS.batches_per_lot).minimize(
-              cost, global_step=global_step)
+          batches_per_lot=FLAGS.batches_per_lot,
+          microbatch_size=FLAGS.microbatch_size or None).minimize(
+              per_example_cost if FLAGS.microbatch_size else cost,
+              global_step=global_step,
+              inputs=[images, labels])
     else:
       gd_op = tf.train.GradientDescentOptimizer(lr).minimize(cost)
 
@@ -361,16 +380,24 @@ def Train(mnist_train_file, mnist_test_file, network_parameters, num_steps,
 
     lot_size = FLAGS.batches_per_lot * FLAGS.batch_size
     lots_per_epoch = NUM_TRAINING_IMAGES / lot_size
+    # Training throughput since the last evaluation, excluding the evaluation.
+    train_examples = 0
+    train_secs = 0.0
     for step in xrange(num_steps):
       epoch = step / lots_per_epoch
       curr_lr = utils.VaryRate(FLAGS.lr, FLAGS.end_lr,
                                FLAGS.lr_saturate_epochs, epoch)
       curr_eps = utils.VaryRate(FLAGS.eps, FLAGS.end_eps,
                                 FLAGS.eps_saturate_epochs, epoch)
+      lot_start_time = time.time()
       for _ in xrange(FLAGS.batches_per_lot):
         _ = sess.run(
             [gd_op], feed_dict={lr: curr_lr, eps: curr_eps, delta: FLAGS.delta})
-      sys.stderr.write("step: %d\n" % step)
+      lot_secs = time.time() - lot_start_time
+      train_examples += lot_size
+      train_secs += lot_secs
+      sys.stderr.write("step: %d (%.1f examples/sec)\n" % (
+          step, lot_size / lot_secs))
 
       # See if we should stop training due to exceeded privacy budget:
       should_terminate = False
@@ -404,6 +431,10 @@ def Train(mnist_train_file, mnist_test_file, network_parameters, num_steps,
                                        randomize=False, load_path=save_path,
                                        save_mistakes=FLAGS.save_mistakes)
         sys.stderr.write("eval_accuracy: %.2f\n" % test_accuracy)
+        examples_per_sec = train_examples / train_secs
+        sys.stderr.write("train_examples_per_sec: %.1f\n" % examples_per_sec)
+        train_examples = 0
+        train_secs = 0.0
 
         curr_time = time.time()
         elapsed_time = curr_time - prev_time
@@ -414,6 +445,7 @@ def Train(mnist_train_file, mnist_test_file, network_parameters, num_steps,
                         "spent_eps_deltas": spent_eps_deltas,
                         "train_accuracy": train_accuracy,
                         "test_accuracy": test_accuracy,
+                        "examples_per_sec": examples_per_sec,
                         "mistakes": mistakes})
         loginfo = {"elapsed_secs": curr_time-start_time,
                    "spent_eps_deltas": spent_eps_deltas,
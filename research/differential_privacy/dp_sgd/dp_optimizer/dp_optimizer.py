@@ -29,7 +29,7 @@ class DPGradientDescentOptimizer(tf.train.GradientDescentOptimizer):
 
   def __init__(self, learning_rate, eps_delta, sanitizer,
                sigma=None, use_locking=False, name="DPGradientDescent",
-               batches_per_lot=1):
+               batches_per_lot=1, microbatch_size=None):
     """Construct a differentially private gradient descent optimizer.
 
     The optimizer uses fixed privacy budget for each batch of training.
@@ -43,6 +43,11 @@ class DPGradientDescentOptimizer(tf.train.GradientDescentOptimizer):
       use_locking: use locking.
       name: name for the object.
       batches_per_lot: Number of batches in a lot.
+      microbatch_size: if not None, compute the per-example gradients with
+        tf.gradients, for microbatch_size examples at a time, instead of with
+        the per_example_gradients rewrite, which only supports some ops. The
+        loss must then be a function of the batch inputs, see minimize, and
+        each example is clipped by one global l2 norm across all variables.
     """
 
     super(DPGradientDescentOptimizer, self).__init__(learning_rate,
@@ -65,15 +70,18 @@ class DPGradientDescentOptimizer(tf.train.GradientDescentOptimizer):
     self._eps_delta = eps_delta
     self._sanitizer = sanitizer
     self._sigma = sigma
+    self._microbatch_size = microbatch_size
 
   def compute_sanitized_gradients(self, loss, var_list=None,
-                                  add_noise=True):
+                                  add_noise=True, inputs=None):
     """Compute the sanitized gradients.
 
     Args:
-      loss: the loss tensor.
+      loss: the loss tensor, or with microbatch_size, a function mapping
+        slices of the inputs to the vector of their per-example losses.
       var_list: the optional variables.
       add_noise: if true, then add noise. Always clip.
+      inputs: with microbatch_size, the list of batch tensors passed to loss.
     Returns:
       a pair of (list of sanitized gradients) and privacy spending accumulation
       operations.
@@ -81,6 +89,10 @@ class DPGradientDescentOptimizer(tf.train.GradientDescentOptimizer):
       TypeError: if var_list contains non-variable.
     """
 
+    if self._microbatch_size is not None:
+      return self._compute_microbatched_sanitized_gradients(
+          loss, var_list, add_noise, inputs)
+
     self._assert_valid_dtypes([loss])
 
     xs = [tf.convert_to_tensor(x) for x in var_list]
@@ -97,8 +109,70 @@ class DPGradientDescentOptimizer(tf.train.GradientDescentOptimizer):
 
     return sanitized_grads
 
+  def _compute_microbatched_sanitized_gradients(self, loss, var_list,
+                                                add_noise, inputs):
+    """Compute the sanitized gradients, one microbatch at a time.
+
+    A while loop goes over the batch in microbatches of microbatch_size
+    examples. For each example of a microbatch, the loss is built on that
+    example alone, inside the loop, and differentiated with tf.gradients, so
+    that each example costs one forward and backward pass of size 1. The
+    gradients of the microbatch are stacked, clipped together by a global l2
+    norm per example, and added to the sums, so that only one microbatch of
+    per-example gradients is held in memory.
+
+    Args:
+      loss: a function mapping slices of the inputs to the vector of their
+        per-example losses.
+      var_list: the variables.
+      add_noise: if true, then add noise. Always clip.
+      inputs: the list of batch tensors passed to loss, whose dimension-0
+        slices are the examples. The batch size must be a multiple of
+        microbatch_size.
+    Returns:
+      the list of sanitized gradients.
+    Raises:
+      ValueError: if inputs is empty.
+    """
+
+    if not inputs:
+      raise ValueError("inputs are required with microbatch_size.")
+    inputs = [tf.convert_to_tensor(x) for x in inputs]
+    microbatch_size = self._microbatch_size
+    batch_size = tf.shape(inputs[0])[0]
+    with tf.control_dependencies(
+        [tf.Assert(tf.equal(tf.mod(batch_size, microbatch_size), 0),
+                   ["batch size must be a multiple of microbatch_size"])]):
+      num_microbatches = tf.identity(batch_size // microbatch_size)
+
+    def body(i, grad_sums):
+      px_grads = [[] for _ in var_list]
+      for j in range(microbatch_size):
+        index = i * microbatch_size + j
+        example_loss = tf.reduce_sum(
+            loss(*[x[index:index + 1] for x in inputs]))
+        grads = tf.gradients(example_loss, var_list)
+        for px_grad, grad, v in zip(px_grads, grads, var_list):
+          px_grad.append(grad if grad is not None else tf.zeros_like(v))
+      clipped_grads = self._sanitizer.clip_jointly(
+          [tf.stack(px_grad) for px_grad in px_grads])
+      return i + 1, [grad_sum + tf.reduce_sum(clipped_grad, 0)
+                     for grad_sum, clipped_grad in zip(grad_sums,
+                                                       clipped_grads)]
+
+    _, grad_sums = tf.while_loop(
+        lambda i, _: i < num_microbatches, body,
+        [tf.constant(0), [tf.zeros_like(v) for v in var_list]],
+        back_prop=False)
+    if not add_noise:
+      return grad_sums
+    return self._sanitizer.add_noise_jointly(
+        grad_sums, self._eps_delta, sigma=self._sigma,
+        num_examples=self._batches_per_lot * tf.slice(
+            tf.shape(inputs[0]), [0], [1]))
+
   def minimize(self, loss, global_step=None, var_list=None,
-               name=None):
+               name=None, inputs=None):
     """Minimize using sanitized gradients.
 
     This gets a var_list which is the list of trainable variables.
@@ -115,10 +189,14 @@ class DPGradientDescentOptimizer(tf.train.GradientDescentOptimizer):
     The lr and the num_steps are in the lot world.
 
     Args:
-      loss: the loss tensor.
+      loss: the loss tensor. With microbatch_size, a function instead, which
+        maps slices of the inputs to the vector of their per-example losses,
+        and builds the model on them with the variables in var_list.
       global_step: the optional global step.
       var_list: the optional variables.
       name: the optional name.
+      inputs: with microbatch_size, the list of batch tensors, whose
+        dimension-0 slices are the examples, passed to loss.
     Returns:
       the operation that runs one step of DP gradient descent.
     """
@@ -136,7 +214,7 @@ class DPGradientDescentOptimizer(tf.train.GradientDescentOptimizer):
 
     if self._batches_per_lot == 1:
       sanitized_grads = self.compute_sanitized_gradients(
-          loss, var_list=var_list)
+          loss, var_list=var_list, inputs=inputs)
 
       grads_and_vars = zip(sanitized_grads, var_list)
       self._assert_valid_dtypes([v for g, v in grads_and_vars if g is not None])
@@ -170,7 +248,7 @@ class DPGradientDescentOptimizer(tf.train.GradientDescentOptimizer):
         A tensorflow op to do the updates to the gradient accumulators
       """
       sanitized_grads = self.compute_sanitized_gradients(
-          loss, var_list=var_list, add_noise=False)
+          loss, var_list=var_list, add_noise=False, inputs=inputs)
 
       update_ops_list = []
       for var, grad in zip(var_list, sanitized_grads):
@@ -201,7 +279,7 @@ class DPGradientDescentOptimizer(tf.train.GradientDescentOptimizer):
       # We add noise in the last lot. This is why we need this code snippet
       # that looks almost identical to the non_last_op case here.
       sanitized_grads = self.compute_sanitized_gradients(
-          loss, var_list=var_list, add_noise=True)
+          loss, var_list=var_list, add_noise=True, inputs=inputs)
 
       normalized_grads = []
       for var, grad in zip(var_list, sanitized_grads):
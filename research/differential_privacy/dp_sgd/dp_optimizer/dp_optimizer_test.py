@@ -0,0 +1,95 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests that the microbatched gradients match the per-example ones."""
+
+from __future__ import division
+
+import numpy as np
+import tensorflow as tf
+
+from differential_privacy.dp_sgd.dp_optimizer import dp_optimizer
+from differential_privacy.dp_sgd.dp_optimizer import sanitizer
+from differential_privacy.dp_sgd.per_example_gradients import per_example_gradients
+
+
+class DPOptimizerTest(tf.test.TestCase):
+
+  def setUp(self):
+    rng = np.random.RandomState(0)
+    self._x = rng.randn(6, 3).astype(np.float32)
+    self._y = rng.randn(6, 2).astype(np.float32)
+    self._w1 = rng.randn(3, 4).astype(np.float32)
+    self._w2 = rng.randn(4, 2).astype(np.float32)
+
+  def _sanitized_gradients(self, l2norm_bound, microbatch_size):
+    """Returns the clipped gradient sums, and the per-example gradients."""
+    with tf.Graph().as_default():
+      x = tf.constant(self._x)
+      y = tf.constant(self._y)
+      w1 = tf.Variable(self._w1)
+      w2 = tf.Variable(self._w2)
+      var_list = [w1, w2]
+
+      def loss_fn(x, y):
+        outputs = tf.matmul(tf.tanh(tf.matmul(x, w1)), w2)
+        return tf.reduce_sum(tf.square(outputs - y), [1])
+
+      # Clip without noise, so no accountant is needed.
+      gaussian_sanitizer = sanitizer.AmortizedGaussianSanitizer(
+          None, sanitizer.ClipOption(l2norm_bound, True))
+      optimizer = dp_optimizer.DPGradientDescentOptimizer(
+          0.1, [1.0, 1e-5], gaussian_sanitizer,
+          microbatch_size=microbatch_size)
+      if microbatch_size:
+        grads = optimizer.compute_sanitized_gradients(
+            loss_fn, var_list=var_list, add_noise=False, inputs=[x, y])
+      else:
+        grads = optimizer.compute_sanitized_gradients(
+            tf.reduce_sum(loss_fn(x, y)), var_list=var_list, add_noise=False)
+      px_grads = per_example_gradients.PerExampleGradients(
+          tf.reduce_sum(loss_fn(x, y)),
+          [tf.convert_to_tensor(v) for v in var_list])
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        return sess.run([grads, px_grads])
+
+  def testMicrobatchesMatchPerExampleGradients(self):
+    # With a large bound, nothing is clipped, and both modes give the sums of
+    # the per-example gradients.
+    expected, _ = self._sanitized_gradients(1e6, None)
+    for microbatch_size in 1, 2, 3:
+      grads, _ = self._sanitized_gradients(1e6, microbatch_size)
+      for expected_grad, grad in zip(expected, grads):
+        self.assertAllClose(expected_grad, grad, rtol=1e-5, atol=1e-5)
+
+  def testMicrobatchesClipJointly(self):
+    for microbatch_size in 1, 3:
+      grads, px_grads = self._sanitized_gradients(0.5, microbatch_size)
+      norms = np.sqrt(sum(np.sum(np.reshape(g, [6, -1]) ** 2, 1)
+                          for g in px_grads))
+      self.assertTrue(np.all(norms > 0.5))
+      scales = 0.5 / norms
+      for px_grad, grad in zip(px_grads, grads):
+        expected = np.tensordot(scales, px_grad, axes=1)
+        self.assertAllClose(expected, grad, rtol=1e-5, atol=1e-5)
+
+  def testMicrobatchSizeMustDivideBatchSize(self):
+    with self.assertRaisesOpError("multiple of microbatch_size"):
+      self._sanitized_gradients(1e6, 4)
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -63,6 +63,21 @@ class AmortizedGaussianSanitizer(object):
 
     self._options[tensor_name] = option
 
+  def _compute_sigma(self, eps_delta):
+    """Compute the noise sigma of an (eps, delta)-DP Gaussian mechanism."""
+    # pylint: disable=unpacking-non-sequence
+    eps, delta = eps_delta
+    with tf.control_dependencies(
+        [tf.Assert(tf.greater(eps, 0),
+                   ["eps needs to be greater than 0"]),
+         tf.Assert(tf.greater(delta, 0),
+                   ["delta needs to be greater than 0"])]):
+      # The following formula is taken from
+      #   Dwork and Roth, The Algorithmic Foundations of Differential
+      #   Privacy, Appendix A.
+      #   http://www.cis.upenn.edu/~aaroth/Papers/privacybook.pdf
+      return tf.sqrt(2.0 * tf.log(1.25 / delta)) / eps
+
   def sanitize(self, x, eps_delta, sigma=None,
                option=ClipOption(None, None), tensor_name=None,
                num_examples=None, add_noise=True):
@@ -88,18 +103,7 @@ class AmortizedGaussianSanitizer(object):
     """
 
     if sigma is None:
-      # pylint: disable=unpacking-non-sequence
-      eps, delta = eps_delta
-      with tf.control_dependencies(
-          [tf.Assert(tf.greater(eps, 0),
-                     ["eps needs to be greater than 0"]),
-           tf.Assert(tf.greater(delta, 0),
-                     ["delta needs to be greater than 0"])]):
-        # The following formula is taken from
-        #   Dwork and Roth, The Algorithmic Foundations of Differential
-        #   Privacy, Appendix A.
-        #   http://www.cis.upenn.edu/~aaroth/Papers/privacybook.pdf
-        sigma = tf.sqrt(2.0 * tf.log(1.25 / delta)) / eps
+      sigma = self._compute_sigma(eps_delta)
 
     l2norm_bound, clip = option
     if l2norm_bound is None:
@@ -121,3 +125,44 @@ class AmortizedGaussianSanitizer(object):
     else:
       saned_x = tf.reduce_sum(x, 0)
     return saned_x
+
+  def clip_jointly(self, xs):
+    """Clip a list of per-example tensors by one global l2 norm per example.
+
+    The per-tensor options are ignored: all the tensors are clipped together
+    with the l2 norm bound of the default option.
+
+    Args:
+      xs: list of tensors whose dimension-0 slices are the examples.
+    Returns:
+      the list of clipped tensors.
+    """
+
+    l2norm_bound, clip = self._default_option
+    if clip:
+      xs = utils.BatchClipByGlobalL2norm(xs, l2norm_bound)
+    return xs
+
+  def add_noise_jointly(self, xs, eps_delta, sigma=None, num_examples=None):
+    """Add Gaussian noise to sums of tensors clipped by clip_jointly.
+
+    As the tensors share one l2 norm bound, the privacy spending is only
+    accumulated once for all of them.
+
+    Args:
+      xs: list of sums over the examples of tensors clipped by clip_jointly.
+      eps_delta: a pair of eps, delta for (eps,delta)-DP. Use it to
+        compute sigma if sigma is None.
+      sigma: if sigma is not None, use sigma.
+      num_examples: the number of examples summed in xs.
+    Returns:
+      the list of noisy tensors.
+    """
+
+    if sigma is None:
+      sigma = self._compute_sigma(eps_delta)
+    l2norm_bound, _ = self._default_option
+    privacy_accum_op = self._accountant.accumulate_privacy_spending(
+        eps_delta, sigma, num_examples)
+    with tf.control_dependencies([privacy_accum_op]):
+      return [utils.AddGaussianNoise(x, sigma * l2norm_bound) for x in xs]
@@ -85,13 +85,27 @@ def GetTensorOpName(x):
     return t[0]
 
 
-def BuildNetwork(inputs, network_parameters):
+def _GetVariable(variables, name, initial_value_fn, **kwargs):
+  """Returns variables[name], or creates it and records it in variables."""
+  if variables is not None and name in variables:
+    return variables[name]
+  var = tf.Variable(initial_value_fn(), name=name, **kwargs)
+  if variables is not None:
+    variables[name] = var
+  return var
+
+
+def BuildNetwork(inputs, network_parameters, variables=None):
   """Build a network using the given parameters.
 
   Args:
     inputs: a Tensor of floats containing the input data.
     network_parameters: NetworkParameters object
       that describes the parameters for the network.
+    variables: optional dictionary from name to variable. The variables in it
+      are reused, and the ones that are created are added to it, so that
+      calling BuildNetwork again with the same dictionary builds another
+      network sharing the variables of the first one.
   Returns:
     output, training_parameters: where the outputs (a tensor) is the output
       of the network, and training_parameters (a dictionary that maps the
@@ -114,19 +128,19 @@ def BuildNetwork(inputs, network_parameters):
     conv_bias_name = "%s_conv_bias" % (conv_param.name)
     conv_std_dev = 1.0 / (conv_param.patch_size
                           * math.sqrt(conv_param.in_channels))
-    conv_weights = tf.Variable(
-        tf.truncated_normal([conv_param.patch_size,
-                             conv_param.patch_size,
-                             conv_param.in_channels,
-                             conv_param.out_channels],
-                            stddev=conv_std_dev),
-        trainable=conv_param.trainable,
-        name=conv_weights_name)
-    conv_bias = tf.Variable(
-        tf.truncated_normal([conv_param.out_channels],
-                            stddev=conv_param.bias_stddev),
-        trainable=conv_param.trainable,
-        name=conv_bias_name)
+    conv_weights = _GetVariable(
+        variables, conv_weights_name,
+        lambda: tf.truncated_normal([conv_param.patch_size,
+                                     conv_param.patch_size,
+                                     conv_param.in_channels,
+                                     conv_param.out_channels],
+                                    stddev=conv_std_dev),
+        trainable=conv_param.trainable)
+    conv_bias = _GetVariable(
+        variables, conv_bias_name,
+        lambda: tf.truncated_normal([conv_param.out_channels],
+                                    stddev=conv_param.bias_stddev),
+        trainable=conv_param.trainable)
     training_parameters[conv_weights_name] = {}
     training_parameters[conv_bias_name] = {}
     conv = tf.nn.conv2d(outputs, conv_weights,
@@ -150,9 +164,11 @@ def BuildNetwork(inputs, network_parameters):
 
   # Now project, if needed
   if network_parameters.projection_type is not "NONE":
-    projection = tf.Variable(tf.truncated_normal(
-        [num_inputs, network_parameters.projection_dimensions],
-        stddev=1.0 / math.sqrt(num_inputs)), trainable=False, name="projection")
+    projection = _GetVariable(
+        variables, "projection",
+        lambda: tf.truncated_normal(
+            [num_inputs, network_parameters.projection_dimensions],
+            stddev=1.0 / math.sqrt(num_inputs)), trainable=False)
     num_inputs = network_parameters.projection_dimensions
     outputs = tf.matmul(outputs, projection)
 
@@ -161,10 +177,11 @@ def BuildNetwork(inputs, network_parameters):
   for layer_parameters in network_parameters.layer_parameters:
     num_units = layer_parameters.num_units
     hidden_weights_name = "%s_weight" % (layer_parameters.name)
-    hidden_weights = tf.Variable(
-        tf.truncated_normal([num_inputs, num_units],
-                            stddev=1.0 / math.sqrt(num_inputs)),
-        name=hidden_weights_name, trainable=layer_parameters.trainable)
+    hidden_weights = _GetVariable(
+        variables, hidden_weights_name,
+        lambda: tf.truncated_normal([num_inputs, num_units],
+                                    stddev=1.0 / math.sqrt(num_inputs)),
+        trainable=layer_parameters.trainable)
     training_parameters[hidden_weights_name] = {}
     if layer_parameters.gradient_l2norm_bound:
       training_parameters[hidden_weights_name]["gradient_l2norm_bound"] = (
@@ -176,8 +193,8 @@ def BuildNetwork(inputs, network_parameters):
     outputs = tf.matmul(outputs, hidden_weights)
     if layer_parameters.with_bias:
       hidden_biases_name = "%s_bias" % (layer_parameters.name)
-      hidden_biases = tf.Variable(tf.zeros([num_units]),
-                                  name=hidden_biases_name)
+      hidden_biases = _GetVariable(variables, hidden_biases_name,
+                                   lambda: tf.zeros([num_units]))
       training_parameters[hidden_biases_name] = {}
       if layer_parameters.bias_gradient_l2norm_bound:
         training_parameters[hidden_biases_name][
@@ -248,6 +265,41 @@ def BatchClipByL2norm(t, upper_bound, name=None):
   return clipped_t
 
 
+def BatchClipByGlobalL2norm(ts, upper_bound, name=None):
+  """Clip a list of tensors by the L2 norm of each example across all of them.
+
+  Like BatchClipByL2norm, but the dimension-0 slices of all tensors that
+  belong to the same example are shrunk by the same factor, such that the l2
+  norm of their concatenation is at most upper_bound.
+
+  Args:
+    ts: list of input tensors, with the same size in dimension 0.
+    upper_bound: the upperbound of the L2 norm.
+    name: optional name.
+  Returns:
+    the list of clipped tensors.
+  """
+
+  assert upper_bound > 0
+  with tf.name_scope(values=ts + [upper_bound], name=name,
+                     default_name="batch_clip_by_global_l2norm"):
+    batch_size = tf.slice(tf.shape(ts[0]), [0], [1])
+    squared_norms = tf.add_n([
+        tf.reduce_sum(
+            tf.reshape(t * t, tf.concat(axis=0, values=[batch_size, [-1]])),
+            [1]) for t in ts])
+    # Add a small number to avoid divide by 0
+    l2norm_inv = tf.rsqrt(squared_norms + 0.000001)
+    scale = tf.minimum(l2norm_inv, 1.0/upper_bound) * upper_bound
+    clipped_ts = []
+    for t in ts:
+      # Broadcast the per-example scale over the other dimensions of t.
+      scale_shape = tf.concat(
+          axis=0, values=[batch_size, tf.ones([tf.rank(t) - 1], tf.int32)])
+      clipped_ts.append(t * tf.reshape(scale, scale_shape))
+  return clipped_ts
+
+
 def SoftThreshold(t, threshold_ratio, name=None):
   """Soft-threshold a tensor by the mean value.
 
@@ -39,7 +39,24 @@ def labels_from_probs(probs):
   return np.asarray(labels, dtype=np.int32)
 
 
-def noisy_max(logits, lap_scale, return_clean_votes=False):
+def label_counts(labels, nb_labels):
+  """
+  Helper function: counts the votes of all teachers for each sample with a
+  single bincount over the flattened (sample, label) pairs.
+  :param labels: int array of shape [nb_teachers, nb_samples] with the label
+                 assigned by each teacher to each sample
+  :param nb_labels: number of classes
+  :return: np.int32 array of shape [nb_samples, nb_labels] with the number of
+           teacher votes for each class
+  """
+  labels = np.asarray(labels, dtype=np.int64)
+  nb_samples = labels.shape[1]
+  flat_labels = labels + nb_labels * np.arange(nb_samples)
+  counts = np.bincount(flat_labels.ravel(), minlength=nb_samples * nb_labels)
+  return np.asarray(counts.reshape((nb_samples, nb_labels)), dtype=np.int32)
+
+
+def noisy_max(logits, lap_scale, return_clean_votes=False, nb_labels=None):
   """
   This aggregation mechanism takes the softmax/logit output of several models
   resulting from inference on identical inputs and computes the noisy-max of
@@ -50,6 +67,7 @@ def noisy_max(logits, lap_scale, return_clean_votes=False):
   :param return_clean_votes: if set to True, also returns clean votes (without
                       Laplacian noise). This can be used to perform the
                       privacy analysis of this aggregation mechanism.
+  :param nb_labels: number of classes, defaults to the last dimension of logits
   :return: pair of result and (if clean_votes is set to True) the clean counts
            for each class per sample and the the original labels produced by
            the teachers.
@@ -59,73 +77,51 @@ def noisy_max(logits, lap_scale, return_clean_votes=False):
   labels = labels_from_probs(logits)
   labels_shape = np.shape(labels)
   labels = labels.reshape((labels_shape[0], labels_shape[1]))
+  if nb_labels is None:
+    nb_labels = np.shape(logits)[-1]
 
-  # Initialize array to hold final labels
-  result = np.zeros(int(labels_shape[1]))
-
-  if return_clean_votes:
-    # Initialize array to hold clean votes for each sample
-    clean_votes = np.zeros((int(labels_shape[1]), 10))
-
-  # Parse each sample
-  for i in xrange(int(labels_shape[1])):
-    # Count number of votes assigned to each class
-    label_counts = np.bincount(labels[:, i], minlength=10)
-
-    if return_clean_votes:
-      # Store vote counts for export
-      clean_votes[i] = label_counts
+  # Count number of votes assigned to each class, for all samples at once
+  counts = label_counts(labels, nb_labels)
 
-    # Cast in float32 to prepare before addition of Laplacian noise
-    label_counts = np.asarray(label_counts, dtype=np.float32)
+  # Sample independent Laplacian noise for each sample and class
+  noise = np.random.laplace(loc=0.0, scale=float(lap_scale),
+                            size=counts.shape)
+  noisy_counts = np.asarray(counts + noise, dtype=np.float32)
 
-    # Sample independent Laplacian noise for each class
-    for item in xrange(10):
-      label_counts[item] += np.random.laplace(loc=0.0, scale=float(lap_scale))
-
-    # Result is the most frequent label
-    result[i] = np.argmax(label_counts)
-
-  # Cast labels to np.int32 for compatibility with deep_cnn.py feed dictionaries
-  result = np.asarray(result, dtype=np.int32)
+  # Result is the most frequent label. Cast labels to np.int32 for
+  # compatibility with deep_cnn.py feed dictionaries
+  result = np.asarray(np.argmax(noisy_counts, axis=1), dtype=np.int32)
 
   if return_clean_votes:
     # Returns several array, which are later saved:
     # result: labels obtained from the noisy aggregation
     # clean_votes: the number of teacher votes assigned to each sample and class
     # labels: the labels assigned by teachers (before the noisy aggregation)
+    clean_votes = np.asarray(counts, dtype=np.float64)
     return result, clean_votes, labels
   else:
     # Only return labels resulting from noisy aggregation
     return result
 
 
-def aggregation_most_frequent(logits):
+def aggregation_most_frequent(logits, nb_labels=None):
   """
   This aggregation mechanism takes the softmax/logit output of several models
   resulting from inference on identical inputs and computes the most frequent
   label. It is deterministic (no noise injection like noisy_max() above.
   :param logits: logits or probabilities for each sample
+  :param nb_labels: number of classes, defaults to the last dimension of logits
   :return:
   """
   # Compute labels from logits/probs and reshape array properly
   labels = labels_from_probs(logits)
   labels_shape = np.shape(labels)
   labels = labels.reshape((labels_shape[0], labels_shape[1]))
+  if nb_labels is None:
+    nb_labels = np.shape(logits)[-1]
 
-  # Initialize array to hold final labels
-  result = np.zeros(int(labels_shape[1]))
-
-  # Parse each sample
-  for i in xrange(int(labels_shape[1])):
-    # Count number of votes assigned to each class
-    label_counts = np.bincount(labels[:, i], minlength=10)
-
-    label_counts = np.asarray(label_counts, dtype=np.int32)
-
-    # Result is the most frequent label
-    result[i] = np.argmax(label_counts)
-
-  return np.asarray(result, dtype=np.int32)
-
+  # Count number of votes assigned to each class, for all samples at once
+  counts = label_counts(labels, nb_labels)
 
+  # Result is the most frequent label
+  return np.asarray(np.argmax(counts, axis=1), dtype=np.int32)
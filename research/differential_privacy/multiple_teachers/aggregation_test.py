@@ -0,0 +1,99 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for the teacher vote aggregation mechanisms."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+from differential_privacy.multiple_teachers import aggregation
+
+
+def noisy_max_per_sample(logits, lap_scale, nb_labels):
+  """Aggregates the votes of each sample separately, as a reference."""
+  labels = aggregation.labels_from_probs(logits)
+  nb_samples = labels.shape[1]
+  result = np.zeros(nb_samples, dtype=np.int32)
+  clean_votes = np.zeros((nb_samples, nb_labels))
+  for i in range(nb_samples):
+    counts = np.bincount(labels[:, i], minlength=nb_labels)
+    clean_votes[i] = counts
+    noisy_counts = np.asarray(counts, dtype=np.float32)
+    for item in range(nb_labels):
+      noisy_counts[item] += np.random.laplace(loc=0.0, scale=float(lap_scale))
+    result[i] = np.argmax(noisy_counts)
+  return result, clean_votes, labels
+
+
+class AggregationTest(tf.test.TestCase):
+
+  def setUp(self):
+    # Logits of 30 teachers for 200 samples and 10 classes.
+    self._logits = np.random.RandomState(0).rand(30, 200, 10)
+
+  def testLabelCounts(self):
+    labels = np.random.RandomState(1).randint(0, 7, size=(25, 40))
+    expected = np.array([np.bincount(labels[:, i], minlength=7)
+                         for i in range(labels.shape[1])])
+    counts = aggregation.label_counts(labels, 7)
+    self.assertEqual(counts.dtype, np.int32)
+    self.assertAllEqual(expected, counts)
+
+  def testNoisyMax(self):
+    for lap_scale in 0.1, 5.0:
+      np.random.seed(2)
+      expected = noisy_max_per_sample(self._logits, lap_scale, 10)
+      np.random.seed(2)
+      result = aggregation.noisy_max(self._logits, lap_scale)
+      self.assertEqual(result.dtype, np.int32)
+      self.assertAllEqual(expected[0], result)
+
+  def testNoisyMaxCleanVotes(self):
+    np.random.seed(3)
+    expected = noisy_max_per_sample(self._logits, 5.0, 10)
+    np.random.seed(3)
+    result, clean_votes, labels = aggregation.noisy_max(
+        self._logits, 5.0, return_clean_votes=True)
+    self.assertAllEqual(expected[0], result)
+    self.assertAllEqual(expected[1], clean_votes)
+    self.assertAllEqual(expected[2], labels)
+
+  def testNoisyMaxNbLabels(self):
+    # Only the first 4 of 10 classes get votes, and only they are counted.
+    logits = self._logits.copy()
+    logits[:, :, 4:] = -1.0
+    np.random.seed(4)
+    expected = noisy_max_per_sample(logits, 1.0, 4)
+    np.random.seed(4)
+    result, clean_votes, _ = aggregation.noisy_max(
+        logits, 1.0, return_clean_votes=True, nb_labels=4)
+    self.assertEqual(clean_votes.shape, (200, 4))
+    self.assertAllEqual(expected[0], result)
+    self.assertAllEqual(expected[1], clean_votes)
+
+  def testAggregationMostFrequent(self):
+    labels = aggregation.labels_from_probs(self._logits)
+    expected = [np.argmax(np.bincount(labels[:, i], minlength=10))
+                for i in range(labels.shape[1])]
+    self.assertAllEqual(expected,
+                        aggregation.aggregation_most_frequent(self._logits))
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -43,6 +43,7 @@ import math
 import numpy as np
 import tensorflow as tf
 
+from differential_privacy.multiple_teachers.aggregation import label_counts
 from differential_privacy.multiple_teachers.input import maybe_download
 
 # These parameters can be changed to compute bounds for different failure rates
@@ -62,6 +63,8 @@ tf.flags.DEFINE_integer("max_examples",1000,
     " or indices_file to do the privacy cost estimate")
 tf.flags.DEFINE_float("too_small", 1e-10, "Small threshold to avoid log of 0")
 tf.flags.DEFINE_bool("input_is_counts", False, "False if labels, True if counts")
+tf.flags.DEFINE_integer("nb_labels", 10, "Number of classes, used when the "
+                        "input holds labels")
 
 FLAGS = tf.flags.FLAGS
 
@@ -211,6 +214,111 @@ def smoothed_sens(counts, noise_eps, l, beta):
   return smoothed_sensitivity
 
 
+def compute_q_noisy_max_batch(counts, noise_eps):
+  """Vectorized compute_q_noisy_max, for each row of counts.
+
+  Args:
+    counts: [n, num_classes] array of scores
+    noise_eps: privacy parameter for noisy_max
+  Returns:
+    q: [n] array of probabilities that the outcome is different from the true
+      winner.
+  """
+  counts = np.asarray(counts, dtype=np.float64)
+  rows = np.arange(counts.shape[0])
+  winners = np.argmax(counts, axis=1)
+  gaps = noise_eps * (counts[rows, winners][:, np.newaxis] - counts)
+  terms = (gaps + 2.0) / (4.0 * np.exp(gaps))
+  terms[rows, winners] = 0.0
+  return np.minimum(np.sum(terms, axis=1), 1.0 - (1.0/counts.shape[1]))
+
+
+def logmgf_exact_batch(q, priv_eps, l_list):
+  """Vectorized logmgf_exact, for each value of q and each moment.
+
+  Args:
+    q: [n] array of pr of non-optimal outcome
+    priv_eps: eps parameter for DP
+    l_list: [num_moments] array of moments to compute.
+  Returns:
+    [n, num_moments] array of upper bounds on logmgf
+  """
+  q = np.asarray(q, dtype=np.float64)[:, np.newaxis]
+  l = np.asarray(l_list, dtype=np.float64)[np.newaxis, :]
+  with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+    t_one = (1-q) * np.power((1-q) / (1 - math.exp(priv_eps) * q), l)
+    t_two = q * np.exp(priv_eps * l)
+    t = t_one + t_two
+    # As in logmgf_exact, fall back to priv_eps * l where the log is undefined.
+    log_t = np.where((q < 0.5) & (t > 0), np.log(t), priv_eps * l)
+  return np.minimum(np.minimum(0.5 * priv_eps * priv_eps * l * (l + 1), log_t),
+                    priv_eps * l)
+
+
+def logmgf_from_counts_batch(counts, noise_eps, l_list):
+  """Vectorized logmgf_from_counts, for each row of counts and each moment."""
+  q = compute_q_noisy_max_batch(counts, noise_eps)
+  return logmgf_exact_batch(q, 2.0 * noise_eps, l_list)
+
+
+def smoothed_sens_batch(counts, noise_eps, l_list, beta):
+  """Vectorized smoothed_sens, for each row of counts and each moment.
+
+  All examples and moments are processed together for each distance k, until
+  the sensitivity of every one of them has dropped to zero.
+
+  Args:
+    counts: [n, num_classes] array of scores
+    noise_eps: noise parameter
+    l_list: [num_moments] array of moments of interest
+    beta: smoothness parameter
+  Returns:
+    [n, num_moments] array of beta smooth upper bounds
+  """
+  counts = np.asarray(counts, dtype=np.float64)
+  l_list = np.asarray(l_list, dtype=np.float64)
+  counts_sorted = -np.sort(-counts, axis=1)
+  max_counts = np.max(counts, axis=1)
+  l_too_large = 0.5 * noise_eps * l_list > 1
+  if np.any(l_too_large):
+    print "l too large to compute sensitivity"
+
+  def sens_at_k(rows, k):
+    """Returns the [len(rows), num_moments] sensitivities at distance k."""
+    shifted = counts_sorted[rows]
+    shifted[:, 0] -= k
+    shifted[:, 1] += k
+    val = logmgf_from_counts_batch(shifted, noise_eps, l_list)
+    shifted[:, 0] -= 1
+    shifted[:, 1] += 1
+    val_changed = logmgf_from_counts_batch(shifted, noise_eps, l_list)
+    sensitivity = val_changed - val
+    # Same test as in sens_at_k, on the counts in their original order.
+    sensitivity[counts[rows, 0] < counts[rows, 1] + k] = 0.0
+    sensitivity[:, l_too_large] = 0.0
+    return sensitivity
+
+  smoothed_sensitivity = sens_at_k(np.arange(counts.shape[0]), 0)
+  # Whether smoothed_sens would still be iterating, per example and moment.
+  active = np.ones(smoothed_sensitivity.shape, dtype=bool)
+  k = 0
+  while True:
+    k += 1
+    active &= (k <= max_counts)[:, np.newaxis]
+    rows = np.flatnonzero(np.any(active, axis=1))
+    if not rows.size:
+      break
+    sensitivity_at_k = sens_at_k(rows, k)
+    rows_active = active[rows]
+    smoothed_sensitivity[rows] = np.where(
+        rows_active,
+        np.maximum(smoothed_sensitivity[rows],
+                   math.exp(-beta * k) * sensitivity_at_k),
+        smoothed_sensitivity[rows])
+    active[rows] = rows_active & (sensitivity_at_k != 0.0)
+  return smoothed_sensitivity
+
+
 def main(unused_argv):
   ##################################################################
   # If we are reproducing results from paper https://arxiv.org/abs/1610.05755,
@@ -235,11 +343,7 @@ def main(unused_argv):
     counts_mat = input_mat
   else:
     # In this case, the input is the raw predictions. Transform
-    num_teachers, n = input_mat.shape
-    counts_mat = np.zeros((n, 10)).astype(np.int32)
-    for i in range(n):
-      for j in range(num_teachers):
-        counts_mat[i, input_mat[j, i]] += 1
+    counts_mat = label_counts(input_mat, FLAGS.nb_labels)
   n = counts_mat.shape[0]
   num_examples = min(n, FLAGS.max_examples)
 
@@ -251,17 +355,13 @@ def main(unused_argv):
 
   l_list = 1.0 + np.array(xrange(FLAGS.moments))
   beta = FLAGS.beta
-  total_log_mgf_nm = np.array([0.0 for _ in l_list])
-  total_ss_nm = np.array([0.0 for _ in l_list])
   noise_eps = FLAGS.noise_eps
 
-  for i in indices:
-    total_log_mgf_nm += np.array(
-        [logmgf_from_counts(counts_mat[i], noise_eps, l)
-         for l in l_list])
-    total_ss_nm += np.array(
-        [smoothed_sens(counts_mat[i], noise_eps, l, beta)
-         for l in l_list])
+  counts = counts_mat[indices]
+  total_log_mgf_nm = np.sum(
+      logmgf_from_counts_batch(counts, noise_eps, l_list), axis=0)
+  total_ss_nm = np.sum(
+      smoothed_sens_batch(counts, noise_eps, l_list, beta), axis=0)
   delta = FLAGS.delta
 
   # We want delta = exp(alpha - eps l).
@@ -289,9 +389,8 @@ def main(unused_argv):
 
   # Data independent bound, as mechanism is
   # 2*noise_eps DP.
-  data_ind_log_mgf = np.array([0.0 for _ in l_list])
-  data_ind_log_mgf += num_examples * np.array(
-      [logmgf_exact(1.0, 2.0 * noise_eps, l) for l in l_list])
+  data_ind_log_mgf = num_examples * logmgf_exact_batch(
+      [1.0], 2.0 * noise_eps, l_list)[0]
 
   data_ind_eps_list = (data_ind_log_mgf - math.log(delta)) / l_list
   print "Data independent bound = " + str(min(data_ind_eps_list)) + "."
@@ -0,0 +1,74 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests that the batch privacy analysis matches the per-example one."""
+
+import numpy as np
+import tensorflow as tf
+
+from differential_privacy.multiple_teachers import analysis
+
+
+class AnalysisTest(tf.test.TestCase):
+
+  def setUp(self):
+    rng = np.random.RandomState(0)
+    # Votes of 250 teachers over 10 classes, more or less peaked.
+    probs = rng.dirichlet(np.ones(10) * 0.3, size=40)
+    self._counts = np.array([rng.multinomial(250, p) for p in probs],
+                            dtype=np.float64)
+    # Ties for the top class, and a winner that is not the first class.
+    self._counts[:3, 0] = self._counts[:3, 1]
+    self._counts[3] = [0, 200, 50, 0, 0, 0, 0, 0, 0, 0]
+    self._l_list = 1.0 + np.arange(8)
+
+  def testComputeQNoisyMaxBatch(self):
+    for noise_eps in 0.05, 0.1, 0.3:
+      expected = [analysis.compute_q_noisy_max(counts, noise_eps)
+                  for counts in self._counts]
+      self.assertAllClose(
+          expected, analysis.compute_q_noisy_max_batch(self._counts, noise_eps))
+
+  def testLogmgfExactBatch(self):
+    q = np.array([0.0, 1e-8, 1e-3, 0.1, 0.3, 0.49, 0.5, 0.9])
+    for priv_eps in 0.1, 0.5, 2.0:
+      expected = [[analysis.logmgf_exact(q_i, priv_eps, l)
+                   for l in self._l_list] for q_i in q]
+      self.assertAllClose(
+          expected, analysis.logmgf_exact_batch(q, priv_eps, self._l_list))
+
+  def testLogmgfFromCountsBatch(self):
+    for noise_eps in 0.05, 0.1, 0.3:
+      expected = [[analysis.logmgf_from_counts(counts, noise_eps, l)
+                   for l in self._l_list] for counts in self._counts]
+      self.assertAllClose(
+          expected,
+          analysis.logmgf_from_counts_batch(self._counts, noise_eps,
+                                            self._l_list))
+
+  def testSmoothedSensBatch(self):
+    # With noise_eps = 0.3, the largest moments are too large to compute the
+    # sensitivity of, which then is 0.
+    for noise_eps in 0.05, 0.1, 0.3:
+      expected = [[analysis.smoothed_sens(counts, noise_eps, l, 0.09)
+                   for l in self._l_list] for counts in self._counts]
+      self.assertAllClose(
+          expected,
+          analysis.smoothed_sens_batch(self._counts, noise_eps, self._l_list,
+                                       0.09))
+
+
+if __name__ == "__main__":
+  tf.test.main()
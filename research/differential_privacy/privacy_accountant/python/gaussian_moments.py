@@ -39,12 +39,26 @@ delta. The example code would be:
 To verify that the I1 >= I2 (see comments in GaussianMomentsAccountant in
 accountant.py for the context), run the same loop above with verify=True
 passed to compute_log_moment.
+
+When many parameter settings are evaluated, e.g. in a hyperparameter search,
+compute_log_moments computes the log moments of all orders at once, in log
+space, and get_privacy_spent_batch computes eps (or delta) over a whole grid
+of (q, sigma, T). Both can share a LogMomentsTable, which memoizes the log
+moments of each (q, sigma) and can be saved to disk:
+
+  table = LogMomentsTable(max_lmbd=32, filename="/tmp/log_moments.npz")
+  eps, _ = get_privacy_spent_batch(
+      qs[:, None, None], sigmas[None, :, None], steps[None, None, :],
+      target_delta=delta, table=table)
+  table.save()
 """
 import math
+import os
 import sys
 
 import numpy as np
 import scipy.integrate as integrate
+import scipy.special
 import scipy.stats
 from sympy.mpmath import mp
 
@@ -321,3 +335,186 @@ def get_privacy_spent(log_moments, target_eps=None, target_delta=None):
     return (target_eps, _compute_delta(log_moments, target_eps))
   else:
     return (_compute_eps(log_moments, target_delta), target_delta)
+
+
+#################################
+# VECTORIZED LOG-SPACE ROUTINES #
+#################################
+
+
+def _logsumexp(x, axis):
+  """Computes log(sum(exp(x))) along axis, without overflow."""
+  x_max = np.max(x, axis=axis, keepdims=True)
+  x_max[~np.isfinite(x_max)] = 0.0
+  with np.errstate(divide="ignore"):
+    return np.squeeze(
+        x_max + np.log(np.sum(np.exp(x - x_max), axis=axis, keepdims=True)),
+        axis=axis)
+
+
+def compute_log_a_orders(q, sigma, max_lmbd):
+  """Computes log(A_lambda) for all orders lambda = 1, ..., max_lmbd at once.
+
+  A_lambda is the moment computed by compute_a. It is expanded as
+  sum_k binom(lambda + 1, k) (1 - q)^(lambda + 1 - k) q^k exp((k^2 - k) /
+  (2 sigma^2)), whose terms are all positive, so that the sum is evaluated in
+  log space without cancellation or overflow.
+
+  Args:
+    q: the sampling ratio.
+    sigma: the noise sigma.
+    max_lmbd: the maximum moment order.
+  Returns:
+    [max_lmbd] array whose (lmbd - 1)-th entry is log(A_lmbd).
+  """
+  alphas = np.arange(2, max_lmbd + 2)[:, np.newaxis]
+  k = np.arange(max_lmbd + 2)[np.newaxis, :]
+  in_range = k <= alphas
+  rest = np.where(in_range, alphas - k, 0)
+  log_binom = (scipy.special.gammaln(alphas + 1) -
+               scipy.special.gammaln(k + 1) - scipy.special.gammaln(rest + 1))
+  with np.errstate(divide="ignore", invalid="ignore"):
+    log_q = np.log(q)
+    log_1mq = np.log1p(-q)
+    # Avoid 0 * -inf when q is 0 or 1.
+    log_terms = (log_binom + np.where(k > 0, k * log_q, 0.0) +
+                 np.where(rest > 0, rest * log_1mq, 0.0) +
+                 (k * k - k) / (2.0 * sigma ** 2))
+  return _logsumexp(np.where(in_range, log_terms, -np.inf), axis=1)
+
+
+class LogMomentsTable(object):
+  """Memo table of log(A_lambda) for all orders, keyed by (q, sigma).
+
+  The table can be saved to, and is loaded from, a NumPy .npz file, so that
+  the moments computed by one search are reused by the next.
+  """
+
+  def __init__(self, max_lmbd=32, filename=None):
+    """Creates a table, loading filename if it exists.
+
+    Args:
+      max_lmbd: the maximum moment order.
+      filename: optional path of the file the table is saved to.
+    """
+    self.max_lmbd = max_lmbd
+    self.filename = filename
+    self._log_a = {}
+    if filename is not None and os.path.exists(filename):
+      with open(filename, "rb") as f:
+        saved = np.load(f)
+        keys, log_a = saved["keys"], saved["log_a"]
+      # Entries saved with fewer orders are recomputed when needed.
+      if log_a.shape[1] >= max_lmbd:
+        for (q, sigma), row in zip(keys.tolist(), log_a[:, :max_lmbd]):
+          self._log_a[(q, sigma)] = row
+
+  def __len__(self):
+    return len(self._log_a)
+
+  def get_log_a(self, q, sigma):
+    """Returns the [max_lmbd] array of log(A_lambda) for q and sigma."""
+    key = (float(q), float(sigma))
+    log_a = self._log_a.get(key)
+    if log_a is None:
+      log_a = compute_log_a_orders(key[0], key[1], self.max_lmbd)
+      self._log_a[key] = log_a
+    return log_a
+
+  def save(self):
+    """Writes the table to filename, replacing the previous file.
+
+    Raises:
+      ValueError: if the previous file holds more orders than the table, as
+        replacing it would lose them.
+    """
+    assert self.filename is not None
+    if os.path.exists(self.filename):
+      with open(self.filename, "rb") as f:
+        saved_max_lmbd = np.load(f)["log_a"].shape[1]
+      if saved_max_lmbd > self.max_lmbd:
+        raise ValueError("%s holds %d orders, more than the %d of the table."
+                         % (self.filename, saved_max_lmbd, self.max_lmbd))
+    keys = np.array(list(self._log_a.keys()), dtype=np.float64).reshape(-1, 2)
+    log_a = np.array([self._log_a[tuple(key)] for key in keys.tolist()],
+                     dtype=np.float64).reshape(-1, self.max_lmbd)
+    tmp_filename = self.filename + ".tmp"
+    with open(tmp_filename, "wb") as f:
+      np.savez(f, keys=keys, log_a=log_a)
+    os.rename(tmp_filename, self.filename)
+
+
+def compute_log_moments(q, sigma, steps, max_lmbd=32, table=None,
+                        verify=False):
+  """Compute the log moments of all orders of the Gaussian mechanism.
+
+  Args:
+    q: the sampling ratio.
+    sigma: the noise sigma.
+    steps: the number of steps.
+    max_lmbd: the maximum moment order, ignored if table is given.
+    table: optional LogMomentsTable to look the moments up in.
+    verify: if True, also computes each moment with the multiprecision
+      routines and verifies the results match.
+  Returns:
+    list of (moment_order, log_moment) pairs for orders 1, ..., max_lmbd, as
+    expected by get_privacy_spent.
+  """
+  if table is None:
+    log_a = compute_log_a_orders(q, sigma, max_lmbd)
+  else:
+    log_a = table.get_log_a(q, sigma)
+  if verify:
+    mp.dps = 50
+    for lmbd, log_moment in enumerate(log_a, 1):
+      moment_a_mp = compute_a_mp(sigma, q, lmbd)
+      if not np.isinf(moment_a_mp):
+        np.testing.assert_allclose(np.exp(log_moment), moment_a_mp, rtol=1e-10)
+  return [(lmbd, log_moment * steps)
+          for lmbd, log_moment in enumerate(log_a.tolist(), 1)]
+
+
+def get_privacy_spent_batch(q, sigma, steps, target_eps=None,
+                            target_delta=None, max_lmbd=32, table=None):
+  """Compute delta (or eps) for a grid of parameters.
+
+  Args:
+    q: array of sampling ratios.
+    sigma: array of noise sigmas.
+    steps: array of numbers of steps. q, sigma and steps are broadcast
+      against each other.
+    target_eps: if not None, the epsilon for which we would like to compute
+      corresponding delta values.
+    target_delta: if not None, the delta for which we would like to compute
+      corresponding epsilon values. Exactly one of target_eps and target_delta
+      is None.
+    max_lmbd: the maximum moment order, ignored if table is given.
+    table: optional LogMomentsTable to look the moments up in. A temporary
+      table is used otherwise, so that each (q, sigma) is computed once.
+  Returns:
+    eps, delta pair of arrays with the broadcast shape of the parameters.
+  """
+  assert (target_eps is None) ^ (target_delta is None)
+  if table is None:
+    table = LogMomentsTable(max_lmbd)
+  q, sigma, steps = np.broadcast_arrays(
+      np.asarray(q, dtype=np.float64), np.asarray(sigma, dtype=np.float64),
+      np.asarray(steps, dtype=np.float64))
+  log_a = np.array([table.get_log_a(q_i, sigma_i)
+                    for q_i, sigma_i in zip(q.ravel(), sigma.ravel())])
+  log_a = log_a.reshape(q.shape + (table.max_lmbd,))
+  orders = np.arange(1, table.max_lmbd + 1, dtype=np.float64)
+  log_moments = steps[..., np.newaxis] * log_a
+  # As in _compute_delta and _compute_eps, inf or NaN orders are skipped.
+  valid = np.isfinite(log_moments)
+  with np.errstate(invalid="ignore", over="ignore"):
+    if target_eps is not None:
+      useful = valid & (log_moments < orders * target_eps)
+      deltas = np.where(useful, np.exp(log_moments - orders * target_eps), 1.0)
+      delta = np.min(deltas, axis=-1)
+      return np.full(q.shape, float(target_eps))[()], delta
+    else:
+      eps = np.where(valid, (log_moments - math.log(target_delta)) / orders,
+                     np.inf)
+      eps = np.min(eps, axis=-1)
+      return eps, np.full(q.shape, float(target_delta))[()]
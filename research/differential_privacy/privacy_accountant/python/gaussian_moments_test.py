@@ -0,0 +1,144 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests that the log-space routines match the per-order ones."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import gaussian_moments
+
+# Parameters for which compute_a is accurate for the orders below.
+_QS = (0.001, 0.01, 0.1)
+_SIGMAS = (1.0, 2.0, 4.0)
+_MAX_LMBD = 8
+
+
+class GaussianMomentsTest(unittest.TestCase):
+
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self._tmpdir)
+
+  def testComputeLogAOrders(self):
+    for q in _QS:
+      for sigma in _SIGMAS:
+        expected = [np.log(gaussian_moments.compute_a(sigma, q, lmbd))
+                    for lmbd in range(1, _MAX_LMBD + 1)]
+        np.testing.assert_allclose(
+            expected,
+            gaussian_moments.compute_log_a_orders(q, sigma, _MAX_LMBD),
+            rtol=1e-8)
+
+  def testComputeLogMoments(self):
+    for q in _QS:
+      for sigma in _SIGMAS:
+        expected = [
+            gaussian_moments.compute_log_moment(q, sigma, 1000, lmbd)
+            for lmbd in range(1, _MAX_LMBD + 1)]
+        log_moments = gaussian_moments.compute_log_moments(
+            q, sigma, 1000, max_lmbd=_MAX_LMBD)
+        self.assertEqual(list(range(1, _MAX_LMBD + 1)),
+                         [lmbd for lmbd, _ in log_moments])
+        np.testing.assert_allclose(
+            expected, [log_moment for _, log_moment in log_moments],
+            rtol=1e-8)
+
+  def _privacy_spent_grid(self, steps, **kwargs):
+    """Calls get_privacy_spent on every point of the grid."""
+    eps = np.zeros((len(_QS), len(_SIGMAS), len(steps)))
+    delta = np.zeros_like(eps)
+    for i, q in enumerate(_QS):
+      for j, sigma in enumerate(_SIGMAS):
+        for k, steps_k in enumerate(steps):
+          log_moments = [
+              (lmbd, gaussian_moments.compute_log_moment(q, sigma, steps_k,
+                                                         lmbd))
+              for lmbd in range(1, _MAX_LMBD + 1)]
+          eps[i, j, k], delta[i, j, k] = gaussian_moments.get_privacy_spent(
+              log_moments, **kwargs)
+    return eps, delta
+
+  def testGetPrivacySpentBatch(self):
+    qs = np.array(_QS)[:, np.newaxis, np.newaxis]
+    sigmas = np.array(_SIGMAS)[np.newaxis, :, np.newaxis]
+    steps = np.array([10, 1000, 100000])
+    for kwargs in dict(target_delta=1e-5), dict(target_eps=1.0):
+      expected_eps, expected_delta = self._privacy_spent_grid(steps, **kwargs)
+      eps, delta = gaussian_moments.get_privacy_spent_batch(
+          qs, sigmas, steps[np.newaxis, np.newaxis, :], max_lmbd=_MAX_LMBD,
+          **kwargs)
+      self.assertEqual(expected_eps.shape, eps.shape)
+      self.assertEqual(expected_delta.shape, delta.shape)
+      np.testing.assert_allclose(expected_eps, eps, rtol=1e-8)
+      np.testing.assert_allclose(expected_delta, delta, rtol=1e-8)
+
+  def testLogMomentsTableSaveAndLoad(self):
+    filename = os.path.join(self._tmpdir, "log_moments.npz")
+    table = gaussian_moments.LogMomentsTable(_MAX_LMBD, filename)
+    for q in _QS:
+      for sigma in _SIGMAS:
+        table.get_log_a(q, sigma)
+    self.assertEqual(len(_QS) * len(_SIGMAS), len(table))
+    table.save()
+
+    loaded = gaussian_moments.LogMomentsTable(_MAX_LMBD, filename)
+    self.assertEqual(len(table), len(loaded))
+    for q in _QS:
+      for sigma in _SIGMAS:
+        np.testing.assert_array_equal(table.get_log_a(q, sigma),
+                                      loaded.get_log_a(q, sigma))
+    self.assertEqual(len(table), len(loaded))
+
+    # Tables with fewer orders reuse the saved ones, tables with more orders
+    # recompute them.
+    fewer = gaussian_moments.LogMomentsTable(_MAX_LMBD // 2, filename)
+    self.assertEqual(len(table), len(fewer))
+    np.testing.assert_array_equal(
+        table.get_log_a(_QS[0], _SIGMAS[0])[:_MAX_LMBD // 2],
+        fewer.get_log_a(_QS[0], _SIGMAS[0]))
+    self.assertEqual(0, len(
+        gaussian_moments.LogMomentsTable(2 * _MAX_LMBD, filename)))
+
+  def testLogMomentsTableKeepsMoreOrders(self):
+    filename = os.path.join(self._tmpdir, "log_moments.npz")
+    table = gaussian_moments.LogMomentsTable(_MAX_LMBD, filename)
+    table.get_log_a(_QS[0], _SIGMAS[0])
+    table.save()
+
+    # A table with fewer orders does not replace the file.
+    fewer = gaussian_moments.LogMomentsTable(_MAX_LMBD // 2, filename)
+    fewer.get_log_a(_QS[1], _SIGMAS[1])
+    with self.assertRaises(ValueError):
+      fewer.save()
+    self.assertEqual(
+        1, len(gaussian_moments.LogMomentsTable(_MAX_LMBD, filename)))
+
+    # A table with more orders does.
+    more = gaussian_moments.LogMomentsTable(2 * _MAX_LMBD, filename)
+    more.get_log_a(_QS[1], _SIGMAS[1])
+    more.save()
+    self.assertEqual(
+        1, len(gaussian_moments.LogMomentsTable(2 * _MAX_LMBD, filename)))
+
+
+if __name__ == "__main__":
+  unittest.main()
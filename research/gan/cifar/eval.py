@@ -22,6 +22,7 @@ import tensorflow as tf
 
 import data_provider
 import networks
+import streaming_statistics
 import util
 
 
@@ -59,6 +60,17 @@ flags.DEFINE_integer('num_images_per_class', 10,
                      'When a conditional generator is used, this is the number '
                      'of images to display per class.')
 
+flags.DEFINE_integer('num_streamed_images', 0,
+                     'If positive, also compute the Inception score and '
+                     'Frechet Inception distance over this many images, '
+                     'streamed through Inception `num_images_generated` at a '
+                     'time.')
+
+flags.DEFINE_string('inception_statistics_cache_dir', None,
+                    'Directory where the Inception statistics of real images '
+                    'are cached between runs. If `None`, they are recomputed '
+                    'in every run.')
+
 flags.DEFINE_integer('max_number_of_evaluations', None,
                      'Number of times to run evaluation. If `None`, run '
                      'forever.')
@@ -114,17 +126,43 @@ def main(_, run_eval_loop=True):
           '%s/%s'% (FLAGS.eval_dir, 'unconditional_cifar10.png'),
           tf.image.encode_png(uint8_images[0]))
 
+  hooks = [tf.contrib.training.SummaryAtEndHook(FLAGS.eval_dir),
+           tf.contrib.training.StopAfterNEvalsHook(1)]
+  if FLAGS.num_streamed_images > 0:
+    hooks.append(_get_streaming_inception_hook(real_data, generated_data))
+
   # For unit testing, use `run_eval_loop=False`.
   if not run_eval_loop: return
   tf.contrib.training.evaluate_repeatedly(
       FLAGS.checkpoint_dir,
       master=FLAGS.master,
-      hooks=[tf.contrib.training.SummaryAtEndHook(FLAGS.eval_dir),
-             tf.contrib.training.StopAfterNEvalsHook(1)],
+      hooks=hooks,
       eval_ops=image_write_ops,
       max_number_of_evaluations=FLAGS.max_number_of_evaluations)
 
 
+def _get_streaming_inception_hook(real_data, generated_data):
+  """Get a hook computing Inception metrics over many streamed images."""
+  num_images = FLAGS.num_streamed_images
+  with tf.name_scope('streaming_inception'):
+    generated_features = util.get_inception_features(generated_data)
+    real_features = None
+    if FLAGS.eval_frechet_inception_distance:
+      real_features = util.get_inception_features(real_data)
+
+  def real_statistics_fn(sess, features):
+    return streaming_statistics.get_cached_statistics(
+        FLAGS.inception_statistics_cache_dir, 'cifar10_train_inception',
+        num_images,
+        lambda: streaming_statistics.accumulate_statistics(sess, features,
+                                                           num_images))
+
+  return streaming_statistics.StreamingStatisticsHook(
+      generated_features, num_images, FLAGS.eval_dir,
+      'streaming_inception_score', 'streaming_frechet_inception_distance',
+      real_features=real_features, real_statistics_fn=real_statistics_fn)
+
+
 def _get_real_data(num_images_generated, dataset_dir):
   """Get real images."""
   data, _, _, num_classes = data_provider.provide_data(
@@ -21,6 +21,16 @@ from __future__ import print_function
 import tensorflow as tf
 tfgan = tf.contrib.gan
 
+# The frozen Inception graph used by `tfgan.eval.run_inception`.
+INCEPTION_URL = ('http://download.tensorflow.org/models/'
+                 'frozen_inception_v1_2015_12_05.tar.gz')
+INCEPTION_FROZEN_GRAPH = 'inceptionv1_for_inception_score.pb'
+INCEPTION_OUTPUT = 'logits:0'
+INCEPTION_FINAL_POOL = 'pool_3:0'
+
+# The Inception graph def, loaded once per process.
+_inception_graph_def = None
+
 
 def get_generator_conditioning(batch_size, num_classes):
   """Generates TFGAN conditioning inputs for evaluation.
@@ -153,3 +163,37 @@ def get_frechet_inception_distance(real_images, generated_images, batch_size,
       resized_real_images, resized_generated_images, num_batches=num_batches)
 
   return fid
+
+
+def _get_inception_graph_def():
+  """Returns the Inception graph def, downloading it on first use only."""
+  global _inception_graph_def
+  if _inception_graph_def is None:
+    _inception_graph_def = tfgan.eval.get_graph_def_from_url_tarball(
+        INCEPTION_URL, INCEPTION_FROZEN_GRAPH)
+  return _inception_graph_def
+
+
+def get_inception_features(images):
+  """Get Inception logits and final pool activations of an image minibatch.
+
+  Unlike `get_inception_scores` and `get_frechet_inception_distance`, this
+  only runs one fixed-size minibatch through Inception, so that statistics
+  over many images can be accumulated with
+  `streaming_statistics.ClassifierStatistics` by running it repeatedly.
+
+  Args:
+    images: Image minibatch. Shape [batch size, width, height, channels]. Values
+      are in [-1, 1].
+
+  Returns:
+    A tuple of Inception logits, shape [batch size, 1008], and final pool
+    activations, shape [batch size, 2048].
+  """
+  size = tfgan.eval.INCEPTION_DEFAULT_IMAGE_SIZE
+  resized_images = tf.image.resize_bilinear(images, [size, size])
+  logits, pool = tfgan.eval.run_inception(
+      resized_images, graph_def=_get_inception_graph_def(),
+      output_tensor=[INCEPTION_OUTPUT, INCEPTION_FINAL_POOL])
+  pool = tf.reshape(pool, [tf.shape(images)[0], -1])
+  return logits, pool
@@ -24,6 +24,7 @@ import tensorflow as tf
 
 import data_provider
 import networks
+import streaming_statistics
 import util
 
 flags = tf.flags
@@ -52,6 +53,16 @@ flags.DEFINE_string('classifier_filename', None,
                     'Location of the pretrained classifier. If `None`, use '
                     'default.')
 
+flags.DEFINE_integer('num_streamed_images', 0,
+                     'If positive, also compute the MNIST score and Frechet '
+                     'distance over this many images, streamed through the '
+                     'classifier `num_images_generated` at a time.')
+
+flags.DEFINE_string('classifier_statistics_cache_dir', None,
+                    'Directory where the classifier statistics of real images '
+                    'are cached between runs. If `None`, they are recomputed '
+                    'in every run.')
+
 flags.DEFINE_integer('max_number_of_evaluations', None,
                      'Number of times to run evaluation. If `None`, run '
                      'forever.')
@@ -86,15 +97,46 @@ def main(_, run_eval_loop=True):
           '%s/%s'% (FLAGS.eval_dir, 'unconditional_gan.png'),
           tf.image.encode_png(uint8_images[0]))
 
+  hooks = [tf.contrib.training.SummaryAtEndHook(FLAGS.eval_dir),
+           tf.contrib.training.StopAfterNEvalsHook(1)]
+  if FLAGS.num_streamed_images > 0:
+    hooks.append(_get_streaming_classifier_hook(
+        real_images, real_images if FLAGS.eval_real_images else images))
+
   # For unit testing, use `run_eval_loop=False`.
   if not run_eval_loop: return
   tf.contrib.training.evaluate_repeatedly(
       FLAGS.checkpoint_dir,
-      hooks=[tf.contrib.training.SummaryAtEndHook(FLAGS.eval_dir),
-             tf.contrib.training.StopAfterNEvalsHook(1)],
+      hooks=hooks,
       eval_ops=image_write_ops,
       max_number_of_evaluations=FLAGS.max_number_of_evaluations)
 
 
+def _get_streaming_classifier_hook(real_images, images):
+  """Get a hook computing classifier metrics over many streamed images."""
+  num_images = FLAGS.num_streamed_images
+  with tf.name_scope('streaming_classifier'):
+    logits = util.mnist_logits(images, FLAGS.classifier_filename)
+    # The Frechet distance is computed on the logits, as in
+    # `util.mnist_frechet_distance`.
+    features = (logits, logits)
+    real_features = None
+    if not FLAGS.eval_real_images:
+      real_logits = util.mnist_logits(real_images, FLAGS.classifier_filename)
+      real_features = (real_logits, real_logits)
+
+  def real_statistics_fn(sess, features):
+    return streaming_statistics.get_cached_statistics(
+        FLAGS.classifier_statistics_cache_dir, 'mnist_train_classifier',
+        num_images,
+        lambda: streaming_statistics.accumulate_statistics(sess, features,
+                                                           num_images))
+
+  return streaming_statistics.StreamingStatisticsHook(
+      features, num_images, FLAGS.eval_dir, 'streaming_MNIST_Classifier_score',
+      'streaming_MNIST_Frechet_distance', real_features=real_features,
+      real_statistics_fn=real_statistics_fn)
+
+
 if __name__ == '__main__':
   tf.app.run()
@@ -36,5 +36,12 @@ class EvalTest(tf.test.TestCase):
   def test_build_graph_generateddata(self):
     self._test_build_graph_helper(False)
 
+  def test_build_graph_streamed(self):
+    tf.flags.FLAGS.num_streamed_images = 2000
+    try:
+      self._test_build_graph_helper(False)
+    finally:
+      tf.flags.FLAGS.num_streamed_images = 0
+
 if __name__ == '__main__':
   tf.test.main()
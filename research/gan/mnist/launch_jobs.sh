@@ -64,7 +64,7 @@ DATASET_DIR=/tmp/mnist-data
 # Location of the classifier frozen graph used for evaluation.
 FROZEN_GRAPH="${git_repo}/research/gan/mnist/data/classify_mnist_graph_def.pb"
 
-export PYTHONPATH=$PYTHONPATH:$git_repo:$git_repo/research:$git_repo/research/slim
+export PYTHONPATH=$PYTHONPATH:$git_repo:$git_repo/research:$git_repo/research/gan:$git_repo/research/slim
 
 # A helper function for printing pretty output.
 Banner () {
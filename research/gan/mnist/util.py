@@ -34,6 +34,7 @@ __all__ = [
     'mnist_score',
     'mnist_frechet_distance',
     'mnist_cross_entropy',
+    'mnist_logits',
     'get_eval_noise_categorical',
     'get_eval_noise_continuous_dim1',
     'get_eval_noise_continuous_dim2',
@@ -46,6 +47,9 @@ MODEL_GRAPH_DEF = '../tensorflow_models/gan/mnist/data/classify_mnist_graph_def.
 INPUT_TENSOR = 'inputs:0'
 OUTPUT_TENSOR = 'logits:0'
 
+# Classifier graph defs already loaded, keyed by filename.
+_graph_defs = {}
+
 
 def mnist_score(images, graph_def_filename=None, input_tensor=INPUT_TENSOR,
                 output_tensor=OUTPUT_TENSOR, num_batches=1):
@@ -115,6 +119,32 @@ def mnist_frechet_distance(real_images, generated_images,
   return frechet_distance
 
 
+def mnist_logits(images, graph_def_filename=None, input_tensor=INPUT_TENSOR,
+                 output_tensor=OUTPUT_TENSOR):
+  """Get MNIST classifier logits of an image minibatch.
+
+  Unlike `mnist_score` and `mnist_frechet_distance`, this only runs one
+  minibatch through the classifier, so that statistics over many images can
+  be accumulated with `streaming_statistics.ClassifierStatistics` by running
+  it repeatedly.
+
+  Args:
+    images: A minibatch tensor of MNIST digits. Shape must be
+      [batch, 28, 28, 1].
+    graph_def_filename: Location of a frozen GraphDef binary file on disk. If
+      `None`, uses a default graph.
+    input_tensor: GraphDef's input tensor name.
+    output_tensor: GraphDef's output tensor name.
+
+  Returns:
+    A logits tensor of [batch, 10].
+  """
+  images.shape.assert_is_compatible_with([None, 28, 28, 1])
+  graph_def = _graph_def_from_par_or_disk(graph_def_filename)
+  return tfgan.eval.run_image_classifier(
+      images, graph_def, input_tensor, output_tensor)
+
+
 def mnist_cross_entropy(images, one_hot_labels, graph_def_filename=None,
                         input_tensor=INPUT_TENSOR, output_tensor=OUTPUT_TENSOR):
   """Returns the cross entropy loss of the classifier on images.
@@ -316,7 +346,11 @@ def get_infogan_noise(batch_size, categorical_dim, structured_continuous_dim,
 
 
 def _graph_def_from_par_or_disk(filename):
-  if filename is None:
-    return tfgan.eval.get_graph_def_from_resource(MODEL_GRAPH_DEF)
-  else:
-    return tfgan.eval.get_graph_def_from_disk(filename)
+  """Loads a classifier graph def, only once per process."""
+  if filename not in _graph_defs:
+    if filename is None:
+      graph_def = tfgan.eval.get_graph_def_from_resource(MODEL_GRAPH_DEF)
+    else:
+      graph_def = tfgan.eval.get_graph_def_from_disk(filename)
+    _graph_defs[filename] = graph_def
+  return _graph_defs[filename]
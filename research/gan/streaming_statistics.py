@@ -0,0 +1,244 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Classifier scores and Frechet distances over streams of images.
+
+The examples evaluate generators with a pretrained classifier, Inception for
+CIFAR and a small classifier for MNIST. These helpers accumulate its outputs
+over many fixed-size minibatches, so that the scores are computed over any
+number of images with constant memory.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import os
+
+import numpy as np
+import tensorflow as tf
+
+
+class ClassifierStatistics(object):
+  """Classifier statistics of a stream of images.
+
+  Keeps the running mean and covariance of the classifier activations, for
+  the Frechet distance, and the sums of class probabilities and of their
+  negative entropies, for the classifier score. Minibatches are merged with
+  the pairwise update of Chan et al., which stays accurate over many images.
+  """
+
+  def __init__(self):
+    self.num_images = 0
+    self.mean = None
+    self._comoment = None
+    self._sum_probs = None
+    self._sum_neg_entropy = 0.0
+
+  def update(self, logits, activations):
+    """Adds a minibatch of classifier logits and activations.
+
+    Args:
+      logits: [batch size, number of classes] array.
+      activations: Array of [batch size, ...] activations the Frechet distance
+        is computed on, for instance the logits themselves.
+    """
+    activations = np.asarray(activations, dtype=np.float64).reshape(
+        len(activations), -1)
+    n = activations.shape[0]
+    if n == 0:
+      return
+    batch_mean = activations.mean(axis=0)
+    centered = activations - batch_mean
+    batch_comoment = np.dot(centered.T, centered)
+    if self.mean is None:
+      self.mean = batch_mean
+      self._comoment = batch_comoment
+    else:
+      total = self.num_images + n
+      delta = batch_mean - self.mean
+      self.mean = self.mean + delta * (n / total)
+      self._comoment += batch_comoment + np.outer(delta, delta) * (
+          self.num_images * n / total)
+    self.num_images += n
+
+    logits = np.asarray(logits, dtype=np.float64)
+    log_probs = logits - logits.max(axis=1, keepdims=True)
+    log_probs -= np.log(np.sum(np.exp(log_probs), axis=1, keepdims=True))
+    probs = np.exp(log_probs)
+    if self._sum_probs is None:
+      self._sum_probs = probs.sum(axis=0)
+    else:
+      self._sum_probs += probs.sum(axis=0)
+    self._sum_neg_entropy += np.sum(probs * log_probs)
+
+  @property
+  def covariance(self):
+    return self._comoment / (self.num_images - 1)
+
+  def classifier_score(self):
+    """Returns the classifier score of all images, computed as one split.
+
+    This is the Inception score when the classifier is Inception.
+    """
+    marginal = self._sum_probs / self.num_images
+    marginal_neg_entropy = np.sum(marginal * np.log(np.maximum(marginal,
+                                                               1e-30)))
+    return float(np.exp(self._sum_neg_entropy / self.num_images -
+                        marginal_neg_entropy))
+
+  def frechet_distance(self, other):
+    """Returns the Frechet distance to other `ClassifierStatistics`."""
+    sigma1, sigma2 = self.covariance, other.covariance
+    # Tr(sqrt(sigma1 sigma2)) is Tr(sqrt(A)) for the symmetric matrix
+    # A = sqrt(sigma1) sigma2 sqrt(sigma1), which has the same eigenvalues.
+    w, v = np.linalg.eigh(sigma1)
+    sqrt_sigma1 = np.dot(v * np.sqrt(np.maximum(w, 0.)), v.T)
+    a = np.dot(np.dot(sqrt_sigma1, sigma2), sqrt_sigma1)
+    trace_sqrt = np.sum(np.sqrt(np.maximum(np.linalg.eigvalsh(a), 0.)))
+    mean_term = np.sum(np.square(self.mean - other.mean))
+    return float(mean_term + np.trace(sigma1) + np.trace(sigma2) -
+                 2. * trace_sqrt)
+
+  def save(self, filename):
+    # np.savez seeks in the file it writes, so it writes to memory first.
+    buf = io.BytesIO()
+    np.savez(buf, num_images=self.num_images, mean=self.mean,
+             comoment=self._comoment, sum_probs=self._sum_probs,
+             sum_neg_entropy=self._sum_neg_entropy)
+    with tf.gfile.Open(filename, 'wb') as f:
+      f.write(buf.getvalue())
+
+  @classmethod
+  def load(cls, filename):
+    with tf.gfile.Open(filename, 'rb') as f:
+      data = np.load(io.BytesIO(f.read()))
+      stats = cls()
+      stats.num_images = int(data['num_images'])
+      stats.mean = data['mean']
+      stats._comoment = data['comoment']  # pylint: disable=protected-access
+      stats._sum_probs = data['sum_probs']  # pylint: disable=protected-access
+      stats._sum_neg_entropy = float(data['sum_neg_entropy'])  # pylint: disable=protected-access
+    return stats
+
+
+def accumulate_statistics(sess, features, num_images, statistics=None):
+  """Runs classifier minibatches until `num_images` are seen.
+
+  Args:
+    sess: A `Session` to run `features` in.
+    features: A (logits, activations) tuple of tensors. Every run must yield
+      a new minibatch.
+    num_images: Python integer. The number of images to accumulate.
+    statistics: `ClassifierStatistics` to update. If `None`, a new one is
+      used.
+
+  Returns:
+    The updated `ClassifierStatistics`.
+  """
+  if statistics is None:
+    statistics = ClassifierStatistics()
+  target = statistics.num_images + num_images
+  while statistics.num_images < target:
+    logits, activations = sess.run(features)
+    n = min(len(activations), target - statistics.num_images)
+    statistics.update(logits[:n], activations[:n])
+  return statistics
+
+
+def get_cached_statistics(cache_dir, name, num_images, compute_fn):
+  """Returns classifier statistics of a dataset, cached on disk.
+
+  Args:
+    cache_dir: Directory of cached statistics. If `None`, nothing is cached.
+    name: Name of the statistics, for instance the dataset, split and
+      classifier they were computed with.
+    num_images: Python integer. The number of images the statistics need.
+    compute_fn: Function of no arguments computing `ClassifierStatistics`
+      over `num_images` images, called when the cache doesn't hold enough
+      images.
+
+  Returns:
+    `ClassifierStatistics`.
+  """
+  if cache_dir is None:
+    return compute_fn()
+  filename = os.path.join(cache_dir, '%s_statistics.npz' % name)
+  if tf.gfile.Exists(filename):
+    statistics = ClassifierStatistics.load(filename)
+    if statistics.num_images >= num_images:
+      return statistics
+  statistics = compute_fn()
+  tf.gfile.MakeDirs(cache_dir)
+  statistics.save(filename)
+  return statistics
+
+
+class StreamingStatisticsHook(tf.train.SessionRunHook):
+  """Computes streaming classifier metrics at the end of an evaluation.
+
+  Writes a classifier score summary and, if real features are given, a
+  Frechet distance summary.
+  """
+
+  def __init__(self, generated_features, num_images, eval_dir, score_tag,
+               distance_tag, real_features=None, real_statistics_fn=None):
+    """Creates the hook.
+
+    Args:
+      generated_features: (logits, activations) tensors of generated images.
+      num_images: Python integer. The number of images to evaluate.
+      eval_dir: Directory where the summaries are written.
+      score_tag: Summary tag of the classifier score.
+      distance_tag: Summary tag of the Frechet distance.
+      real_features: (logits, activations) tensors of real images, or `None`.
+      real_statistics_fn: Function of a `Session` and of `real_features`,
+        returning their `ClassifierStatistics`, for instance with a cache. If
+        `None`, they are accumulated on every evaluation.
+    """
+    self._generated_features = generated_features
+    self._num_images = num_images
+    self._eval_dir = eval_dir
+    self._score_tag = score_tag
+    self._distance_tag = distance_tag
+    self._real_features = real_features
+    self._real_statistics_fn = real_statistics_fn
+    self._real_statistics = None
+
+  def begin(self):
+    self._global_step = tf.train.get_global_step()
+
+  def end(self, session):
+    generated = accumulate_statistics(
+        session, self._generated_features, self._num_images)
+    values = [tf.Summary.Value(tag=self._score_tag,
+                               simple_value=generated.classifier_score())]
+    if self._real_features is not None:
+      real = self._real_statistics
+      if real is None and self._real_statistics_fn is None:
+        real = accumulate_statistics(
+            session, self._real_features, self._num_images)
+      elif real is None:
+        # Cached statistics of real images don't change between evaluations.
+        real = self._real_statistics_fn(session, self._real_features)
+        self._real_statistics = real
+      values.append(tf.Summary.Value(
+          tag=self._distance_tag,
+          simple_value=generated.frechet_distance(real)))
+    writer = tf.summary.FileWriterCache.get(self._eval_dir)
+    global_step = (0 if self._global_step is None else
+                   session.run(self._global_step))
+    writer.add_summary(tf.Summary(value=values), global_step)
+    writer.flush()
@@ -0,0 +1,137 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for streaming_statistics."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import numpy as np
+import tensorflow as tf
+import streaming_statistics
+
+
+class ClassifierStatisticsTest(tf.test.TestCase):
+
+  def _statistics(self, logits, activations, batch_size):
+    stats = streaming_statistics.ClassifierStatistics()
+    for i in range(0, len(activations), batch_size):
+      stats.update(logits[i:i + batch_size], activations[i:i + batch_size])
+    return stats
+
+  def test_streaming_matches_full_batch(self):
+    rng = np.random.RandomState(0)
+    activations = rng.randn(100, 8) * 10 + 1000
+    logits = rng.randn(100, 5)
+    stats = self._statistics(logits, activations, 7)
+    self.assertEqual(100, stats.num_images)
+    self.assertAllClose(activations.mean(axis=0), stats.mean)
+    self.assertAllClose(np.cov(activations, rowvar=False), stats.covariance)
+
+    probs = np.exp(logits) / np.sum(np.exp(logits), axis=1, keepdims=True)
+    marginal = probs.mean(axis=0)
+    kl = np.sum(probs * (np.log(probs) - np.log(marginal)), axis=1)
+    self.assertAllClose(np.exp(kl.mean()), stats.classifier_score())
+
+  def test_frechet_distance(self):
+    rng = np.random.RandomState(0)
+    activations1 = rng.randn(1000, 4) * [1., 2., 3., 4.]
+    activations2 = rng.randn(1000, 4) * [4., 3., 2., 1.] + 1.
+    logits = np.zeros([1000, 3])
+    stats1 = self._statistics(logits, activations1, 64)
+    stats2 = self._statistics(logits, activations2, 100)
+    self.assertAllClose(0.0, stats1.frechet_distance(stats1), atol=1e-6)
+
+    # Covariances are almost diagonal, so sqrt(sigma1 sigma2) almost is too.
+    var1, var2 = np.diag(stats1.covariance), np.diag(stats2.covariance)
+    expected = (np.sum(np.square(stats1.mean - stats2.mean)) +
+                np.sum(var1 + var2 - 2. * np.sqrt(var1 * var2)))
+    self.assertNear(expected, stats1.frechet_distance(stats2), 0.5)
+
+  def test_save_and_load(self):
+    rng = np.random.RandomState(0)
+    stats = self._statistics(rng.randn(10, 3), rng.randn(10, 4), 4)
+    filename = self.get_temp_dir() + '/statistics.npz'
+    stats.save(filename)
+    loaded = streaming_statistics.ClassifierStatistics.load(filename)
+    self.assertEqual(stats.num_images, loaded.num_images)
+    self.assertAllClose(stats.covariance, loaded.covariance)
+    self.assertAllClose(stats.classifier_score(), loaded.classifier_score())
+
+
+class _MinibatchSession(object):
+  """Returns the next minibatch of (logits, activations) on every run."""
+
+  def __init__(self, logits, activations, batch_size):
+    self._logits = logits
+    self._activations = activations
+    self._batch_size = batch_size
+    self.num_runs = 0
+
+  def run(self, unused_fetches):
+    start = self.num_runs * self._batch_size
+    end = start + self._batch_size
+    self.num_runs += 1
+    return self._logits[start:end], self._activations[start:end]
+
+
+class AccumulateStatisticsTest(tf.test.TestCase):
+
+  def setUp(self):
+    rng = np.random.RandomState(0)
+    self._logits = rng.randn(40, 3)
+    self._activations = rng.randn(40, 4)
+
+  def test_accumulate_statistics(self):
+    sess = _MinibatchSession(self._logits, self._activations, 4)
+    stats = streaming_statistics.accumulate_statistics(sess, None, 10)
+    # The last minibatch is truncated to the requested number of images.
+    self.assertEqual(3, sess.num_runs)
+    self.assertEqual(10, stats.num_images)
+    self.assertAllClose(self._activations[:10].mean(axis=0), stats.mean)
+
+    streaming_statistics.accumulate_statistics(sess, None, 6, stats)
+    expected = streaming_statistics.ClassifierStatistics()
+    expected.update(self._logits[:10], self._activations[:10])
+    expected.update(self._logits[12:18], self._activations[12:18])
+    self.assertEqual(16, stats.num_images)
+    self.assertAllClose(expected.covariance, stats.covariance)
+    self.assertAllClose(expected.classifier_score(), stats.classifier_score())
+
+  def test_get_cached_statistics(self):
+    cache_dir = os.path.join(self.get_temp_dir(), 'cache')
+    num_computed = []
+
+    def compute_fn(num_images):
+      num_computed.append(num_images)
+      sess = _MinibatchSession(self._logits, self._activations, 4)
+      return streaming_statistics.accumulate_statistics(sess, None,
+                                                        num_images)
+
+    for num_images in 20, 10, 30:
+      stats = streaming_statistics.get_cached_statistics(
+          cache_dir, 'test', num_images,
+          lambda: compute_fn(num_images))  # pylint: disable=cell-var-from-loop
+      self.assertGreaterEqual(stats.num_images, num_images)
+    # Statistics of fewer images are served from the cache.
+    self.assertEqual([20, 30], num_computed)
+    self.assertTrue(
+        tf.gfile.Exists(os.path.join(cache_dir, 'test_statistics.npz')))
+
+
+if __name__ == '__main__':
+  tf.test.main()
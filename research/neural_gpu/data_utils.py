@@ -47,14 +47,79 @@ def bin_for(l):
   return len(bins) - 1
 
 
+class DataBin(object):
+  """Examples of a length bin, stored as zero-padded int32 arrays.
+
+  An example is a pair ([input rows], [target rows]) of lists of ids, as in
+  lists of examples. The rows are stored in inputs[:len(self)] and
+  targets[:len(self)], of shape [size, rows, width], preallocated and grown
+  by doubling, so that batches are a single gather.
+  """
+
+  def __init__(self, width):
+    self.width = width
+    self.inputs = None
+    self.targets = None
+    self._size = 0
+
+  def __len__(self):
+    return self._size
+
+  def __getitem__(self, i):
+    if not -self._size <= i < self._size:
+      raise IndexError("DataBin index out of range")
+    return ([np.trim_zeros(r, "b").tolist() for r in self.inputs[i]],
+            [np.trim_zeros(r, "b").tolist() for r in self.targets[i]])
+
+  def _reserve(self, size, input_rows, target_rows, width):
+    """Makes room for size examples of the given shapes."""
+    if self.inputs is None:
+      self.width = max(width, self.width)
+      self.inputs = np.zeros((size, input_rows, self.width), dtype=np.int32)
+      self.targets = np.zeros((size, target_rows, self.width), dtype=np.int32)
+      return
+    if (self.inputs.shape[1], self.targets.shape[1]) != (input_rows,
+                                                         target_rows):
+      raise ValueError("Examples in a bin must have the same number of rows.")
+    capacity = self.inputs.shape[0]
+    if size <= capacity and width <= self.width:
+      return
+    if size > capacity:
+      capacity = max(size, 2 * capacity)
+    width = max(width, self.width)
+    for name in ["inputs", "targets"]:
+      old = getattr(self, name)
+      new = np.zeros((capacity, old.shape[1], width), dtype=np.int32)
+      new[:self._size, :, :self.width] = old[:self._size]
+      setattr(self, name, new)
+    self.width = width
+
+  def append(self, example):
+    """Adds an example ([input rows], [target rows])."""
+    inputs, targets = example
+    width = max([self.width] + [len(r) for r in inputs] +
+                [len(r) for r in targets])
+    self._reserve(self._size + 1, len(inputs), len(targets), width)
+    for rows, arr in [(inputs, self.inputs), (targets, self.targets)]:
+      for r, row in enumerate(rows):
+        arr[self._size, r, :len(row)] = row
+    self._size += 1
+
+  def extend(self, inputs, targets):
+    """Adds examples given as [n, rows, length] arrays, zero-padded."""
+    n = inputs.shape[0]
+    width = max(self.width, inputs.shape[2], targets.shape[2])
+    self._reserve(self._size + n, inputs.shape[1], targets.shape[1], width)
+    self.inputs[self._size:self._size + n, :, :inputs.shape[2]] = inputs
+    self.targets[self._size:self._size + n, :, :targets.shape[2]] = targets
+    self._size += n
+
+
 train_set = {}
 test_set = {}
 for some_task in all_tasks:
-  train_set[some_task] = []
-  test_set[some_task] = []
-  for all_max_len in xrange(10000):
-    train_set[some_task].append([])
-    test_set[some_task].append([])
+  train_set[some_task] = [DataBin(b) for b in bins]
+  test_set[some_task] = [DataBin(b) for b in bins]
 
 
 def read_tmp_file(name):
@@ -106,40 +171,123 @@ def add(n1, n2, base=10):
   return [0]
 
 
+def propagate_carries(digits, base=10):
+  """Normalizes lower-endian digit arrays [n, k] with digits >= base."""
+  res = np.zeros((digits.shape[0], digits.shape[1] + 1), dtype=np.int64)
+  carry = np.zeros(digits.shape[0], dtype=np.int64)
+  for i in xrange(digits.shape[1]):
+    carry, res[:, i] = np.divmod(digits[:, i] + carry, base)
+  res[:, -1] = carry
+  return res
+
+
+def add_batch(d1, d2, base=10):
+  """Add the lower-endian digit arrays [n, k], returns [n, k + 1] digits."""
+  return propagate_carries(d1.astype(np.int64) + d2, base)
+
+
+def mul_batch(d1, d2, base=10):
+  """Multiply the lower-endian digit arrays [n, k], returns [n, 2k] digits.
+
+  The digit products are summed as a convolution, then carried once."""
+  n, k = d1.shape
+  conv = np.zeros((n, max(2 * k - 1, 0)), dtype=np.int64)
+  for i in xrange(k):
+    conv[:, i:i + k] += d1[:, i:i + 1] * d2
+  return propagate_carries(conv, base)[:, :max(2 * k, 1)]
+
+
+def digits_to_ids(digits):
+  """Ids of digit arrays [n, k] without their leading zeros, zero-padded.
+
+  As in add, zero is the single digit [0]."""
+  nonzero = digits != 0
+  num_digits = np.where(nonzero.any(axis=1),
+                        digits.shape[1] - np.argmax(nonzero[:, ::-1], axis=1),
+                        1)
+  ids = np.zeros((digits.shape[0], max(digits.shape[1], 1)), dtype=np.int32)
+  ids[:, :digits.shape[1]] = digits + 1
+  ids[np.arange(ids.shape[1]) >= num_digits[:, None]] = 0
+  return ids
+
+
+def rand_arithmetic_batch(task, l, n):
+  """Random examples of an arithmetic task, with inputs of length <= l.
+
+  Returns:
+    inputs [n, 4, length] with the input in row 1, as [[], i, [], []], and
+    targets [n, 1, target length].
+  """
+  k = max((l - 1) // 2, 0)
+  base = 10
+  if task[0] == "b": base = 2
+  if task[0] == "q": base = 4
+  d1 = np.random.randint(base, size=(n, k))
+  d2 = np.random.randint(base, size=(n, k))
+  if task in ["add", "badd", "qadd"]:
+    res, sep = add_batch(d1, d2, base), 11
+  elif task in ["mul", "bmul"]:
+    res, sep = mul_batch(d1, d2, base), 12
+  else:
+    raise ValueError("Not an arithmetic task: %s" % task)
+  inputs = np.zeros((n, 4, 2 * k + 1), dtype=np.int32)
+  inputs[:, 1, :k] = d1 + 1
+  inputs[:, 1, k] = sep
+  inputs[:, 1, k + 1:] = d2 + 1
+  return inputs, digits_to_ids(res)[:, None, :]
+
+
+def rand_dup_batch(l, n, nclass):
+  """Random examples of the duplication task, of length l."""
+  k = l // 2
+  x = np.random.randint(nclass - 1, size=(n, k)) + 1
+  inputs = np.zeros((n, 1, l), dtype=np.int32)
+  targets = np.zeros((n, 1, l), dtype=np.int32)
+  inputs[:, 0, :k] = x
+  targets[:, 0, :k] = x
+  targets[:, 0, k:2 * k] = x
+  return inputs, targets
+
+
+def spec_batch(task, inp, nclass):
+  """Targets [n, length] for inputs [n, l] of the tasks computed from input."""
+  if task == "sort":
+    return np.sort(inp, axis=1)
+  elif task == "id":
+    return inp
+  elif task == "rev":
+    return inp[:, ::-1]
+  elif task == "incr":
+    carry_in = np.cumprod(
+        np.concatenate([np.ones_like(inp[:, :1]), inp[:, :-1] >= nclass - 1],
+                       axis=1), axis=1)[:, :inp.shape[1]].astype(bool)
+    incremented = np.where(inp + 1 < nclass, inp + 1, 1)
+    return np.where(carry_in, incremented, inp)
+  elif task == "left":
+    return inp[:, :1]
+  elif task == "right":
+    return inp[:, -1:]
+  elif task == "left-shift":
+    return np.roll(inp, 1, axis=1)
+  raise ValueError("No batched spec for task %s" % task)
+
+
+batched_tasks = ["add", "badd", "qadd", "bmul", "mul", "dup", "sort", "id",
+                 "rev", "incr", "left", "right", "left-shift"]
+
+
+def rand_batch(task, l, n, nclass):
+  """Random examples [n, rows, length] of one of the batched_tasks."""
+  if task in ["add", "badd", "qadd", "bmul", "mul"]:
+    return rand_arithmetic_batch(task, l, n)
+  elif task == "dup":
+    return rand_dup_batch(l, n, nclass)
+  inp = np.random.randint(nclass - 1, size=(n, l)) + 1
+  return inp[:, None, :], spec_batch(task, inp, nclass)[:, None, :]
+
+
 def init_data(task, length, nbr_cases, nclass):
   """Data initialization."""
-  def rand_pair(l, task):
-    """Random data pair for a task. Total length should be <= l."""
-    k = (l-1)/2
-    base = 10
-    if task[0] == "b": base = 2
-    if task[0] == "q": base = 4
-    d1 = [np.random.randint(base) for _ in xrange(k)]
-    d2 = [np.random.randint(base) for _ in xrange(k)]
-    if task in ["add", "badd", "qadd"]:
-      res = add(d1, d2, base)
-    elif task in ["mul", "bmul"]:
-      d1n = sum([d * (base ** i) for i, d in enumerate(d1)])
-      d2n = sum([d * (base ** i) for i, d in enumerate(d2)])
-      if task == "bmul":
-        res = [int(x) for x in list(reversed(str(bin(d1n * d2n))))[:-2]]
-      else:
-        res = [int(x) for x in list(reversed(str(d1n * d2n)))]
-    else:
-      sys.exit()
-    sep = [12]
-    if task in ["add", "badd", "qadd"]: sep = [11]
-    inp = [d + 1 for d in d1] + sep + [d + 1 for d in d2]
-    return inp, [r + 1 for r in res]
-
-  def rand_dup_pair(l):
-    """Random data pair for duplication task. Total length should be <= l."""
-    k = l/2
-    x = [np.random.randint(nclass - 1) + 1 for _ in xrange(k)]
-    inp = x + [0 for _ in xrange(l - k)]
-    res = x + x + [0 for _ in xrange(l - 2*k)]
-    return inp, res
-
   def rand_rev2_pair(l):
     """Random data pair for reverse2 task. Total length should be <= l."""
     inp = [(np.random.randint(nclass - 1) + 1,
@@ -295,22 +443,18 @@ def init_data(task, length, nbr_cases, nclass):
             ilist.append(inp + out)
           dset[task][bin_for(plen)].append([ilist, [ptoks]])
 
-  for case in xrange(0 if is_prog else nbr_cases):
+  is_batched = task in batched_tasks
+  if is_batched:
+    for dset in [train_set, test_set]:
+      inputs, targets = rand_batch(task, l, nbr_cases, nclass)
+      dset[task][bin_for(inputs.shape[2])].extend(inputs, targets)
+
+  for case in xrange(0 if is_prog or is_batched else nbr_cases):
     total_time += time.time() - cur_time
     cur_time = time.time()
     if l > 10000 and case % 100 == 1:
       print_out("  avg gen time %.4f s" % (total_time / float(case)))
-    if task in ["add", "badd", "qadd", "bmul", "mul"]:
-      i, t = rand_pair(l, task)
-      train_set[task][bin_for(len(i))].append([[[], i, [], []], [t]])
-      i, t = rand_pair(l, task)
-      test_set[task][bin_for(len(i))].append([[[], i, [], []], [t]])
-    elif task == "dup":
-      i, t = rand_dup_pair(l)
-      train_set[task][bin_for(len(i))].append([[i], [t]])
-      i, t = rand_dup_pair(l)
-      test_set[task][bin_for(len(i))].append([[i], [t]])
-    elif task == "rev2":
+    if task == "rev2":
       i, t = rand_rev2_pair(l)
       train_set[task][bin_for(len(i))].append([[i], [t]])
       i, t = rand_rev2_pair(l)
@@ -349,8 +493,30 @@ def to_id(s):
   return int(s) + 1
 
 
+def get_bin_batch(data_bin, pad_length, batch_size, height, offset=None):
+  """Get a batch from a DataBin, random or from offset on while it lasts."""
+  idx = np.random.randint(len(data_bin), size=batch_size)
+  if offset is not None:
+    in_bin = offset + np.arange(batch_size) < len(data_bin)
+    idx[in_bin] = offset + np.arange(batch_size)[in_bin]
+  width = min(data_bin.width, pad_length)
+  if data_bin.width > pad_length:
+    assert not np.any(data_bin.inputs[idx, :, width:])
+    assert not np.any(data_bin.targets[idx, :, width:])
+  input_rows = data_bin.inputs.shape[1]
+  assert input_rows in [1, height]
+  res_input = np.zeros([batch_size, height, pad_length], dtype=np.int32)
+  res_target = np.zeros([batch_size, 1, pad_length], dtype=np.int32)
+  res_input[:, :input_rows, :width] = data_bin.inputs[idx, :, :width]
+  res_target[:, :, :width] = data_bin.targets[idx, :, :width]
+  return res_input, res_target
+
+
 def get_batch(bin_id, batch_size, data_set, height, offset=None, preset=None):
   """Get a batch of data, training or testing."""
+  if preset is None and isinstance(data_set[bin_id], DataBin):
+    return get_bin_batch(data_set[bin_id], bins[bin_id], batch_size, height,
+                         offset)
   inputs, targets = [], []
   pad_length = bins[bin_id]
   for b in xrange(batch_size):
@@ -438,15 +438,16 @@ class Controller(object):
     while True:
       if batch_size > len(self.replay_buffer):
         batch_size = len(self.replay_buffer)
-      episodes, probs = self.replay_buffer.get_batch(batch_size)
-      count = sum(len(ep[-2]) for ep in episodes)
+      batch, probs = self.replay_buffer.get_batched_episodes(batch_size)
+      pads = batch[-1]
+      count = np.sum(1 - pads)
       if count >= desired_count or not self.batch_by_steps:
         break
       if batch_size == len(self.replay_buffer):
         return None, None
       batch_size *= 1.2
 
-    return (self.convert_to_batched_episodes(episodes), probs)
+    return batch, probs
 
   def seed_replay_buffer(self, episodes):
     """Seed the replay buffer with some episodes."""
@@ -15,19 +15,217 @@
 
 """Replay buffer.
 
-Implements replay buffer in Python.
+Implements replay buffer in Python. Episodes are kept in flat arrays of steps
+and prioritized sampling uses a sum tree, so that sampling and priority
+updates take O(log n) per episode.
 """
 
 import random
 import numpy as np
 
 
+class SegmentTree(object):
+  """Complete binary tree whose nodes reduce their two children.
+
+  The leaves are the array values; the root reduces all of them.
+  """
+
+  def __init__(self, capacity, operation, neutral_element):
+    self.capacity = capacity
+    self.size = 1
+    while self.size < capacity:
+      self.size *= 2
+    self.operation = operation
+    self.tree = np.full(2 * self.size, neutral_element, dtype=np.float64)
+
+  def __getitem__(self, idxs):
+    return self.tree[self.size + np.asarray(idxs)]
+
+  def update(self, idxs, values):
+    """Sets the leaves idxs to values and updates their ancestors."""
+    nodes = self.size + np.asarray(idxs, dtype=np.int64).ravel()
+    if not nodes.size:
+      return
+    self.tree[nodes] = values
+    nodes = np.unique(nodes)
+    while nodes[0] > 1:
+      nodes //= 2
+      # The nodes stay sorted, so their duplicates are adjacent.
+      nodes = nodes[np.concatenate([[True], nodes[1:] != nodes[:-1]])]
+      self.tree[nodes] = self.operation(self.tree[2 * nodes],
+                                        self.tree[2 * nodes + 1])
+
+  def reduce(self):
+    return self.tree[1]
+
+
+class SumTree(SegmentTree):
+  """Segment tree of sums, to sample leaves proportionally to their value."""
+
+  def __init__(self, capacity):
+    super(SumTree, self).__init__(capacity, np.add, 0.0)
+
+  def find_prefix_sum(self, prefix_sums):
+    """Leaves at which the running sum of the leaves reaches prefix_sums."""
+    prefix_sums = np.array(prefix_sums, dtype=np.float64)
+    nodes = np.ones(prefix_sums.shape, dtype=np.int64)
+    while self.size > 1 and nodes.size and nodes[0] < self.size:
+      left = 2 * nodes
+      left_sums = self.tree[left]
+      # Never descend into an empty subtree because of rounding.
+      go_right = (prefix_sums >= left_sums) & (self.tree[left + 1] > 0)
+      prefix_sums -= left_sums * go_right
+      nodes = left + go_right
+    return nodes - self.size
+
+
+class EpisodeStorage(object):
+  """Episodes in flat, preallocated arrays of steps, indexed by slot.
+
+  An episode is [initial_state, observations, actions, rewards, terminated]
+  where observations and actions are lists of arrays of length + 1 steps and
+  rewards has length steps. The steps of the episode in slot i are the rows
+  offsets[i]:offsets[i] + lengths[i] + 1 of the step arrays (rewards being
+  padded with a trailing 0). New episodes are written at the end of the step
+  arrays, which are compacted or grown when full.
+  """
+
+  def __init__(self, max_size):
+    self.max_size = max_size
+    self.offsets = np.zeros(max_size, dtype=np.int64)
+    self.lengths = np.zeros(max_size, dtype=np.int64)
+    self.live = np.zeros(max_size, dtype=bool)
+    self.terminated = np.zeros(max_size, dtype=bool)
+    self.initial_states = None
+    self.observations = None
+    self.actions = None
+    self.rewards = None
+    self.num_steps = 0
+
+  def _step_arrays(self):
+    return [self.rewards] + self.observations + self.actions
+
+  def _set_step_arrays(self, arrays):
+    self.rewards = arrays[0]
+    self.observations = arrays[1:1 + len(self.observations)]
+    self.actions = arrays[1 + len(self.observations):]
+
+  def _allocate(self, episode, capacity):
+    initial_state, observations, actions, rewards, _ = episode
+    initial_state = np.asarray(initial_state)
+    self.initial_states = np.zeros(
+        (self.max_size,) + initial_state.shape, dtype=initial_state.dtype)
+    self.observations = [
+        np.zeros((capacity,) + np.shape(obs)[1:], dtype=np.asarray(obs).dtype)
+        for obs in observations]
+    self.actions = [
+        np.zeros((capacity,) + np.shape(act)[1:], dtype=np.asarray(act).dtype)
+        for act in actions]
+    self.rewards = np.zeros(capacity, dtype=np.asarray(rewards).dtype)
+
+  def _reserve(self, num_steps):
+    """Makes room for num_steps more steps at the end of the step arrays."""
+    capacity = len(self.rewards)
+    if self.num_steps + num_steps <= capacity:
+      return
+    # Copy the live episodes, in slot order, to the start of new arrays.
+    slots = np.nonzero(self.live)[0]
+    sizes = self.lengths[slots] + 1
+    live_steps = np.sum(sizes)
+    if live_steps + num_steps > capacity // 2:
+      capacity = max(2 * (live_steps + num_steps), capacity)
+    new_offsets = np.cumsum(sizes) - sizes
+    rows = (np.arange(live_steps) - np.repeat(new_offsets, sizes) +
+            np.repeat(self.offsets[slots], sizes))
+    new_arrays = []
+    for arr in self._step_arrays():
+      new_arr = np.zeros((capacity,) + arr.shape[1:], dtype=arr.dtype)
+      new_arr[:live_steps] = arr[rows]
+      new_arrays.append(new_arr)
+    self._set_step_arrays(new_arrays)
+    self.offsets[slots] = new_offsets
+    self.num_steps = live_steps
+
+  @staticmethod
+  def _fit(arr, value):
+    """Returns arr, promoted if needed to hold value."""
+    dtype = np.promote_types(arr.dtype, np.asarray(value).dtype)
+    return arr if dtype == arr.dtype else arr.astype(dtype)
+
+  def put(self, idxs, episodes):
+    """Stores episodes in slots idxs, replacing the ones there."""
+    if not len(episodes):
+      return
+    idxs = np.asarray(idxs, dtype=np.int64)
+    lengths = np.array([len(ep[3]) for ep in episodes], dtype=np.int64)
+    sizes = lengths + 1
+    if self.rewards is None:
+      self._allocate(episodes[0], 16 * np.sum(sizes))
+    self.live[idxs] = False
+    self._reserve(np.sum(sizes))
+    start = self.num_steps
+    offsets = start + np.cumsum(sizes) - sizes
+
+    initial_states = np.array([ep[0] for ep in episodes])
+    self.initial_states = self._fit(self.initial_states, initial_states)
+    self.initial_states[idxs] = initial_states
+    # Rewards get a trailing 0 to have as many steps as observations.
+    zero = np.zeros(1, dtype=np.asarray(episodes[0][3]).dtype)
+    values = [np.concatenate([part for ep in episodes
+                              for part in (ep[3], zero)])]
+    for i in xrange(len(self.observations)):
+      values.append(np.concatenate([ep[1][i] for ep in episodes]))
+    for i in xrange(len(self.actions)):
+      values.append(np.concatenate([ep[2][i] for ep in episodes]))
+    arrays = self._step_arrays()
+    for i, value in enumerate(values):
+      arrays[i] = self._fit(arrays[i], value)
+      arrays[i][start:start + len(value)] = value
+    self._set_step_arrays(arrays)
+
+    self.offsets[idxs] = offsets
+    self.lengths[idxs] = lengths
+    self.terminated[idxs] = [ep[4] for ep in episodes]
+    self.live[idxs] = True
+    self.num_steps = start + np.sum(sizes)
+
+  def get(self, idx):
+    """The episode in slot idx."""
+    start, length = self.offsets[idx], self.lengths[idx]
+    return [self.initial_states[idx].copy(),
+            [obs[start:start + length + 1].copy()
+             for obs in self.observations],
+            [act[start:start + length + 1].copy() for act in self.actions],
+            self.rewards[start:start + length].copy(),
+            self.terminated[idx]]
+
+  def gather(self, idxs, max_length=None):
+    """Time-major batch of the episodes in slots idxs.
+
+    Returns (initial_state, observations, actions, rewards, terminated, pads)
+    as Controller.convert_to_batched_episodes: observations and actions of
+    max_length + 1 steps repeat the steps of shorter episodes, rewards are 0
+    and pads 1 past the end of an episode.
+    """
+    idxs = np.asarray(idxs)
+    lengths = self.lengths[idxs]
+    max_length = max_length or np.max(lengths)
+    steps = np.arange(max_length + 1)[:, None]
+    rows = self.offsets[idxs] + steps % (lengths + 1)
+    pads = (steps[:-1] >= lengths).astype(np.int64)
+    rewards = self.rewards[rows[:-1]] * (1 - pads)
+    observations = [obs[rows] for obs in self.observations]
+    actions = [act[rows] for act in self.actions]
+    return (self.initial_states[idxs], observations, actions, rewards,
+            self.terminated[idxs], pads)
+
+
 class ReplayBuffer(object):
 
   def __init__(self, max_size):
     self.max_size = max_size
     self.cur_size = 0
-    self.buffer = {}
+    self.buffer = EpisodeStorage(max_size)
     self.init_length = 0
 
   def __len__(self):
@@ -39,19 +237,14 @@ class ReplayBuffer(object):
 
   def add(self, episodes, *args):
     """Add episodes to buffer."""
-    idx = 0
-    while self.cur_size < self.max_size and idx < len(episodes):
-      self.buffer[self.cur_size] = episodes[idx]
-      self.cur_size += 1
-      idx += 1
-
-    if idx < len(episodes):
-      remove_idxs = self.remove_n(len(episodes) - idx)
-      for remove_idx in remove_idxs:
-        self.buffer[remove_idx] = episodes[idx]
-        idx += 1
-
-    assert len(self.buffer) == self.cur_size
+    new_idxs = range(self.cur_size,
+                     min(self.max_size, self.cur_size + len(episodes)))
+    self.cur_size += len(new_idxs)
+    if len(new_idxs) < len(episodes):
+      new_idxs = (list(new_idxs) +
+                  list(self.remove_n(len(episodes) - len(new_idxs))))
+    self.buffer.put(new_idxs, episodes)
+    return new_idxs
 
   def remove_n(self, n):
     """Get n items for removal."""
@@ -59,17 +252,36 @@ class ReplayBuffer(object):
     idxs = random.sample(xrange(self.init_length, self.cur_size), n)
     return idxs
 
+  def sample(self, n):
+    """Sample indices of a batch, and their probabilities if prioritized."""
+    # random batch
+    idxs = random.sample(xrange(self.cur_size), int(n))
+    return idxs, None
+
   def get_batch(self, n):
     """Get batch of episodes to train on."""
-    # random batch
-    idxs = random.sample(xrange(self.cur_size), n)
-    return [self.buffer[idx] for idx in idxs], None
+    idxs, probs = self.sample(n)
+    return [self.buffer.get(idx) for idx in idxs], probs
+
+  def get_batched_episodes(self, n):
+    """Get time-major batch of episodes to train on, see EpisodeStorage."""
+    idxs, probs = self.sample(n)
+    return self.buffer.gather(idxs), probs
 
   def update_last_batch(self, delta):
     pass
 
 
 class PrioritizedReplayBuffer(ReplayBuffer):
+  """Replay buffer sampling episode i with probability ~ exp(alpha * p_i).
+
+  The exponentiated priorities are kept in a sum tree, relative to a reference
+  priority that is moved, rebuilding the tree, when they would overflow or
+  all underflow.
+  """
+
+  # Bound on alpha * |priority - reference priority| of new priorities.
+  MAX_EXPONENT = 100.
 
   def __init__(self, max_size, alpha=0.2,
                eviction_strategy='rand'):
@@ -80,42 +292,61 @@ class PrioritizedReplayBuffer(ReplayBuffer):
     self.remove_idx = 0
 
     self.cur_size = 0
-    self.buffer = {}
+    self.buffer = EpisodeStorage(max_size)
     self.priorities = np.zeros(self.max_size)
     self.init_length = 0
 
+    # Exponentiated priorities, and the priorities past the seed episodes.
+    self.sum_tree = SumTree(self.max_size)
+    self.max_tree = SegmentTree(self.max_size, np.maximum, -np.inf)
+    self.max_tree.update(np.arange(self.max_size), 0.)
+    self.ref_priority = 0.
+
   def __len__(self):
     return self.cur_size
 
+  def seed_buffer(self, episodes):
+    self.max_tree.update(np.arange(len(episodes)), -np.inf)
+    super(PrioritizedReplayBuffer, self).seed_buffer(episodes)
+
   def add(self, episodes, priorities, new_idxs=None):
     """Add episodes to buffer."""
     if new_idxs is None:
-      idx = 0
-      new_idxs = []
-      while self.cur_size < self.max_size and idx < len(episodes):
-        self.buffer[self.cur_size] = episodes[idx]
-        new_idxs.append(self.cur_size)
-        self.cur_size += 1
-        idx += 1
-
-      if idx < len(episodes):
-        remove_idxs = self.remove_n(len(episodes) - idx)
-        for remove_idx in remove_idxs:
-          self.buffer[remove_idx] = episodes[idx]
-          new_idxs.append(remove_idx)
-          idx += 1
+      new_idxs = super(PrioritizedReplayBuffer, self).add(episodes)
     else:
       assert len(new_idxs) == len(episodes)
-      for new_idx, ep in zip(new_idxs, episodes):
-        self.buffer[new_idx] = ep
-
-    self.priorities[new_idxs] = priorities
-    self.priorities[0:self.init_length] = np.max(
-        self.priorities[self.init_length:])
+      self.buffer.put(new_idxs, episodes)
 
-    assert len(self.buffer) == self.cur_size
+    self.set_priorities(new_idxs, priorities)
     return new_idxs
 
+  def set_priorities(self, idxs, priorities):
+    """Set the priorities of idxs; seed episodes get the max priority."""
+    idxs = np.asarray(idxs, dtype=np.int64)
+    self.priorities[idxs] = priorities
+    updated = [idxs]
+    not_seeds = idxs[idxs >= self.init_length]
+    self.max_tree.update(not_seeds, self.priorities[not_seeds])
+    max_priority = self.max_tree.reduce()
+    if self.init_length and np.isfinite(max_priority) and np.any(
+        self.priorities[0:self.init_length] != max_priority):
+      self.priorities[0:self.init_length] = max_priority
+      updated.append(np.arange(self.init_length))
+    idxs = np.concatenate(updated)
+
+    exponents = self.alpha * (self.priorities[idxs] - self.ref_priority)
+    if np.any(np.abs(exponents) > self.MAX_EXPONENT):
+      self.rebuild_sum_tree()
+    else:
+      self.sum_tree.update(idxs, np.exp(exponents))
+
+  def rebuild_sum_tree(self):
+    """Recomputes the sum tree, relative to the max priority."""
+    p = self.priorities[:self.cur_size]
+    self.ref_priority = np.max(p) if self.cur_size else 0.
+    self.sum_tree.update(np.arange(self.cur_size),
+                         np.exp(self.alpha * (p - self.ref_priority)))
+
   def remove_n(self, n):
     """Get n items for removal."""
     assert self.init_length + n <= self.cur_size
@@ -137,25 +368,46 @@ class PrioritizedReplayBuffer(ReplayBuffer):
     return idxs
 
   def sampling_distribution(self):
-    p = self.priorities[:self.cur_size]
-    p = np.exp(self.alpha * (p - np.max(p)))
+    p = self.sum_tree[np.arange(self.cur_size)]
     norm = np.sum(p)
     if norm > 0:
-      uniform = 0.0
-      p = p / norm * (1 - uniform) + 1.0 / self.cur_size * uniform
+      p = p / norm
     else:
       p = np.ones(self.cur_size) / self.cur_size
     return p
 
-  def get_batch(self, n):
-    """Get batch of episodes to train on."""
-    p = self.sampling_distribution()
-    idxs = np.random.choice(self.cur_size, size=int(n), replace=False, p=p)
+  def sample(self, n):
+    """Sample n distinct indices, with the probabilities of the first draw.
+
+    Draws like np.random.choice(replace=False): repeatedly draws the missing
+    number of indices, keeps the new ones in order of first appearance and
+    zeroes them out of the sum tree, which is restored at the end.
+    """
+    n = int(n)
+    if not self.sum_tree.reduce() > 0:
+      self.rebuild_sum_tree()
+    total = self.sum_tree.reduce()
+    idxs = np.zeros(0, dtype=np.int64)
+    while idxs.size < n:
+      remaining_total = self.sum_tree.reduce()
+      if not remaining_total > 0:
+        # Only episodes with no probability left, pick them uniformly.
+        rest = np.setdiff1d(np.arange(self.cur_size), idxs)
+        rest = np.random.permutation(rest)[:n - idxs.size]
+        self.sum_tree.update(rest, 0.)
+        idxs = np.concatenate([idxs, rest])
+        break
+      draws = self.sum_tree.find_prefix_sum(
+          np.random.uniform(0., remaining_total, size=n - idxs.size))
+      _, first = np.unique(draws, return_index=True)
+      new_idxs = draws[np.sort(first)]
+      self.sum_tree.update(new_idxs, 0.)
+      idxs = np.concatenate([idxs, new_idxs])
+    self.sum_tree.update(
+        idxs, np.exp(self.alpha * (self.priorities[idxs] - self.ref_priority)))
     self.last_batch = idxs
-    return [self.buffer[idx] for idx in idxs], p[idxs]
+    return idxs, self.sum_tree[idxs] / total
 
   def update_last_batch(self, delta):
     """Update last batch idxs with new priority."""
-    self.priorities[self.last_batch] = np.abs(delta)
-    self.priorities[0:self.init_length] = np.max(
-        self.priorities[self.init_length:])
+    self.set_priorities(self.last_batch, np.abs(delta))
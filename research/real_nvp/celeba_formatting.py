@@ -28,66 +28,32 @@ python celeba_formatting.py \
     --fn_root [CELEBA_FOLDER] \
     --set [SUBSET_INDEX]
 
+See dataset_formatting.py for the sharding, encoding and parallelism flags.
 """
 
-import os
 import os.path
 
-import scipy.io
-import scipy.io.wavfile
-import scipy.ndimage
 import tensorflow as tf
 
+import dataset_formatting
+
 
-tf.flags.DEFINE_string("file_out", "",
-                       "Filename of the output .tfrecords file.")
-tf.flags.DEFINE_string("fn_root", "", "Name of root file path.")
 tf.flags.DEFINE_string("partition_fn", "", "Partition file path.")
 tf.flags.DEFINE_string("set", "", "Name of subset.")
 
 FLAGS = tf.flags.FLAGS
 
 
-def _int64_feature(value):
-    return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
-
-
-def _bytes_feature(value):
-    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
-
-
 def main():
     """Main converter function."""
     # Celeb A
     with open(FLAGS.partition_fn, "r") as infile:
         img_fn_list = infile.readlines()
     img_fn_list = [elem.strip().split() for elem in img_fn_list]
-    img_fn_list = [elem[0] for elem in img_fn_list if elem[1] == FLAGS.set]
-    fn_root = FLAGS.fn_root
-    num_examples = len(img_fn_list)
-
-    file_out = "%s.tfrecords" % FLAGS.file_out
-    writer = tf.python_io.TFRecordWriter(file_out)
-    for example_idx, img_fn in enumerate(img_fn_list):
-        if example_idx % 1000 == 0:
-            print example_idx, "/", num_examples
-        image_raw = scipy.ndimage.imread(os.path.join(fn_root, img_fn))
-        rows = image_raw.shape[0]
-        cols = image_raw.shape[1]
-        depth = image_raw.shape[2]
-        image_raw = image_raw.tostring()
-        example = tf.train.Example(
-            features=tf.train.Features(
-                feature={
-                    "height": _int64_feature(rows),
-                    "width": _int64_feature(cols),
-                    "depth": _int64_feature(depth),
-                    "image_raw": _bytes_feature(image_raw)
-                }
-            )
-        )
-        writer.write(example.SerializeToString())
-    writer.close()
+    img_fn_list = [os.path.join(FLAGS.fn_root, elem[0])
+                   for elem in img_fn_list if elem[1] == FLAGS.set]
+    dataset_formatting.format_dataset(
+        img_fn_list, dataset_formatting.load_image)
 
 
 if __name__ == "__main__":
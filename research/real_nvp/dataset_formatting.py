@@ -0,0 +1,176 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Parallel, sharded formatting of image datasets into .tfrecords files.
+
+The images of a dataset are split into contiguous, deterministic shards
+[FILE_OUT]_00000.tfrecords, [FILE_OUT]_00001.tfrecords, ... and every shard is
+decoded, resized and written by one process of a pool. A shard is first
+written to a temporary file and renamed once complete, so an interrupted run
+can be resumed by running it again with the same flags: finished shards are
+skipped.
+
+Each record holds the "height", "width" and "depth" of its image, and the
+pixels either as raw uint8 bytes in "image_raw" or, with --encoding png, as a
+PNG in "image_png".
+"""
+
+from __future__ import print_function
+
+import io
+import multiprocessing
+import os
+import os.path
+import time
+
+import numpy
+from PIL import Image
+import tensorflow as tf
+
+
+tf.flags.DEFINE_string("file_out", "",
+                       "Filename prefix of the output .tfrecords files.")
+tf.flags.DEFINE_string("fn_root", "", "Name of root file path.")
+tf.flags.DEFINE_integer("num_shards", 0,
+                        "Number of output files. If 0, writes 10000 "
+                        "examples per file.")
+tf.flags.DEFINE_integer("num_workers", 0,
+                        "Number of formatting processes. If 0, uses one "
+                        "per CPU.")
+tf.flags.DEFINE_string("encoding", "raw",
+                       "Encoding of the pixels. Must be 'raw' or 'png'.")
+tf.flags.DEFINE_boolean("resume", True,
+                        "Whether to skip the shards already written by a "
+                        "previous run.")
+
+FLAGS = tf.flags.FLAGS
+
+EXAMPLES_PER_SHARD = 10000
+
+
+def _int64_feature(value):
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
+
+
+def _bytes_feature(value):
+    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+
+
+def load_image(path):
+    """Decodes an image file into a uint8 array."""
+    return numpy.array(Image.open(path))
+
+
+def encode_example(image, encoding="raw"):
+    """Serializes a uint8 image of shape [height, width, depth]."""
+    rows, cols, depth = image.shape
+    feature = {
+        "height": _int64_feature(rows),
+        "width": _int64_feature(cols),
+        "depth": _int64_feature(depth),
+    }
+    if encoding == "png":
+        buf = io.BytesIO()
+        Image.fromarray(image).save(buf, format="PNG")
+        feature["image_png"] = _bytes_feature(buf.getvalue())
+    elif encoding == "raw":
+        feature["image_raw"] = _bytes_feature(image.tostring())
+    else:
+        raise ValueError("Unknown encoding %s." % encoding)
+    example = tf.train.Example(features=tf.train.Features(feature=feature))
+    return example.SerializeToString()
+
+
+def shard_filename(file_out, shard_idx):
+    return "%s_%05d.tfrecords" % (file_out, shard_idx)
+
+
+def shard_bounds(num_examples, num_shards):
+    """Returns the [start, end) example indices of every shard."""
+    bounds = numpy.arange(num_shards + 1) * num_examples // num_shards
+    return zip(bounds[:-1], bounds[1:])
+
+
+def _write_shard(args):
+    """Formats the images of one shard, returns its number of examples."""
+    file_out, img_fn_list, process_fn, encoding = args
+    tmp_file_out = file_out + ".tmp"
+    writer = tf.python_io.TFRecordWriter(tmp_file_out)
+    for img_fn in img_fn_list:
+        image = process_fn(img_fn)
+        writer.write(encode_example(image, encoding))
+    writer.close()
+    tf.gfile.Rename(tmp_file_out, file_out, overwrite=True)
+    return len(img_fn_list)
+
+
+def format_dataset(img_fn_list, process_fn, file_out=None, num_shards=None,
+                   num_workers=None, encoding=None, resume=None):
+    """Formats a list of images into sharded .tfrecords files.
+
+    Args:
+        img_fn_list: list of image paths. Its order defines the order of the
+            examples and their shards.
+        process_fn: function from an image path to a uint8 array of shape
+            [height, width, depth]. Must be picklable, i.e. a module level
+            function, as it runs in the worker processes.
+        file_out, num_shards, num_workers, encoding, resume: override the
+            flags of the same names.
+    Returns:
+        the list of the shard filenames.
+    """
+    file_out = FLAGS.file_out if file_out is None else file_out
+    num_shards = FLAGS.num_shards if num_shards is None else num_shards
+    num_workers = FLAGS.num_workers if num_workers is None else num_workers
+    encoding = FLAGS.encoding if encoding is None else encoding
+    resume = FLAGS.resume if resume is None else resume
+    num_examples = len(img_fn_list)
+    if num_shards <= 0:
+        num_shards = max(1, -(-num_examples // EXAMPLES_PER_SHARD))
+    if num_workers <= 0:
+        num_workers = multiprocessing.cpu_count()
+
+    filenames = [shard_filename(file_out, shard_idx)
+                 for shard_idx in range(num_shards)]
+    tasks = []
+    for filename, (start, end) in zip(filenames,
+                                      shard_bounds(num_examples, num_shards)):
+        if resume and tf.gfile.Exists(filename):
+            continue
+        tasks.append((filename, img_fn_list[start:end], process_fn, encoding))
+    print("Formatting %d examples into %d shards, %d already done." % (
+        num_examples, num_shards, num_shards - len(tasks)))
+
+    start_time = time.time()
+    num_done = 0
+    pool = multiprocessing.Pool(min(num_workers, max(1, len(tasks))))
+    try:
+        for task_idx, num_written in enumerate(
+                pool.imap(_write_shard, tasks)):
+            num_done += num_written
+            print("Wrote %s, %d examples in %.0fs." % (
+                tasks[task_idx][0], num_done, time.time() - start_time))
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return filenames
+
+
+def list_images(fn_root, extension):
+    """Sorted paths of the files of fn_root with the given extension."""
+    return [os.path.join(fn_root, img_fn)
+            for img_fn in sorted(os.listdir(fn_root))
+            if img_fn.endswith(extension)]
@@ -52,6 +52,14 @@ tf.flags.DEFINE_integer("train_steps", 1000000000000000000,
 
 tf.flags.DEFINE_string("data_path", "", "Path to the data.")
 
+tf.flags.DEFINE_string("data_encoding", "raw",
+                       "Encoding of the formatted images. Must be 'raw' "
+                       "or 'png', as in the --encoding of the formatting "
+                       "scripts.")
+
+tf.flags.DEFINE_integer("num_readers", 1,
+                        "Number of parallel readers of the data files.")
+
 tf.flags.DEFINE_string("mode", "train",
                        "Mode of execution. Must be 'train', "
                        "'sample' or 'eval'.")
@@ -923,6 +931,58 @@ def decoder(input_, hps, n_scale, use_batch_norm=True,
     return res, log_diff
 
 
+def read_image(filename_queue):
+    """Reads a uint8 image of shape [height, width, depth] from .tfrecords."""
+    reader = tf.TFRecordReader()
+    _, serialized_example = reader.read(filename_queue)
+    if FLAGS.data_encoding == "png":
+        features = tf.parse_single_example(
+            serialized_example,
+            features={"image_png": tf.FixedLenFeature([], tf.string)})
+        return tf.image.decode_png(features["image_png"], channels=3)
+    elif FLAGS.data_encoding == "raw":
+        features = tf.parse_single_example(
+            serialized_example,
+            features={
+                "image_raw": tf.FixedLenFeature([], tf.string),
+                "height": tf.FixedLenFeature([], tf.int64),
+                "width": tf.FixedLenFeature([], tf.int64),
+                "depth": tf.FixedLenFeature([], tf.int64)
+            })
+        image = tf.decode_raw(features["image_raw"], tf.uint8)
+        shape = tf.cast(tf.stack([features["height"], features["width"],
+                                  features["depth"]]), tf.int32)
+        return tf.reshape(image, shape)
+    else:
+        raise ValueError("Unknown data encoding.")
+
+
+def batch_images(image_fn, batch_size):
+    """Batches the images of FLAGS.num_readers parallel readers.
+
+    Args:
+        image_fn: function from a uint8 image read from the data files to the
+            image to batch.
+        batch_size: size of the batches.
+    Returns:
+        a batch of images.
+    """
+    filename_queue = tf.train.string_input_producer(
+        gfile.Glob(FLAGS.data_path), num_epochs=None)
+    images_list = [[image_fn(read_image(filename_queue))]
+                   for _ in xrange(FLAGS.num_readers)]
+    if FLAGS.mode == "train":
+        return tf.train.shuffle_batch_join(
+            images_list, batch_size=batch_size,
+            capacity=1000 + 3 * batch_size,
+            # Ensures a minimum amount of shuffling of examples.
+            min_after_dequeue=1000)
+    else:
+        return tf.train.batch_join(
+            images_list, batch_size=batch_size,
+            capacity=1000 + 3 * batch_size)
+
+
 class RealNVP(object):
     """Real NVP model."""
 
@@ -932,28 +992,11 @@ class RealNVP(object):
         if FLAGS.dataset == "imnet":
             with tf.device(
                 tf.train.replica_device_setter(0, worker_device=device)):
-                filename_queue = tf.train.string_input_producer(
-                    gfile.Glob(FLAGS.data_path), num_epochs=None)
-                reader = tf.TFRecordReader()
-                _, serialized_example = reader.read(filename_queue)
-                features = tf.parse_single_example(
-                    serialized_example,
-                    features={
-                        "image_raw": tf.FixedLenFeature([], tf.string),
-                    })
-                image = tf.decode_raw(features["image_raw"], tf.uint8)
-                image.set_shape([FLAGS.image_size * FLAGS.image_size * 3])
-                image = tf.cast(image, tf.float32)
-                if FLAGS.mode == "train":
-                    images = tf.train.shuffle_batch(
-                        [image], batch_size=hps.batch_size, num_threads=1,
-                        capacity=1000 + 3 * hps.batch_size,
-                        # Ensures a minimum amount of shuffling of examples.
-                        min_after_dequeue=1000)
-                else:
-                    images = tf.train.batch(
-                        [image], batch_size=hps.batch_size, num_threads=1,
-                        capacity=1000 + 3 * hps.batch_size)
+                def image_fn(image):
+                    image = tf.reshape(
+                        image, [FLAGS.image_size * FLAGS.image_size * 3])
+                    return tf.cast(image, tf.float32)
+                images = batch_images(image_fn, hps.batch_size)
             self.x_orig = x_orig = images
             image_size = FLAGS.image_size
             x_in = tf.reshape(
@@ -965,30 +1008,14 @@ class RealNVP(object):
         elif FLAGS.dataset == "celeba":
             with tf.device(
                 tf.train.replica_device_setter(0, worker_device=device)):
-                filename_queue = tf.train.string_input_producer(
-                    gfile.Glob(FLAGS.data_path), num_epochs=None)
-                reader = tf.TFRecordReader()
-                _, serialized_example = reader.read(filename_queue)
-                features = tf.parse_single_example(
-                    serialized_example,
-                    features={
-                        "image_raw": tf.FixedLenFeature([], tf.string),
-                    })
-                image = tf.decode_raw(features["image_raw"], tf.uint8)
-                image.set_shape([218 * 178 * 3])  # 218, 178
-                image = tf.cast(image, tf.float32)
-                image = tf.reshape(image, [218, 178, 3])
-                image = image[40:188, 15:163, :]
-                if FLAGS.mode == "train":
-                    image = tf.image.random_flip_left_right(image)
-                    images = tf.train.shuffle_batch(
-                        [image], batch_size=hps.batch_size, num_threads=1,
-                        capacity=1000 + 3 * hps.batch_size,
-                        min_after_dequeue=1000)
-                else:
-                    images = tf.train.batch(
-                        [image], batch_size=hps.batch_size, num_threads=1,
-                        capacity=1000 + 3 * hps.batch_size)
+                def image_fn(image):
+                    image = tf.cast(image, tf.float32)
+                    image = tf.reshape(image, [218, 178, 3])
+                    image = image[40:188, 15:163, :]
+                    if FLAGS.mode == "train":
+                        image = tf.image.random_flip_left_right(image)
+                    return image
+                images = batch_images(image_fn, hps.batch_size)
             self.x_orig = x_orig = images
             image_size = 64
             x_in = tf.reshape(x_orig, [hps.batch_size, 148, 148, 3])
@@ -999,38 +1026,12 @@ class RealNVP(object):
         elif FLAGS.dataset == "lsun":
             with tf.device(
                 tf.train.replica_device_setter(0, worker_device=device)):
-                filename_queue = tf.train.string_input_producer(
-                    gfile.Glob(FLAGS.data_path), num_epochs=None)
-                reader = tf.TFRecordReader()
-                _, serialized_example = reader.read(filename_queue)
-                features = tf.parse_single_example(
-                    serialized_example,
-                    features={
-                        "image_raw": tf.FixedLenFeature([], tf.string),
-                        "height": tf.FixedLenFeature([], tf.int64),
-                        "width": tf.FixedLenFeature([], tf.int64),
-                        "depth": tf.FixedLenFeature([], tf.int64)
-                    })
-                image = tf.decode_raw(features["image_raw"], tf.uint8)
-                height = tf.reshape((features["height"], tf.int64)[0], [1])
-                height = tf.cast(height, tf.int32)
-                width = tf.reshape((features["width"], tf.int64)[0], [1])
-                width = tf.cast(width, tf.int32)
-                depth = tf.reshape((features["depth"], tf.int64)[0], [1])
-                depth = tf.cast(depth, tf.int32)
-                image = tf.reshape(image, tf.concat([height, width, depth], 0))
-                image = tf.random_crop(image, [64, 64, 3])
-                if FLAGS.mode == "train":
-                    image = tf.image.random_flip_left_right(image)
-                    images = tf.train.shuffle_batch(
-                        [image], batch_size=hps.batch_size, num_threads=1,
-                        capacity=1000 + 3 * hps.batch_size,
-                        # Ensures a minimum amount of shuffling of examples.
-                        min_after_dequeue=1000)
-                else:
-                    images = tf.train.batch(
-                        [image], batch_size=hps.batch_size, num_threads=1,
-                        capacity=1000 + 3 * hps.batch_size)
+                def image_fn(image):
+                    image = tf.random_crop(image, [64, 64, 3])
+                    if FLAGS.mode == "train":
+                        image = tf.image.random_flip_left_right(image)
+                    return image
+                images = batch_images(image_fn, hps.batch_size)
             self.x_orig = x_orig = images
             image_size = 64
             x_in = tf.reshape(x_orig, [hps.batch_size, 64, 64, 3])
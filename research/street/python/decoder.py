@@ -22,9 +22,11 @@ Sequence Data with Recurrent Neural Networks.
 http://www.cs.toronto.edu/~graves/icml_2006.pdf
 """
 import collections
+from multiprocessing.pool import ThreadPool
 import re
 
 import errorcounter as ec
+import numpy as np
 import tensorflow as tf
 
 # Named tuple Part describes a part of a multi (1 or more) part code that
@@ -56,6 +58,12 @@ class Decoder(object):
     # self.decoder[42] = [..., (utf8='x', index=1, num_codes3), ...] where ...
     # means all other uses of the code 42.
     self.decoder = []
+    # self.code_strings[code] is the utf8 string of a code that alone
+    # represents a whole string, and self.single_codes[code] is True for such
+    # codes, so they can be decoded by lookup instead of by StringFromCTC.
+    # The last entry stands for all the codes that self.decoder doesn't know.
+    self.code_strings = np.array([None], dtype=object)
+    self.single_codes = np.array([False])
     if filename:
       self._InitializeDecoder(filename)
 
@@ -79,46 +87,101 @@ class Decoder(object):
     coord = tf.train.Coordinator()
     threads = tf.train.start_queue_runners(sess=sess, coord=coord)
     # Run the requested number of evaluation steps, gathering the outputs of the
-    # softmax and the true labels of the evaluation examples.
+    # softmax and the true labels of the evaluation examples. Each batch is
+    # scored in a background thread while the model runs on the next one.
     total_label_counts = ec.ErrorCounts(0, 0, 0, 0)
     total_word_counts = ec.ErrorCounts(0, 0, 0, 0)
     sequence_errors = 0
-    for _ in xrange(num_steps):
-      softmax_result, labels = model.RunAStep(sess)
-      # Collapse softmax to same shape as labels.
-      predictions = softmax_result.argmax(axis=-1)
-      # Exclude batch from num_dims.
-      num_dims = len(predictions.shape) - 1
-      batch_size = predictions.shape[0]
-      null_label = softmax_result.shape[-1] - 1
-      for b in xrange(batch_size):
-        if num_dims == 2:
-          # TODO(rays) Support 2-d data.
-          raise ValueError('2-d label data not supported yet!')
-        else:
-          if num_dims == 1:
-            pred_batch = predictions[b, :]
-            labels_batch = labels[b, :]
-          else:
-            pred_batch = [predictions[b]]
-            labels_batch = [labels[b]]
-          text = self.StringFromCTC(pred_batch, model.using_ctc, null_label)
-          truth = self.StringFromCTC(labels_batch, False, null_label)
-          # Note that recall_errs is false negatives (fn) aka drops/deletions.
-          # Actual recall would be 1-fn/truth_words.
-          # Likewise precision_errs is false positives (fp) aka adds/insertions.
-          # Actual precision would be 1-fp/ocr_words.
-          total_word_counts = ec.AddErrors(total_word_counts,
-                                           ec.CountWordErrors(text, truth))
-          total_label_counts = ec.AddErrors(total_label_counts,
-                                            ec.CountErrors(text, truth))
-          if text != truth:
-            sequence_errors += 1
-
+    num_sequences = 0
+    pool = ThreadPool(1)
+    results = []
+    try:
+      for _ in xrange(num_steps):
+        softmax_result, labels = model.RunAStep(sess)
+        if results:
+          # Only one batch is scored at a time, to bound memory use.
+          results[-1].wait()
+        results.append(
+            pool.apply_async(self._ScoreBatch,
+                             (softmax_result, labels, model.using_ctc)))
+      for result in results:
+        label_counts, word_counts, errors, batch_size = result.get()
+        total_label_counts = ec.AddErrors(total_label_counts, label_counts)
+        total_word_counts = ec.AddErrors(total_word_counts, word_counts)
+        sequence_errors += errors
+        num_sequences += batch_size
+    finally:
+      pool.close()
+      pool.join()
     coord.request_stop()
     coord.join(threads)
     return ec.ComputeErrorRates(total_label_counts, total_word_counts,
-                                sequence_errors, num_steps * batch_size)
+                                sequence_errors, num_sequences)
+
+  def _ScoreBatch(self, softmax_result, labels, using_ctc):
+    """Decodes a batch of softmax outputs and counts its errors.
+
+    Args:
+      softmax_result: Softmax output of the model, [batch, (width,) classes].
+      labels: Corresponding true labels, [batch(, width)].
+      using_ctc: If True, the softmax output is decoded with CTC.
+    Returns:
+      label_counts: ErrorCounts of the chars in the batch.
+      word_counts: ErrorCounts of the words in the batch.
+      sequence_errors: Number of sequences that are not exactly right.
+      batch_size: Number of sequences in the batch.
+    Raises:
+      ValueError: If an unsupported number of dimensions is used.
+    """
+    # Collapse softmax to same shape as labels.
+    predictions = softmax_result.argmax(axis=-1)
+    # Exclude batch from num_dims.
+    num_dims = len(predictions.shape) - 1
+    if num_dims == 2:
+      # TODO(rays) Support 2-d data.
+      raise ValueError('2-d label data not supported yet!')
+    null_label = softmax_result.shape[-1] - 1
+    texts = self.BatchStringsFromCTC(predictions, using_ctc, null_label)
+    truths = self.BatchStringsFromCTC(labels, False, null_label)
+    # Note that recall_errs is false negatives (fn) aka drops/deletions.
+    # Actual recall would be 1-fn/truth_words.
+    # Likewise precision_errs is false positives (fp) aka adds/insertions.
+    # Actual precision would be 1-fp/ocr_words.
+    word_counts = ec.CountBatchWordErrors(texts, truths)
+    label_counts = ec.CountBatchErrors(texts, truths)
+    sequence_errors = sum(text != truth for text, truth in zip(texts, truths))
+    return label_counts, word_counts, sequence_errors, len(texts)
+
+  def BatchStringsFromCTC(self, ctc_labels, merge_dups, null_label):
+    """Decodes a batch of CTC outputs to strings.
+
+    Args:
+      ctc_labels: Array of class labels including null characters to remove,
+        [batch, width] or [batch].
+      merge_dups: If True, Duplicate labels will be merged
+      null_label: Label value to ignore.
+
+    Returns:
+      List of the labels of each batch element decoded to a string, as
+      StringFromCTC would.
+    """
+    codes, rows = self._BatchCodesFromCTC(ctc_labels, merge_dups, null_label)
+    batch_size = len(ctc_labels)
+    # Sequences made only of single codes are decoded by lookup, the others
+    # by the full decoding of multi-code sequences.
+    lookup = np.minimum(codes, len(self.single_codes) - 1)
+    num_multi_codes = np.bincount(
+        rows, weights=~self.single_codes[lookup], minlength=batch_size)
+    ends = np.cumsum(np.bincount(rows, minlength=batch_size))
+    strings = self.code_strings[lookup]
+    texts = []
+    for b in xrange(batch_size):
+      start = ends[b - 1] if b else 0
+      if num_multi_codes[b]:
+        texts.append(self._StringFromCodes(codes[start:ends[b]]))
+      else:
+        texts.append(''.join(strings[start:ends[b]]))
+    return texts
 
   def StringFromCTC(self, ctc_labels, merge_dups, null_label):
     """Decodes CTC output to a string.
@@ -139,6 +202,18 @@ class Decoder(object):
     """
     # Run regular ctc on the labels, extracting a list of codes.
     codes = self._CodesFromCTC(ctc_labels, merge_dups, null_label)
+    return self._StringFromCodes(codes)
+
+  def _StringFromCodes(self, codes):
+    """Decodes a sequence of codes to a string.
+
+    Extracts only sequences of codes that are allowed by self.decoder.
+    Args:
+      codes: List of codes, without null characters.
+
+    Returns:
+      Codes decoded to a string.
+    """
     length = len(codes)
     if length == 0:
       return ''
@@ -202,6 +277,13 @@ class Decoder(object):
           while code >= len(self.decoder):
             self.decoder.append([])
           self.decoder[code].append(Part(utf8, index, num_codes))
+    self.single_codes = np.array(
+        [len(parts) == 1 and parts[0].num_codes == 1 for parts in self.decoder]
+        + [False])
+    self.code_strings = np.array(
+        [parts[0].utf8 if single else None
+         for parts, single in zip(self.decoder, self.single_codes)] + [None],
+        dtype=object)
 
   def _CodesFromCTC(self, ctc_labels, merge_dups, null_label):
     """Collapses CTC output to regular output.
@@ -241,3 +323,40 @@ class Decoder(object):
           out_labels.append(label)
         prev_label = label
     return out_labels
+
+  def _BatchCodesFromCTC(self, ctc_labels, merge_dups, null_label):
+    """Collapses a batch of CTC outputs to regular output, as _CodesFromCTC.
+
+    Args:
+      ctc_labels: Array of class labels including null characters to remove,
+        [batch, width] or [batch].
+      merge_dups: If True, Duplicate labels will be merged.
+      null_label: Label value to ignore.
+
+    Returns:
+      codes: Int array of the labels of all batch elements with null
+        characters removed, batch element after batch element.
+      rows: Int array of the batch element of each of the codes.
+    """
+    labels = np.asarray(ctc_labels)
+    labels = labels.reshape([labels.shape[0], -1])
+    keep = labels != null_label
+    if merge_dups:
+      keep[:, 1:] &= labels[:, 1:] != labels[:, :-1]
+    # Trailing zeros are removed, so only labels up to the last non-zero one
+    # are kept.
+    nonzero = keep & (labels != 0)
+    width = labels.shape[1]
+    last_nonzero = width - 1 - np.argmax(nonzero[:, ::-1], axis=1)
+    last_nonzero[~nonzero.any(axis=1)] = -1
+    keep &= np.arange(width) <= last_nonzero[:, np.newaxis]
+    rows, cols = np.nonzero(keep)
+    codes = labels[rows, cols]
+    if merge_dups:
+      # Zeros that are only separated by nulls are merged too.
+      dup_zeros = np.zeros(codes.shape, dtype=bool)
+      dup_zeros[1:] = ((codes[1:] == 0) & (codes[:-1] == 0) &
+                       (rows[1:] == rows[:-1]))
+      codes = codes[~dup_zeros]
+      rows = rows[~dup_zeros]
+    return codes, rows
@@ -15,6 +15,7 @@
 """Tests for decoder."""
 import os
 
+import numpy as np
 import tensorflow as tf
 import decoder
 
@@ -53,5 +54,38 @@ class DecoderTest(tf.test.TestCase):
     self.assertEqual(text, 'farm barn')
 
 
+  def testBatchCodesFromCTC(self):
+    """Tests that the batch CTC decoder matches the simple CTC decoder.
+    """
+    ctc_labels = np.random.RandomState(42).choice(
+        [0, 0, 1, 2, 9, 9, 9], size=[64, 20])
+    ctc_labels[0, :] = [9, 9, 9, 1, 9, 2, 2, 3, 9, 9, 0, 0, 1, 9, 1, 9, 9, 9,
+                        0, 9]
+    ctc_labels[1, :] = 9
+    decode = decoder.Decoder(filename=None)
+    for merge_dups in [False, True]:
+      codes, rows = decode._BatchCodesFromCTC(
+          ctc_labels, merge_dups=merge_dups, null_label=9)
+      for b, labels in enumerate(ctc_labels):
+        self.assertEqual(
+            codes[rows == b].tolist(),
+            decode._CodesFromCTC(labels, merge_dups=merge_dups, null_label=9))
+
+  def testBatchStringsFromCTC(self):
+    """Tests that the batch decoder matches StringFromCTC, with multi-codes.
+    """
+    ctc_labels = np.array(
+        [[9, 6, 9, 1, 3, 9, 4, 9, 5, 5, 9, 5, 0, 2, 1, 3, 9, 4, 9],
+         [9, 6, 9, 1, 3, 9, 3, 9, 0, 0, 9, 2, 0, 2, 1, 3, 9, 4, 9],
+         [9, 9, 9, 9, 9, 9, 9, 9, 9, 9, 9, 9, 9, 9, 9, 9, 9, 9, 9]])
+    decode = decoder.Decoder(filename=_testdata('charset_size_10.txt'))
+    texts = decode.BatchStringsFromCTC(ctc_labels, merge_dups=True,
+                                       null_label=9)
+    self.assertEqual(texts, ['farm barn', 'farr b barn', ''])
+    for text, labels in zip(texts, ctc_labels):
+      self.assertEqual(
+          text, decode.StringFromCTC(labels, merge_dups=True, null_label=9))
+
+
 if __name__ == '__main__':
   tf.test.main()
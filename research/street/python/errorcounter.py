@@ -18,6 +18,8 @@
 """
 import collections
 
+import numpy as np
+
 # Named tuple Error counts describes the counts needed to accumulate errors
 # over multiple trials:
 #   false negatives (aka drops or deletions),
@@ -70,6 +72,88 @@ def CountErrors(ocr_text, truth_text):
   return ErrorCounts(drops, adds, len(truth_text), len(ocr_text))
 
 
+def CountBatchErrors(ocr_texts, truth_texts):
+  """Counts the char drops and adds summed over pairs of strings.
+
+  Equivalent to summing CountErrors over zip(ocr_texts, truth_texts), but the
+  bags of chars of the whole batch are counted at once with array operations.
+  Args:
+    ocr_texts:   List of OCR text strings.
+    truth_texts: List of truth text strings, of the same length.
+
+  Returns:
+    ErrorCounts named tuple.
+  """
+  ocr_ids, ocr_rows = _CharIds(ocr_texts)
+  truth_ids, truth_rows = _CharIds(truth_texts)
+  return _CountBagErrors(ocr_ids, ocr_rows, truth_ids, truth_rows)
+
+
+def CountBatchWordErrors(ocr_texts, truth_texts):
+  """Counts the word drops and adds summed over pairs of strings.
+
+  Equivalent to summing CountWordErrors over zip(ocr_texts, truth_texts).
+  Args:
+    ocr_texts:   List of OCR text strings.
+    truth_texts: List of truth text strings, of the same length.
+
+  Returns:
+    ErrorCounts named tuple.
+  """
+  ocr_words = [text.split() for text in ocr_texts]
+  truth_words = [text.split() for text in truth_texts]
+  all_words = [w for words in ocr_words + truth_words for w in words]
+  if not all_words:
+    return ErrorCounts(0, 0, 0, 0)
+  _, word_ids = np.unique(np.array(all_words), return_inverse=True)
+  num_ocr_words = sum(len(words) for words in ocr_words)
+  return _CountBagErrors(word_ids[:num_ocr_words], _RowIds(ocr_words),
+                         word_ids[num_ocr_words:], _RowIds(truth_words))
+
+
+def _RowIds(sequences):
+  """Returns the index of the sequence of each element of the sequences."""
+  lengths = [len(sequence) for sequence in sequences]
+  return np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+
+
+def _CharIds(texts):
+  """Returns the chars of the texts as ints, and the index of their text."""
+  joined = texts[0][:0].join(texts) if texts else ''
+  if isinstance(joined, bytes):
+    ids = np.frombuffer(joined, dtype=np.uint8)
+  else:
+    ids = np.frombuffer(joined.encode('utf-32-le'), dtype=np.uint32)
+  return ids.astype(np.int64), _RowIds(texts)
+
+
+def _CountBagErrors(ocr_ids, ocr_rows, truth_ids, truth_rows):
+  """Counts the drops and adds between bags of int ids, one bag per row.
+
+  Args:
+    ocr_ids:    Int array of the ids of all OCR elements.
+    ocr_rows:   Int array of the row of each OCR element.
+    truth_ids:  Int array of the ids of all truth elements.
+    truth_rows: Int array of the row of each truth element.
+
+  Returns:
+    ErrorCounts named tuple, summed over rows.
+  """
+  # Histogram of (row, id) pairs, with truth elements counting +1 and OCR
+  # elements -1, so positive bins are drops and negative bins adds.
+  keys = np.concatenate([(truth_rows << 32) | truth_ids,
+                         (ocr_rows << 32) | ocr_ids])
+  if not keys.size:
+    return ErrorCounts(0, 0, 0, 0)
+  _, bins = np.unique(keys, return_inverse=True)
+  signs = np.concatenate([np.ones(len(truth_ids), dtype=np.int64),
+                          -np.ones(len(ocr_ids), dtype=np.int64)])
+  counts = np.bincount(bins.ravel(), weights=signs).astype(np.int64)
+  drops = int(counts[counts > 0].sum())
+  adds = int(-counts[counts < 0].sum())
+  return ErrorCounts(drops, adds, len(truth_ids), len(ocr_ids))
+
+
 def AddErrors(counts1, counts2):
   """Adds the counts and returns a new sum tuple.
 
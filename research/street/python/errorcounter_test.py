@@ -120,5 +120,25 @@ class ErrorcounterTest(tf.test.TestCase):
             fn=2, fp=1, truth_count=3, test_count=2))
 
 
+  def testCountBatchErrors(self):
+    """Tests that the batch error counters match the sums of single counts.
+    """
+    ocr_texts = ['farm barn', 'farm barn.', 'farmbarn', '', 'farm ba rn', '']
+    truth_texts = ['farm barn', 'farm barn', 'farm barn', 'farm barn',
+                   'farm barn', '']
+    char_counts = ec.ErrorCounts(0, 0, 0, 0)
+    word_counts = ec.ErrorCounts(0, 0, 0, 0)
+    for ocr_text, truth_text in zip(ocr_texts, truth_texts):
+      char_counts = ec.AddErrors(char_counts,
+                                 ec.CountErrors(ocr_text, truth_text))
+      word_counts = ec.AddErrors(word_counts,
+                                 ec.CountWordErrors(ocr_text, truth_text))
+    self.assertEqual(char_counts, ec.CountBatchErrors(ocr_texts, truth_texts))
+    self.assertEqual(word_counts,
+                     ec.CountBatchWordErrors(ocr_texts, truth_texts))
+    self.assertEqual(
+        ec.CountBatchErrors(['', ''], ['', '']), ec.ErrorCounts(0, 0, 0, 0))
+
+
 if __name__ == '__main__':
   tf.test.main()
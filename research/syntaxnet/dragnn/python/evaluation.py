@@ -12,36 +12,221 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ==============================================================================
-"""Parser evaluation utils."""
+"""Parser evaluation utils.
+
+Corpora are decoded once into flat per-token arrays, so that the metrics are
+computed with a few vectorized comparisons. The gold corpus, which is evaluated
+repeatedly during training, is only decoded the first time it is seen.
+"""
 
 from __future__ import division
 
+import multiprocessing
+
+import numpy as np
 import tensorflow as tf
 
 from syntaxnet import sentence_pb2
 from syntaxnet.util import check
 
+# Number of chunks per worker process, for load balancing.
+_CHUNKS_PER_WORKER = 4
+
+
+def _decode_parse_columns(serialized_sentences):
+  """Decodes sentences into lists of texts, token counts and token fields."""
+  texts, lengths, tags, heads, labels = [], [], [], [], []
+  sentence = sentence_pb2.Sentence()
+  for serialized_sentence in serialized_sentences:
+    sentence.ParseFromString(serialized_sentence)
+    texts.append(sentence.text)
+    lengths.append(len(sentence.token))
+    for token in sentence.token:
+      tags.append(token.tag)
+      heads.append(token.head)
+      labels.append(token.label)
+  return texts, lengths, tags, heads, labels
+
+
+def _decode_span_columns(serialized_sentences):
+  """Decodes sentences into lists of texts, token counts and token spans."""
+  texts, lengths, starts, ends = [], [], [], []
+  sentence = sentence_pb2.Sentence()
+  for serialized_sentence in serialized_sentences:
+    sentence.ParseFromString(serialized_sentence)
+    texts.append(sentence.text)
+    lengths.append(len(sentence.token))
+    for token in sentence.token:
+      starts.append(token.start)
+      ends.append(token.end)
+  return texts, lengths, starts, ends
+
+
+def _decode_corpus(decode_fn, corpus, num_workers):
+  """Decodes a corpus with decode_fn, concatenating the columns of all chunks.
+
+  Args:
+    decode_fn: Function decoding a list of serialized sentences into a tuple
+      of lists.
+    corpus: List of serialized sentences.
+    num_workers: Number of worker processes. If 1, the corpus is decoded in
+      this process. The workers are forked, which may deadlock in a process
+      that already runs TensorFlow threads, so only use several of them in
+      processes that do not.
 
-def calculate_parse_metrics(gold_corpus, annotated_corpus):
+  Returns:
+    The tuple of lists that decode_fn would return on the whole corpus.
+  """
+  if num_workers <= 1 or len(corpus) < 2:
+    return decode_fn(corpus)
+  chunk_size = -(-len(corpus) // (num_workers * _CHUNKS_PER_WORKER))
+  chunks = [corpus[i:i + chunk_size] for i in range(0, len(corpus), chunk_size)]
+  pool = multiprocessing.Pool(num_workers)
+  try:
+    results = pool.map(decode_fn, chunks)
+  finally:
+    pool.close()
+    pool.join()
+  columns = tuple([] for _ in results[0])
+  for result in results:
+    for column, values in zip(columns, result):
+      column.extend(values)
+  return columns
+
+
+def _encode(values, ids, add_missing):
+  """Maps strings to integer ids, optionally extending the id map.
+
+  Args:
+    values: List of strings.
+    ids: Dict from string to id.
+    add_missing: Whether strings missing from ids get a new id; otherwise they
+      are mapped to -1, which matches no string.
+
+  Returns:
+    [len(values)] int32 array of ids.
+  """
+  if add_missing:
+    return np.array([ids.setdefault(value, len(ids)) for value in values],
+                    dtype=np.int32)
+  return np.array([ids.get(value, -1) for value in values], dtype=np.int32)
+
+
+class _ParseColumns(object):
+  """Per-token tags, heads and labels of a corpus, as flat arrays."""
+
+  def __init__(self, corpus, reference=None, num_workers=1):
+    """Decodes a corpus.
+
+    Args:
+      corpus: List of serialized sentences.
+      reference: Optional _ParseColumns whose tag and label ids are reused, so
+        that the arrays of both corpora can be compared.
+      num_workers: Number of decoding processes, see _decode_corpus().
+    """
+    texts, lengths, tags, heads, labels = _decode_corpus(
+        _decode_parse_columns, corpus, num_workers)
+    self.texts = texts
+    self.lengths = np.array(lengths, dtype=np.int64)
+    self.heads = np.array(heads, dtype=np.int64)
+    if reference is None:
+      self.tag_ids, self.label_ids = {}, {}
+    else:
+      self.tag_ids, self.label_ids = reference.tag_ids, reference.label_ids
+    self.tags = _encode(tags, self.tag_ids, reference is None)
+    self.labels = _encode(labels, self.label_ids, reference is None)
+
+
+class _SpanColumns(object):
+  """Token spans of a corpus, as flat arrays."""
+
+  def __init__(self, corpus, num_workers=1):
+    """Decodes a corpus and checks that its spans are valid and distinct.
+
+    Args:
+      corpus: List of serialized sentences.
+      num_workers: Number of decoding processes, see _decode_corpus().
+    """
+    texts, lengths, starts, ends = _decode_corpus(_decode_span_columns, corpus,
+                                                  num_workers)
+    self.texts = texts
+    self.sentence_ids = np.repeat(
+        np.arange(len(lengths), dtype=np.int64), lengths)
+    self.starts = np.array(starts, dtype=np.int64)
+    self.ends = np.array(ends, dtype=np.int64)
+    invalid = np.flatnonzero(self.ends < self.starts)
+    if invalid.size:
+      check.Ge(self.ends[invalid[0]], self.starts[invalid[0]])
+    order = np.lexsort((self.ends, self.starts, self.sentence_ids))
+    duplicates = order[1:][
+        (np.diff(self.sentence_ids[order]) == 0) &
+        (np.diff(self.starts[order]) == 0) & (np.diff(self.ends[order]) == 0)]
+    if duplicates.size:
+      check.Eq(duplicates.size, 0, 'Duplicate token (%d, %d)' %
+               (self.starts[duplicates[0]], self.ends[duplicates[0]]))
+
+
+def _num_common_spans(gold, annotated):
+  """Returns the number of spans shared by two _SpanColumns."""
+  starts = np.concatenate([gold.starts, annotated.starts])
+  if not starts.size:
+    return 0
+  ends = np.concatenate([gold.ends, annotated.ends])
+  # Each span is keyed by (sentence, start, end), packed into one integer.
+  offset = int(starts.min())
+  span_base = int(ends.max()) - offset + 1
+  num_sentences = len(gold.texts)
+  check.Le(num_sentences * span_base * span_base, np.iinfo(np.int64).max,
+           'Token spans are too large to be compared')
+
+  def keys(spans):
+    return ((spans.sentence_ids * span_base + spans.starts - offset) *
+            span_base + spans.ends - offset)
+
+  return np.intersect1d(keys(gold), keys(annotated), assume_unique=True).size
+
+
+# Columns of the last gold corpus passed to each metric, keyed by the metric
+# name. Each entry is a (corpus, num_sentences, columns) tuple.
+_gold_columns_cache = {}
+
+
+def _cached_gold_columns(metric, gold_corpus, columns_fn):
+  """Returns columns_fn(gold_corpus), reusing them for the same gold corpus."""
+  cached = _gold_columns_cache.get(metric)
+  if (cached is None or cached[0] is not gold_corpus or
+      cached[1] != len(gold_corpus)):
+    cached = (gold_corpus, len(gold_corpus), columns_fn(gold_corpus))
+    _gold_columns_cache[metric] = cached
+  return cached[2]
+
+
+def _check_texts_aligned(gold_texts, annotated_texts):
+  """Checks that the gold and annotated sentences have the same texts."""
+  if gold_texts != annotated_texts:
+    for gold_text, annotated_text in zip(gold_texts, annotated_texts):
+      check.Eq(gold_text, annotated_text, 'Text is not aligned')
+
+
+def calculate_parse_metrics(gold_corpus, annotated_corpus, num_workers=1):
   """Calculate POS/UAS/LAS accuracy based on gold and annotated sentences."""
   check.Eq(len(gold_corpus), len(annotated_corpus), 'Corpora are not aligned')
-  num_tokens = 0
-  num_correct_pos = 0
-  num_correct_uas = 0
-  num_correct_las = 0
-  for gold_str, annotated_str in zip(gold_corpus, annotated_corpus):
-    gold = sentence_pb2.Sentence()
-    annotated = sentence_pb2.Sentence()
-    gold.ParseFromString(gold_str)
-    annotated.ParseFromString(annotated_str)
-    check.Eq(gold.text, annotated.text, 'Text is not aligned')
-    check.Eq(len(gold.token), len(annotated.token), 'Tokens are not aligned')
-    tokens = zip(gold.token, annotated.token)
-    num_tokens += len(tokens)
-    num_correct_pos += sum(1 for x, y in tokens if x.tag == y.tag)
-    num_correct_uas += sum(1 for x, y in tokens if x.head == y.head)
-    num_correct_las += sum(1 for x, y in tokens
-                           if x.head == y.head and x.label == y.label)
+  gold = _cached_gold_columns(
+      'parse', gold_corpus,
+      lambda corpus: _ParseColumns(corpus, num_workers=num_workers))
+  annotated = _ParseColumns(annotated_corpus, gold, num_workers)
+  _check_texts_aligned(gold.texts, annotated.texts)
+  misaligned = np.flatnonzero(gold.lengths != annotated.lengths)
+  if misaligned.size:
+    check.Eq(gold.lengths[misaligned[0]], annotated.lengths[misaligned[0]],
+             'Tokens are not aligned')
+
+  num_tokens = gold.tags.size
+  correct_heads = gold.heads == annotated.heads
+  num_correct_pos = np.count_nonzero(gold.tags == annotated.tags)
+  num_correct_uas = np.count_nonzero(correct_heads)
+  num_correct_las = np.count_nonzero(correct_heads &
+                                     (gold.labels == annotated.labels))
 
   tf.logging.info('Total num documents: %d', len(annotated_corpus))
   tf.logging.info('Total num tokens: %d', num_tokens)
@@ -60,15 +245,10 @@ def parser_summaries(gold_corpus, annotated_corpus):
   return {'POS': pos, 'LAS': las, 'UAS': uas, 'eval_metric': las}
 
 
-def calculate_segmentation_metrics(gold_corpus, annotated_corpus):
+def calculate_segmentation_metrics(gold_corpus, annotated_corpus,
+                                   num_workers=1):
   """Calculate precision/recall/f1 based on gold and annotated sentences."""
   check.Eq(len(gold_corpus), len(annotated_corpus), 'Corpora are not aligned')
-  num_gold_tokens = 0
-  num_test_tokens = 0
-  num_correct_tokens = 0
-  def token_span(token):
-    check.Ge(token.end, token.start)
-    return (token.start, token.end)
 
   def ratio(numerator, denominator):
     check.Ge(numerator, 0)
@@ -80,23 +260,14 @@ def calculate_segmentation_metrics(gold_corpus, annotated_corpus):
     else:
       return float('inf')  # map x/0 to inf
 
-  for gold_str, annotated_str in zip(gold_corpus, annotated_corpus):
-    gold = sentence_pb2.Sentence()
-    annotated = sentence_pb2.Sentence()
-    gold.ParseFromString(gold_str)
-    annotated.ParseFromString(annotated_str)
-    check.Eq(gold.text, annotated.text, 'Text is not aligned')
-    gold_spans = set()
-    test_spans = set()
-    for token in gold.token:
-      check.NotIn(token_span(token), gold_spans, 'Duplicate token')
-      gold_spans.add(token_span(token))
-    for token in annotated.token:
-      check.NotIn(token_span(token), test_spans, 'Duplicate token')
-      test_spans.add(token_span(token))
-    num_gold_tokens += len(gold_spans)
-    num_test_tokens += len(test_spans)
-    num_correct_tokens += len(gold_spans.intersection(test_spans))
+  gold = _cached_gold_columns(
+      'segmentation', gold_corpus,
+      lambda corpus: _SpanColumns(corpus, num_workers=num_workers))
+  annotated = _SpanColumns(annotated_corpus, num_workers)
+  _check_texts_aligned(gold.texts, annotated.texts)
+  num_gold_tokens = gold.starts.size
+  num_test_tokens = annotated.starts.size
+  num_correct_tokens = _num_common_spans(gold, annotated)
 
   tf.logging.info('Total num documents: %d', len(annotated_corpus))
   tf.logging.info('Total gold tokens: %d', num_gold_tokens)
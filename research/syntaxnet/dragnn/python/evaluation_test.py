@@ -93,6 +93,35 @@ class EvaluationTest(tf.test.TestCase):
         'eval_metric': 58.82
     }, summaries)
 
+  def testCalculateParseMetricsWithWorkers(self):
+    gold_corpus = self._gold_corpus * 3
+    test_corpus = self._test_corpus * 3
+    pos, uas, las = evaluation.calculate_parse_metrics(
+        gold_corpus, test_corpus, num_workers=2)
+    self.assertEqual(75, pos)
+    self.assertEqual(50, uas)
+    self.assertEqual(25, las)
+
+    # The gold columns are reused when the same gold corpus is evaluated again.
+    pos, uas, las = evaluation.calculate_parse_metrics(gold_corpus,
+                                                       gold_corpus)
+    self.assertEqual((100, 100, 100), (pos, uas, las))
+
+  def testCalculateParseMetricsMisaligned(self):
+    self._add_sentence(['DT'], [-1], ['ROOT'], self._gold_corpus)
+    self._add_sentence(['DT', 'NN'], [-1, 0], ['ROOT', 'dep'],
+                       self._test_corpus)
+    with self.assertRaisesRegexp(ValueError, 'Tokens are not aligned'):
+      evaluation.calculate_parse_metrics(self._gold_corpus, self._test_corpus)
+
+  def testCalculateSegmentationMetricsDuplicateToken(self):
+    sentence = sentence_pb2.Sentence()
+    sentence.token.add(word='x', start=0, end=3)
+    sentence.token.add(word='x', start=0, end=3)
+    corpus = [sentence.SerializeToString()]
+    with self.assertRaisesRegexp(ValueError, 'Duplicate token'):
+      evaluation.calculate_segmentation_metrics(corpus, corpus)
+
   def testParserSummaries(self):
     summaries = evaluation.parser_summaries(self._gold_corpus,
                                             self._test_corpus)
@@ -16,6 +16,7 @@ r"""Runs a both a segmentation and parsing model on a CoNLL dataset.
 """
 
 import re
+import threading
 import time
 import tensorflow as tf
 
@@ -51,6 +52,10 @@ flags.DEFINE_string('output_file', '',
 flags.DEFINE_bool('text_format', False, '')
 
 flags.DEFINE_integer('max_batch_size', 2048, 'Maximum batch size to support.')
+flags.DEFINE_bool('sort_by_length', True, 'Whether to batch sentences of '
+                  'similar token counts together. Output keeps input order.')
+flags.DEFINE_integer('num_session_threads', 1, 'Number of threads running '
+                     'batches concurrently on the inference session.')
 flags.DEFINE_string('inference_beam_size', '', 'Comma separated list of '
                     'component_name=beam_size pairs.')
 flags.DEFINE_string('locally_normalize', '', 'Comma separated list of '
@@ -80,8 +85,123 @@ def get_segmenter_corpus(input_data_path, use_text_format):
   return char_corpus
 
 
+def _sentence_lengths(input_data):
+  """Returns the number of tokens of each serialized sentence."""
+  lengths = []
+  sentence = sentence_pb2.Sentence()
+  for serialized_sentence in input_data:
+    sentence.ParseFromString(serialized_sentence)
+    lengths.append(len(sentence.token))
+  return lengths
+
+
+def _make_batches(lengths, max_batch_size, sort_by_length):
+  """Splits sentence indices into batches of at most max_batch_size.
+
+  Args:
+    lengths: The number of tokens of each sentence.
+    max_batch_size: The maximum batch size to use.
+    sort_by_length: Whether to batch sentences of similar lengths together,
+      so that a long sentence does not pad out a batch of short ones.
+
+  Returns:
+    A list of batches, each a list of indices into the corpus.
+  """
+  order = list(range(len(lengths)))
+  if sort_by_length:
+    order.sort(key=lambda index: lengths[index])
+  return [
+      order[start:start + max_batch_size]
+      for start in range(0, len(order), max_batch_size)
+  ]
+
+
+def _run_batches(sess, input_data, feed_dict, max_batch_size, sort_by_length,
+                 num_threads, timeline_output_file):
+  """Annotates the corpus with the SavedModel loaded in a session.
+
+  Batches are run concurrently by num_threads threads sharing the session,
+  and the annotations are returned in the order of the input corpus.
+
+  Args:
+    sess: Session with an annotation SavedModel loaded.
+    input_data: Input corpus to annotate.
+    feed_dict: Additional inputs fed to every batch.
+    max_batch_size: The maximum batch size to use.
+    sort_by_length: Whether to batch sentences of similar lengths together.
+    num_threads: Number of batches to run concurrently.
+    timeline_output_file: Filepath for timeline export. Does not export if None.
+
+  Returns:
+    A list of annotated sentences.
+  """
+  lengths = _sentence_lengths(input_data)
+  batches = _make_batches(lengths, max_batch_size, sort_by_length)
+  processed = [None] * len(input_data)
+  output_node = 'annotation/annotations:0'
+
+  lock = threading.Lock()
+  pending_batches = iter(enumerate(batches))
+  errors = []
+
+  def _Worker():
+    while not errors:
+      with lock:
+        batch_index, indices = next(pending_batches, (None, None))
+      if indices is None:
+        return
+      batch_feed_dict = dict(feed_dict)
+      batch_feed_dict['annotation/ComputeSession/InputBatch:0'] = [
+          input_data[index] for index in indices
+      ]
+
+      # Process.
+      tf.logging.info('Processing batch %d of %d (%d sentences, up to %d '
+                      'tokens)', batch_index + 1, len(batches), len(indices),
+                      max(lengths[index] for index in indices))
+      try:
+        if timeline_output_file and batch_index == len(batches) - 1:
+          run_metadata = tf.RunMetadata()
+          serialized_annotations = sess.run(
+              output_node,
+              feed_dict=batch_feed_dict,
+              options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
+              run_metadata=run_metadata)
+          trace = timeline.Timeline(step_stats=run_metadata.step_stats)
+          with open(timeline_output_file, 'w') as trace_file:
+            trace_file.write(trace.generate_chrome_trace_format())
+        else:
+          serialized_annotations = sess.run(
+              output_node, feed_dict=batch_feed_dict)
+      except Exception as e:  # pylint: disable=broad-except
+        errors.append(e)
+        return
+
+      # Save the outputs in input order.
+      for index, annotation in zip(indices, serialized_annotations):
+        processed[index] = annotation
+
+  start_time = time.time()
+  threads = [threading.Thread(target=_Worker) for _ in range(num_threads)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  if errors:
+    raise errors[0]
+
+  # Report statistics.
+  elapsed = max(time.time() - start_time, 1e-9)
+  tf.logging.info('Processed %d documents (%d tokens) in %.2f seconds: %.1f '
+                  'sentences/sec, %.1f tokens/sec.', len(input_data),
+                  sum(lengths), elapsed, len(input_data) / elapsed,
+                  sum(lengths) / elapsed)
+  return processed
+
+
 def run_segmenter(input_data, segmenter_model, session_config, max_batch_size,
-                  timeline_output_file=None):
+                  timeline_output_file=None, sort_by_length=True,
+                  num_threads=1):
   """Runs the provided segmenter model on the provided character corpus.
 
   Args:
@@ -90,6 +210,8 @@ def run_segmenter(input_data, segmenter_model, session_config, max_batch_size,
     session_config: A session configuration object.
     max_batch_size: The maximum batch size to use.
     timeline_output_file: Filepath for timeline export. Does not export if None.
+    sort_by_length: Whether to batch sentences of similar lengths together.
+    num_threads: Number of batches to run concurrently.
 
   Returns:
     A list of segmented sentences suitable for parsing.
@@ -103,37 +225,8 @@ def run_segmenter(input_data, segmenter_model, session_config, max_batch_size,
 
     # Use the graph to segment the sentences.
     tf.logging.info('Segmenting sentences...')
-    processed = []
-    start_time = time.time()
-    run_metadata = tf.RunMetadata()
-    for start in range(0, len(input_data), max_batch_size):
-      # Prepare the inputs.
-      end = min(start + max_batch_size, len(input_data))
-      feed_dict = {
-          'annotation/ComputeSession/InputBatch:0': input_data[start:end]
-      }
-      output_node = 'annotation/annotations:0'
-
-      # Process.
-      tf.logging.info('Processing examples %d to %d' % (start, end))
-      if timeline_output_file and end == len(input_data):
-        serialized_annotations = sess.run(
-            output_node,
-            feed_dict=feed_dict,
-            options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
-            run_metadata=run_metadata)
-        trace = timeline.Timeline(step_stats=run_metadata.step_stats)
-        with open(timeline_output_file, 'w') as trace_file:
-          trace_file.write(trace.generate_chrome_trace_format())
-      else:
-        serialized_annotations = sess.run(output_node, feed_dict=feed_dict)
-
-      # Save the outputs.
-      processed.extend(serialized_annotations)
-
-  # Report statistics.
-  tf.logging.info('Segmented %d documents in %.2f seconds.',
-                  len(input_data), time.time() - start_time)
+    processed = _run_batches(sess, input_data, {}, max_batch_size,
+                             sort_by_length, num_threads, timeline_output_file)
 
   # Once all sentences are segmented, the processed data can be used in the
   # parsers.
@@ -142,7 +235,7 @@ def run_segmenter(input_data, segmenter_model, session_config, max_batch_size,
 
 def run_parser(input_data, parser_model, session_config, beam_sizes,
                locally_normalized_components, max_batch_size,
-               timeline_output_file):
+               timeline_output_file, sort_by_length=True, num_threads=1):
   """Runs the provided segmenter model on the provided character corpus.
 
   Args:
@@ -153,6 +246,8 @@ def run_parser(input_data, parser_model, session_config, beam_sizes,
     locally_normalized_components: A list of components to normalize (optional).
     max_batch_size: The maximum batch size to use.
     timeline_output_file: Filepath for timeline export. Does not export if None.
+    sort_by_length: Whether to batch sentences of similar lengths together.
+    num_threads: Number of batches to run concurrently.
 
   Returns:
     A list of parsed sentences.
@@ -164,41 +259,15 @@ def run_parser(input_data, parser_model, session_config, beam_sizes,
                                parser_model)
 
     tf.logging.info('Parsing sentences...')
-
-    processed = []
-    start_time = time.time()
-    run_metadata = tf.RunMetadata()
     tf.logging.info('Corpus length is %d' % len(input_data))
-    for start in range(0, len(input_data), max_batch_size):
-      # Set up the input and output.
-      end = min(start + max_batch_size, len(input_data))
-      feed_dict = {
-          'annotation/ComputeSession/InputBatch:0': input_data[start:end]
-      }
-      for comp, beam_size in beam_sizes:
-        feed_dict['%s/InferenceBeamSize:0' % comp] = beam_size
-      for comp in locally_normalized_components:
-        feed_dict['%s/LocallyNormalize:0' % comp] = True
-      output_node = 'annotation/annotations:0'
+    feed_dict = {}
+    for comp, beam_size in beam_sizes:
+      feed_dict['%s/InferenceBeamSize:0' % comp] = beam_size
+    for comp in locally_normalized_components:
+      feed_dict['%s/LocallyNormalize:0' % comp] = True
+    processed = _run_batches(sess, input_data, feed_dict, max_batch_size,
+                             sort_by_length, num_threads, timeline_output_file)
 
-      # Process.
-      tf.logging.info('Processing examples %d to %d' % (start, end))
-      if timeline_output_file and end == len(input_data):
-        serialized_annotations = sess.run(
-            output_node,
-            feed_dict=feed_dict,
-            options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
-            run_metadata=run_metadata)
-        trace = timeline.Timeline(step_stats=run_metadata.step_stats)
-        with open(timeline_output_file, 'w') as trace_file:
-          trace_file.write(trace.generate_chrome_trace_format())
-      else:
-        serialized_annotations = sess.run(output_node, feed_dict=feed_dict)
-
-      processed.extend(serialized_annotations)
-
-    tf.logging.info('Processed %d documents in %.2f seconds.',
-                    len(input_data), time.time() - start_time)
     _, uas, las = evaluation.calculate_parse_metrics(input_data, processed)
     tf.logging.info('UAS: %.2f', uas)
     tf.logging.info('LAS: %.2f', las)
@@ -266,13 +335,16 @@ def main(unused_argv):
     segmenter_input = get_segmenter_corpus(FLAGS.input_file, FLAGS.text_format)
     parser_input = run_segmenter(segmenter_input, FLAGS.segmenter_saved_model,
                                  session_config, FLAGS.max_batch_size,
-                                 FLAGS.timeline_output_file)
+                                 FLAGS.timeline_output_file,
+                                 FLAGS.sort_by_length,
+                                 FLAGS.num_session_threads)
     use_gold_segmentation = False
 
   # Now that we have parser input data, parse.
   processed = run_parser(parser_input, FLAGS.parser_saved_model, session_config,
                          component_beam_sizes, components_to_locally_normalize,
-                         FLAGS.max_batch_size, FLAGS.timeline_output_file)
+                         FLAGS.max_batch_size, FLAGS.timeline_output_file,
+                         FLAGS.sort_by_length, FLAGS.num_session_threads)
 
   if FLAGS.output_file:
     print_output(FLAGS.output_file, FLAGS.text_format, use_gold_segmentation,
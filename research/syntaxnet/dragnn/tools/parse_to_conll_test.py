@@ -0,0 +1,74 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for the batching of dragnn.tools.parse_to_conll."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+
+from tensorflow.python.platform import googletest
+from dragnn.tools import parse_to_conll
+from syntaxnet import sentence_pb2
+
+
+class _AnnotatingSession(object):
+  """Stands in for a session, annotating each sentence with a prefix."""
+
+  def __init__(self):
+    self.batches = []
+    self._lock = threading.Lock()
+
+  def run(self, unused_fetches, feed_dict, **unused_kwargs):
+    batch = feed_dict['annotation/ComputeSession/InputBatch:0']
+    with self._lock:
+      self.batches.append(batch)
+    return [b'annotated:' + sentence for sentence in batch]
+
+
+class ParseToConllTest(googletest.TestCase):
+
+  def setUp(self):
+    # Sentences of 5, 1, 4, 2, 6, 3 and 0 tokens, out of length order.
+    self._lengths = [5, 1, 4, 2, 6, 3, 0]
+    self._input_data = []
+    for length in self._lengths:
+      sentence = sentence_pb2.Sentence()
+      for i in range(length):
+        sentence.token.add(start=i, end=i, word='w%d' % i)
+      self._input_data.append(sentence.SerializeToString())
+
+  def testMakeBatches(self):
+    self.assertEqual([[0, 1, 2], [3, 4, 5], [6]],
+                     parse_to_conll._make_batches(self._lengths, 3, False))
+    self.assertEqual([[6, 1, 3], [5, 2, 0], [4]],
+                     parse_to_conll._make_batches(self._lengths, 3, True))
+
+  def testRunBatchesKeepsInputOrder(self):
+    expected = [b'annotated:' + sentence for sentence in self._input_data]
+    for sort_by_length in False, True:
+      for num_threads in 1, 3:
+        sess = _AnnotatingSession()
+        processed = parse_to_conll._run_batches(
+            sess, self._input_data, {}, 3, sort_by_length, num_threads, None)
+        self.assertEqual(expected, processed)
+        # The last batch is smaller than the maximum batch size.
+        self.assertEqual([1, 3, 3], sorted(len(b) for b in sess.batches))
+
+
+if __name__ == '__main__':
+  googletest.main()
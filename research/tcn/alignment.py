@@ -69,8 +69,8 @@ def compute_average_alignment(
 
         times_i = np.array(range(seq_len))
         # Get the nearest time_index for each embedding in view_i.
-        times_j = np.array([util.KNNIdsWithDistances(
-            q, embeddings_view_j, k=1)[0][0] for q in embeddings_view_i])
+        times_j, _ = util.BlockedKNN(embeddings_view_i, embeddings_view_j, k=1)
+        times_j = times_j[:, 0]
 
         # Compute sequence view pair alignment.
         alignment = np.mean(
@@ -18,8 +18,11 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import collections
 import functools
 import random
+import threading
+import time
 import numpy as np
 import preprocessing
 import tensorflow as tf
@@ -30,6 +33,129 @@ def record_dataset(filename):
   return tf.data.TFRecordDataset(filename)
 
 
+class DecodedFrameCache(object):
+  """A bounded LRU cache of decoded frames, keyed by (sequence, view, time).
+
+  Frames are kept as decoded np.uint8 images. Lookups and insertions are
+  thread safe, so that the cache can be shared by parallel tf.data map calls.
+  """
+
+  def __init__(self, max_frames):
+    """Creates an empty cache.
+
+    Args:
+      max_frames: Int, the maximum number of frames kept. The least recently
+        used frames are evicted first.
+    """
+    self.max_frames = max_frames
+    self.hits = 0
+    self.misses = 0
+    self._frames = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._frames)
+
+  def lookup(self, task, view, timestep):
+    """Returns (found, frame), frame is empty if not found."""
+    key = (task, int(view), int(timestep))
+    with self._lock:
+      frame = self._frames.pop(key, None)
+      if frame is None:
+        self.misses += 1
+        return False, np.zeros((0, 0, 3), dtype=np.uint8)
+      self._frames[key] = frame
+      self.hits += 1
+      return True, frame
+
+  def insert(self, task, view, timestep, frame):
+    """Inserts a frame, evicting the least recently used ones, returns it."""
+    key = (task, int(view), int(timestep))
+    with self._lock:
+      self._frames.pop(key, None)
+      self._frames[key] = frame
+      while len(self._frames) > self.max_frames:
+        self._frames.popitem(last=False)
+    return frame
+
+  def hit_rate(self):
+    """Returns the fraction of lookups found in the cache."""
+    lookups = self.hits + self.misses
+    return self.hits / lookups if lookups else 0.
+
+
+class ThroughputCounters(object):
+  """Counts the elements produced by each stage of an input pipeline.
+
+  Comparing the rate of the last stage with the training step rate tells
+  whether training is input-bound, and comparing the stages tells which one
+  limits the pipeline. Rates are logged every log_every_secs.
+  """
+
+  def __init__(self, log_every_secs=60., frame_cache=None):
+    """Creates zero counters.
+
+    Args:
+      log_every_secs: Float, the interval at which rates are logged, or None
+        to never log them.
+      frame_cache: An optional `DecodedFrameCache` whose hit rate is logged.
+    """
+    self.log_every_secs = log_every_secs
+    self.frame_cache = frame_cache
+    self._counts = collections.OrderedDict()
+    self._start_time = time.time()
+    self._last_log_time = self._start_time
+    self._lock = threading.Lock()
+
+  def count(self, stage, num_elements=1):
+    """Adds num_elements to the count of stage."""
+    with self._lock:
+      self._counts[stage] = self._counts.get(stage, 0) + num_elements
+      now = time.time()
+      should_log = (self.log_every_secs is not None and
+                    now - self._last_log_time >= self.log_every_secs)
+      if should_log:
+        self._last_log_time = now
+    if should_log:
+      self.log()
+
+  def counts(self):
+    """Returns an ordered dict from stage name to the elements produced."""
+    with self._lock:
+      return collections.OrderedDict(self._counts)
+
+  def rates(self):
+    """Returns an ordered dict from stage name to the elements per second."""
+    elapsed = max(time.time() - self._start_time, 1e-6)
+    return collections.OrderedDict(
+        (stage, n / elapsed) for stage, n in self.counts().items())
+
+  def log(self):
+    """Logs the rate of each stage and the frame cache hit rate."""
+    rates = self.rates()
+    msg = ', '.join('%s: %.1f/s' % (stage, rate)
+                    for stage, rate in rates.items())
+    if self.frame_cache is not None:
+      msg += ', frame cache hit rate: %.3f' % self.frame_cache.hit_rate()
+    tf.logging.info('Input pipeline throughput: %s', msg)
+
+  def counted(self, stage, tensors):
+    """Returns tensors, counting one element of stage each time they're run."""
+    def _count():
+      self.count(stage)
+      return np.int64(0)
+    with tf.control_dependencies(
+        [tf.py_func(_count, [], tf.int64, stateful=True)]):
+      return _identity(tensors)
+
+
+def _identity(tensors):
+  """Applies tf.identity to a tensor or a tuple of tensors."""
+  if isinstance(tensors, (tuple, list)):
+    return type(tensors)(tf.identity(t) for t in tensors)
+  return tf.identity(tensors)
+
+
 def full_sequence_provider(file_list, num_views):
   """Provides full preprocessed image sequences.
 
@@ -270,7 +396,14 @@ def parse_sequence_to_pairs_batch(
       preprocessing.decode_image, anchor_images, dtype=tf.float32)
   pos_images = tf.map_fn(
       preprocessing.decode_image, pos_images, dtype=tf.float32)
+  return _preprocess_pairs_batch(
+      anchor_images, pos_images, seq_len, preprocess_fn, is_training,
+      num_pairs)
+
 
+def _preprocess_pairs_batch(
+    anchor_images, pos_images, seq_len, preprocess_fn, is_training, num_pairs):
+  """Preprocesses decoded anchor and positive images into a pairs batch."""
   # Concatenate [anchor, postitive] images into a batch and preprocess it.
   concatenated = tf.concat([anchor_images, pos_images], 0)
   preprocessed = preprocess_fn(concatenated, is_training)
@@ -290,6 +423,90 @@ def parse_sequence_to_pairs_batch(
           anchor_labels, positive_labels, seq_len)
 
 
+def sample_sequence_pair_strings(
+    serialized_example, num_views, batch_size, window):
+  """Samples (anchor, positive) pairs from a sequence, without decoding them.
+
+  Args:
+    serialized_example: A serialized SequenceExample.
+    num_views: Int, the number of simultaneous viewpoints at each timestep in
+      the dataset.
+    batch_size: Int, size of the batch to get.
+    window: Int, only take pairs from a maximium window of this size.
+  Returns:
+    task: A string `Tensor`, the name of the sequence.
+    ap_time_indices: A 1-D int32 `Tensor` holding the timestep of each pair.
+    a_view_indices: A 1-D int32 `Tensor` holding the view of each anchor.
+    p_view_indices: A 1-D int32 `Tensor` holding the view of each positive.
+    anchor_strings: A 1-D string `Tensor` of jpeg-encoded anchor images.
+    pos_strings: A 1-D string `Tensor` of jpeg-encoded positive images.
+    seq_len: Int, the number of timesteps in the sequence.
+  """
+  context, views, seq_len = parse_sequence_example(
+      serialized_example, num_views)
+  num_pairs = batch_size // 2
+  ap_time_indices, a_view_indices, p_view_indices = get_tcn_anchor_pos_indices(
+      seq_len, num_views, num_pairs, window)
+  anchor_strings = tf.gather_nd(
+      views, tf.stack([a_view_indices, ap_time_indices], 1))
+  pos_strings = tf.gather_nd(
+      views, tf.stack([p_view_indices, ap_time_indices], 1))
+  return (context['task'], ap_time_indices, a_view_indices, p_view_indices,
+          anchor_strings, pos_strings, seq_len)
+
+
+def decode_cached_frames(frame_cache, task, view_indices, time_indices,
+                         image_strings):
+  """Decodes frames of a sequence, reusing the ones found in frame_cache.
+
+  Args:
+    frame_cache: A `DecodedFrameCache`.
+    task: A string `Tensor`, the name of the sequence.
+    view_indices: A 1-D int32 `Tensor` holding the view of each frame.
+    time_indices: A 1-D int32 `Tensor` holding the timestep of each frame.
+    image_strings: A 1-D string `Tensor` of jpeg-encoded frames.
+  Returns:
+    images: A 4-D float32 `Tensor` holding images in range [0,1].
+  """
+  def _decode_frame(elems):
+    view, timestep, image_string = elems
+    found, cached = tf.py_func(
+        frame_cache.lookup, [task, view, timestep], [tf.bool, tf.uint8],
+        stateful=True)
+    found.set_shape([])
+    def _decode_and_insert():
+      frame = tf.image.decode_jpeg(image_string, channels=3)
+      return tf.py_func(
+          frame_cache.insert, [task, view, timestep, frame], tf.uint8,
+          stateful=True)
+    frame = tf.cond(found, lambda: cached, _decode_and_insert)
+    frame.set_shape([None, None, 3])
+    return tf.image.convert_image_dtype(frame, dtype=tf.float32)
+  return tf.map_fn(
+      _decode_frame, (view_indices, time_indices, image_strings),
+      dtype=tf.float32)
+
+
+def decode_sequence_pair_strings(
+    task, ap_time_indices, a_view_indices, p_view_indices, anchor_strings,
+    pos_strings, seq_len, frame_cache, preprocess_fn, is_training, batch_size):
+  """Decodes pairs from sample_sequence_pair_strings into a preprocessed batch.
+
+  Frames are decoded through frame_cache, while preprocessing, which is random
+  in training, is applied to every batch.
+
+  Returns:
+    The outputs of parse_sequence_to_pairs_batch.
+  """
+  anchor_images = decode_cached_frames(
+      frame_cache, task, a_view_indices, ap_time_indices, anchor_strings)
+  pos_images = decode_cached_frames(
+      frame_cache, task, p_view_indices, ap_time_indices, pos_strings)
+  return _preprocess_pairs_batch(
+      anchor_images, pos_images, seq_len, preprocess_fn, is_training,
+      batch_size // 2)
+
+
 def multiview_pairs_provider(file_list,
                              preprocess_fn,
                              num_views,
@@ -299,7 +516,9 @@ def multiview_pairs_provider(file_list,
                              examples_per_seq=2,
                              num_parallel_calls=12,
                              sequence_prefetch_size=12,
-                             batch_prefetch_size=12):
+                             batch_prefetch_size=12,
+                             frame_cache=None,
+                             counters=None):
   """Provides multi-view TCN anchor-positive image pairs.
 
   Returns batches of Multi-view TCN pairs, where each pair consists of an
@@ -331,6 +550,11 @@ def multiview_pairs_provider(file_list,
       mapper.
     sequence_prefetch_size: Int, size of the buffer used to prefetch sequences.
     batch_prefetch_size: Int, size of the buffer used to prefetch batches.
+    frame_cache: An optional `DecodedFrameCache`. If given, sequences are
+      parsed and sampled in a first parallel map stage, and only the sampled
+      frames missing from the cache are decoded, in a second one.
+    counters: An optional `ThroughputCounters`, counting the sequences parsed,
+      the sequences decoded and the batches produced.
   Returns:
     batch_images: A 4-D float32 `Tensor` holding preprocessed batch images.
     anchor_labels: A 1-D int32 `Tensor` holding anchor image labels.
@@ -338,9 +562,23 @@ def multiview_pairs_provider(file_list,
     positive_labels: A 1-D int32 `Tensor` holding positive image labels.
     pos_images: A 4-D float32 `Tensor` holding raw positive images.
   """
+  def _count(stage, outputs):
+    if counters is None:
+      return outputs
+    return counters.counted(stage, outputs)
+
   def _parse_sequence(x):
-    return parse_sequence_to_pairs_batch(
-        x, preprocess_fn, is_training, num_views, examples_per_seq, window)
+    return _count('parsed_sequences', parse_sequence_to_pairs_batch(
+        x, preprocess_fn, is_training, num_views, examples_per_seq, window))
+
+  def _sample_sequence(x):
+    return _count('parsed_sequences', sample_sequence_pair_strings(
+        x, num_views, examples_per_seq, window))
+
+  def _decode_sequence(*sampled):
+    return _count('decoded_sequences', decode_sequence_pair_strings(
+        *(sampled + (frame_cache, preprocess_fn, is_training,
+                     examples_per_seq))))
 
   # Build a buffer of shuffled input TFRecords that repeats forever.
   dataset = get_shuffled_input_records(file_list)
@@ -348,20 +586,33 @@ def multiview_pairs_provider(file_list,
   # Prefetch a number of opened TFRecords.
   dataset = dataset.prefetch(sequence_prefetch_size)
 
-  # Use _parse_sequence to map sequences to batches (one sequence per batch).
-  dataset = dataset.map(
-      _parse_sequence, num_parallel_calls=num_parallel_calls)
-
   # Filter out sequences that don't have at least examples_per_seq.
   def seq_greater_than_min(seqlen, maximum):
     return seqlen >= maximum
   filter_fn = functools.partial(seq_greater_than_min, maximum=examples_per_seq)
-  dataset = dataset.filter(lambda a, b, c, d, e, f, seqlen: filter_fn(seqlen))
+
+  if frame_cache is None:
+    # Use _parse_sequence to map sequences to batches (one sequence per batch).
+    dataset = dataset.map(
+        _parse_sequence, num_parallel_calls=num_parallel_calls)
+    dataset = dataset.filter(
+        lambda a, b, c, d, e, f, seqlen: filter_fn(seqlen))
+  else:
+    # Sample pairs from sequences, then decode only the sampled frames, so
+    # that sequences which are filtered out are never decoded.
+    dataset = dataset.map(
+        _sample_sequence, num_parallel_calls=num_parallel_calls)
+    dataset = dataset.filter(
+        lambda a, b, c, d, e, f, seqlen: filter_fn(seqlen))
+    dataset = dataset.map(
+        _decode_sequence, num_parallel_calls=num_parallel_calls)
 
   # Take a number of sequences for the batch.
   assert batch_size % examples_per_seq == 0
   sequences_per_batch = batch_size // examples_per_seq
   dataset = dataset.batch(sequences_per_batch)
+  if counters is not None:
+    dataset = dataset.map(lambda *batch: _count('batches', batch))
 
   # Prefetch batches of images.
   dataset = dataset.prefetch(batch_prefetch_size)
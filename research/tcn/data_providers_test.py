@@ -65,5 +65,66 @@ class DataTest(tf.test.TestCase):
       # Make sure batch time indices are a contiguous range.
       self.assertTrue(np.array_equal(np_time_indices, range(first, last+1)))
 
+  def testDecodedFrameCacheEvictsLeastRecentlyUsed(self):
+    """Ensures the frame cache keeps the most recently used frames."""
+    cache = data_providers.DecodedFrameCache(max_frames=2)
+    frames = [np.full((2, 2, 3), i, dtype=np.uint8) for i in range(3)]
+    cache.insert(b'seq', 0, 0, frames[0])
+    cache.insert(b'seq', 1, 0, frames[1])
+    found, frame = cache.lookup(b'seq', 0, 0)
+    self.assertTrue(found)
+    np.testing.assert_array_equal(frame, frames[0])
+    # Inserting a third frame evicts (seq, 1, 0), the least recently used.
+    cache.insert(b'seq', 0, 1, frames[2])
+    self.assertEqual(len(cache), 2)
+    self.assertFalse(cache.lookup(b'seq', 1, 0)[0])
+    self.assertTrue(cache.lookup(b'seq', 0, 1)[0])
+    self.assertEqual(cache.hits, 2)
+    self.assertEqual(cache.misses, 1)
+
+  def _write_sequences(self, filename, num_sequences, num_views, seq_len):
+    """Writes SequenceExamples of random 8x8 jpeg frames to filename."""
+    with tf.Graph().as_default(), tf.Session() as sess:
+      image = tf.placeholder(tf.uint8, [8, 8, 3])
+      encoded = tf.image.encode_jpeg(image)
+      rng = np.random.RandomState(0)
+      with tf.python_io.TFRecordWriter(filename) as writer:
+        for i in range(num_sequences):
+          example = tf.train.SequenceExample()
+          example.context.feature['task'].bytes_list.value.append(
+              b'seq%d' % i)
+          example.context.feature['len'].int64_list.value.append(seq_len)
+          for view in range(num_views):
+            frames = example.feature_lists.feature_list['view%d' % view]
+            for _ in range(seq_len):
+              frames.feature.add().bytes_list.value.append(sess.run(
+                  encoded, {image: rng.randint(0, 256, size=(8, 8, 3))}))
+          writer.write(example.SerializeToString())
+
+  def testMultiviewPairsProviderWithFrameCache(self):
+    """Ensures the frame-cached pairs have the expected shapes and reuse."""
+    filename = self.get_temp_dir() + '/sequences.tfrecord'
+    self._write_sequences(filename, num_sequences=2, num_views=2, seq_len=4)
+    frame_cache = data_providers.DecodedFrameCache(max_frames=100)
+    num_batches = 10
+    with tf.Graph().as_default():
+      outputs = data_providers.multiview_pairs_provider(
+          [filename],
+          lambda images, is_training: tf.image.resize_images(images, [4, 4]),
+          num_views=2, window=4, is_training=True, batch_size=8,
+          examples_per_seq=4, num_parallel_calls=2, sequence_prefetch_size=2,
+          batch_prefetch_size=1, frame_cache=frame_cache)
+      with tf.Session() as sess:
+        for _ in range(num_batches):
+          np_outputs = sess.run(outputs)
+    self.assertEqual([(8, 4, 4, 3), (4,), (4,), (4, 8, 8, 3), (4, 8, 8, 3)],
+                     [o.shape for o in np_outputs])
+    # The 2 sequences hold only 2 * 2 * 4 frames, so most lookups are hits.
+    # Prefetching may have run more batches than were fetched.
+    self.assertLessEqual(len(frame_cache), 16)
+    self.assertGreaterEqual(frame_cache.hits + frame_cache.misses,
+                            num_batches * 8)
+    self.assertGreater(frame_cache.hits, frame_cache.misses)
+
 if __name__ == "__main__":
   tf.test.main()
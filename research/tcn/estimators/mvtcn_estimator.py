@@ -40,6 +40,12 @@ class MVTCNEstimator(base_estimator.BaseEstimator):
     sequence_prefetch_size = config.data.sequence_prefetch_size
     batch_prefetch_size = config.data.batch_prefetch_size
     examples_per_seq = config.data.examples_per_sequence
+    frame_cache, counters = None, None
+    if config.data.frame_cache_size > 0:
+      # Decode only the sampled frames, keeping recently used ones.
+      frame_cache = data_providers.DecodedFrameCache(
+          config.data.frame_cache_size)
+      counters = data_providers.ThroughputCounters(frame_cache=frame_cache)
     return functools.partial(
         data_providers.multiview_pairs_provider,
         file_list=records,
@@ -50,7 +56,9 @@ class MVTCNEstimator(base_estimator.BaseEstimator):
         examples_per_seq=examples_per_seq,
         num_parallel_calls=num_parallel_calls,
         sequence_prefetch_size=sequence_prefetch_size,
-        batch_prefetch_size=batch_prefetch_size)
+        batch_prefetch_size=batch_prefetch_size,
+        frame_cache=frame_cache,
+        counters=counters)
 
   def forward(self, images_concat, is_training, reuse=False):
     """See base class."""
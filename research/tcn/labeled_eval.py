@@ -21,7 +21,6 @@ from __future__ import print_function
 from collections import defaultdict
 import os
 import numpy as np
-from sklearn.metrics.pairwise import pairwise_distances
 import data_providers
 from estimators.get_estimator import get_estimator
 from utils import util
@@ -65,29 +64,12 @@ def nearest_cross_sequence_neighbors(data, tasks, n_neighbors=1):
     indices: an np.int32 array of size [num_data, n_neighbors] holding the
       n_neighbors nearest indices for every row in data. These are
       restricted to be from different named sequences (as defined in `tasks`).
+      If fewer than n_neighbors rows are in other sequences, the missing
+      indices are -1.
   """
-
-  # Compute the pairwise sequence adjacency matrix from `tasks`.
-  num_data = data.shape[0]
-  tasks = np.array(tasks)
-  tasks = np.reshape(tasks, (num_data, 1))
-  assert len(tasks.shape) == 2
-  not_adjacent = (tasks != tasks.T)
-
-  # Compute the symmetric pairwise distance matrix.
-  pdist = pairwise_distances(data, metric='sqeuclidean')
-
-  # For every row in the pairwise distance matrix, only consider
-  # cross-sequence columns.
-  indices = np.zeros((num_data, n_neighbors), dtype=np.int32)
-  for idx in range(num_data):
-    # Restrict to cross_sequence neighbors.
-    distances = [(
-        pdist[idx][i], i) for i in xrange(num_data) if not_adjacent[idx][i]]
-    _, nearest_indices = zip(*sorted(
-        distances, key=lambda x: x[0])[:n_neighbors])
-    indices[idx] = nearest_indices
-  return indices
+  indices, _ = util.BlockedKNN(
+      data, data, k=n_neighbors, query_groups=tasks, target_groups=tasks)
+  return indices.astype(np.int32)
 
 
 def compute_cross_sequence_recall_at_k(retrieved_labels, labels, k_list):
@@ -154,7 +136,9 @@ def compute_cross_sequence_recalls_at_k(
   # Compute knn indices.
   indices = nearest_cross_sequence_neighbors(
       embeddings, tasks, n_neighbors=max(k_list))
-  retrieved_labels = labels[indices]
+  # Missing neighbors retrieve a label that matches no class.
+  retrieved_labels = np.where(indices[:, :, np.newaxis] >= 0,
+                              labels[indices], np.min(labels) - 1)
 
   # Compute the recall@k for each classification problem.
   recall_lists = []
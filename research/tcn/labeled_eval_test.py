@@ -20,6 +20,7 @@ from __future__ import print_function
 
 import numpy as np
 import labeled_eval
+from utils import util
 import tensorflow as tf
 
 
@@ -42,6 +43,54 @@ class LabeledEvalTest(tf.test.TestCase):
     repeated_tasks = np.tile(np.reshape(tasks, (num_data, 1)), n_neighbors)
     self.assertTrue(np.all(np.not_equal(repeated_tasks, tasks[indices])))
 
+  def testNearestCrossSequenceNeighborsMatchesBruteForce(self):
+    num_data = 48
+    n_neighbors = 3
+    data = np.random.randn(num_data, 4)
+    tasks = np.repeat(['a', 'b', 'c'], num_data // 3)
+
+    indices = labeled_eval.nearest_cross_sequence_neighbors(
+        data, tasks, n_neighbors=n_neighbors)
+    blocked_indices, _ = util.BlockedKNN(
+        data, data, k=n_neighbors, query_groups=tasks, target_groups=tasks,
+        block_size=5)
+
+    # Brute force: sort all cross-sequence distances of every row.
+    pdist = np.sum(np.square(data[:, np.newaxis] - data[np.newaxis]), axis=2)
+    pdist[tasks[:, np.newaxis] == tasks[np.newaxis]] = np.inf
+    expected = np.argsort(pdist, axis=1, kind='mergesort')[:, :n_neighbors]
+    self.assertAllEqual(expected, indices)
+    self.assertAllEqual(expected, blocked_indices)
+
+  def testBlockedKNNTiedDistances(self):
+    # Integer-valued data has many targets at the same distance, and ties
+    # must go to the lowest indices.
+    rng = np.random.RandomState(0)
+    for _ in range(20):
+      queries = rng.randint(0, 3, size=(30, 2)).astype(np.float64)
+      targets = rng.randint(0, 3, size=(40, 2)).astype(np.float64)
+      pdist = np.sum(np.square(queries[:, np.newaxis] - targets[np.newaxis]),
+                     axis=2)
+      for k in 1, 4, 40:
+        expected = np.argsort(pdist, axis=1, kind='mergesort')[:, :k]
+        indices, distances = util.BlockedKNN(queries, targets, k=k,
+                                             block_size=7)
+        self.assertAllEqual(expected, indices)
+        self.assertAllEqual(np.sort(pdist, axis=1)[:, :k], distances)
+
+  def testBlockedKNNMissingCrossSequenceNeighbors(self):
+    # Rows of sequence 'a' have only one neighbor in another sequence.
+    data = np.random.randn(5, 4)
+    tasks = np.array(['a', 'a', 'a', 'a', 'b'])
+    indices, distances = util.BlockedKNN(
+        data, data, k=3, query_groups=tasks, target_groups=tasks,
+        block_size=2)
+    self.assertAllEqual(np.full((4, 1), 4), indices[:4, :1])
+    self.assertAllEqual(np.full((4, 2), -1), indices[:4, 1:])
+    self.assertTrue(np.all(np.isinf(distances[:4, 1:])))
+    self.assertTrue(np.all(indices[4] < 4))
+    self.assertTrue(np.all(np.isfinite(distances)[4]))
+
   def testPerfectCrossSequenceRecall(self):
     # Make sure cross-sequence recall@k returns 1.0 for near-duplicate features.
     embeddings = np.random.randn(10, 2)
@@ -188,6 +188,83 @@ def KNNIdsWithDistances(query_vec, target_seq, k=1):
   return sorted_distances[:k]
 
 
+def BlockedKNN(queries, targets, k=1, query_groups=None, target_groups=None,
+               block_size=None):
+  """Gets the k nearest targets to every query, in squared euclidean distance.
+
+  Distances are computed with matrix products over blocks of queries, so that
+  memory is bounded by block_size x [number of targets]. If groups are given,
+  targets in the same group as a query are not retrieved for it.
+
+  Args:
+    queries: 2-D numpy array of size [number of queries, feature dimension].
+    targets: 2-D numpy array of size [number of targets, feature dimension].
+    k: Int, the number of neighbors to return for each query.
+    query_groups: Optional 1-D array of size [number of queries], holding the
+      group (e.g. the sequence name) each query belongs to.
+    target_groups: Optional 1-D array of size [number of targets], holding the
+      group each target belongs to. Required if query_groups is given.
+    block_size: Int, the number of queries per block. Defaults to a block of
+      about 2^22 distances.
+  Returns:
+    ids: np.int64 array of size [number of queries, k] holding the target
+      indices, sorted by distance, ties broken by index. Missing neighbors,
+      when fewer than k targets are in other groups, have index -1.
+    distances: np.float64 array of size [number of queries, k] holding the
+      squared distances. Missing neighbors have infinite distance.
+  """
+  queries = np.asarray(queries, dtype=np.float64)
+  targets = np.asarray(targets, dtype=np.float64)
+  num_queries, num_targets = queries.shape[0], targets.shape[0]
+  k = min(k, num_targets)
+  if query_groups is not None:
+    _, group_ids = np.unique(
+        np.concatenate([np.asarray(query_groups), np.asarray(target_groups)]),
+        return_inverse=True)
+    query_groups = group_ids[:num_queries]
+    target_groups = group_ids[num_queries:]
+  if block_size is None:
+    block_size = max(1, (1 << 22) // max(num_targets, 1))
+
+  target_sq_norms = np.sum(np.square(targets), axis=1)
+  ids = np.zeros((num_queries, k), dtype=np.int64)
+  distances = np.zeros((num_queries, k), dtype=np.float64)
+  for start in range(0, num_queries, block_size):
+    block = queries[start:start + block_size]
+    dists = np.dot(block, targets.T)
+    dists *= -2.
+    dists += np.sum(np.square(block), axis=1)[:, np.newaxis]
+    dists += target_sq_norms
+    np.maximum(dists, 0., out=dists)
+    if query_groups is not None:
+      dists[query_groups[start:start + block_size, np.newaxis] ==
+            target_groups] = np.inf
+    rows = np.arange(block.shape[0])[:, np.newaxis]
+    if k < num_targets:
+      block_ids = np.argpartition(dists, k - 1, axis=1)[:, :k]
+      # argpartition keeps an arbitrary subset of the targets tied at the
+      # k-th distance. Rows with such ties are sorted stably instead, so that
+      # the lowest indices are kept.
+      kth_dists = np.max(dists[rows, block_ids], axis=1)
+      tied = np.sum(dists <= kth_dists[:, np.newaxis], axis=1) > k
+      if np.any(tied):
+        block_ids[tied] = np.argsort(dists[tied], axis=1,
+                                     kind='mergesort')[:, :k]
+    else:
+      block_ids = np.tile(np.arange(num_targets), (block.shape[0], 1))
+    block_dists = dists[rows, block_ids]
+    # Sort the k candidates by distance, then by index.
+    order = np.lexsort((block_ids, block_dists), axis=1)
+    block_ids = block_ids[rows, order]
+    if query_groups is not None:
+      # Same-group targets only fill the slots that have no other target.
+      block_ids[query_groups[start:start + block_size, np.newaxis] ==
+                target_groups[block_ids]] = -1
+    ids[start:start + block_size] = block_ids
+    distances[start:start + block_size] = block_dists[rows, order]
+  return ids, distances
+
+
 def CopyLocalConfigsToCNS(outdir, configs, gfs_user):
   """Copies experiment yaml config files to the job_logdir on /cns."""
   assert configs
@@ -89,6 +89,9 @@ flags.DEFINE_string("rnn_mode", None,
                     "The low level implementation of lstm cell: one of CUDNN, "
                     "BASIC, and BLOCK, representing cudnn_lstm, basic_lstm, "
                     "and lstm_block_cell classes.")
+flags.DEFINE_bool("numpy_reader", False,
+                  "Build the vocabulary with numpy, cache the word ids as "
+                  ".npy files and feed the model from a tf.data pipeline.")
 FLAGS = flags.FLAGS
 BASIC = "basic"
 CUDNN = "cudnn"
@@ -106,7 +109,11 @@ class PTBInput(object):
     self.batch_size = batch_size = config.batch_size
     self.num_steps = num_steps = config.num_steps
     self.epoch_size = ((len(data) // batch_size) - 1) // num_steps
-    self.input_data, self.targets = reader.ptb_producer(
+    if FLAGS.numpy_reader:
+      producer = reader.ptb_dataset_producer
+    else:
+      producer = reader.ptb_producer
+    self.input_data, self.targets = producer(
         data, batch_size, num_steps, name=name)
 
 
@@ -453,7 +460,10 @@ def main(_):
         "which is less than the requested --num_gpus=%d."
         % (len(gpus), FLAGS.num_gpus))
 
-  raw_data = reader.ptb_raw_data(FLAGS.data_path)
+  if FLAGS.numpy_reader:
+    raw_data = reader.ptb_raw_data_arrays(FLAGS.data_path)
+  else:
+    raw_data = reader.ptb_raw_data(FLAGS.data_path)
   train_data, valid_data, test_data, _ = raw_data
 
   config = get_config()
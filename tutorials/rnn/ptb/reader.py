@@ -23,10 +23,14 @@ import collections
 import os
 import sys
 
+import numpy as np
 import tensorflow as tf
 
 Py3 = sys.version_info[0] == 3
 
+# Approximate number of characters tokenized at once by the numpy reader.
+_BLOCK_CHARS = 1 << 24
+
 def _read_words(filename):
   with tf.gfile.GFile(filename, "r") as f:
     if Py3:
@@ -52,6 +56,110 @@ def _file_to_word_ids(filename, word_to_id):
   return [word_to_id[word] for word in data if word in word_to_id]
 
 
+def _read_word_blocks(filename):
+  """Yields the words of _read_words(filename) in blocks of bounded size."""
+  with tf.gfile.GFile(filename, "r") as f:
+    lines = []
+    num_chars = 0
+    remainder = ""
+    for line in f:
+      if not Py3:
+        line = line.decode("utf-8")
+      lines.append(line)
+      num_chars += len(line)
+      if num_chars < _BLOCK_CHARS:
+        continue
+      text = remainder + "".join(lines).replace("\n", "<eos>")
+      lines = []
+      num_chars = 0
+      # Only split at a space, so that no word is cut between two blocks.
+      split = text.rfind(" ")
+      if split < 0:
+        remainder = text
+        continue
+      remainder = text[split:]
+      yield text[:split].split()
+    yield (remainder + "".join(lines).replace("\n", "<eos>")).split()
+
+
+def _build_vocab_array(filename):
+  """Builds the vocabulary of filename and converts it to word ids.
+
+  Every block of words is reduced to its unique words with np.unique, so only
+  the vocabulary is ever held as Python strings; the words of the file are
+  kept as one int32 id each.
+
+  Args:
+    filename: path to the text file to build the vocabulary from.
+
+  Returns:
+    A pair (words, ids): the vocabulary as an array of words sorted by
+    decreasing count and then alphabetically, exactly as in _build_vocab, and
+    the int32 word ids of the whole file.
+  """
+  first_seen = {}
+  counts = []
+  block_ids = []
+  for words in _read_word_blocks(filename):
+    if not words:
+      continue
+    unique, inverse, unique_counts = np.unique(
+        words, return_inverse=True, return_counts=True)
+    seen_ids = np.empty(len(unique), dtype=np.int32)
+    for i, word in enumerate(unique):
+      seen_id = first_seen.setdefault(word, len(first_seen))
+      if seen_id == len(counts):
+        counts.append(0)
+      counts[seen_id] += unique_counts[i]
+      seen_ids[i] = seen_id
+    block_ids.append(seen_ids[inverse.ravel()])
+
+  vocab = np.empty(len(first_seen), dtype=object)
+  for word, seen_id in first_seen.items():
+    vocab[seen_id] = word
+  vocab = vocab.astype("U")
+  order = np.lexsort((vocab, -np.array(counts, dtype=np.int64)))
+  seen_to_id = np.empty(len(order), dtype=np.int32)
+  seen_to_id[order] = np.arange(len(order), dtype=np.int32)
+  if block_ids:
+    ids = seen_to_id[np.concatenate(block_ids)]
+  else:
+    ids = np.zeros(0, dtype=np.int32)
+  return vocab[order], ids
+
+
+def _file_to_word_id_array(filename, vocab):
+  """Vectorized _file_to_word_ids for a vocabulary from _build_vocab_array."""
+  sort_order = np.argsort(vocab)
+  sorted_vocab = vocab[sort_order]
+  block_ids = []
+  for words in _read_word_blocks(filename):
+    if not words or not len(vocab):
+      continue
+    unique, inverse = np.unique(words, return_inverse=True)
+    position = np.minimum(np.searchsorted(sorted_vocab, unique),
+                          len(vocab) - 1)
+    unique_ids = np.where(sorted_vocab[position] == unique,
+                          sort_order[position], -1)
+    ids = unique_ids[inverse.ravel()]
+    # Words that are not in the vocabulary are dropped.
+    block_ids.append(ids[ids >= 0].astype(np.int32))
+  if not block_ids:
+    return np.zeros(0, dtype=np.int32)
+  return np.concatenate(block_ids)
+
+
+def _load_or_save(path, build_fn):
+  """Loads the array cached at path, or builds it and caches it there."""
+  if tf.gfile.Exists(path):
+    with tf.gfile.GFile(path, "rb") as f:
+      return np.load(f)
+  array = build_fn()
+  with tf.gfile.GFile(path, "wb") as f:
+    np.save(f, array)
+  return array
+
+
 def ptb_raw_data(data_path=None):
   """Load PTB raw data from data directory "data_path".
 
@@ -83,6 +191,46 @@ def ptb_raw_data(data_path=None):
   return train_data, valid_data, test_data, vocabulary
 
 
+def ptb_raw_data_arrays(data_path=None, prefix="ptb", suffix=".txt"):
+  """Load PTB raw data from data directory "data_path" as numpy arrays.
+
+  Gives the same word ids as ptb_raw_data, but builds the vocabulary with
+  numpy and never holds a whole file as Python strings, which makes it
+  usable for larger corpora. The vocabulary and the word ids of every file
+  are cached as .npy files next to the text files and are loaded from there
+  on later calls; delete them when the text files change.
+
+  Args:
+    data_path: string path to the directory with the text files.
+    prefix: file name prefix of the text files, e.g. "wiki" for WikiText.
+    suffix: file name suffix of the text files, e.g. ".tokens" for WikiText.
+
+  Returns:
+    tuple (train_data, valid_data, test_data, vocabulary)
+    where each of the data objects is an int32 array of word ids.
+  """
+  train_path = os.path.join(data_path, prefix + ".train" + suffix)
+  valid_path = os.path.join(data_path, prefix + ".valid" + suffix)
+  test_path = os.path.join(data_path, prefix + ".test" + suffix)
+
+  built = {}
+  def build_train():
+    built["vocab"], train_ids = _build_vocab_array(train_path)
+    return train_ids
+  def build_vocab():
+    if "vocab" not in built:
+      built["vocab"], _ = _build_vocab_array(train_path)
+    return built["vocab"]
+
+  train_data = _load_or_save(train_path + ".ids.npy", build_train)
+  vocab = _load_or_save(train_path + ".vocab.npy", build_vocab)
+  valid_data = _load_or_save(
+      valid_path + ".ids.npy", lambda: _file_to_word_id_array(valid_path, vocab))
+  test_data = _load_or_save(
+      test_path + ".ids.npy", lambda: _file_to_word_id_array(test_path, vocab))
+  return train_data, valid_data, test_data, len(vocab)
+
+
 def ptb_producer(raw_data, batch_size, num_steps, name=None):
   """Iterate on the raw PTB data.
 
@@ -125,3 +273,48 @@ def ptb_producer(raw_data, batch_size, num_steps, name=None):
                          [batch_size, (i + 1) * num_steps + 1])
     y.set_shape([batch_size, num_steps])
     return x, y
+
+
+def ptb_dataset_producer(raw_data, batch_size, num_steps, name=None):
+  """Iterate on the raw PTB data with a tf.data pipeline.
+
+  A drop-in replacement for ptb_producer that produces the same batches in
+  the same order, but without queue runners.
+
+  Args:
+    raw_data: one of the raw data outputs from ptb_raw_data or
+      ptb_raw_data_arrays.
+    batch_size: int, the batch size.
+    num_steps: int, the number of unrolls.
+    name: the name of this operation (optional).
+
+  Returns:
+    A pair of Tensors, each shaped [batch_size, num_steps]. The second element
+    of the tuple is the same data time-shifted to the right by one.
+
+  Raises:
+    ValueError: if batch_size or num_steps are too high.
+  """
+  with tf.name_scope(name, "PTBDatasetProducer", [batch_size, num_steps]):
+    raw_data = np.asarray(raw_data, dtype=np.int32)
+    batch_len = len(raw_data) // batch_size
+    epoch_size = (batch_len - 1) // num_steps
+    if epoch_size <= 0:
+      raise ValueError("epoch_size == 0, decrease batch_size or num_steps")
+    data = tf.convert_to_tensor(
+        raw_data[0 : batch_size * batch_len].reshape([batch_size, batch_len]),
+        name="data")
+
+    def slice_batch(i):
+      i = tf.cast(i, tf.int32)
+      x = tf.strided_slice(data, [0, i * num_steps],
+                           [batch_size, (i + 1) * num_steps])
+      y = tf.strided_slice(data, [0, i * num_steps + 1],
+                           [batch_size, (i + 1) * num_steps + 1])
+      return x, y
+
+    dataset = tf.data.Dataset.range(epoch_size).repeat().map(slice_batch)
+    x, y = dataset.prefetch(1).make_one_shot_iterator().get_next()
+    x.set_shape([batch_size, num_steps])
+    y.set_shape([batch_size, num_steps])
+    return x, y
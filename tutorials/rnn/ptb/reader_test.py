@@ -44,6 +44,21 @@ class PtbReaderTest(tf.test.TestCase):
     output = reader.ptb_raw_data(tmpdir)
     self.assertEqual(len(output), 4)
 
+  def testPtbRawDataArrays(self):
+    tmpdir = os.path.join(tf.test.get_temp_dir(), "arrays")
+    tf.gfile.MakeDirs(tmpdir)
+    for suffix in "train", "valid", "test":
+      filename = os.path.join(tmpdir, "ptb.%s.txt" % suffix)
+      with tf.gfile.GFile(filename, "w") as fh:
+        fh.write(self._string_data)
+    expected = reader.ptb_raw_data(tmpdir)
+    # The second call loads the cached .npy files.
+    for _ in range(2):
+      output = reader.ptb_raw_data_arrays(tmpdir)
+      self.assertEqual(output[3], expected[3])
+      for data, expected_data in zip(output[:3], expected[:3]):
+        self.assertAllEqual(data, expected_data)
+
   def testPtbProducer(self):
     raw_data = [4, 3, 2, 1, 0, 5, 6, 1, 1, 1, 1, 0, 3, 4, 1]
     batch_size = 3
@@ -63,6 +78,22 @@ class PtbReaderTest(tf.test.TestCase):
         coord.request_stop()
         coord.join()
 
+  def testPtbDatasetProducer(self):
+    raw_data = [4, 3, 2, 1, 0, 5, 6, 1, 1, 1, 1, 0, 3, 4, 1]
+    batch_size = 3
+    num_steps = 2
+    x, y = reader.ptb_dataset_producer(raw_data, batch_size, num_steps)
+    with self.test_session() as session:
+      xval, yval = session.run([x, y])
+      self.assertAllEqual(xval, [[4, 3], [5, 6], [1, 0]])
+      self.assertAllEqual(yval, [[3, 2], [6, 1], [0, 3]])
+      xval, yval = session.run([x, y])
+      self.assertAllEqual(xval, [[2, 1], [1, 1], [3, 4]])
+      self.assertAllEqual(yval, [[1, 0], [1, 1], [4, 1]])
+      # The producer wraps around after an epoch.
+      xval, yval = session.run([x, y])
+      self.assertAllEqual(xval, [[4, 3], [5, 6], [1, 0]])
+
 
 if __name__ == "__main__":
   tf.test.main()
@@ -19,11 +19,15 @@ from __future__ import division
 from __future__ import print_function
 
 import gzip
+import multiprocessing
 import os
 import re
 import tarfile
 
+import numpy as np
+import six
 from six.moves import urllib
+from six.moves import xrange  # pylint: disable=redefined-builtin
 
 from tensorflow.python.platform import gfile
 import tensorflow as tf
@@ -48,6 +52,14 @@ _DIGIT_RE = re.compile(br"\d")
 _WMT_ENFR_TRAIN_URL = "http://www.statmt.org/wmt10/training-giga-fren.tar"
 _WMT_ENFR_DEV_URL = "http://www.statmt.org/wmt15/dev-v2.tgz"
 
+# Suffixes of the two files making up a binary token-id corpus.
+_TOKENS_SUFFIX = ".tokens"
+_OFFSETS_SUFFIX = ".offsets"
+
+# Number of file chunks handed to each worker process; more chunks than
+# workers keeps the pool busy when line lengths vary across the file.
+_CHUNKS_PER_WORKER = 4
+
 
 def maybe_download(directory, filename, url):
   """Download filename from url unless it's already in directory."""
@@ -111,8 +123,50 @@ def basic_tokenizer(sentence):
   return [w for w in words if w]
 
 
+def _line_aligned_chunks(data_path, num_chunks):
+  """Split data_path into at most num_chunks byte ranges of whole lines."""
+  size = gfile.Stat(data_path).length
+  boundaries = [0]
+  with gfile.GFile(data_path, mode="rb") as f:
+    for i in xrange(1, num_chunks):
+      position = size * i // num_chunks
+      if position <= boundaries[-1]:
+        continue
+      f.seek(position)
+      f.readline()  # Move to the start of the next line.
+      boundaries.append(min(f.tell(), size))
+  boundaries.append(size)
+  return [(start, end) for start, end in zip(boundaries[:-1], boundaries[1:])
+          if end > start]
+
+
+def _read_chunk_lines(data_path, start, end):
+  """Yield the lines of data_path that start in the byte range [start, end)."""
+  with gfile.GFile(data_path, mode="rb") as f:
+    f.seek(start)
+    position = start
+    while position < end:
+      line = f.readline()
+      if not line:
+        break
+      position += len(line)
+      yield tf.compat.as_bytes(line)
+
+
+def _count_chunk_tokens(args):
+  """Pool worker: count the tokens of one chunk of a data file."""
+  data_path, start, end, tokenizer, normalize_digits = args
+  vocab = {}
+  for line in _read_chunk_lines(data_path, start, end):
+    tokens = tokenizer(line) if tokenizer else basic_tokenizer(line)
+    for w in tokens:
+      word = _DIGIT_RE.sub(b"0", w) if normalize_digits else w
+      vocab[word] = vocab.get(word, 0) + 1
+  return vocab
+
+
 def create_vocabulary(vocabulary_path, data_path, max_vocabulary_size,
-                      tokenizer=None, normalize_digits=True):
+                      tokenizer=None, normalize_digits=True, num_workers=1):
   """Create vocabulary file (if it does not exist yet) from data file.
 
   Data file is assumed to contain one sentence per line. Each sentence is
@@ -128,30 +182,49 @@ def create_vocabulary(vocabulary_path, data_path, max_vocabulary_size,
     tokenizer: a function to use to tokenize each data sentence;
       if None, basic_tokenizer will be used.
     normalize_digits: Boolean; if true, all digits are replaced by 0s.
+    num_workers: number of processes tokenizing chunks of the data file in
+      parallel; the tokenizer must be picklable if this is larger than 1.
   """
   if not gfile.Exists(vocabulary_path):
     print("Creating vocabulary %s from data %s" % (vocabulary_path, data_path))
     vocab = {}
-    with gfile.GFile(data_path, mode="rb") as f:
-      counter = 0
-      for line in f:
-        counter += 1
-        if counter % 100000 == 0:
-          print("  processing line %d" % counter)
-        line = tf.compat.as_bytes(line)
-        tokens = tokenizer(line) if tokenizer else basic_tokenizer(line)
-        for w in tokens:
-          word = _DIGIT_RE.sub(b"0", w) if normalize_digits else w
-          if word in vocab:
-            vocab[word] += 1
-          else:
-            vocab[word] = 1
-      vocab_list = _START_VOCAB + sorted(vocab, key=vocab.get, reverse=True)
-      if len(vocab_list) > max_vocabulary_size:
-        vocab_list = vocab_list[:max_vocabulary_size]
-      with gfile.GFile(vocabulary_path, mode="wb") as vocab_file:
-        for w in vocab_list:
-          vocab_file.write(w + b"\n")
+    if num_workers > 1:
+      chunks = _line_aligned_chunks(data_path,
+                                    num_workers * _CHUNKS_PER_WORKER)
+      tasks = [(data_path, start, end, tokenizer, normalize_digits)
+               for start, end in chunks]
+      pool = multiprocessing.Pool(num_workers)
+      try:
+        # Chunks are merged in file order, so ties in the frequency sort below
+        # are broken exactly as in the single-process loop.
+        for i, chunk_vocab in enumerate(pool.imap(_count_chunk_tokens, tasks)):
+          print("  processed chunk %d of %d" % (i + 1, len(tasks)))
+          for word, count in six.iteritems(chunk_vocab):
+            vocab[word] = vocab.get(word, 0) + count
+      finally:
+        pool.close()
+        pool.join()
+    else:
+      with gfile.GFile(data_path, mode="rb") as f:
+        counter = 0
+        for line in f:
+          counter += 1
+          if counter % 100000 == 0:
+            print("  processing line %d" % counter)
+          line = tf.compat.as_bytes(line)
+          tokens = tokenizer(line) if tokenizer else basic_tokenizer(line)
+          for w in tokens:
+            word = _DIGIT_RE.sub(b"0", w) if normalize_digits else w
+            if word in vocab:
+              vocab[word] += 1
+            else:
+              vocab[word] = 1
+    vocab_list = _START_VOCAB + sorted(vocab, key=vocab.get, reverse=True)
+    if len(vocab_list) > max_vocabulary_size:
+      vocab_list = vocab_list[:max_vocabulary_size]
+    with gfile.GFile(vocabulary_path, mode="wb") as vocab_file:
+      for w in vocab_list:
+        vocab_file.write(w + b"\n")
 
 
 def initialize_vocabulary(vocabulary_path):
@@ -244,7 +317,112 @@ def data_to_token_ids(data_path, target_path, vocabulary_path,
           tokens_file.write(" ".join([str(tok) for tok in token_ids]) + "\n")
 
 
-def prepare_wmt_data(data_dir, en_vocabulary_size, fr_vocabulary_size, tokenizer=None):
+# Vocabulary of a worker process in data_to_binary_corpus, set by the pool
+# initializer so the dictionary is not pickled along with every chunk.
+_worker_vocab = None
+
+
+def _init_token_ids_worker(vocabulary_path):
+  global _worker_vocab
+  _worker_vocab, _ = initialize_vocabulary(vocabulary_path)
+
+
+def _chunk_to_token_ids(vocab, data_path, start, end, tokenizer,
+                        normalize_digits):
+  """Convert one chunk of a data file into flat token-ids and line lengths."""
+  token_ids = []
+  lengths = []
+  for line in _read_chunk_lines(data_path, start, end):
+    ids = sentence_to_token_ids(line, vocab, tokenizer, normalize_digits)
+    token_ids.extend(ids)
+    lengths.append(len(ids))
+  return np.array(token_ids, dtype="<i4"), np.array(lengths, dtype="<i8")
+
+
+def _token_ids_worker(args):
+  """Pool worker: convert one chunk using the vocabulary of this process."""
+  return _chunk_to_token_ids(_worker_vocab, *args)
+
+
+def data_to_binary_corpus(data_path, target_path, vocabulary_path,
+                          tokenizer=None, normalize_digits=True,
+                          num_workers=1):
+  """Tokenize data file into a binary token-ids corpus using a process pool.
+
+  This is the binary counterpart of data_to_token_ids. Instead of a text file
+  the corpus is stored as two raw little-endian arrays: target_path.tokens
+  holds the int32 token-ids of all sentences back to back, and
+  target_path.offsets holds num_sentences + 1 int64 offsets into it, so that
+  sentence i is tokens[offsets[i]:offsets[i + 1]]. Use load_binary_corpus to
+  memory-map the result.
+
+  Args:
+    data_path: path to the data file in one-sentence-per-line format.
+    target_path: path prefix of the binary corpus files to create.
+    vocabulary_path: path to the vocabulary file.
+    tokenizer: a function to use to tokenize each sentence;
+      if None, basic_tokenizer will be used.
+    normalize_digits: Boolean; if true, all digits are replaced by 0s.
+    num_workers: number of processes tokenizing chunks of the data file in
+      parallel; the tokenizer must be picklable if this is larger than 1.
+  """
+  # The offsets file is written last, so its presence marks a complete corpus.
+  if gfile.Exists(target_path + _OFFSETS_SUFFIX):
+    return
+  print("Tokenizing data in %s into binary corpus %s" % (data_path,
+                                                        target_path))
+  chunks = _line_aligned_chunks(data_path,
+                                max(num_workers, 1) * _CHUNKS_PER_WORKER)
+  tasks = [(data_path, start, end, tokenizer, normalize_digits)
+           for start, end in chunks]
+  if num_workers > 1:
+    pool = multiprocessing.Pool(num_workers, _init_token_ids_worker,
+                                (vocabulary_path,))
+    results = pool.imap(_token_ids_worker, tasks)
+  else:
+    pool = None
+    vocab, _ = initialize_vocabulary(vocabulary_path)
+    results = (_chunk_to_token_ids(vocab, *task) for task in tasks)
+  lengths = []
+  try:
+    with gfile.GFile(target_path + _TOKENS_SUFFIX, mode="wb") as tokens_file:
+      for i, (token_ids, chunk_lengths) in enumerate(results):
+        print("  tokenized chunk %d of %d" % (i + 1, len(tasks)))
+        tokens_file.write(token_ids.tobytes())
+        lengths.append(chunk_lengths)
+  finally:
+    if pool is not None:
+      pool.close()
+      pool.join()
+  offsets = np.zeros(sum(len(l) for l in lengths) + 1, dtype="<i8")
+  if lengths:
+    np.cumsum(np.concatenate(lengths), out=offsets[1:])
+  with gfile.GFile(target_path + _OFFSETS_SUFFIX, mode="wb") as offsets_file:
+    offsets_file.write(offsets.tobytes())
+
+
+def load_binary_corpus(corpus_path):
+  """Memory-map a corpus written by data_to_binary_corpus.
+
+  The corpus files must be on the local file system.
+
+  Args:
+    corpus_path: path prefix of the binary corpus files.
+
+  Returns:
+    a pair (tokens, offsets) of read-only arrays: the int32 token-ids of all
+    sentences and the num_sentences + 1 int64 offsets of each sentence.
+  """
+  def _map(path, dtype):
+    if os.path.getsize(path) == 0:  # np.memmap can not map empty files.
+      return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+  return (_map(corpus_path + _TOKENS_SUFFIX, "<i4"),
+          _map(corpus_path + _OFFSETS_SUFFIX, "<i8"))
+
+
+def prepare_wmt_data(data_dir, en_vocabulary_size, fr_vocabulary_size, tokenizer=None,
+                     num_workers=1, binary_corpus=False):
   """Get WMT data into data_dir, create vocabularies and tokenize data.
 
   Args:
@@ -253,6 +431,10 @@ def prepare_wmt_data(data_dir, en_vocabulary_size, fr_vocabulary_size, tokenizer
     fr_vocabulary_size: size of the French vocabulary to create and use.
     tokenizer: a function to use to tokenize each data sentence;
       if None, basic_tokenizer will be used.
+    num_workers: number of processes used for tokenization.
+    binary_corpus: if true, token-ids are stored as binary corpora (see
+      data_to_binary_corpus) and the returned token-ids paths are their
+      path prefixes.
 
   Returns:
     A tuple of 6 elements:
@@ -272,11 +454,11 @@ def prepare_wmt_data(data_dir, en_vocabulary_size, fr_vocabulary_size, tokenizer
   from_dev_path = dev_path + ".en"
   to_dev_path = dev_path + ".fr"
   return prepare_data(data_dir, from_train_path, to_train_path, from_dev_path, to_dev_path, en_vocabulary_size,
-                      fr_vocabulary_size, tokenizer)
+                      fr_vocabulary_size, tokenizer, num_workers, binary_corpus)
 
 
 def prepare_data(data_dir, from_train_path, to_train_path, from_dev_path, to_dev_path, from_vocabulary_size,
-                 to_vocabulary_size, tokenizer=None):
+                 to_vocabulary_size, tokenizer=None, num_workers=1, binary_corpus=False):
   """Preapre all necessary files that are required for the training.
 
     Args:
@@ -289,6 +471,10 @@ def prepare_data(data_dir, from_train_path, to_train_path, from_dev_path, to_dev
       to_vocabulary_size: size of the "to language" vocabulary to create and use.
       tokenizer: a function to use to tokenize each data sentence;
         if None, basic_tokenizer will be used.
+      num_workers: number of processes used for tokenization.
+      binary_corpus: if true, token-ids are stored as binary corpora (see
+        data_to_binary_corpus) and the returned token-ids paths are their
+        path prefixes.
 
     Returns:
       A tuple of 6 elements:
@@ -302,20 +488,32 @@ def prepare_data(data_dir, from_train_path, to_train_path, from_dev_path, to_dev
   # Create vocabularies of the appropriate sizes.
   to_vocab_path = os.path.join(data_dir, "vocab%d.to" % to_vocabulary_size)
   from_vocab_path = os.path.join(data_dir, "vocab%d.from" % from_vocabulary_size)
-  create_vocabulary(to_vocab_path, to_train_path , to_vocabulary_size, tokenizer)
-  create_vocabulary(from_vocab_path, from_train_path , from_vocabulary_size, tokenizer)
+  create_vocabulary(to_vocab_path, to_train_path , to_vocabulary_size, tokenizer,
+                    num_workers=num_workers)
+  create_vocabulary(from_vocab_path, from_train_path , from_vocabulary_size, tokenizer,
+                    num_workers=num_workers)
+
+  if binary_corpus:
+    ids_suffix = ".ids%d.bin"
+    def to_token_ids(data_path, target_path, vocabulary_path):
+      data_to_binary_corpus(data_path, target_path, vocabulary_path, tokenizer,
+                            num_workers=num_workers)
+  else:
+    ids_suffix = ".ids%d"
+    def to_token_ids(data_path, target_path, vocabulary_path):
+      data_to_token_ids(data_path, target_path, vocabulary_path, tokenizer)
 
   # Create token ids for the training data.
-  to_train_ids_path = to_train_path + (".ids%d" % to_vocabulary_size)
-  from_train_ids_path = from_train_path + (".ids%d" % from_vocabulary_size)
-  data_to_token_ids(to_train_path, to_train_ids_path, to_vocab_path, tokenizer)
-  data_to_token_ids(from_train_path, from_train_ids_path, from_vocab_path, tokenizer)
+  to_train_ids_path = to_train_path + (ids_suffix % to_vocabulary_size)
+  from_train_ids_path = from_train_path + (ids_suffix % from_vocabulary_size)
+  to_token_ids(to_train_path, to_train_ids_path, to_vocab_path)
+  to_token_ids(from_train_path, from_train_ids_path, from_vocab_path)
 
   # Create token ids for the development data.
-  to_dev_ids_path = to_dev_path + (".ids%d" % to_vocabulary_size)
-  from_dev_ids_path = from_dev_path + (".ids%d" % from_vocabulary_size)
-  data_to_token_ids(to_dev_path, to_dev_ids_path, to_vocab_path, tokenizer)
-  data_to_token_ids(from_dev_path, from_dev_ids_path, from_vocab_path, tokenizer)
+  to_dev_ids_path = to_dev_path + (ids_suffix % to_vocabulary_size)
+  from_dev_ids_path = from_dev_path + (ids_suffix % from_vocabulary_size)
+  to_token_ids(to_dev_path, to_dev_ids_path, to_vocab_path)
+  to_token_ids(from_dev_path, from_dev_ids_path, from_vocab_path)
 
   return (from_train_ids_path, to_train_ids_path,
           from_dev_ids_path, to_dev_ids_path,
@@ -0,0 +1,86 @@
+# Copyright 2015 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for models.tutorials.rnn.translate.data_utils."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os.path
+
+import tensorflow as tf
+
+import data_utils
+
+
+class DataUtilsTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._tmpdir = tf.test.get_temp_dir()
+    self._data_path = os.path.join(self._tmpdir, "data.txt")
+    # Lines of varying lengths, including empty ones and digits.
+    lines = ["the cat sat on the mat .", "", "a dog , 12 cats !",
+             "why ?", "", "the end of 2017 was cold"]
+    lines = [" ".join(["word%d" % (i % 7)] * (i % 11)) + " " + line
+             for i in range(40) for line in lines]
+    with tf.gfile.GFile(self._data_path, "w") as fh:
+      fh.write("\n".join(lines) + "\n")
+    self._vocabulary_path = os.path.join(self._tmpdir, "vocab")
+    data_utils.create_vocabulary(self._vocabulary_path, self._data_path, 20)
+
+  def testLineAlignedChunks(self):
+    with tf.gfile.GFile(self._data_path, "rb") as fh:
+      data = fh.read()
+    for num_chunks in 1, 2, 3, 7, 50, len(data) + 5:
+      chunks = data_utils._line_aligned_chunks(self._data_path, num_chunks)
+      self.assertLessEqual(len(chunks), num_chunks)
+      # The chunks cover the file back to back.
+      self.assertEqual(chunks[0][0], 0)
+      self.assertEqual(chunks[-1][1], len(data))
+      for (_, end), (start, _) in zip(chunks[:-1], chunks[1:]):
+        self.assertEqual(end, start)
+      # Every chunk starts at the start of a line.
+      for start, end in chunks:
+        self.assertLess(start, end)
+        if start > 0:
+          self.assertEqual(data[start - 1:start], b"\n")
+      # Reading the chunks gives back the lines of the file.
+      lines = []
+      for start, end in chunks:
+        lines.extend(
+            data_utils._read_chunk_lines(self._data_path, start, end))
+      self.assertEqual(b"".join(lines), data)
+
+  def testBinaryCorpusMatchesTokenIds(self):
+    ids_path = os.path.join(self._tmpdir, "data.ids")
+    data_utils.data_to_token_ids(self._data_path, ids_path,
+                                 self._vocabulary_path)
+    with tf.gfile.GFile(ids_path, "r") as fh:
+      expected = [[int(x) for x in line.split()] for line in fh]
+    for num_workers in 1, 3:
+      corpus_path = os.path.join(self._tmpdir, "corpus%d" % num_workers)
+      data_utils.data_to_binary_corpus(self._data_path, corpus_path,
+                                       self._vocabulary_path,
+                                       num_workers=num_workers)
+      tokens, offsets = data_utils.load_binary_corpus(corpus_path)
+      self.assertEqual(len(offsets), len(expected) + 1)
+      sentences = [tokens[offsets[i]:offsets[i + 1]].tolist()
+                   for i in range(len(expected))]
+      self.assertEqual(sentences, expected)
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -73,6 +73,10 @@ tf.app.flags.DEFINE_boolean("self_test", False,
                             "Run a self-test if this is set to True.")
 tf.app.flags.DEFINE_boolean("use_fp16", False,
                             "Train using fp16 instead of fp32.")
+tf.app.flags.DEFINE_integer("num_workers", 1,
+                            "Number of processes used to tokenize the data.")
+tf.app.flags.DEFINE_boolean("binary_corpus", False,
+                            "Store token-ids as memory-mapped binary corpora.")
 
 FLAGS = tf.app.flags.FLAGS
 
@@ -119,6 +123,69 @@ def read_data(source_path, target_path, max_size=None):
   return data_set
 
 
+class BinaryCorpusBucket(object):
+  """The (source, target) pairs of one bucket, backed by binary corpora.
+
+  Pairs are materialized as lists of token-ids only when indexed, so a bucket
+  costs one integer per pair instead of two Python lists.
+  """
+
+  def __init__(self, source_corpus, target_corpus, line_ids):
+    self._source_tokens, self._source_offsets = source_corpus
+    self._target_tokens, self._target_offsets = target_corpus
+    self._line_ids = line_ids
+
+  def __len__(self):
+    return len(self._line_ids)
+
+  def __getitem__(self, index):
+    line = self._line_ids[index]
+    source_ids = self._source_tokens[
+        self._source_offsets[line]:self._source_offsets[line + 1]].tolist()
+    target_ids = self._target_tokens[
+        self._target_offsets[line]:self._target_offsets[line + 1]].tolist()
+    target_ids.append(data_utils.EOS_ID)
+    return source_ids, target_ids
+
+
+def read_binary_data(source_path, target_path, max_size=None):
+  """Memory-map binary source and target corpora and put them into buckets.
+
+  This is the counterpart of read_data for corpora written by
+  data_utils.data_to_binary_corpus; bucket assignment is done for all pairs
+  at once from the sentence lengths.
+
+  Args:
+    source_path: path prefix of the binary corpus for the source language.
+    target_path: path prefix of the binary corpus for the target language;
+      it must be aligned with the source corpus.
+    max_size: maximum number of pairs to read, all other will be ignored;
+      if 0 or None, the corpora will be read completely (no limit).
+
+  Returns:
+    data_set: a list of length len(_buckets); data_set[n] is a
+      BinaryCorpusBucket with the (source, target) pairs that fit into the
+      n-th bucket, in the same order as read_data would return them.
+  """
+  source_corpus = data_utils.load_binary_corpus(source_path)
+  target_corpus = data_utils.load_binary_corpus(target_path)
+  num_pairs = min(len(source_corpus[1]), len(target_corpus[1])) - 1
+  if max_size:
+    num_pairs = min(num_pairs, max_size)
+  source_lengths = np.diff(source_corpus[1][:num_pairs + 1])
+  # Target sentences get an EOS symbol appended.
+  target_lengths = np.diff(target_corpus[1][:num_pairs + 1]) + 1
+  unassigned = np.ones(num_pairs, dtype=bool)
+  data_set = []
+  for source_size, target_size in _buckets:
+    fits = (unassigned & (source_lengths < source_size) &
+            (target_lengths < target_size))
+    data_set.append(BinaryCorpusBucket(source_corpus, target_corpus,
+                                       np.flatnonzero(fits)))
+    unassigned &= ~fits
+  return data_set
+
+
 def create_model(session, forward_only):
   """Create translation model and initialize or load parameters in session."""
   dtype = tf.float16 if FLAGS.use_fp16 else tf.float32
@@ -165,12 +232,15 @@ def train():
         from_dev_data,
         to_dev_data,
         FLAGS.from_vocab_size,
-        FLAGS.to_vocab_size)
+        FLAGS.to_vocab_size,
+        num_workers=FLAGS.num_workers,
+        binary_corpus=FLAGS.binary_corpus)
   else:
       # Prepare WMT data.
       print("Preparing WMT data in %s" % FLAGS.data_dir)
       from_train, to_train, from_dev, to_dev, _, _ = data_utils.prepare_wmt_data(
-          FLAGS.data_dir, FLAGS.from_vocab_size, FLAGS.to_vocab_size)
+          FLAGS.data_dir, FLAGS.from_vocab_size, FLAGS.to_vocab_size,
+          num_workers=FLAGS.num_workers, binary_corpus=FLAGS.binary_corpus)
 
   with tf.Session() as sess:
     # Create model.
@@ -180,8 +250,9 @@ def train():
     # Read data into buckets and compute their sizes.
     print ("Reading development and training data (limit: %d)."
            % FLAGS.max_train_data_size)
-    dev_set = read_data(from_dev, to_dev)
-    train_set = read_data(from_train, to_train, FLAGS.max_train_data_size)
+    read_fn = read_binary_data if FLAGS.binary_corpus else read_data
+    dev_set = read_fn(from_dev, to_dev)
+    train_set = read_fn(from_train, to_train, FLAGS.max_train_data_size)
     train_bucket_sizes = [len(train_set[b]) for b in xrange(len(_buckets))]
     train_total_size = float(sum(train_bucket_sizes))
 